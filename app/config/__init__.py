@@ -7,7 +7,6 @@ Provides volume information to API and frontend
 
 import os
 import platform
-import yaml
 from typing import List, Dict, Optional
 from pathlib import Path
 
@@ -22,6 +21,20 @@ class VolumeConfig:
         self.description = data.get('description', '')
         self.check_mounted = data.get('check_mounted', False)
         self.vlan_id = data.get('vlan_id')
+        # Max concurrent transfer streams touching this volume (None = unlimited)
+        self.max_streams = data.get('max_streams')
+        # Durability level for files written here (None = KETTER_DURABILITY)
+        self.durability = data.get('durability')
+        # Concurrent ranged streams for one large file (None = per-type default)
+        self.copy_streams = data.get('copy_streams')
+        # "host:port" of the transfer agent serving this volume (TRANSFER_NODE_MODE)
+        self.agent = data.get('agent')
+        # Bandwidth cap in MB/s (None = unlimited), optionally per time-of-day window:
+        # [{"window": "09:00-19:00", "max_mbps": 200}, ...] (app.services.bandwidth)
+        self.max_mbps = data.get('max_mbps')
+        self.rate_windows = data.get('rate_windows') or []
+        # Folder ZIP packaging: "store" or "adaptive" (None = KETTER_ZIP_COMPRESSION)
+        self.zip_compression = data.get('zip_compression')
 
     def is_available(self) -> bool:
         """Check if volume path exists and is accessible"""
@@ -37,6 +50,13 @@ class VolumeConfig:
             'alias': self.alias,
             'type': self.type,
             'description': self.description,
+            'max_streams': self.max_streams,
+            'durability': self.durability,
+            'copy_streams': self.copy_streams,
+            'agent': self.agent,
+            'max_mbps': self.max_mbps,
+            'rate_windows': self.rate_windows,
+            'zip_compression': self.zip_compression,
             'available': self.is_available()
         }
 
@@ -49,6 +69,8 @@ class KetterConfig:
         self.server_name = "Unknown"
         self.server_location = ""
         self.volumes: List[VolumeConfig] = []
+        # Default copy streams per volume type, e.g. {"network": 4, "local": 1}
+        self.copy_streams_by_type: Dict[str, int] = {}
 
         self._load_config()
 
@@ -60,6 +82,8 @@ class KetterConfig:
             self._load_defaults()
             return
 
+        import yaml  # Only needed once per process, keep it off the import path
+
         try:
             with open(self.config_path, 'r') as f:
                 config = yaml.safe_load(f)
@@ -69,6 +93,8 @@ class KetterConfig:
             self.server_name = server.get('name', 'Unknown')
             self.server_location = server.get('location', '')
 
+            self.copy_streams_by_type = config.get('copy_streams') or {}
+
             # Load volumes
             volumes_data = config.get('volumes', [])
             self.volumes = [VolumeConfig(vol) for vol in volumes_data]
@@ -168,6 +194,22 @@ class KetterConfig:
         volume_paths = [v.path for v in self.volumes]
         return (False, f"Path must start with a configured volume: {', '.join(volume_paths)}")
 
+    def get_volume_for_path(self, path: str) -> Optional[VolumeConfig]:
+        """
+        Find the configured volume that contains a path
+
+        Uses the longest matching volume path, so nested volumes
+        (e.g. /Volumes and /Volumes/Nexis) resolve to the most specific one.
+        Matches stop at path boundaries: /Volumes/Nexis2 is not on /Volumes/Nexis.
+        """
+        matches = [
+            v for v in self.volumes
+            if v.path and (path == v.path or path.startswith(v.path.rstrip('/') + '/'))
+        ]
+        if not matches:
+            return None
+        return max(matches, key=lambda v: len(v.path))
+
     def get_server_info(self) -> dict:
         """Get server information"""
         return {
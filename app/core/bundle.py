@@ -0,0 +1,318 @@
+"""
+Ketter 3.0 - Small-File Bundles
+Many small files in one transfer, one job and one compact result list
+
+MRC Principles:
+- Simple: each file is read whole, hashed, written under a temp name and
+  renamed; no per-file DB rows, commits, audit events or fsyncs
+- Reliable: one syncfs for the whole bundle, then every file is re-read
+  from the storage and compared with its source hash
+- Transparent: Transfer.bundle_files holds one [relpath, size, sha256,
+  error] row per file; bundle digests (folder manifest format) over the
+  source hashes (SOURCE, FINAL) and over the hashes re-read from the
+  destination (DESTINATION)
+- Retryable: files that failed are re-queued as a new bundle of just those
+  files (new_bundle_retry), up to KETTER_BUNDLE_MAX_RETRIES times; the
+  verified ones are done (a MOVE already deleted their sources)
+
+Used by the continuous watcher and POST /transfers/bundle for files up to
+KETTER_BUNDLE_MAX_FILE_KB. Larger files keep their own transfer.
+
+Per-file cost is a handful of syscalls (open, read, write, rename, re-read)
+instead of several DB round trips and an RQ job dispatch.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models import Transfer, TransferStatus, Checksum, ChecksumType, AuditEventType
+from app.security.path_security import validate_path_pair, PathSecurityError
+from app.database import acquire_transfer_lock, release_transfer_lock
+from app.services.progress import get_live_progress
+from app.services.transfer_lock import verify_transfer_fence
+from .copy_engine import log_event, reserve_disk_space, calculate_sha256_from_storage, CopyEngineError
+from .file_io import get_durability, sync_tree
+from .folder_manifest import MANIFEST_ALGORITHM, folder_digest
+
+BUNDLE_MAX_FILE_BYTES = int(os.getenv("KETTER_BUNDLE_MAX_FILE_KB", "1024")) * 1024
+BUNDLE_MIN_FILES = int(os.getenv("KETTER_BUNDLE_MIN_FILES", "8"))
+BUNDLE_MAX_FILES = int(os.getenv("KETTER_BUNDLE_MAX_FILES", "5000"))
+BUNDLE_MAX_RETRIES = int(os.getenv("KETTER_BUNDLE_MAX_RETRIES", "3"))
+PARTIAL_SUFFIX = ".ketter-part"
+
+
+class BundleError(Exception):
+    """Bundle could not be created or run"""
+    pass
+
+
+def plan_bundles(files: Sequence[Tuple[str, int]]) -> Tuple[List[List[str]], List[str]]:
+    """
+    Split (path, size) pairs into bundles of small files and single files
+
+    Bundling pays off only from BUNDLE_MIN_FILES small files on; below
+    that every file keeps its own transfer.
+
+    Returns:
+        (bundles: lists of paths, singles: paths)
+    """
+    small = [path for path, size in files if size <= BUNDLE_MAX_FILE_BYTES]
+    if len(small) < BUNDLE_MIN_FILES:
+        return [], [path for path, _ in files]
+    singles = [path for path, size in files if size > BUNDLE_MAX_FILE_BYTES]
+    bundles = [small[i:i + BUNDLE_MAX_FILES] for i in range(0, len(small), BUNDLE_MAX_FILES)]
+    return bundles, singles
+
+
+def new_bundle_transfer(paths: Sequence[str], destination_path: str, root: Optional[str] = None,
+                        **fields) -> Transfer:
+    """
+    Unsaved parent Transfer for a bundle of files
+
+    source_path is the deepest directory holding every file (or root, to
+    keep the layout of an earlier bundle); files keep their path relative
+    to it under destination_path.
+    """
+    if not paths:
+        raise BundleError("Bundle needs at least one file")
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    files = []
+    for path in sorted(paths):
+        files.append([os.path.relpath(os.path.abspath(path), root), os.path.getsize(path), None, None])
+    return Transfer(
+        source_path=root,
+        destination_path=destination_path,
+        file_name=f"{len(files)} files (bundle)",
+        file_size=sum(entry[1] for entry in files),
+        file_count=len(files),
+        bundle_files=files,
+        status=TransferStatus.PENDING,
+        **fields
+    )
+
+
+def new_bundle_retry(transfer: Transfer) -> Optional[Transfer]:
+    """
+    Unsaved bundle with only the failed files of a finished bundle
+
+    Same root, destination, mode and lane; retry_count counts the
+    generations. None when no failed file still exists at the source or
+    after BUNDLE_MAX_RETRIES generations.
+    """
+    retries = transfer.retry_count or 0
+    if retries >= BUNDLE_MAX_RETRIES:
+        return None
+    paths = [
+        os.path.join(transfer.source_path, entry[0])
+        for entry in transfer.bundle_files or []
+        if entry[3] is not None and os.path.isfile(os.path.join(transfer.source_path, entry[0]))
+    ]
+    if not paths:
+        return None
+    return new_bundle_transfer(
+        paths,
+        transfer.destination_path,
+        root=transfer.source_path,
+        operation_mode=transfer.operation_mode,
+        priority=transfer.priority,
+        retry_count=retries + 1
+    )
+
+
+def _ensure_relpath_safe(relpath: str) -> None:
+    norm = os.path.normpath(relpath)
+    if os.path.isabs(relpath) or norm == ".." or norm.startswith(".." + os.sep):
+        raise PathSecurityError(f"Bundle entry escapes its root: {relpath}")
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def copy_small_file(source: str, dest: str) -> Tuple[int, str]:
+    """
+    Copy one small file (read whole, temp name + rename)
+
+    Returns:
+        (size, source SHA-256)
+    """
+    data = _read_file(source)
+    temp_path = dest + PARTIAL_SUFFIX
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, dest)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def transfer_bundle_with_verification(
+    transfer_id: int,
+    db: Session,
+    heartbeat_callback: Optional[Callable] = None
+) -> Transfer:
+    """
+    Copy and verify every file of a bundle
+
+    Fluxo:
+    1. Copy pass: per file read, hash, write, rename (errors recorded per file)
+    2. One batched sync of the destination filesystem
+    3. Verify pass: re-read each copied file from the storage
+    4. COMPLETED if every file verified, else FAILED with the per-file errors
+       (MOVE deletes the sources of verified files only; the worker
+       re-queues the failed files, see new_bundle_retry)
+
+    Returns:
+        Transfer: COMPLETED or FAILED bundle
+
+    Raises:
+        ValueError: Transfer missing, not pending or not a bundle
+    """
+    transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
+    if not transfer:
+        raise ValueError(f"Transfer {transfer_id} not found")
+    if transfer.status != TransferStatus.PENDING:
+        raise ValueError(f"Transfer {transfer_id} is not pending (status: {transfer.status})")
+    if transfer.bundle_files is None:
+        raise ValueError(f"Transfer {transfer_id} is not a bundle")
+
+    move_lease = None
+    if transfer.operation_mode == "move":
+        move_lease = acquire_transfer_lock(db, transfer_id, timeout_seconds=30)
+        if move_lease is None:
+            raise CopyEngineError("Could not acquire lock for MOVE bundle (timeout)")
+
+    space_reservation = None
+    try:
+        source_root, dest_root = validate_path_pair(transfer.source_path, transfer.destination_path)
+        files = [list(entry) for entry in transfer.bundle_files]
+        for entry in files:
+            _ensure_relpath_safe(entry[0])
+
+        space_reservation = reserve_disk_space(os.path.join(dest_root, ""), transfer_id, transfer.file_size)
+        durability = get_durability(dest_root)
+
+        transfer.status = TransferStatus.COPYING
+        transfer.started_at = datetime.now(timezone.utc)
+        db.commit()
+        log_event(db, transfer_id, AuditEventType.TRANSFER_STARTED,
+                 f"Bundle: copying {len(files)} files ({transfer.file_size} bytes)")
+
+        # 1. Copy pass
+        copied_bytes = 0
+        live = get_live_progress(transfer)
+        created_dirs = set()
+        for done, entry in enumerate(files, start=1):
+            relpath = entry[0]
+            dest = os.path.join(dest_root, relpath)
+            try:
+                dest_dir = os.path.dirname(dest)
+                if dest_dir not in created_dirs:
+                    os.makedirs(dest_dir, exist_ok=True)
+                    created_dirs.add(dest_dir)
+                entry[1], entry[2] = copy_small_file(os.path.join(source_root, relpath), dest)
+                entry[3] = None
+                copied_bytes += entry[1]
+            except OSError as e:
+                entry[2], entry[3] = None, f"copy: {e.strerror or e}"
+
+            if heartbeat_callback:
+                heartbeat_callback(done, len(files))
+            space_reservation.written(copied_bytes)
+            live.update(bytes_transferred=copied_bytes,
+                        progress_percent=int(done * 100 / len(files)) // 2)
+
+        # 2. One sync for the whole bundle
+        sync_tree(dest_root, durability,
+                  heartbeat=(lambda: heartbeat_callback(len(files), len(files))) if heartbeat_callback else None)
+
+        # 3. Verify pass (from the storage, not the page cache)
+        transfer.status = TransferStatus.VERIFYING
+        transfer.bytes_transferred = copied_bytes
+        db.commit()
+        read_back = {}  # relpath -> [bytes read, None, SHA-256] from the destination
+        for done, entry in enumerate(files, start=1):
+            if entry[3] is None:
+                try:
+                    dest_hash, stats = calculate_sha256_from_storage(os.path.join(dest_root, entry[0]))
+                    read_back[entry[0]] = [stats["bytes_read"], None, dest_hash]
+                    if dest_hash != entry[2]:
+                        entry[3] = f"checksum mismatch: destination {dest_hash}"
+                    elif stats["bytes_read"] != entry[1]:
+                        entry[3] = f"size mismatch: destination {stats['bytes_read']} bytes"
+                except OSError as e:
+                    entry[3] = f"verify: {e.strerror or e}"
+            if heartbeat_callback:
+                heartbeat_callback(done, len(files))
+
+        verified = [entry for entry in files if entry[3] is None]
+        failed = [entry for entry in files if entry[3] is not None]
+
+        # 4. MOVE: sources of verified files only, under a current fence
+        if move_lease is not None and verified:
+            if not verify_transfer_fence(db, move_lease):
+                raise CopyEngineError("MOVE lease lost before source deletion (newer fence token exists)")
+            for entry in verified:
+                try:
+                    os.remove(os.path.join(source_root, entry[0]))
+                except OSError as e:
+                    entry[3] = f"source delete: {e.strerror or e}"
+                    failed.append(entry)
+
+        transfer.bundle_files = files
+        transfer.completed_at = datetime.now(timezone.utc)
+        transfer.progress_percent = 100
+        summary = {"files": len(files), "verified": len(verified), "failed": len(failed),
+                   "bytes": copied_bytes, "durability": durability}
+
+        if failed:
+            transfer.status = TransferStatus.FAILED
+            transfer.error_message = (
+                f"{len(failed)} of {len(files)} bundled files failed; first: {failed[0][0]}: {failed[0][3]}"
+            )
+            db.commit()
+            log_event(db, transfer_id, AuditEventType.ERROR,
+                     f"Bundle failed: {len(failed)} of {len(files)} files", summary)
+            return transfer
+
+        # SOURCE: hashes of the bytes read from the sources; DESTINATION:
+        # hashes and sizes re-read from the destination storage
+        digest = folder_digest({entry[0]: [entry[1], None, entry[2]] for entry in files})
+        dest_digest = folder_digest(read_back)
+        for checksum_type, value in ((ChecksumType.SOURCE, digest),
+                                     (ChecksumType.DESTINATION, dest_digest),
+                                     (ChecksumType.FINAL, digest)):
+            db.add(Checksum(
+                transfer_id=transfer_id,
+                checksum_type=checksum_type,
+                algorithm=MANIFEST_ALGORITHM,
+                checksum_value=value,
+                calculation_duration_seconds=0
+            ))
+        transfer.status = TransferStatus.COMPLETED
+        db.commit()
+        log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
+                 f"Bundle completed: {len(files)} files verified (digest {digest[:16]}...)",
+                 dict(summary, digest=digest, destination_digest=dest_digest))
+        return transfer
+
+    except Exception as e:
+        db.rollback()
+        transfer.status = TransferStatus.FAILED
+        transfer.error_message = str(e)
+        db.commit()
+        log_event(db, transfer_id, AuditEventType.ERROR, f"Bundle failed: {e}")
+        raise
+    finally:
+        if space_reservation is not None:
+            space_reservation.release()
+        release_transfer_lock(db, move_lease)
@@ -12,17 +12,63 @@ Week 5: ZIP Smart support for folder transfers
 ENHANCE #1: Path security validation (defense in depth)
 """
 
+import errno
 import os
 import shutil
 import hashlib
 import tempfile
+import time
 from datetime import datetime, timezone
-from typing import Callable, Optional
+from typing import Callable, Optional, Tuple
 from sqlalchemy.orm import Session
 
-from app.models import Transfer, Checksum, AuditLog, TransferStatus, ChecksumType, AuditEventType
+from app.models import (
+    Transfer, Checksum, ChecksumTree, FolderManifest, AuditLog,
+    TransferStatus, ChecksumType, AuditEventType
+)
 from app.security.path_security import validate_path_pair, PathSecurityError
 from app.database import acquire_transfer_lock, release_transfer_lock
+from app.services.transfer_lock import verify_transfer_fence
+from app.services.transfer_agent import agent_for_path, send_file_sync
+from app.services.space_ledger import SpaceReservation, reserve_space
+from app.services.bandwidth import RateShaper
+from app.services.progress import get_live_progress
+from .file_io import (
+    preallocate,
+    is_sparse,
+    data_extents,
+    get_durability,
+    WriteBehind,
+    sync_file,
+    fsync_directory,
+    sync_tree,
+    StorageReader,
+    VERIFY_CACHE_MODE
+)
+from .folder_manifest import (
+    MANIFEST_ALGORITHM,
+    RESYNC_VERIFY,
+    RESYNC_VERIFY_LEVELS,
+    scan_folder,
+    diff_manifest,
+    recheck_unchanged,
+    build_entries,
+    folder_digest
+)
+from .multistream import RANGE_BYTES, plan_streams, record_throughput, multistream_copy
+from .delta_sync import DELTA_SYNC_ENABLED, is_delta_candidate, delta_sync_file
+from .hashing import FINAL_ALGORITHM, get_checksum_algorithm, new_hasher
+from .tree_hash import (
+    TreeHash,
+    TREE_HASH_ENABLED,
+    TREE_HASH_MIN_BYTES,
+    TREE_ALGORITHM,
+    TREE_WORKERS,
+    can_drop_cache,
+    tree_hash,
+    hash_chunk,
+    repair_ranges
+)
 from .zip_engine import (
     is_directory,
     count_files_recursive,
@@ -30,10 +76,16 @@ from .zip_engine import (
     unzip_folder_smart,
     validate_zip_integrity,
     cleanup_zip_file,
-    format_file_count
+    format_file_count,
+    get_zip_compression,
+    get_zip_info
 )
 
 
+# Opt-in: stop after the copy in COPIED_UNVERIFIED and verify in a separate job
+DEFERRED_VERIFICATION = os.getenv("KETTER_DEFERRED_VERIFICATION", "0") == "1"
+
+
 class CopyEngineError(Exception):
     """Base exception for Copy Engine errors"""
     pass
@@ -188,7 +240,19 @@ def delete_source_after_move(source_path: str, is_folder: bool) -> None:
 
 def calculate_sha256(file_path: str, chunk_size: int = 8192, progress_callback: Optional[Callable] = None) -> str:
     """
-    Calcula SHA-256 de um arquivo
+    Calcula SHA-256 de um arquivo (ver calculate_checksum)
+    """
+    return calculate_checksum(file_path, FINAL_ALGORITHM, chunk_size, progress_callback)
+
+
+def calculate_checksum(
+    file_path: str,
+    algorithm: str = FINAL_ALGORITHM,
+    chunk_size: int = 8192,
+    progress_callback: Optional[Callable] = None
+) -> str:
+    """
+    Calcula o checksum de um arquivo com o algoritmo dado (app.core.hashing)
 
     MRC: Simple, reliable hash calculation
     - Lê arquivo em chunks para suportar arquivos grandes (500GB+)
@@ -196,17 +260,18 @@ def calculate_sha256(file_path: str, chunk_size: int = 8192, progress_callback:
 
     Args:
         file_path: Caminho do arquivo
+        algorithm: Nome no registro (sha256, blake2b, crc32, xxh64...)
         chunk_size: Tamanho do chunk em bytes (default: 8KB)
         progress_callback: Função callback(bytes_read) para progresso
 
     Returns:
-        str: SHA-256 hash em hexadecimal (64 caracteres)
+        str: Hash em hexadecimal
 
     Raises:
         FileNotFoundError: Se arquivo não existe
         PermissionError: Se sem permissão de leitura
     """
-    sha256_hash = hashlib.sha256()
+    digest = new_hasher(algorithm)
     file_size = os.path.getsize(file_path)
     bytes_read = 0
 
@@ -215,14 +280,61 @@ def calculate_sha256(file_path: str, chunk_size: int = 8192, progress_callback:
             chunk = f.read(chunk_size)
             if not chunk:
                 break
-            sha256_hash.update(chunk)
+            digest.update(chunk)
             bytes_read += len(chunk)
 
             # Progress callback
             if progress_callback:
                 progress_callback(bytes_read, file_size)
 
-    return sha256_hash.hexdigest()
+    return digest.hexdigest()
+
+
+def calculate_sha256_from_storage(
+    file_path: str,
+    progress_callback: Optional[Callable] = None,
+    cache_mode: Optional[str] = None,
+    max_bytes_per_second: Optional[float] = None,
+    algorithm: str = FINAL_ALGORITHM
+) -> Tuple[str, dict]:
+    """
+    Calcula SHA-256 lendo do storage, não do page cache
+
+    MRC: The DESTINATION checksum must prove the bytes on the disk/NAS.
+    Right after a copy the file is still in RAM, so a plain read would
+    hash the cache. See file_io.StorageReader for the modes (dontneed,
+    direct, off - KETTER_VERIFY_CACHE_MODE).
+
+    Args:
+        file_path: Caminho do arquivo
+        progress_callback: Função callback(bytes_read, total_bytes)
+        cache_mode: Override de KETTER_VERIFY_CACHE_MODE
+        max_bytes_per_second: Teto de throughput (None = sem limite)
+        algorithm: Algoritmo do registro (default: SHA-256)
+
+    Returns:
+        tuple: (hash hex, read stats: cache_mode, bytes_read, read_seconds, read_mbps)
+    """
+    sha256_hash = new_hasher(algorithm)
+    file_size = os.path.getsize(file_path)
+    reader = StorageReader(
+        file_path, mode=cache_mode,
+        heartbeat=(lambda: progress_callback(0, file_size)) if progress_callback else None
+    )
+    started = time.monotonic()
+
+    for chunk in reader.chunks():
+        sha256_hash.update(chunk)
+        if progress_callback:
+            progress_callback(reader.bytes_read, file_size)
+
+        # Throughput cap: sleep until the average rate is back under the limit
+        if max_bytes_per_second:
+            ahead = reader.bytes_read / max_bytes_per_second - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    return sha256_hash.hexdigest(), reader.stats()
 
 
 def check_disk_space(destination_path: str, required_bytes: int, min_free_percent: int = 10) -> bool:
@@ -267,60 +379,880 @@ def check_disk_space(destination_path: str, required_bytes: int, min_free_percen
     return True
 
 
+def reserve_disk_space(
+    destination_path: str,
+    transfer_id: int,
+    required_bytes: int,
+    min_free_percent: int = 10
+) -> SpaceReservation:
+    """
+    Reserva espaço no disco de destino (ledger compartilhado entre transfers)
+
+    MRC: Pre-flight validation - fail fast, also under concurrency.
+    Unlike check_disk_space, bytes already reserved by other running
+    transfers on the same filesystem count against the free space.
+
+    Args:
+        destination_path: Caminho de destino
+        transfer_id: Dono da reserva
+        required_bytes: Bytes necessários para o arquivo
+        min_free_percent: Percentual mínimo de espaço livre após cópia (default: 10%)
+
+    Returns:
+        SpaceReservation: Reserva concedida (release() ao terminar)
+
+    Raises:
+        InsufficientSpaceError: Se espaço insuficiente
+    """
+    dest_dir = os.path.dirname(destination_path)
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir, exist_ok=True)
+
+    reservation = reserve_space(dest_dir, transfer_id, required_bytes, min_free_percent)
+    if not reservation.granted:
+        raise InsufficientSpaceError(
+            f"Insufficient disk space. "
+            f"Required: {required_bytes / (1024**3):.2f} GB, "
+            f"Available: {reservation.free_bytes / (1024**3):.2f} GB, "
+            f"Reserved by running transfers: {reservation.reserved_by_others / (1024**3):.2f} GB "
+            f"(minimum free: {min_free_percent}%)"
+        )
+    return reservation
+
+
 def copy_file_with_progress(
     source_path: str,
     destination_path: str,
     chunk_size: int = 1024 * 1024,  # 1MB chunks
-    progress_callback: Optional[Callable] = None
+    progress_callback: Optional[Callable] = None,
+    durability: Optional[str] = None,
+    hasher=None,
+    allocation_callback: Optional[Callable] = None
 ) -> int:
     """
     Copia arquivo com progress tracking
 
     MRC: Reliable file copy with progress feedback
 
+    Dense sources: the destination is preallocated to the full size first
+    (less fragmentation, immediate ENOSPC). Sparse sources: only the data
+    extents are copied (SEEK_DATA/SEEK_HOLE) so holes stay holes instead of
+    being written out as zeros. Both fall back to a plain sequential copy
+    when the filesystem does not support them.
+
+    The destination is made durable according to `durability` (see
+    file_io: none, fsync, writebehind, full) before returning, so the
+    DESTINATION checksum is computed over data that survives a power loss.
+
     Args:
         source_path: Caminho do arquivo original
         destination_path: Caminho de destino
         chunk_size: Tamanho do chunk (default: 1MB)
         progress_callback: Função callback(bytes_copied, total_bytes)
+        durability: Nível de durabilidade (None = configuração do volume)
+        hasher: Objeto hashlib opcional alimentado com os bytes copiados
+            (holes contam como zeros), p.ex. o SHA-256 FINAL
+        allocation_callback: Callback(allocated_bytes) once the destination
+            is preallocated (the disk space is taken before any progress)
 
     Returns:
-        int: Total de bytes copiados
+        int: Total de bytes copiados (tamanho lógico, holes incluídos)
 
     Raises:
         FileNotFoundError: Se source não existe
         PermissionError: Se sem permissão
+        InsufficientSpaceError: Se a pré-alocação falhar por falta de espaço
         IOError: Erros de I/O
     """
     file_size = os.path.getsize(source_path)
-    bytes_copied = 0
 
     # Create destination directory if needed
     dest_dir = os.path.dirname(destination_path)
     if dest_dir and not os.path.exists(dest_dir):
         os.makedirs(dest_dir, exist_ok=True)
 
+    level = durability or get_durability(destination_path)
+
     with open(source_path, 'rb') as source_file:
         with open(destination_path, 'wb') as dest_file:
-            while True:
-                chunk = source_file.read(chunk_size)
-                if not chunk:
-                    break
+            write_behind = WriteBehind(dest_file.fileno()) if level in ("writebehind", "full") else None
+
+            extents = None
+            if is_sparse(source_path):
+                extents = data_extents(source_file.fileno(), file_size)
+
+            if extents is not None:
+                # Sparse: copy data extents only, holes stay unallocated
+                position = 0
+                for start, end in extents:
+                    _hash_zeros(hasher, start - position, chunk_size)
+                    source_file.seek(start)
+                    dest_file.seek(start)
+                    position = _copy_range(source_file, dest_file, start, end, chunk_size, file_size,
+                                           progress_callback, write_behind, hasher)
+                _hash_zeros(hasher, file_size - position, chunk_size)
+                dest_file.truncate(file_size)  # Trailing hole
+                bytes_copied = file_size
+            else:
+                try:
+                    if preallocate(dest_file.fileno(), file_size) and allocation_callback:
+                        allocation_callback(file_size)
+                except OSError as e:
+                    if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                        raise InsufficientSpaceError(
+                            f"Insufficient disk space: could not preallocate "
+                            f"{file_size / (1024**3):.2f} GB at {destination_path}"
+                        ) from e
+                    raise
+
+                bytes_copied = _copy_range(source_file, dest_file, 0, None, chunk_size, file_size,
+                                           progress_callback, write_behind, hasher)
+                # Preallocation set the size up front: trim if the source was shorter
+                dest_file.truncate(bytes_copied)
+
+            dest_file.flush()
+            # The final flush can take minutes: keep the stall detector fed
+            sync_file(dest_file.fileno(), level,
+                      heartbeat=(lambda: progress_callback(bytes_copied, file_size)) if progress_callback else None)
+
+    if level == "full":
+        fsync_directory(os.path.dirname(os.path.abspath(destination_path)))
+
+    if progress_callback and extents is not None:
+        progress_callback(file_size, file_size)
+
+    return bytes_copied
+
+
+def _copy_range(source_file, dest_file, start: int, end: Optional[int], chunk_size: int,
+                file_size: int, progress_callback: Optional[Callable],
+                write_behind: Optional[WriteBehind] = None, hasher=None) -> int:
+    """Copy [start, end) (end=None: until EOF); returns the final position"""
+    position = start
+    while end is None or position < end:
+        size = chunk_size if end is None else min(chunk_size, end - position)
+        chunk = source_file.read(size)
+        if not chunk:
+            break
+
+        dest_file.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        position += len(chunk)
+
+        if write_behind is not None:
+            dest_file.flush()
+            write_behind.written(position)
+
+        # Progress callback (logical position: skipped holes count as done)
+        if progress_callback:
+            progress_callback(position, file_size)
+    return position
+
+
+def _hash_zeros(hasher, length: int, chunk_size: int) -> None:
+    """Feed a hole's zeros to hasher (no I/O)"""
+    if hasher is None or length <= 0:
+        return
+    zeros = bytes(min(chunk_size, length))
+    while length > 0:
+        hasher.update(zeros[:min(len(zeros), length)])
+        length -= len(zeros)
+
+
+def destination_copy_path(transfer: Transfer, is_folder: bool) -> str:
+    """
+    Where the copy pass writes: the destination itself, or <folder>.zip
+    next to it for folder transfers (unzipped after verification)
+    """
+    if not is_folder:
+        return transfer.destination_path
+    dest_folder_name = os.path.basename(transfer.original_folder_path.rstrip('/'))
+    dest_parent = os.path.dirname(transfer.destination_path)
+    return os.path.join(dest_parent, f"{dest_folder_name}.zip")
+
+
+def _defer_verification(db: Session, transfer: Transfer) -> Transfer:
+    """
+    End the copy pass in COPIED_UNVERIFIED
+
+    The source ZIP of a folder transfer is no longer needed (its SOURCE
+    checksum is stored), so it is removed now. MOVE sources are untouched
+    until verification passes.
+    """
+    if transfer.zip_file_path:
+        cleanup_zip_file(transfer.zip_file_path)
+
+    transfer.status = TransferStatus.COPIED_UNVERIFIED
+    db.commit()
+
+    log_event(db, transfer.id, AuditEventType.TRANSFER_PROGRESS,
+             "Copy finished - destination verification deferred to low-priority job",
+             {"deferred_verification": True})
+    return transfer
+
+
+def verify_copied_transfer(
+    transfer_id: int,
+    db: Session,
+    heartbeat_callback: Optional[Callable] = None,
+    max_bytes_per_second: Optional[float] = None
+) -> Transfer:
+    """
+    Verificação adiada: passos 5-7 de uma transfer em COPIED_UNVERIFIED
+
+    **MRC: Same safety model as the inline flow** - the FINAL checksum is
+    only written after the destination re-hash matches the stored SOURCE
+    checksum, and MOVE sources are deleted only after that, under a fresh
+    fenced lease.
+
+    Args:
+        transfer_id: ID da transferência
+        db: Database session
+        heartbeat_callback: Callback(done, total) para o stall detector
+        max_bytes_per_second: Teto de leitura do destino (None = sem limite)
+
+    Returns:
+        Transfer: Transfer object atualizado (COMPLETED)
+
+    Raises:
+        ValueError: Se transfer não existe ou não aguarda verificação
+        ChecksumMismatchError: Se checksums não batem
+        CopyEngineError: Outros erros
+    """
+    transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
+    if not transfer:
+        raise ValueError(f"Transfer {transfer_id} not found")
+    if transfer.status != TransferStatus.COPIED_UNVERIFIED:
+        raise ValueError(f"Transfer {transfer_id} is not awaiting verification (status: {transfer.status})")
+
+    # One verifier per transfer; for MOVE this is also the fenced deletion lease
+    lease = acquire_transfer_lock(db, transfer_id, timeout_seconds=30)
+    if lease is None:
+        raise CopyEngineError(f"Could not acquire lock to verify transfer {transfer_id}")
+
+    is_folder = bool(transfer.is_folder_transfer)
+    dest_for_copy = destination_copy_path(transfer, is_folder)
+    try:
+        db.refresh(transfer)
+        if transfer.status != TransferStatus.COPIED_UNVERIFIED:
+            raise ValueError(f"Transfer {transfer_id} is not awaiting verification (status: {transfer.status})")
+
+        # SOURCE rows: the in-flight one, plus a streamed SHA-256 when the
+        # in-flight algorithm is not SHA-256 (a tree root is loaded separately)
+        source_rows = db.query(Checksum).filter(
+            Checksum.transfer_id == transfer_id,
+            Checksum.checksum_type == ChecksumType.SOURCE,
+            Checksum.algorithm != TREE_ALGORITHM
+        ).order_by(Checksum.id).all()
+        if not source_rows:
+            raise CopyEngineError(f"Transfer {transfer_id} has no SOURCE checksum to verify against")
+        in_flight = source_rows[0]
+        final_row = next((row for row in source_rows if row.algorithm == FINAL_ALGORITHM), None)
+        if final_row is None:
+            raise CopyEngineError(f"Transfer {transfer_id} has no SOURCE SHA-256 for the FINAL record")
+
+        return _verify_and_complete(
+            db, transfer, in_flight.checksum_value, dest_for_copy, is_folder,
+            get_durability(transfer.destination_path), lease,
+            heartbeat_callback=heartbeat_callback,
+            max_bytes_per_second=max_bytes_per_second,
+            algorithm=in_flight.algorithm,
+            final_hash=final_row.checksum_value
+        )
+
+    except ValueError:
+        raise
+
+    except Exception as e:
+        print(f"[Transfer {transfer_id}] Deferred verification failed: {str(e)}")
+        db.rollback()
+
+        # Scratch ZIP at the destination is useless once verification failed
+        if is_folder and os.path.isfile(dest_for_copy):
+            cleanup_zip_file(dest_for_copy)
+
+        transfer_fresh = db.query(Transfer).filter(Transfer.id == transfer_id).first()
+        if transfer_fresh:
+            transfer_fresh.status = TransferStatus.FAILED
+            transfer_fresh.error_message = str(e)
+            db.commit()
+            log_event(db, transfer_id, AuditEventType.ERROR,
+                     f"Deferred verification failed (source kept): {str(e)}",
+                     {"error": str(e), "error_type": type(e).__name__})
+
+        if isinstance(e, CopyEngineError):
+            raise
+        raise CopyEngineError(f"Deferred verification failed: {str(e)}") from e
+
+    finally:
+        release_transfer_lock(db, lease)
+
+
+def _tree_row(transfer_id: int, checksum_type: ChecksumType, tree: TreeHash) -> ChecksumTree:
+    return ChecksumTree(
+        transfer_id=transfer_id,
+        checksum_type=checksum_type,
+        algorithm=TREE_ALGORITHM,
+        chunk_size=tree.chunk_size,
+        file_size=tree.file_size,
+        root=tree.root,
+        leaves=tree.leaves
+    )
+
+
+def _load_tree(db: Session, transfer_id: int, checksum_type: ChecksumType) -> Optional[TreeHash]:
+    row = db.query(ChecksumTree).filter(
+        ChecksumTree.transfer_id == transfer_id,
+        ChecksumTree.checksum_type == checksum_type
+    ).order_by(ChecksumTree.id.desc()).first()
+    if row is None:
+        return None
+    return TreeHash(list(row.leaves), row.chunk_size, row.file_size)
+
+
+def _verify_tree(
+    db: Session,
+    transfer: Transfer,
+    source_tree: TreeHash,
+    source_hash: str,
+    dest_for_copy: str,
+    is_folder: bool,
+    heartbeat_callback: Optional[Callable] = None
+) -> Tuple[str, dict]:
+    """
+    Destination verification against the SOURCE tree
+
+    Chunks are read back in parallel. Chunks that differ are re-copied from
+    the source (only those ranges) and re-hashed once; if the trees still
+    differ the transfer fails with the exact bad ranges. No flat digest of
+    the destination is read: its DESTINATION value is the tree root
+    (TREE_ALGORITHM), compared with the SOURCE tree root.
+
+    Returns:
+        (destination tree root, read stats)
+    """
+    transfer_id = transfer.id
+    drop_cache = VERIFY_CACHE_MODE != "off" and can_drop_cache()
+    started = datetime.now(timezone.utc)
+    dest_tree, _ = tree_hash(
+        dest_for_copy, chunk_size=source_tree.chunk_size,
+        progress_callback=heartbeat_callback, drop_cache=drop_cache
+    )
+    seconds = max((datetime.now(timezone.utc) - started).total_seconds(), 1e-6)
+    read_stats = {
+        "mode": "tree",
+        "cache_mode": "dontneed" if drop_cache else "off",
+        "chunks": len(dest_tree.leaves),
+        "workers": TREE_WORKERS,
+        "bytes_read": dest_tree.file_size,
+        "read_seconds": round(seconds, 3),
+        "read_mbps": round(dest_tree.file_size / (1024 ** 2) / seconds, 1),
+    }
+
+    bad_ranges = source_tree.diff(dest_tree)
+    if bad_ranges:
+        log_event(db, transfer_id, AuditEventType.ERROR,
+                 f"Tree hash mismatch in {len(bad_ranges)} range(s) - repairing only those ranges",
+                 {"bad_ranges": bad_ranges, "source_root": source_tree.root, "dest_root": dest_tree.root})
+
+        repair_source = transfer.zip_file_path if is_folder else transfer.source_path
+        if repair_source and os.path.isfile(repair_source) and dest_tree.file_size == source_tree.file_size:
+            read_stats["repaired_bytes"] = repair_ranges(repair_source, dest_for_copy, bad_ranges)
+            for start, end in bad_ranges:
+                for index in range(start // source_tree.chunk_size, -(-end // source_tree.chunk_size)):
+                    dest_tree.update_leaf(index, hash_chunk(dest_for_copy, source_tree, index, drop_cache))
+            bad_ranges = source_tree.diff(dest_tree)
+            if not bad_ranges:
+                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                         f"Repaired {read_stats['repaired_bytes']} bytes; destination tree now matches source",
+                         {"repaired_bytes": read_stats["repaired_bytes"], "root": dest_tree.root})
+
+    if bad_ranges:
+        transfer.status = TransferStatus.FAILED
+        transfer.error_message = f"Checksum mismatch in {len(bad_ranges)} range(s): {bad_ranges[:5]}"
+        db.commit()
+
+        log_event(db, transfer_id, AuditEventType.ERROR,
+                 f"CHECKSUM MISMATCH! Transfer failed.",
+                 {"bad_ranges": bad_ranges, "source_root": source_tree.root, "dest_root": dest_tree.root})
+
+        raise ChecksumMismatchError(
+            f"Tree hash verification failed! Bad byte ranges: {bad_ranges}"
+        )
+
+    db.add(_tree_row(transfer_id, ChecksumType.DESTINATION, dest_tree))
+    db.commit()
+    return dest_tree.root, read_stats
+
+
+def _verify_and_complete(
+    db: Session,
+    transfer: Transfer,
+    source_hash: str,
+    dest_for_copy: str,
+    is_folder: bool,
+    durability: str,
+    move_lease,
+    heartbeat_callback: Optional[Callable] = None,
+    max_bytes_per_second: Optional[float] = None,
+    algorithm: str = FINAL_ALGORITHM,
+    final_hash: Optional[str] = None,
+    remote: Optional[dict] = None,
+    rate_limited: bool = False
+) -> Transfer:
+    """
+    Steps 5-7 of the transfer: DESTINATION checksum, FINAL verification,
+    unzip (folders), MOVE source deletion and COMPLETED.
+
+    source_hash and the DESTINATION hash use the in-flight `algorithm`;
+    the FINAL record is `final_hash` (SHA-256, defaults to source_hash).
+    `remote` is the result of a transfer agent stream: the agent already
+    re-read the destination from its storage. With `rate_limited` (bandwidth
+    shaping active) the read-back stays sequential so heartbeat_callback
+    can pace it.
+
+    Shared by the inline flow and the deferred verification job. Raises on
+    any failure; the caller owns rollback, cleanup and lock release.
+    """
+    transfer_id = transfer.id
+
+    # 5. Calculate DESTINATION checksum
+    transfer.status = TransferStatus.VERIFYING
+    db.commit()
+
+    log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS, "Calculating destination checksum...")
+
+    start_time = datetime.now(timezone.utc)
+    # Calculate checksum of copied file (ZIP if folder)
+    # Read back from the storage (not the page cache) and measure real read speed
+    # With a source tree the read-back is parallel and mismatches are repaired
+    # range by range; a throughput-capped (deferred) verify stays sequential
+    source_tree = _load_tree(db, transfer_id, ChecksumType.SOURCE)
+    dest_algorithm, expected_hash = algorithm, source_hash
+    if remote is not None:
+        dest_hash, read_stats = remote["checksum"], remote["read"]
+    elif source_tree is not None and algorithm == FINAL_ALGORITHM and not max_bytes_per_second and not rate_limited:
+        # The destination is checked (and recorded) by its tree root
+        dest_algorithm, expected_hash = TREE_ALGORITHM, source_tree.root
+        dest_hash, read_stats = _verify_tree(db, transfer, source_tree, source_hash, dest_for_copy,
+                                             is_folder, heartbeat_callback)
+    else:
+        dest_hash, read_stats = calculate_sha256_from_storage(
+            dest_for_copy,
+            progress_callback=heartbeat_callback,
+            max_bytes_per_second=max_bytes_per_second,
+            algorithm=algorithm
+        )
+    calc_duration = int((datetime.now(timezone.utc) - start_time).total_seconds())
+
+    # Save DESTINATION checksum
+    dest_checksum = Checksum(
+        transfer_id=transfer_id,
+        checksum_type=ChecksumType.DESTINATION,
+        algorithm=dest_algorithm,
+        checksum_value=dest_hash,
+        calculation_duration_seconds=calc_duration
+    )
+    db.add(dest_checksum)
+    db.commit()
+
+    log_event(db, transfer_id, AuditEventType.CHECKSUM_CALCULATED,
+             f"Destination checksum ({dest_algorithm}): {dest_hash[:16]}... ({calc_duration}s, "
+             f"read {read_stats['read_mbps']} MB/s from storage, cache mode {read_stats['cache_mode']})",
+             {"checksum": dest_hash, "algorithm": dest_algorithm, "duration": calc_duration, "read": read_stats})
+
+    # 6. FINAL verification - Compare checksums
+    if expected_hash != dest_hash:
+        transfer.status = TransferStatus.FAILED
+        transfer.error_message = f"Checksum mismatch! Source: {expected_hash[:16]}..., Dest: {dest_hash[:16]}..."
+        db.commit()
+
+        log_event(db, transfer_id, AuditEventType.ERROR,
+                 f"CHECKSUM MISMATCH! Transfer failed.",
+                 {"source_checksum": expected_hash, "dest_checksum": dest_hash, "algorithm": dest_algorithm})
+
+        raise ChecksumMismatchError(
+            f"Checksum verification failed! "
+            f"Source: {expected_hash}, "
+            f"Destination: {dest_hash}"
+        )
+
+    # Save FINAL checksum (same as others, confirming match)
+    # Always SHA-256: with a faster in-flight algorithm it is the SHA-256
+    # streamed during the copy, now confirmed by the in-flight match
+    final_hash = final_hash or source_hash
+    final_checksum = Checksum(
+        transfer_id=transfer_id,
+        checksum_type=ChecksumType.FINAL,
+        algorithm=FINAL_ALGORITHM,
+        checksum_value=final_hash,  # Same as source/dest
+        calculation_duration_seconds=0  # No calculation, just verification
+    )
+    db.add(final_checksum)
+    db.commit()
+
+    if algorithm == FINAL_ALGORITHM:
+        log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
+                 "Triple SHA-256 verification PASSED ",
+                 {"checksum": final_hash})
+    else:
+        log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
+                 f"Triple verification PASSED ({algorithm} in-flight, SHA-256 FINAL)",
+                 {"checksum": final_hash, "in_flight_algorithm": algorithm, "in_flight_checksum": source_hash})
+
+    # Week 5: If folder transfer, unzip at destination
+    # IMPORTANT: Do unzip BEFORE delete in MOVE mode to ensure integrity
+    if is_folder:
+        log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                 f"Unzipping folder at destination...")
+
+        # Unzip with progress tracking
+        def unzip_progress(files_done, total_files, current_file):
+            # Progress is 50-100% (second half)
+            percent = 50 + int((files_done / total_files) * 50) if total_files > 0 else 50
+            get_live_progress(transfer).update(progress_percent=percent)
+            if heartbeat_callback:
+                heartbeat_callback(files_done, total_files)
+
+        # Unzip to original destination path
+        unzip_folder_smart(dest_for_copy, transfer.destination_path, progress_callback=unzip_progress)
+        sync_tree(transfer.destination_path, durability,
+                  heartbeat=(lambda: heartbeat_callback(0, 0)) if heartbeat_callback else None)
+        transfer.unzip_completed = 1
+        db.commit()
+
+        log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                 f"Folder unzipped successfully: {format_file_count(transfer.file_count)}")
+
+        # Resync mode: first run, record the baseline for the next one
+        if transfer.sync_mode == "resync":
+            _complete_manifest(db, transfer, heartbeat_callback)
+
+        # Cleanup temporary ZIP files
+        if transfer.zip_file_path:
+            cleanup_zip_file(transfer.zip_file_path)  # Source ZIP
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     "Cleaned up temporary ZIP files")
+
+        if dest_for_copy and os.path.exists(dest_for_copy):
+            cleanup_zip_file(dest_for_copy)  # Destination ZIP
+
+    # Week 6: MOVE mode - Delete source AFTER unzip to ensure data integrity
+    # Only delete if unzip succeeded (if folder) or copy verified (if file)
+    if transfer.operation_mode == "move":
+        try:
+            # ENHANCE #4: Post-verification check before deletion
+            # Verify destination is actually readable before deleting source
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     "MOVE mode: Verifying destination is readable before deletion...")
+
+            dest_to_verify = transfer.destination_path
+            size_to_verify = transfer.file_size
+
+            # For file transfers, verify the copied file
+            # For folder transfers, verify the unzipped folder
+            # Agent destinations are not mounted here: the agent's storage
+            # re-read (DESTINATION checksum) is the readability proof
+            if remote is None:
+                verify_destination_readable(dest_to_verify, is_folder, size_to_verify)
+
+            log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
+                     "Destination verified as readable and intact (post-verification check)")
+
+            # Fencing: a holder whose lease expired (or was superseded by a
+            # newer token) must never delete the source
+            if not verify_transfer_fence(db, move_lease):
+                raise CopyEngineError(
+                    f"MOVE lock lost before source deletion (fence token {move_lease.token}); source kept"
+                )
+
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     "MOVE mode: Deleting source after verification...")
+
+            # FIXED: More explicit logic for clarity and maintainability
+            if is_folder:
+                # For folder transfer: delete contents, preserve folder structure
+                delete_source_after_move(transfer.original_folder_path, is_folder=True)
+            else:
+                # For file transfer: delete the file itself
+                delete_source_after_move(transfer.source_path, is_folder=False)
+
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     "Source deleted successfully (MOVE mode)")
+        except CopyEngineError as e:
+            log_event(db, transfer_id, AuditEventType.ERROR,
+                     f"Failed to delete source in MOVE mode: {str(e)}")
+            raise
+
+    # 7. Complete transfer
+    transfer.status = TransferStatus.COMPLETED
+    transfer.completed_at = datetime.now(timezone.utc)
+    transfer.progress_percent = 100
+    db.commit()
+
+    duration = (transfer.completed_at - transfer.started_at).total_seconds()
+    speed_mbps = (transfer.file_size / (1024**2)) / duration if duration > 0 else 0
+
+    if is_folder:
+        log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
+                 f"Folder transfer completed successfully in {duration:.1f}s ({speed_mbps:.2f} MB/s) - {format_file_count(transfer.file_count)}",
+                 {
+                     "duration_seconds": duration,
+                     "speed_mbps": speed_mbps,
+                     "file_size": transfer.file_size,
+                     "file_count": transfer.file_count,
+                     "is_folder_transfer": True
+                 })
+    else:
+        log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
+                 f"Transfer completed successfully in {duration:.1f}s ({speed_mbps:.2f} MB/s)",
+                 {
+                     "duration_seconds": duration,
+                     "speed_mbps": speed_mbps,
+                     "file_size": transfer.file_size
+                 })
+
+    return transfer
+
+
+def _previous_manifest(db: Session, transfer: Transfer) -> Optional[FolderManifest]:
+    """Manifest of the last completed run of the same folder pair"""
+    return db.query(FolderManifest).join(Transfer).filter(
+        FolderManifest.source_root == transfer.source_path,
+        FolderManifest.destination_root == transfer.destination_path,
+        FolderManifest.digest.isnot(None),
+        FolderManifest.transfer_id != transfer.id,
+        Transfer.status == TransferStatus.COMPLETED
+    ).order_by(FolderManifest.id.desc()).first()
+
+
+def _complete_manifest(db: Session, transfer: Transfer, heartbeat_callback: Optional[Callable] = None) -> None:
+    """
+    Fill the hashes of the baseline manifest after a full folder transfer
+
+    The sizes/mtimes were taken from the source before the ZIP; the hashes
+    come from the extracted (already verified) destination tree.
+    """
+    manifest = db.query(FolderManifest).filter(
+        FolderManifest.transfer_id == transfer.id
+    ).order_by(FolderManifest.id.desc()).first()
+    if manifest is None:
+        return
+
+    scan = {rel: (entry[0], entry[1]) for rel, entry in manifest.entries.items()}
+    entries = build_entries(scan, transfer.destination_path, progress_callback=heartbeat_callback)
+    manifest.entries = entries
+    manifest.digest = folder_digest(entries)
+    db.commit()
+
+    log_event(db, transfer.id, AuditEventType.CHECKSUM_CALCULATED,
+             f"Folder manifest recorded: {format_file_count(manifest.file_count)}, digest {manifest.digest[:16]}...",
+             {"folder_digest": manifest.digest, "file_count": manifest.file_count})
+
+
+def _resync_folder(
+    db: Session,
+    transfer: Transfer,
+    previous: FolderManifest,
+    source_scan: dict,
+    progress_callback: Optional[Callable] = None,
+    heartbeat_callback: Optional[Callable] = None
+) -> Transfer:
+    """
+    Incremental folder transfer against the previous run's manifest
+
+    Added and changed files are copied straight into the destination tree
+    (via a temp name, renamed after the per-file SHA-256 check), removed
+    files are deleted only with delete_removed. Ends with the folder
+    digest as SOURCE/DESTINATION/FINAL checksums and a new manifest.
+
+    The digest is only as strong as KETTER_RESYNC_VERIFY (see
+    folder_manifest): with "manifest" unchanged files are size-checked,
+    with "full" they are re-hashed from storage first. The level is
+    recorded in the verification audit event.
+    Raises on any failure; the caller owns rollback and FAILED.
+    """
+    transfer_id = transfer.id
+    source_root = transfer.source_path
+    dest_root = transfer.destination_path
+
+    if RESYNC_VERIFY not in RESYNC_VERIFY_LEVELS:
+        raise ValueError(f"Unknown KETTER_RESYNC_VERIFY '{RESYNC_VERIFY}' "
+                         f"(expected one of {', '.join(RESYNC_VERIFY_LEVELS)})")
+
+    diff = diff_manifest(previous.entries, source_scan, dest_root)
+    damaged = []
+    if RESYNC_VERIFY == "full":
+        damaged = recheck_unchanged(diff, previous.entries, dest_root, progress_callback=heartbeat_callback)
+        if damaged:
+            log_event(db, transfer_id, AuditEventType.ERROR,
+                     f"Resync: {len(damaged)} unchanged file(s) differ at destination - copying them again",
+                     {"damaged": damaged[:100]})
+    to_copy = diff.to_copy
+    copy_bytes = sum(source_scan[rel][0] for rel in to_copy)
+
+    transfer.file_count = len(source_scan)
+    transfer.file_size = sum(size for size, _ in source_scan.values())
+    transfer.status = TransferStatus.VALIDATING
+    db.commit()
+
+    log_event(db, transfer_id, AuditEventType.TRANSFER_STARTED,
+             f"Resync against transfer {previous.transfer_id}: {len(diff.added)} added, "
+             f"{len(diff.changed)} changed, {len(diff.removed)} removed, {len(diff.unchanged)} unchanged",
+             {"resync": diff.summary(), "previous_transfer_id": previous.transfer_id, "copy_bytes": copy_bytes})
 
-                dest_file.write(chunk)
-                bytes_copied += len(chunk)
+    space_reservation = reserve_disk_space(os.path.join(dest_root, ""), transfer_id, copy_bytes)
+    durability = get_durability(dest_root)
+    shaper = RateShaper(transfer_id, [source_root, dest_root], transfer.max_mbps)
+    live = get_live_progress(transfer)
+    try:
+        transfer.status = TransferStatus.COPYING
+        transfer.started_at = datetime.now(timezone.utc)
+        db.commit()
 
-                # Progress callback
+        entries = {rel: list(previous.entries[rel]) for rel in diff.unchanged}
+        copied_bytes = 0
+        touched_dirs = set()
+
+        for relpath in to_copy:
+            src = os.path.join(source_root, relpath)
+            dst = os.path.join(dest_root, relpath)
+            temp_path = f"{dst}.ketter-part"
+            size, mtime_ns = source_scan[relpath]
+            done_before = copied_bytes
+
+            def update_progress(bytes_done, total_bytes):
+                transferred = done_before + bytes_done
+                shaper(transferred, copy_bytes)
+                space_reservation.written(transferred)
+                live.update(
+                    bytes_transferred=transferred,
+                    progress_percent=int(transferred * 100 / copy_bytes) if copy_bytes else 100,
+                    rate_allowed_mbps=shaper.allowed_mbps,
+                    rate_achieved_mbps=shaper.achieved_mbps
+                )
                 if progress_callback:
-                    progress_callback(bytes_copied, file_size)
+                    progress_callback(transferred, copy_bytes)
+                if heartbeat_callback:
+                    heartbeat_callback(transferred, copy_bytes)
 
-    return bytes_copied
+            source_hasher = new_hasher(FINAL_ALGORITHM)
+            try:
+                written = copy_file_with_progress(
+                    src, temp_path, progress_callback=update_progress, durability=durability,
+                    hasher=source_hasher,
+                    allocation_callback=lambda nbytes: space_reservation.written(done_before + nbytes)
+                )
+                dest_hash, _ = calculate_sha256_from_storage(temp_path)
+                if dest_hash != source_hasher.hexdigest():
+                    raise ChecksumMismatchError(
+                        f"Checksum mismatch on {relpath}! "
+                        f"Source: {source_hasher.hexdigest()}, Destination: {dest_hash}"
+                    )
+                os.replace(temp_path, dst)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            touched_dirs.add(os.path.dirname(dst))
+            # Bytes actually read: a file rewritten since the scan keeps the
+            # scanned mtime and is copied again next run
+            entries[relpath] = [written, mtime_ns, dest_hash]
+            copied_bytes += written
+
+        deleted = 0
+        if transfer.delete_removed:
+            for relpath in diff.removed:
+                path = os.path.join(dest_root, relpath)
+                if os.path.isfile(path):
+                    os.remove(path)
+                    touched_dirs.add(os.path.dirname(path))
+                    deleted += 1
+
+        if durability == "full":
+            for directory in sorted(touched_dirs):
+                fsync_directory(directory)
+
+        # Folder-level verification: every entry is on the destination with
+        # its size. Copied files were hash-checked from storage above;
+        # unchanged ones were re-hashed (full) or checked in the run that
+        # copied them (manifest)
+        transfer.status = TransferStatus.VERIFYING
+        db.commit()
+
+        missing = [rel for rel, entry in entries.items()
+                   if not os.path.isfile(os.path.join(dest_root, rel))
+                   or os.path.getsize(os.path.join(dest_root, rel)) != entry[0]]
+        if missing:
+            raise CopyEngineError(
+                f"Resync verification failed: {len(missing)} file(s) missing or resized at destination "
+                f"(first: {missing[0]})"
+            )
+
+        digest = folder_digest(entries)
+        for checksum_type in (ChecksumType.SOURCE, ChecksumType.DESTINATION, ChecksumType.FINAL):
+            db.add(Checksum(
+                transfer_id=transfer_id,
+                checksum_type=checksum_type,
+                algorithm=MANIFEST_ALGORITHM,
+                checksum_value=digest,
+                calculation_duration_seconds=0
+            ))
+        db.add(FolderManifest(
+            transfer_id=transfer_id,
+            source_root=source_root,
+            destination_root=dest_root,
+            file_count=len(entries),
+            total_bytes=sum(entry[0] for entry in entries.values()),
+            digest=digest,
+            entries=entries
+        ))
+        db.commit()
+
+        rehashed = len(to_copy) + (len(diff.unchanged) if RESYNC_VERIFY == "full" else 0)
+        if RESYNC_VERIFY == "full":
+            scope = f"all {len(entries)} file(s) read back from storage"
+        else:
+            scope = (f"manifest-level: {len(to_copy)} copied file(s) read back from storage, "
+                     f"{len(diff.unchanged)} unchanged file(s) size-checked against the previous run")
+        log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
+                 f"Resync verification PASSED ({scope}) - folder digest {digest[:16]}...",
+                 {"folder_digest": digest, "file_count": len(entries), "verify_level": RESYNC_VERIFY,
+                  "rehashed_files": rehashed, "size_checked_files": len(entries) - rehashed,
+                  "damaged_recopied": len(damaged)})
+
+        transfer.status = TransferStatus.COMPLETED
+        transfer.completed_at = datetime.now(timezone.utc)
+        transfer.bytes_transferred = copied_bytes
+        transfer.progress_percent = 100
+        transfer.unzip_completed = 1
+        db.commit()
+
+        duration = (transfer.completed_at - transfer.started_at).total_seconds()
+        log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
+                 f"Folder resync completed in {duration:.1f}s - {len(to_copy)} file(s) copied "
+                 f"({copied_bytes / (1024**2):.1f} MB), {deleted} deleted",
+                 {
+                     "duration_seconds": duration,
+                     "copied_bytes": copied_bytes,
+                     "file_count": len(entries),
+                     "deleted": deleted,
+                     "resync": diff.summary(),
+                     "is_folder_transfer": True
+                 })
+        return transfer
+    finally:
+        space_reservation.release()
 
 
 def transfer_file_with_verification(
     transfer_id: int,
     db: Session,
-    progress_callback: Optional[Callable] = None
+    progress_callback: Optional[Callable] = None,
+    heartbeat_callback: Optional[Callable] = None,
+    defer_verification: Optional[bool] = None
 ) -> Transfer:
     """
     Transfere arquivo com verificação tripla SHA-256
@@ -336,13 +1268,23 @@ def transfer_file_with_verification(
     6. Verifica checksums (FINAL)
     7. Atualiza status para COMPLETED
 
+    Com verificação adiada (KETTER_DEFERRED_VERIFICATION=1), o fluxo para
+    após o passo 4 em COPIED_UNVERIFIED; os passos 5-7 rodam depois em
+    verify_copied_transfer() (job de baixa prioridade).
+
+    Pastas com sync_mode="resync" e um manifesto anterior copiam só os
+    arquivos novos/alterados (ver _resync_folder), sem ZIP.
+
     Args:
         transfer_id: ID da transferência
         db: Database session
         progress_callback: Callback(bytes_done, total_bytes) opcional
+        heartbeat_callback: Callback(done, total) chamado em todo loop de I/O
+            (hash, cópia, zip, unzip) - usado pelo stall detector do worker
+        defer_verification: Override de KETTER_DEFERRED_VERIFICATION
 
     Returns:
-        Transfer: Transfer object atualizado
+        Transfer: Transfer object atualizado (COMPLETED ou COPIED_UNVERIFIED)
 
     Raises:
         ValueError: Se transfer não existe ou status inválido
@@ -360,28 +1302,41 @@ def transfer_file_with_verification(
 
     # ENHANCE #2: Concurrent MOVE protection - Acquire exclusive lock for MOVE mode
     # Prevents two jobs from processing the same MOVE transfer simultaneously
-    lock_acquired = False
+    # The lock is a fenced Redis lease (see app.services.transfer_lock): it is
+    # renewed while the transfer runs and its token is re-checked before the
+    # source is deleted.
+    move_lease = None
     if transfer.operation_mode == "move":
         print(f"[Transfer {transfer_id}] MOVE mode detected - Acquiring exclusive lock...")
-        lock_acquired = acquire_transfer_lock(db, transfer_id, timeout_seconds=30)
+        move_lease = acquire_transfer_lock(db, transfer_id, timeout_seconds=30)
 
-        if not lock_acquired:
+        if move_lease is None:
             # Another job is already processing this transfer
             error_msg = f"Could not acquire lock for MOVE transfer (timeout). Another job may be processing this transfer."
             print(f"[Transfer {transfer_id}] {error_msg}")
 
-            transfer.status = TransferStatus.FAILED
-            transfer.error_message = error_msg
-            db.commit()
+            # Only fail a transfer nobody started; never overwrite the holder's status
+            db.refresh(transfer)
+            if transfer.status == TransferStatus.PENDING:
+                transfer.status = TransferStatus.FAILED
+                transfer.error_message = error_msg
+                db.commit()
 
             log_event(db, transfer_id, AuditEventType.ERROR,
                      f"Lock acquisition timeout: {error_msg}")
 
             raise CopyEngineError(error_msg)
 
-        print(f"[Transfer {transfer_id}] Exclusive lock acquired for MOVE mode")
+        # A concurrent job may have finished this transfer while we waited for the lease
+        db.refresh(transfer)
+        if transfer.status != TransferStatus.PENDING:
+            release_transfer_lock(db, move_lease)
+            raise ValueError(f"Transfer {transfer_id} is not pending (status: {transfer.status})")
+
+        print(f"[Transfer {transfer_id}] Exclusive lock acquired for MOVE mode (fence token {move_lease.token})")
         log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                 "Exclusive lock acquired for MOVE mode (concurrent protection)")
+                 "Exclusive lock acquired for MOVE mode (concurrent protection)",
+                 metadata={"fence_token": move_lease.token})
 
     # SECURITY VALIDATION (Defense in Depth - ENHANCE #1)
     # Double-check paths even though they were validated at API level
@@ -406,8 +1361,10 @@ def transfer_file_with_verification(
         log_event(db, transfer_id, AuditEventType.ERROR,
                  f"Path security violation: {str(e)}")
 
+        release_transfer_lock(db, move_lease)
         raise CopyEngineError(f"Path security validation failed: {e}")
 
+    space_reservation = None
     try:
         # Week 5: Check if source is a folder (ZIP Smart)
         is_folder = is_directory(transfer.source_path)
@@ -423,6 +1380,27 @@ def transfer_file_with_verification(
             log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
                      f"Folder detected: {transfer.source_path}")
 
+            # Resync mode: with a previous manifest copy only what changed,
+            # otherwise run the full transfer and record the baseline.
+            # MOVE empties the source, so there is nothing to resync against.
+            if transfer.sync_mode == "resync" and transfer.operation_mode != "move":
+                source_scan = scan_folder(transfer.source_path)  # stat before any read
+                previous = _previous_manifest(db, transfer)
+                if previous is not None:
+                    return _resync_folder(db, transfer, previous, source_scan,
+                                          progress_callback, heartbeat_callback)
+                db.add(FolderManifest(
+                    transfer_id=transfer_id,
+                    source_root=transfer.source_path,
+                    destination_root=transfer.destination_path,
+                    file_count=len(source_scan),
+                    total_bytes=sum(size for size, _ in source_scan.values()),
+                    entries={rel: [size, mtime_ns, None] for rel, (size, mtime_ns) in source_scan.items()}
+                ))
+                db.commit()
+                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                         "Resync: no previous manifest for this destination - full transfer")
+
             # Count files in folder
             file_count, folder_size = count_files_recursive(transfer.source_path)
             transfer.file_count = file_count
@@ -441,24 +1419,43 @@ def transfer_file_with_verification(
             transfer.zip_file_path = zip_path
             db.commit()
 
+            # Slow-link volumes may ask for adaptive per-entry compression
+            zip_compression = get_zip_compression(transfer.destination_path)
             log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                     f"Zipping folder (STORE mode - no compression)...")
+                     "Zipping folder (adaptive compression)..." if zip_compression == "adaptive"
+                     else "Zipping folder (STORE mode - no compression)...")
 
             # ZIP folder with progress tracking
             def zip_progress(files_done, total_files, current_file):
                 percent = int((files_done / total_files) * 100) if total_files > 0 else 0
-                transfer.progress_percent = percent // 2  # First half of progress
-                db.commit()
+                get_live_progress(transfer).update(progress_percent=percent // 2)  # First half of progress
+                if heartbeat_callback:
+                    heartbeat_callback(files_done, total_files)
 
-            zip_folder_smart(transfer.source_path, zip_path, progress_callback=zip_progress)
+            zip_folder_smart(transfer.source_path, zip_path, progress_callback=zip_progress,
+                             compression=zip_compression)
             zip_created = True
 
             # Validate ZIP integrity
             if not validate_zip_integrity(zip_path):
                 raise CopyEngineError("ZIP file validation failed")
 
+            zip_metadata = None
+            if zip_compression == "adaptive":
+                zip_info = get_zip_info(zip_path)
+                compressed = [name for name, decision in zip_info['decisions'].items()
+                              if not decision.startswith("store")]
+                zip_metadata = {
+                    "compression": zip_compression,
+                    "entries_compressed": len(compressed),
+                    "entries_stored": zip_info['file_count'] - len(compressed),
+                    "saved_percent": round(zip_info['compression_ratio'], 1)
+                }
             log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                     f"Folder zipped successfully: {format_file_count(file_count)}")
+                     f"Folder zipped successfully: {format_file_count(file_count)}"
+                     + (f" ({zip_metadata['entries_compressed']} entries compressed, "
+                        f"{zip_metadata['saved_percent']}% saved)" if zip_metadata else ""),
+                     zip_metadata)
 
             # Update source to ZIP file for transfer
             actual_source_path = zip_path
@@ -472,12 +1469,24 @@ def transfer_file_with_verification(
         # Log: validation started
         log_event(db, transfer_id, AuditEventType.TRANSFER_STARTED, "Starting validation")
 
-        # 2. Check disk space (use actual size - ZIP if folder, file if file)
-        check_disk_space(transfer.destination_path, transfer.file_size)
+        # Destination volume served by a transfer agent (TRANSFER_NODE_MODE):
+        # stream the file to it instead of writing through a local mount.
+        # Folders keep the local ZIP path (they are unzipped here).
+        remote_agent = agent_for_path(transfer.destination_path) if not is_folder else None
 
-        # Log: space validated
-        log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                 f"Disk space validated ({transfer.file_size / (1024**3):.2f} GB required)")
+        # Bandwidth shaping: transfer and volume limits (re-read while running)
+        # paced from every byte loop below (source hash, copy, read-back)
+        shaper = RateShaper(transfer_id, [transfer.source_path, transfer.destination_path], transfer.max_mbps)
+        shaped_heartbeat = shaper.wrap(heartbeat_callback)
+
+        # 2. Reserve disk space (use actual size - ZIP if folder, file if file)
+        # (an agent checks the space on its own volume)
+        if remote_agent is None:
+            space_reservation = reserve_disk_space(transfer.destination_path, transfer_id, transfer.file_size)
+
+            # Log: space validated
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     f"Disk space validated ({transfer.file_size / (1024**3):.2f} GB required)")
 
         # 3. Calculate SOURCE checksum
         transfer.status = TransferStatus.VERIFYING
@@ -488,22 +1497,47 @@ def transfer_file_with_verification(
 
         start_time = datetime.now(timezone.utc)
         # Use actual_source_path (ZIP if folder, original file if file)
-        source_hash = calculate_sha256(actual_source_path)
+        # Large files (opt-in): tree hash in the same read as the flat SHA-256
+        # In-flight algorithm: CHECKSUM_ALGORITHM (the tree is always SHA-256)
+        source_tree = None
+        if TREE_HASH_ENABLED and transfer.file_size >= TREE_HASH_MIN_BYTES:
+            algorithm = FINAL_ALGORITHM
+            source_tree, source_hash = tree_hash(
+                actual_source_path, progress_callback=shaped_heartbeat, with_flat=True
+            )
+        else:
+            # Agent streams are checked end to end with SHA-256
+            algorithm = FINAL_ALGORITHM if remote_agent else get_checksum_algorithm()
+            source_hash = calculate_checksum(actual_source_path, algorithm, progress_callback=shaped_heartbeat)
         calc_duration = int((datetime.now(timezone.utc) - start_time).total_seconds())
 
         # Save SOURCE checksum
         source_checksum = Checksum(
             transfer_id=transfer_id,
             checksum_type=ChecksumType.SOURCE,
+            algorithm=algorithm,
             checksum_value=source_hash,
             calculation_duration_seconds=calc_duration
         )
         db.add(source_checksum)
+        if source_tree is not None:
+            db.add(_tree_row(transfer_id, ChecksumType.SOURCE, source_tree))
+            # Root as a Checksum too: the DESTINATION row of a tree verify is a root
+            db.add(Checksum(
+                transfer_id=transfer_id,
+                checksum_type=ChecksumType.SOURCE,
+                algorithm=TREE_ALGORITHM,
+                checksum_value=source_tree.root,
+                calculation_duration_seconds=calc_duration
+            ))
         db.commit()
 
+        source_metadata = {"checksum": source_hash, "algorithm": algorithm, "duration": calc_duration}
+        if source_tree is not None:
+            source_metadata["tree"] = {"root": source_tree.root, "chunks": len(source_tree.leaves)}
         log_event(db, transfer_id, AuditEventType.CHECKSUM_CALCULATED,
-                 f"Source checksum: {source_hash[:16]}... ({calc_duration}s)",
-                 {"checksum": source_hash, "duration": calc_duration})
+                 f"Source checksum ({algorithm}): {source_hash[:16]}... ({calc_duration}s)",
+                 source_metadata)
 
         # 4. Copy file
         transfer.status = TransferStatus.COPYING
@@ -512,184 +1546,141 @@ def transfer_file_with_verification(
         log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
                  f"Copying {transfer.file_name} ({transfer.file_size / (1024**3):.2f} GB)...")
 
+        # Live progress goes to Redis; the row gets it with the next status change
+        live = get_live_progress(transfer)
+
+        # Bytes on disk leave the space reservation (statvfs already counts
+        # them). A folder's ZIP keeps it: the extracted tree needs the room again.
+        on_disk = space_reservation.written if space_reservation is not None and not is_folder else None
+
         def update_progress(bytes_done, total_bytes):
-            percent = int((bytes_done / total_bytes) * 100)
-            transfer.bytes_transferred = bytes_done
-            transfer.progress_percent = percent
-            db.commit()
+            shaper(bytes_done, total_bytes)
+            if on_disk:
+                on_disk(bytes_done)
+            live.update(
+                bytes_transferred=bytes_done,
+                progress_percent=int((bytes_done / total_bytes) * 100),
+                rate_allowed_mbps=shaper.allowed_mbps,
+                rate_achieved_mbps=shaper.achieved_mbps
+            )
             if progress_callback:
                 progress_callback(bytes_done, total_bytes)
+            if heartbeat_callback:
+                heartbeat_callback(bytes_done, total_bytes)
 
         # Copy file (ZIP if folder, file if file)
         # For folder: destination will be the ZIP, we'll unzip after verification
-        dest_for_copy = transfer.destination_path
-        if is_folder:
-            # If folder transfer, destination should be ZIP first
-            dest_folder_name = os.path.basename(transfer.original_folder_path.rstrip('/'))
-            dest_zip_filename = f"{dest_folder_name}.zip"
-            dest_parent = os.path.dirname(transfer.destination_path)
-            dest_for_copy = os.path.join(dest_parent, dest_zip_filename)
-
-        bytes_copied = copy_file_with_progress(
-            actual_source_path,
-            dest_for_copy,
-            progress_callback=update_progress
-        )
-
-        log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                 f"File copied: {bytes_copied} bytes")
-
-        # 5. Calculate DESTINATION checksum
-        transfer.status = TransferStatus.VERIFYING
-        db.commit()
-
-        log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS, "Calculating destination checksum...")
-
-        start_time = datetime.now(timezone.utc)
-        # Calculate checksum of copied file (ZIP if folder)
-        dest_hash = calculate_sha256(dest_for_copy)
-        calc_duration = int((datetime.now(timezone.utc) - start_time).total_seconds())
-
-        # Save DESTINATION checksum
-        dest_checksum = Checksum(
-            transfer_id=transfer_id,
-            checksum_type=ChecksumType.DESTINATION,
-            checksum_value=dest_hash,
-            calculation_duration_seconds=calc_duration
-        )
-        db.add(dest_checksum)
-        db.commit()
-
-        log_event(db, transfer_id, AuditEventType.CHECKSUM_CALCULATED,
-                 f"Destination checksum: {dest_hash[:16]}... ({calc_duration}s)",
-                 {"checksum": dest_hash, "duration": calc_duration})
-
-        # 6. FINAL verification - Compare checksums
-        if source_hash != dest_hash:
-            transfer.status = TransferStatus.FAILED
-            transfer.error_message = f"Checksum mismatch! Source: {source_hash[:16]}..., Dest: {dest_hash[:16]}..."
-            db.commit()
-
-            log_event(db, transfer_id, AuditEventType.ERROR,
-                     f"CHECKSUM MISMATCH! Transfer failed.",
-                     {"source_checksum": source_hash, "dest_checksum": dest_hash})
-
-            raise ChecksumMismatchError(
-                f"Checksum verification failed! "
-                f"Source: {source_hash}, "
-                f"Destination: {dest_hash}"
+        dest_for_copy = destination_copy_path(transfer, is_folder)
+
+        # Durability: files are synced right after the copy; a folder's ZIP is
+        # scratch, its extracted tree is synced once after unzip (batched)
+        durability = get_durability(transfer.destination_path)
+
+        # Non-SHA-256 in-flight algorithm: the FINAL SHA-256 is computed from
+        # the bytes as they are copied (no extra read)
+        final_hasher = new_hasher(FINAL_ALGORITHM) if algorithm != FINAL_ALGORITHM else None
+
+        # Delta sync (opt-in): the file already exists at the destination,
+        # write only the changed ranges; too different -> plain copy
+        delta = None
+        remote = None
+        if remote_agent is not None:
+            agent_host, agent_port = remote_agent
+            remote = send_file_sync(
+                agent_host, agent_port, actual_source_path, dest_for_copy, source_hash,
+                algorithm=algorithm, progress_callback=update_progress
             )
+        elif DELTA_SYNC_ENABLED and not is_folder and is_delta_candidate(actual_source_path, dest_for_copy):
+            delta = delta_sync_file(
+                actual_source_path, dest_for_copy, durability,
+                progress_callback=update_progress, hasher=final_hasher
+            )
+            if delta is None and final_hasher is not None:
+                final_hasher = new_hasher(FINAL_ALGORITHM)  # partially fed by the scan
 
-        # Save FINAL checksum (same as others, confirming match)
-        final_checksum = Checksum(
-            transfer_id=transfer_id,
-            checksum_type=ChecksumType.FINAL,
-            checksum_value=source_hash,  # Same as source/dest
-            calculation_duration_seconds=0  # No calculation, just verification
-        )
-        db.add(final_checksum)
-        db.commit()
-
-        log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
-                 "Triple SHA-256 verification PASSED ",
-                 {"checksum": source_hash})
-
-        # Week 5: If folder transfer, unzip at destination
-        # IMPORTANT: Do unzip BEFORE delete in MOVE mode to ensure integrity
-        if is_folder:
+        if remote is not None:
+            bytes_copied = transfer.file_size
             log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                     f"Unzipping folder at destination...")
-
-            # Unzip with progress tracking
-            def unzip_progress(files_done, total_files, current_file):
-                # Progress is 50-100% (second half)
-                percent = 50 + int((files_done / total_files) * 50) if total_files > 0 else 50
-                transfer.progress_percent = percent
-                db.commit()
-
-            # Unzip to original destination path
-            unzip_folder_smart(dest_for_copy, transfer.destination_path, progress_callback=unzip_progress)
-            transfer.unzip_completed = 1
-            db.commit()
-
+                     f"File streamed to agent {agent_host}:{agent_port}: {remote['bytes_sent']} bytes"
+                     + (f" (resumed at {remote['resumed_from']})" if remote["resumed_from"] else ""),
+                     {"agent": f"{agent_host}:{agent_port}", "resumed_from": remote["resumed_from"],
+                      "bytes_sent": remote["bytes_sent"]})
+        elif delta is not None:
+            bytes_copied = transfer.file_size
             log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                     f"Folder unzipped successfully: {format_file_count(transfer.file_count)}")
-
-            # Cleanup temporary ZIP files
-            if zip_created and transfer.zip_file_path:
-                cleanup_zip_file(transfer.zip_file_path)  # Source ZIP
-                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                         "Cleaned up temporary ZIP files")
-
-            if dest_for_copy and os.path.exists(dest_for_copy):
-                cleanup_zip_file(dest_for_copy)  # Destination ZIP
-
-        # Week 6: MOVE mode - Delete source AFTER unzip to ensure data integrity
-        # Only delete if unzip succeeded (if folder) or copy verified (if file)
-        if transfer.operation_mode == "move":
-            try:
-                # ENHANCE #4: Post-verification check before deletion
-                # Verify destination is actually readable before deleting source
-                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                         "MOVE mode: Verifying destination is readable before deletion...")
-
-                dest_to_verify = transfer.destination_path
-                size_to_verify = transfer.file_size
-
-                # For file transfers, verify the copied file
-                # For folder transfers, verify the unzipped folder
-                verify_destination_readable(dest_to_verify, is_folder, size_to_verify)
-
-                log_event(db, transfer_id, AuditEventType.CHECKSUM_VERIFIED,
-                         "Destination verified as readable and intact (post-verification check)")
-
-                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                         "MOVE mode: Deleting source after verification...")
-
-                # FIXED: More explicit logic for clarity and maintainability
-                if is_folder:
-                    # For folder transfer: delete contents, preserve folder structure
-                    delete_source_after_move(transfer.original_folder_path, is_folder=True)
-                else:
-                    # For file transfer: delete the file itself
-                    delete_source_after_move(transfer.source_path, is_folder=False)
-
-                log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
-                         "Source deleted successfully (MOVE mode)")
-            except CopyEngineError as e:
-                log_event(db, transfer_id, AuditEventType.ERROR,
-                         f"Failed to delete source in MOVE mode: {str(e)}")
-                raise
-
-        # 7. Complete transfer
-        transfer.status = TransferStatus.COMPLETED
-        transfer.completed_at = datetime.now(timezone.utc)
-        transfer.progress_percent = 100
-        db.commit()
+                     f"File delta-synced: {delta['literal_bytes']} changed bytes written "
+                     f"({delta['matched_bytes']} reused, {delta['mode']})",
+                     {"durability": durability, "delta": delta})
+        else:
+            # Network volumes: several ranged streams hide per-request latency
+            # (a shaped copy stays sequential: ranged streams are not paced)
+            streams, stream_key = plan_streams(actual_source_path, dest_for_copy, transfer.file_size)
+            if shaper.limited:
+                streams = 1
+            copy_metadata = {"durability": durability, "streams": streams}
+            if streams > 1:
+                copy_started = time.monotonic()
+                bytes_copied, leaves = multistream_copy(
+                    actual_source_path,
+                    dest_for_copy,
+                    streams,
+                    range_size=source_tree.chunk_size if source_tree is not None else RANGE_BYTES,
+                    progress_callback=update_progress,
+                    durability="none" if is_folder else durability,
+                    hasher=final_hasher,
+                    with_leaves=source_tree is not None,
+                    allocation_callback=on_disk
+                )
+                copy_seconds = time.monotonic() - copy_started
+                record_throughput(stream_key, streams, bytes_copied, copy_seconds)
+                copy_metadata["copy_mbps"] = round(bytes_copied / (1024**2) / copy_seconds, 1) if copy_seconds > 0 else None
 
-        duration = (transfer.completed_at - transfer.started_at).total_seconds()
-        speed_mbps = (transfer.file_size / (1024**2)) / duration if duration > 0 else 0
+                # Leaves of the bytes just copied vs the SOURCE tree: the
+                # source changed after it was hashed
+                if leaves is not None and leaves != source_tree.leaves:
+                    raise CopyEngineError(
+                        "Source changed during transfer: copied chunks differ from the SOURCE tree hash"
+                    )
+            else:
+                bytes_copied = copy_file_with_progress(
+                    actual_source_path,
+                    dest_for_copy,
+                    progress_callback=update_progress,
+                    durability="none" if is_folder else durability,
+                    hasher=final_hasher,
+                    allocation_callback=on_disk
+                )
 
-        if is_folder:
-            log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
-                     f"Folder transfer completed successfully in {duration:.1f}s ({speed_mbps:.2f} MB/s) - {format_file_count(transfer.file_count)}",
-                     {
-                         "duration_seconds": duration,
-                         "speed_mbps": speed_mbps,
-                         "file_size": transfer.file_size,
-                         "file_count": transfer.file_count,
-                         "is_folder_transfer": True
-                     })
-        else:
-            log_event(db, transfer_id, AuditEventType.TRANSFER_COMPLETED,
-                     f"Transfer completed successfully in {duration:.1f}s ({speed_mbps:.2f} MB/s)",
-                     {
-                         "duration_seconds": duration,
-                         "speed_mbps": speed_mbps,
-                         "file_size": transfer.file_size
-                     })
+            if shaper.limited:
+                copy_metadata["rate"] = shaper.report()
+            log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
+                     f"File copied: {bytes_copied} bytes" + (f" ({streams} streams)" if streams > 1 else ""),
+                     copy_metadata)
+
+        final_hash = source_hash
+        if final_hasher is not None:
+            final_hash = final_hasher.hexdigest()
+            db.add(Checksum(
+                transfer_id=transfer_id,
+                checksum_type=ChecksumType.SOURCE,
+                algorithm=FINAL_ALGORITHM,
+                checksum_value=final_hash,
+                calculation_duration_seconds=0
+            ))
+            db.commit()
 
-        return transfer
+        # Deferred verification (opt-in): free the worker now and verify the
+        # destination in a low-priority job (see verify_copied_transfer)
+        if defer_verification is None:
+            defer_verification = DEFERRED_VERIFICATION
+        if defer_verification and remote is None:
+            return _defer_verification(db, transfer)
+
+        return _verify_and_complete(
+            db, transfer, source_hash, dest_for_copy, is_folder, durability,
+            move_lease, shaped_heartbeat, algorithm=algorithm, final_hash=final_hash,
+            remote=remote, rate_limited=shaper.limited
+        )
 
     except Exception as e:
         # ENHANCE #3: Comprehensive rollback on error
@@ -757,11 +1748,15 @@ def transfer_file_with_verification(
         raise CopyEngineError(f"Transfer failed and rolled back: {str(e)}") from e
 
     finally:
+        # Return reserved bytes to the space ledger (completed or failed)
+        if space_reservation is not None:
+            space_reservation.release()
+
         # ENHANCE #2: Release lock if acquired for MOVE mode
-        if lock_acquired:
+        if move_lease is not None:
             try:
                 print(f"[Transfer {transfer_id}] Releasing exclusive lock for MOVE mode...")
-                release_transfer_lock(db, transfer_id)
+                release_transfer_lock(db, move_lease)
                 print(f"[Transfer {transfer_id}] Lock released successfully")
 
                 log_event(db, transfer_id, AuditEventType.TRANSFER_PROGRESS,
@@ -0,0 +1,493 @@
+"""
+Ketter 3.0 - Low-level File I/O
+Preallocation, sparse extents, durability and cache-bypassing reads
+
+MRC Principles:
+- Simple: plain os/ctypes calls, no extra dependencies
+- Reliable: every optimization degrades to the plain sequential copy
+- Explicit: out-of-space is reported before the first byte is written
+
+Preallocation uses fallocate(2) instead of os.posix_fallocate: when the
+filesystem lacks native support (NFS v3, SMB, some FUSE NAS clients)
+glibc's posix_fallocate emulates it by writing every block, which would
+add a full extra write pass over the network. fallocate(2) fails with
+EOPNOTSUPP instead and the copy just proceeds without preallocation.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import mmap
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+PREALLOCATE_ENABLED = os.getenv("KETTER_PREALLOCATE", "1") == "1"
+
+# Errors meaning "not supported here", not "no space"
+_UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL, errno.ENOTTY}
+
+_fallocate = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        _fallocate = getattr(_libc, "fallocate64", None) or _libc.fallocate
+        _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+        _fallocate.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _fallocate = None
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """
+    Reserve size bytes of disk blocks for an open destination file
+
+    Allocating the whole file up front gives the filesystem a chance to lay
+    it out contiguously (less fragmentation on busy NAS volumes, faster
+    reads later) and makes ENOSPC happen now instead of halfway through.
+
+    Args:
+        fd: Destination file descriptor (opened for writing)
+        size: Final file size in bytes
+
+    Returns:
+        bool: True if preallocated, False if unsupported/disabled
+
+    Raises:
+        OSError: ENOSPC / EDQUOT (not enough space) or other real I/O errors
+    """
+    if not PREALLOCATE_ENABLED or size <= 0:
+        return False
+
+    if _fallocate is not None:
+        if _fallocate(fd, 0, 0, size) == 0:
+            return True
+        err = ctypes.get_errno()
+        if err in _UNSUPPORTED_ERRNOS:
+            return False
+        raise OSError(err, os.strerror(err))
+
+    # Non-Linux: only use posix_fallocate where the platform has it natively
+    return False
+
+
+def is_sparse(path: str) -> bool:
+    """True if the file occupies fewer blocks than its logical size"""
+    st = os.stat(path)
+    blocks = getattr(st, "st_blocks", None)
+    return blocks is not None and blocks * 512 < st.st_size
+
+
+def data_extents(fd: int, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    (start, end) byte ranges that hold data, skipping holes
+
+    Uses lseek(SEEK_DATA/SEEK_HOLE) and returns the full list up front: the
+    probing moves the fd offset, so it must finish before buffered reads
+    on the same file start. Returns None when the platform or filesystem
+    does not support it (caller copies densely instead).
+    """
+    if not hasattr(os, "SEEK_DATA") or size <= 0:
+        return None
+
+    extents = []
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                break  # Only a hole remains
+            if e.errno in _UNSUPPORTED_ERRNOS and not extents:
+                return None
+            raise
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        extents.append((data, hole))
+        offset = hole
+
+    os.lseek(fd, 0, os.SEEK_SET)
+    return extents
+
+
+# ============================================================================
+# Durability
+# ============================================================================
+#
+# Levels (each includes the previous one):
+#   none        - leave flushing to the kernel (fastest, not crash-safe)
+#   fsync       - fdatasync the destination before it is verified
+#   writebehind - also start writeback every KETTER_WRITEBEHIND_MB while
+#                 copying (sync_file_range), so dirty pages never pile up
+#                 and the final fdatasync is short
+#   full        - also fsync the parent directory so the file's directory
+#                 entry survives a power loss
+#
+# A single fdatasync/syncfs can block for minutes (lots of dirty pages, a
+# slow NAS). With a heartbeat the flush runs in a helper thread and the
+# caller keeps the stall detector fed until it returns; after
+# KETTER_SYNC_MAX_SECONDS the beats stop, so a flush hung on a dead server
+# still trips the detector.
+
+DURABILITY_LEVELS = ("none", "fsync", "writebehind", "full")
+DEFAULT_DURABILITY = os.getenv("KETTER_DURABILITY", "full")
+WRITEBEHIND_WINDOW_BYTES = int(os.getenv("KETTER_WRITEBEHIND_MB", "32")) * 1024 * 1024
+SYNC_BEAT_SECONDS = 5
+SYNC_MAX_SECONDS = int(os.getenv("KETTER_SYNC_MAX_SECONDS", "3600"))
+
+SYNC_FILE_RANGE_WAIT_BEFORE = 1
+SYNC_FILE_RANGE_WRITE = 2
+SYNC_FILE_RANGE_WAIT_AFTER = 4
+
+_sync_file_range = None
+_syncfs = None
+if sys.platform.startswith("linux"):
+    try:
+        _sync_file_range = _libc.sync_file_range
+        _sync_file_range.argtypes = [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_uint]
+        _sync_file_range.restype = ctypes.c_int
+        _syncfs = _libc.syncfs
+        _syncfs.argtypes = [ctypes.c_int]
+        _syncfs.restype = ctypes.c_int
+    except (NameError, AttributeError):
+        _sync_file_range = None
+        _syncfs = None
+
+
+def get_durability(path: str) -> str:
+    """
+    Durability level for a destination path
+
+    The configured volume's `durability` (ketter.config.yml) wins over
+    KETTER_DURABILITY, so each volume can use the level its benchmark
+    justifies (scripts/bench_durability.py).
+    """
+    from app.config import get_config
+
+    volume = get_config().get_volume_for_path(path)
+    level = (volume.durability if volume is not None and volume.durability else DEFAULT_DURABILITY)
+    if level not in DURABILITY_LEVELS:
+        raise ValueError(f"Unknown durability level '{level}' (expected one of {', '.join(DURABILITY_LEVELS)})")
+    return level
+
+
+class WriteBehind:
+    """
+    Rolling writeback for one file being written sequentially
+
+    After each window is written its writeback is started (non-blocking)
+    and the window before it is waited for, so at most two windows of
+    dirty pages exist at any time.
+    """
+
+    def __init__(self, fd: int, window: int = WRITEBEHIND_WINDOW_BYTES):
+        self.fd = fd
+        self.window = window
+        self.started_to = 0
+        self.previous: Optional[Tuple[int, int]] = None
+
+    def written(self, position: int) -> None:
+        if _sync_file_range is None or position - self.started_to < self.window:
+            return
+        start, length = self.started_to, position - self.started_to
+        _sync_file_range(self.fd, start, length, SYNC_FILE_RANGE_WRITE)
+        if self.previous is not None:
+            _sync_file_range(
+                self.fd, self.previous[0], self.previous[1],
+                SYNC_FILE_RANGE_WAIT_BEFORE | SYNC_FILE_RANGE_WRITE | SYNC_FILE_RANGE_WAIT_AFTER
+            )
+        self.previous = (start, length)
+        self.started_to = position
+
+
+def call_with_heartbeat(heartbeat: Optional[Callable[[], None]], fn: Callable, *args):
+    """
+    fn(*args), calling heartbeat() every SYNC_BEAT_SECONDS while it blocks
+
+    Without a heartbeat fn runs inline. Exceptions from fn are re-raised
+    in the caller; so is anything heartbeat() raises (a detected stall).
+    """
+    if heartbeat is None:
+        return fn(*args)
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn(*args)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, name="ketter-sync", daemon=True)
+    started = time.monotonic()
+    worker.start()
+    while True:
+        worker.join(SYNC_BEAT_SECONDS)
+        if not worker.is_alive():
+            break
+        if time.monotonic() - started < SYNC_MAX_SECONDS:
+            heartbeat()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+def _fdatasync(fd: int) -> None:
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def sync_file(fd: int, level: str, heartbeat: Optional[Callable[[], None]] = None) -> None:
+    """Flush file data to stable storage for every level except none"""
+    if level == "none":
+        return
+    call_with_heartbeat(heartbeat, _fdatasync, fd)
+
+
+def fsync_directory(path: str) -> None:
+    """fsync a directory so entries created in it are durable"""
+    flags = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # Some filesystems (SMB, some FUSE) reject fsync on directories
+        if e.errno not in _UNSUPPORTED_ERRNOS and e.errno != errno.EBADF:
+            raise
+    finally:
+        os.close(fd)
+
+
+def sync_filesystem(path: str) -> None:
+    """
+    Flush everything dirty on the filesystem holding path in one call
+
+    Batches durability for folder transfers: one syncfs() after all files
+    are written instead of one fsync per file. Falls back to sync().
+    """
+    if _syncfs is not None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if _syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+    os.sync()
+
+
+def sync_tree(path: str, level: str, heartbeat: Optional[Callable[[], None]] = None) -> None:
+    """Make a freshly written folder durable (batched: one syncfs)"""
+    if level == "none":
+        return
+    call_with_heartbeat(heartbeat, sync_filesystem, path)
+    if level == "full":
+        fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+# ============================================================================
+# Cache-bypassing reads (destination verification)
+# ============================================================================
+#
+# Reading a file right after writing it is served from the page cache, so
+# its checksum proves the bytes in RAM, not on the storage. Modes:
+#   dontneed - fdatasync, then posix_fadvise(DONTNEED) before and while
+#              reading, so every page comes from the device (or NAS server)
+#   direct   - O_DIRECT reads into page-aligned buffers (falls back to
+#              dontneed where the filesystem rejects O_DIRECT, e.g. tmpfs)
+#   off      - plain buffered reads
+# macOS has neither; F_NOCACHE is used there instead.
+
+VERIFY_CACHE_MODE = os.getenv("KETTER_VERIFY_CACHE_MODE", "dontneed")
+VERIFY_CHUNK_BYTES = int(os.getenv("KETTER_VERIFY_CHUNK_MB", "8")) * 1024 * 1024
+
+_F_NOCACHE = 48  # fcntl.h on macOS
+
+
+class StorageReader:
+    """
+    Sequential reader that bypasses (or drops) the page cache
+
+    Usage:
+        reader = StorageReader(path)
+        for chunk in reader.chunks():
+            digest.update(chunk)
+        reader.mode, reader.read_throughput_bps
+
+    Chunks are only valid until the next iteration (buffers are reused).
+    """
+
+    def __init__(self, path: str, mode: Optional[str] = None, chunk_size: int = VERIFY_CHUNK_BYTES,
+                 heartbeat: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.requested_mode = mode or VERIFY_CACHE_MODE
+        self.heartbeat = heartbeat  # Fed while the initial flush blocks
+        self.mode = "off"
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+    @property
+    def read_throughput_bps(self) -> float:
+        return self.bytes_read / self.read_seconds if self.read_seconds > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "cache_mode": self.mode,
+            "bytes_read": self.bytes_read,
+            "read_seconds": round(self.read_seconds, 3),
+            "read_mbps": round(self.read_throughput_bps / (1024 * 1024), 1),
+        }
+
+    def chunks(self):
+        fd = self._open()
+        try:
+            if self.mode == "direct":
+                yield from self._direct_chunks(fd)
+            else:
+                yield from self._buffered_chunks(fd)
+        finally:
+            os.close(fd)
+
+    def _open(self) -> int:
+        if self.requested_mode == "direct" and hasattr(os, "O_DIRECT"):
+            try:
+                fd = os.open(self.path, os.O_RDONLY | os.O_DIRECT)
+                self.mode = "direct"
+                return fd
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+
+        fd = os.open(self.path, os.O_RDONLY)
+        if self.requested_mode == "off":
+            return fd
+
+        if hasattr(os, "posix_fadvise"):
+            # Dirty pages cannot be dropped: flush them first
+            sync_file(fd, "fsync", heartbeat=self.heartbeat)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            self.mode = "dontneed"
+        elif sys.platform == "darwin":
+            import fcntl
+            os.fsync(fd)
+            fcntl.fcntl(fd, _F_NOCACHE, 1)
+            self.mode = "nocache"
+        return fd
+
+    def _timed_read(self, read):
+        start = time.perf_counter()
+        n = read()
+        self.read_seconds += time.perf_counter() - start
+        self.bytes_read += n
+        return n
+
+    def _buffered_chunks(self, fd: int):
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        offset = 0
+        while True:
+            n = self._timed_read(lambda: os.readv(fd, [view]))
+            if n == 0:
+                return
+            if self.mode == "dontneed":
+                # Also drop what we just read (and its readahead) as we go
+                os.posix_fadvise(fd, offset, n, os.POSIX_FADV_DONTNEED)
+            offset += n
+            yield view[:n]
+
+    def _direct_chunks(self, fd: int):
+        buf = mmap.mmap(-1, self.chunk_size)  # page-aligned, as O_DIRECT requires
+        view = memoryview(buf)
+        offset = 0
+        while True:
+            n = self._timed_read(lambda: os.preadv(fd, [view], offset))
+            if n == 0:
+                return
+            offset += n
+            yield view[:n]
+            if n < self.chunk_size:
+                return
+
+
+# ============================================
+# I/O PRIORITY
+# ============================================
+# Deferred verification reads whole destinations back; it runs in the idle
+# I/O class so it only gets the disk when copies are not using it.
+# ioprio_set has no libc wrapper, hence the raw syscall (Linux only).
+
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_SYSCALLS = {
+    "x86_64": (251, 252),
+    "aarch64": (30, 31),
+    "i386": (289, 290),
+    "i686": (289, 290),
+    "armv7l": (314, 315),
+}
+
+_syscall = None
+if sys.platform.startswith("linux"):
+    try:
+        _syscall = _libc.syscall
+        _syscall.restype = ctypes.c_long
+    except (NameError, AttributeError):
+        _syscall = None
+
+
+def _ioprio_syscalls() -> Optional[Tuple[int, int]]:
+    if _syscall is None:
+        return None
+    return _IOPRIO_SYSCALLS.get(os.uname().machine)
+
+
+def get_io_priority() -> Optional[int]:
+    """Current ioprio of this process, or None where unsupported"""
+    numbers = _ioprio_syscalls()
+    if numbers is None:
+        return None
+    value = _syscall(numbers[1], _IOPRIO_WHO_PROCESS, 0)
+    return None if value < 0 else value
+
+
+def set_io_priority(io_class: str, level: int = 7) -> bool:
+    """
+    Set this process' I/O class ("idle", "best-effort", "realtime")
+
+    Returns:
+        bool: False where ioprio is unavailable or refused
+    """
+    numbers = _ioprio_syscalls()
+    if numbers is None:
+        return False
+    value = (IOPRIO_CLASSES[io_class] << _IOPRIO_CLASS_SHIFT) | (0 if io_class == "idle" else level)
+    return _syscall(numbers[0], _IOPRIO_WHO_PROCESS, 0, value) == 0
+
+
+@contextmanager
+def lowered_io_priority(io_class: str = "idle") -> Iterator[bool]:
+    """
+    Run a block in a lower I/O class, restoring the previous priority after
+
+    Yields whether the priority was actually changed (no-op off Linux).
+    """
+    if io_class not in IOPRIO_CLASSES:
+        raise ValueError(f"Unknown I/O class '{io_class}'. Valid: {', '.join(IOPRIO_CLASSES)}")
+
+    previous = get_io_priority()
+    changed = previous is not None and set_io_priority(io_class)
+    try:
+        yield changed
+    finally:
+        if changed:
+            _syscall(_ioprio_syscalls()[0], _IOPRIO_WHO_PROCESS, 0, previous)
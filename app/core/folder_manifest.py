@@ -0,0 +1,215 @@
+"""
+Ketter 3.0 - Folder Manifest
+Per-file listing of a folder transfer, diffed on the next run (resync)
+
+MRC Principles:
+- Simple: path -> [size, mtime_ns, sha256], one JSON row per run
+- Reliable: a file counts as unchanged only if size and mtime match the
+  previous run AND the destination copy still has that size
+- Explicit: the folder digest covers every path, size and hash
+
+Resync (sync_mode="resync" on a folder transfer):
+1. Load the manifest of the last completed run to the same destination
+2. Scan the source (stat only, no reads) and diff: added / changed /
+   removed / unchanged
+3. Copy added + changed files one by one (verified per file), delete
+   removed ones if delete_removed is set
+4. Record the new manifest and its folder-level digest
+
+The stat of a file is taken before it is read, so a file modified while
+it is copied has a newer mtime on the next run and is copied again.
+
+Verification level (KETTER_RESYNC_VERIFY):
+- manifest (default): copied files are re-read from storage; unchanged
+  files are only size-checked and keep the hash the run that copied them
+  read back. The digest is a manifest-level check, reported as such.
+- full: unchanged files are also re-hashed from storage; one that no
+  longer matches its manifest hash is copied again.
+
+Manifest hashes are always read from storage (file_io.StorageReader),
+not from the page cache the copy or unzip just filled.
+"""
+
+import hashlib
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .file_io import StorageReader
+
+MANIFEST_ALGORITHM = "sha256-manifest"
+RESYNC_VERIFY_LEVELS = ("manifest", "full")
+RESYNC_VERIFY = os.getenv("KETTER_RESYNC_VERIFY", "manifest")
+
+# relpath -> [size, mtime_ns, sha256 or None]
+Entries = Dict[str, List]
+
+
+def scan_folder(root: str) -> Dict[str, Tuple[int, int]]:
+    """
+    relpath -> (size, mtime_ns) of every file under root
+
+    Same rules as the ZIP engine: hidden files and directories are skipped.
+    """
+    listing = {}
+    for current, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(current, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # Vanished or unreadable, like count_files_recursive
+            listing[os.path.relpath(path, root)] = (st.st_size, st.st_mtime_ns)
+    return listing
+
+
+def hash_file(path: str, chunk_size: int = 8 * 1024 * 1024,
+              progress_callback: Optional[Callable] = None) -> str:
+    """
+    SHA-256 of a file read from storage (not the page cache)
+
+    progress_callback(bytes_hashed, size) after every chunk.
+    """
+    sha256 = hashlib.sha256()
+    size = os.path.getsize(path)
+    reader = StorageReader(
+        path, chunk_size=chunk_size,
+        heartbeat=(lambda: progress_callback(0, size)) if progress_callback else None
+    )
+    for chunk in reader.chunks():
+        sha256.update(chunk)
+        if progress_callback:
+            progress_callback(reader.bytes_read, size)
+    return sha256.hexdigest()
+
+
+def folder_digest(entries: Entries) -> str:
+    """SHA-256 over the sorted "relpath NUL size NUL sha256" lines"""
+    digest = hashlib.sha256()
+    for relpath in sorted(entries):
+        size, _, file_hash = entries[relpath]
+        digest.update(f"{relpath}\0{size}\0{file_hash}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+class ManifestDiff:
+    """Result of diffing the previous manifest against a fresh source scan"""
+
+    def __init__(self):
+        self.added: List[str] = []
+        self.changed: List[str] = []
+        self.removed: List[str] = []
+        self.unchanged: List[str] = []
+
+    @property
+    def to_copy(self) -> List[str]:
+        return sorted(self.added + self.changed)
+
+    def summary(self) -> dict:
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.removed),
+            "unchanged": len(self.unchanged),
+        }
+
+
+def diff_manifest(
+    previous: Entries,
+    scan: Dict[str, Tuple[int, int]],
+    destination_root: str
+) -> ManifestDiff:
+    """
+    Classify every path of the previous run and of the fresh scan
+
+    A path is unchanged only if size and mtime match the previous run and
+    the destination file still exists with that size; otherwise (edited
+    source, destination deleted or truncated) it is copied again.
+    """
+    diff = ManifestDiff()
+    for relpath in sorted(scan):
+        size, mtime_ns = scan[relpath]
+        old = previous.get(relpath)
+        if old is None:
+            diff.added.append(relpath)
+        elif old[0] != size or old[1] != mtime_ns or old[2] is None:
+            diff.changed.append(relpath)
+        elif _destination_size(destination_root, relpath) != size:
+            diff.changed.append(relpath)
+        else:
+            diff.unchanged.append(relpath)
+    diff.removed = sorted(set(previous) - set(scan))
+    return diff
+
+
+def recheck_unchanged(
+    diff: ManifestDiff,
+    previous: Entries,
+    destination_root: str,
+    progress_callback: Optional[Callable] = None
+) -> List[str]:
+    """
+    KETTER_RESYNC_VERIFY=full: re-hash every unchanged destination file
+    from storage; files whose hash no longer matches the manifest move to
+    diff.changed (copied again)
+
+    Returns:
+        list: relpaths that were found damaged
+    """
+    damaged = []
+    total = len(diff.unchanged)
+    for done, relpath in enumerate(list(diff.unchanged), start=1):
+        actual = hash_file(
+            os.path.join(destination_root, relpath),
+            progress_callback=(lambda *_: progress_callback(done - 1, total)) if progress_callback else None
+        )
+        if actual != previous[relpath][2]:
+            damaged.append(relpath)
+        if progress_callback:
+            progress_callback(done, total)
+
+    for relpath in damaged:
+        diff.unchanged.remove(relpath)
+        diff.changed.append(relpath)
+    diff.changed.sort()
+    return damaged
+
+
+def build_entries(
+    scan: Dict[str, Tuple[int, int]],
+    hash_root: str,
+    progress_callback: Optional[Callable] = None
+) -> Entries:
+    """
+    Manifest entries for a scan, hashing the files under hash_root
+
+    Used after a full folder transfer: the scan is the source stat taken
+    before the ZIP, the hashes come from the verified extracted copy.
+    A file whose copy does not have the scanned size gets no hash, so the
+    next resync copies it again. progress_callback(files_done, total) is
+    also called while a large file is being hashed (stall detector).
+    """
+    entries: Entries = {}
+    total = len(scan)
+    for done, relpath in enumerate(sorted(scan), start=1):
+        size, mtime_ns = scan[relpath]
+        path = os.path.join(hash_root, relpath)
+        file_hash = None
+        if _destination_size(hash_root, relpath) == size:
+            file_hash = hash_file(
+                path,
+                progress_callback=(lambda *_: progress_callback(done - 1, total)) if progress_callback else None
+            )
+        entries[relpath] = [size, mtime_ns, file_hash]
+        if progress_callback:
+            progress_callback(done, total)
+    return entries
+
+
+def _destination_size(root: str, relpath: str) -> Optional[int]:
+    try:
+        return os.path.getsize(os.path.join(root, relpath))
+    except OSError:
+        return None
@@ -0,0 +1,101 @@
+"""
+Ketter 3.0 - Checksum Algorithms
+Registry of hash algorithms for the in-flight SOURCE/DESTINATION check
+
+MRC Principles:
+- Simple: one name -> hashlib-style object (update / hexdigest)
+- Explicit: the algorithm is stored on every Checksum row
+- Reliable: the FINAL record is always SHA-256, whatever runs in-flight
+
+Tiers:
+- sha256   - cryptographic, the default and the FINAL record
+- blake2b  - cryptographic, faster than SHA-256 on CPUs without SHA-NI
+- crc32    - non-cryptographic (zlib), catches accidental corruption only
+- xxh64, xxh3_128 - non-cryptographic at memory-bandwidth speed
+  (optional: `pip install xxhash`)
+
+Selected with CHECKSUM_ALGORITHM (docker-compose.yml). With a
+non-cryptographic or non-SHA-256 algorithm the copy pass also streams the
+source through SHA-256, so the FINAL SHA-256 costs no extra read.
+"""
+
+import hashlib
+import os
+import zlib
+
+FINAL_ALGORITHM = "sha256"
+
+
+class _CRC32:
+    """zlib.crc32 behind the hashlib interface"""
+
+    name = "crc32"
+    digest_size = 4
+
+    def __init__(self):
+        self._value = 0
+
+    def update(self, data) -> None:
+        self._value = zlib.crc32(data, self._value)
+
+    def digest(self) -> bytes:
+        return self._value.to_bytes(4, "big")
+
+    def hexdigest(self) -> str:
+        return f"{self._value:08x}"
+
+
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "crc32": _CRC32,
+}
+
+try:
+    import xxhash
+
+    ALGORITHMS["xxh64"] = xxhash.xxh64
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+except ImportError:  # optional dependency
+    xxhash = None
+
+CRYPTOGRAPHIC_ALGORITHMS = {"sha256", "blake2b"}
+
+_ALIASES = {
+    "sha-256": "sha256",
+    "blake2": "blake2b",
+    "blake2b-512": "blake2b",
+    "crc-32": "crc32",
+    "xxhash64": "xxh64",
+    "xxh3": "xxh3_128",
+}
+
+
+def normalize_algorithm(name: str) -> str:
+    """
+    Canonical registry name ("SHA256" -> "sha256")
+
+    Raises:
+        ValueError: Unknown algorithm, or xxhash algorithm without the package
+    """
+    key = (name or "").strip().lower()
+    key = _ALIASES.get(key, key)
+    if key in ALGORITHMS:
+        return key
+    if key in ("xxh64", "xxh3_128"):
+        raise ValueError(f"Checksum algorithm '{name}' requires the xxhash package (pip install xxhash)")
+    raise ValueError(f"Unknown checksum algorithm '{name}'. Valid: {', '.join(sorted(ALGORITHMS))}")
+
+
+def get_checksum_algorithm() -> str:
+    """In-flight algorithm from CHECKSUM_ALGORITHM (default SHA-256)"""
+    return normalize_algorithm(os.getenv("CHECKSUM_ALGORITHM", "SHA256"))
+
+
+def new_hasher(algorithm: str):
+    """Fresh hashlib-style object for a registry name"""
+    return ALGORITHMS[normalize_algorithm(algorithm)]()
+
+
+def is_cryptographic(algorithm: str) -> bool:
+    return normalize_algorithm(algorithm) in CRYPTOGRAPHIC_ALGORITHMS
@@ -0,0 +1,264 @@
+"""
+Ketter 3.0 - Multi-Stream Copy
+Concurrent ranged copy of one large file (pread/pwrite on a thread pool)
+
+MRC Principles:
+- Simple: fixed-size ranges, one range per task, positional I/O only
+- Fast: several requests in flight hide SMB/NFS per-request latency
+- Explicit: stream count comes from ketter.config.yml, tuned by measurement
+
+Configuration (ketter.config.yml):
+- copy_streams: {network: 4, local: 1}  - default per volume type
+- volumes[].copy_streams                - per-volume override
+The larger of the source and destination volume counts is used; 1 keeps
+the sequential copy. Different from max_streams, which bounds how many
+transfers touch a volume at once.
+
+Tuning: each worker process remembers the throughput it measured per
+(source volume, destination volume) and stream count, and hill-climbs:
+after the configured count, the untried neighbours (n+1, n-1) of the best
+count so far are tried, then the best one is kept.
+
+Digests: per-range SHA-256 leaves (equal to tree hash leaves when the range
+size is the tree chunk size) and/or an ordered full-file hasher fed while
+copying - pieces that arrive early are held until the bytes before them
+have been hashed (bounded memory).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .file_io import preallocate, is_sparse, sync_file, fsync_directory
+
+MULTISTREAM_MIN_BYTES = int(os.getenv("KETTER_MULTISTREAM_MIN_MB", "256")) * 1024 * 1024
+RANGE_BYTES = int(os.getenv("KETTER_MULTISTREAM_RANGE_MB", "64")) * 1024 * 1024
+MAX_STREAMS = int(os.getenv("KETTER_MULTISTREAM_MAX", "16"))
+PIECE_BYTES = 4 * 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+
+def configured_streams(path: str) -> int:
+    """Stream count for the volume containing path (1 = sequential)"""
+    from app.config import get_config
+
+    config = get_config()
+    volume = config.get_volume_for_path(path)
+    if volume is None:
+        return 1
+    if volume.copy_streams:
+        return max(1, int(volume.copy_streams))
+    return max(1, int(config.copy_streams_by_type.get(volume.type, 1)))
+
+
+def _volume_key(source_path: str, dest_path: str) -> str:
+    from app.config import get_config
+
+    config = get_config()
+    source = config.get_volume_for_path(source_path)
+    dest = config.get_volume_for_path(dest_path)
+    return f"{source.path if source else '?'}->{dest.path if dest else '?'}"
+
+
+class StreamTuner:
+    """Hill-climbing stream count per volume pair from measured throughput"""
+
+    def __init__(self, max_streams: int = MAX_STREAMS, smoothing: float = 0.5):
+        self.max_streams = max_streams
+        self.smoothing = smoothing
+        self._rates: Dict[str, Dict[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, key: str, configured: int) -> int:
+        with self._lock:
+            rates = self._rates.get(key)
+            if not rates:
+                return min(configured, self.max_streams)
+            best = max(rates, key=rates.get)
+            for candidate in (best + 1, best - 1):
+                if 1 <= candidate <= self.max_streams and candidate not in rates:
+                    return candidate
+            return best
+
+    def record(self, key: str, streams: int, bytes_copied: int, seconds: float) -> None:
+        if seconds <= 0 or bytes_copied <= 0:
+            return
+        rate = bytes_copied / seconds
+        with self._lock:
+            rates = self._rates.setdefault(key, {})
+            previous = rates.get(streams)
+            rates[streams] = rate if previous is None else previous + (rate - previous) * self.smoothing
+
+    def rates(self, key: str) -> Dict[int, float]:
+        with self._lock:
+            return dict(self._rates.get(key, {}))
+
+
+_tuner = StreamTuner()
+
+
+def plan_streams(source_path: str, dest_path: str, file_size: int) -> Tuple[int, str]:
+    """
+    (streams, tuning key) for copying source_path to dest_path
+
+    Small files, sparse files (holes are kept by the sequential copy) and
+    volumes without copy_streams > 1 get 1 stream.
+    """
+    key = _volume_key(source_path, dest_path)
+    if file_size < MULTISTREAM_MIN_BYTES or is_sparse(source_path):
+        return 1, key
+    configured = max(configured_streams(source_path), configured_streams(dest_path))
+    if configured <= 1:
+        return 1, key
+    return _tuner.choose(key, configured), key
+
+
+def record_throughput(key: str, streams: int, bytes_copied: int, seconds: float) -> None:
+    _tuner.record(key, streams, bytes_copied, seconds)
+
+
+class _OrderedFeed:
+    """Feeds pieces copied out of order to one hasher, in file order"""
+
+    def __init__(self, hasher, limit_bytes: int):
+        self.hasher = hasher
+        self.limit_bytes = limit_bytes
+        self.next_offset = 0
+        self.pending: Dict[int, bytes] = {}
+        self.pending_bytes = 0
+        self.failed = False
+        self.cond = threading.Condition()
+
+    def feed(self, offset: int, data: bytes) -> None:
+        with self.cond:
+            # Ahead of the hashed prefix: park the piece, waiting while the
+            # buffer is full. The range holding next_offset was submitted
+            # earlier, so its worker is running and never waits here.
+            while offset != self.next_offset and self.pending_bytes >= self.limit_bytes:
+                if self.failed:
+                    raise RuntimeError("Multi-stream copy aborted")
+                self.cond.wait(timeout=1)
+            if offset != self.next_offset:
+                self.pending[offset] = data
+                self.pending_bytes += len(data)
+                return
+
+            self.hasher.update(data)
+            self.next_offset += len(data)
+            while self.next_offset in self.pending:
+                piece = self.pending.pop(self.next_offset)
+                self.pending_bytes -= len(piece)
+                self.hasher.update(piece)
+                self.next_offset += len(piece)
+            self.cond.notify_all()
+
+    def abort(self) -> None:
+        with self.cond:
+            self.failed = True
+            self.cond.notify_all()
+
+
+def multistream_copy(
+    source_path: str,
+    dest_path: str,
+    streams: int,
+    range_size: int = RANGE_BYTES,
+    progress_callback: Optional[Callable] = None,
+    durability: str = "fsync",
+    hasher=None,
+    with_leaves: bool = False,
+    allocation_callback: Optional[Callable] = None
+) -> Tuple[int, Optional[List[str]]]:
+    """
+    Copy source to dest with `streams` concurrent ranged copies
+
+    Args:
+        source_path: Arquivo original
+        dest_path: Destino (criado/truncado e pré-alocado)
+        streams: Threads de cópia
+        range_size: Bytes por range (= chunk do tree hash para leaves comparáveis)
+        progress_callback: Callback(bytes_copied, total_bytes), called from
+            the calling thread only (safe for DB sessions)
+        durability: Nível de durabilidade (file_io)
+        hasher: Objeto hashlib alimentado com o arquivo inteiro, em ordem
+        with_leaves: Also return the SHA-256 of every range
+        allocation_callback: Callback(allocated_bytes) once the destination
+            is preallocated
+
+    Returns:
+        (bytes copied, leaves or None)
+    """
+    file_size = os.path.getsize(source_path)
+    ranges = [(offset, min(range_size, file_size - offset)) for offset in range(0, file_size, range_size)]
+    feed = _OrderedFeed(hasher, limit_bytes=max(1, streams) * PIECE_BYTES * 4) if hasher is not None else None
+    copied = [0]
+    copied_lock = threading.Lock()
+
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir and not os.path.exists(dest_dir):
+        os.makedirs(dest_dir, exist_ok=True)
+
+    src = os.open(source_path, os.O_RDONLY)
+    try:
+        dst = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if preallocate(dst, file_size) and allocation_callback:
+                allocation_callback(file_size)
+
+            def copy_range(offset: int, length: int) -> Optional[str]:
+                leaf = hashlib.sha256() if with_leaves else None
+                position, end = offset, offset + length
+                while position < end:
+                    data = os.pread(src, min(PIECE_BYTES, end - position), position)
+                    if not data:
+                        raise OSError(f"Unexpected end of file at byte {position}")
+                    view = memoryview(data)
+                    while view:
+                        written = os.pwrite(dst, view, position)
+                        view = view[written:]
+                        position += written
+                    if leaf is not None:
+                        leaf.update(data)
+                    if feed is not None:
+                        feed.feed(position - len(data), data)
+                    with copied_lock:
+                        copied[0] += len(data)
+                return leaf.hexdigest() if leaf is not None else None
+
+            with ThreadPoolExecutor(max_workers=max(1, streams)) as pool:
+                # Submitted in file order: workers pick ranges in order
+                futures = [pool.submit(copy_range, offset, length) for offset, length in ranges]
+                try:
+                    pending = futures
+                    while pending:
+                        done, pending = wait(pending, timeout=PROGRESS_INTERVAL_SECONDS,
+                                             return_when=FIRST_EXCEPTION)
+                        for future in done:
+                            future.result()  # Raise the first failure
+                        if progress_callback:
+                            progress_callback(copied[0], file_size)
+                except BaseException:
+                    if feed is not None:
+                        feed.abort()
+                    for future in futures:
+                        future.cancel()
+                    raise
+                leaves = [future.result() for future in futures] if with_leaves else None
+
+            os.ftruncate(dst, file_size)
+            sync_file(dst, durability,
+                      heartbeat=(lambda: progress_callback(file_size, file_size)) if progress_callback else None)
+        finally:
+            os.close(dst)
+    finally:
+        os.close(src)
+
+    if durability == "full":
+        fsync_directory(os.path.dirname(os.path.abspath(dest_path)))
+
+    if with_leaves and not ranges:
+        leaves = [hashlib.sha256(b"").hexdigest()]
+    return file_size, leaves
@@ -0,0 +1,253 @@
+"""
+Ketter 3.0 - Tree Hash
+Parallel Merkle tree SHA-256 for large files
+
+MRC Principles:
+- Simple: fixed-size chunks, SHA-256 per chunk, binary tree over the chunks
+- Fast: chunks are hashed on a thread pool (hashlib and pread release the GIL)
+- Explicit: a mismatch names the exact byte ranges that differ
+
+Tree layout:
+- leaf i   = SHA-256 of bytes [i * chunk_size, (i + 1) * chunk_size)
+  (plain digest, so a range can be checked by hand with dd | sha256sum)
+- parent   = SHA-256(0x01 || left || right) over raw digests
+- odd node = carried up unchanged
+- root of a single chunk = its leaf
+
+Opt-in via KETTER_TREE_HASH=1 for files of at least KETTER_TREE_HASH_MIN_MB.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from .file_io import sync_file
+
+TREE_HASH_ENABLED = os.getenv("KETTER_TREE_HASH", "0") == "1"
+TREE_HASH_MIN_BYTES = int(os.getenv("KETTER_TREE_HASH_MIN_MB", "1024")) * 1024 * 1024
+TREE_CHUNK_BYTES = int(os.getenv("KETTER_TREE_CHUNK_MB", "64")) * 1024 * 1024
+TREE_WORKERS = int(os.getenv("KETTER_TREE_WORKERS", "0")) or (os.cpu_count() or 2)
+
+TREE_ALGORITHM = "sha256-merkle"
+READ_BYTES = 8 * 1024 * 1024
+
+
+class TreeHash:
+    """Chunk digests and root of one file"""
+
+    def __init__(self, leaves: List[str], chunk_size: int, file_size: int):
+        self.leaves = leaves
+        self.chunk_size = chunk_size
+        self.file_size = file_size
+        self.root = merkle_root(leaves)
+
+    def chunk_range(self, index: int) -> Tuple[int, int]:
+        """Byte range [start, end) of chunk index"""
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.file_size)
+
+    def diff(self, other: "TreeHash") -> List[Tuple[int, int]]:
+        """
+        Byte ranges where other differs from this tree
+
+        Adjacent bad chunks are merged. A size change marks everything
+        past the shorter file as different.
+        """
+        if self.chunk_size != other.chunk_size:
+            raise ValueError("Cannot compare trees with different chunk sizes")
+
+        bad = [i for i, (a, b) in enumerate(zip(self.leaves, other.leaves)) if a != b]
+        bad += range(min(len(self.leaves), len(other.leaves)), max(len(self.leaves), len(other.leaves)))
+
+        ranges: List[Tuple[int, int]] = []
+        for index in bad:
+            start, end = self.chunk_range(index)
+            end = max(end, min((index + 1) * self.chunk_size, other.file_size))
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def update_leaf(self, index: int, digest: str) -> None:
+        self.leaves[index] = digest
+        self.root = merkle_root(self.leaves)
+
+
+def merkle_root(leaves: List[str]) -> str:
+    """Root digest (hex) over leaf digests (hex)"""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
+
+def chunk_ranges(file_size: int, chunk_size: int = TREE_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """(offset, length) of every chunk; an empty file has one empty chunk"""
+    if file_size == 0:
+        return [(0, 0)]
+    return [(offset, min(chunk_size, file_size - offset)) for offset in range(0, file_size, chunk_size)]
+
+
+def can_drop_cache() -> bool:
+    """drop_cache needs posix_fadvise (Linux); elsewhere reads are buffered"""
+    return hasattr(os, "posix_fadvise")
+
+
+def _evict(fd: int, offset: int, length: int) -> None:
+    if length and can_drop_cache():
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def _hash_range(fd: int, offset: int, length: int, drop_cache: bool) -> str:
+    # Evict BEFORE reading (the file must already be flushed): pages left
+    # by the copy or a repair would otherwise answer the read from RAM.
+    # Evict again after, so verification does not fill the cache either.
+    if drop_cache:
+        _evict(fd, offset, length)
+    digest = hashlib.sha256()
+    position, end = offset, offset + length
+    while position < end:
+        data = os.pread(fd, min(READ_BYTES, end - position), position)
+        if not data:
+            raise OSError(f"Unexpected end of file at byte {position}")
+        digest.update(data)
+        position += len(data)
+    if drop_cache:
+        _evict(fd, offset, length)
+    return digest.hexdigest()
+
+
+def tree_hash(
+    path: str,
+    chunk_size: int = TREE_CHUNK_BYTES,
+    workers: int = TREE_WORKERS,
+    progress_callback: Optional[Callable] = None,
+    with_flat: bool = False,
+    drop_cache: bool = False
+) -> Tuple[TreeHash, Optional[str]]:
+    """
+    Tree hash of a file, chunks hashed in parallel
+
+    Args:
+        path: File to hash
+        chunk_size: Leaf size in bytes
+        workers: Hashing threads
+        progress_callback: Callback(bytes_done, total_bytes)
+        with_flat: Also compute the flat SHA-256 in the same read (the
+            reads become sequential; leaf hashing stays parallel)
+        drop_cache: Flush the file, then evict each chunk from the page
+            cache before reading it, so the hash reflects storage, not
+            memory (destination verification)
+
+    Returns:
+        (TreeHash, flat SHA-256 hex or None)
+    """
+    file_size = os.path.getsize(path)
+    ranges = chunk_ranges(file_size, chunk_size)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if drop_cache:
+            # Dirty pages cannot be evicted: flush them first
+            sync_file(fd, "fsync",
+                      heartbeat=(lambda: progress_callback(0, file_size)) if progress_callback else None)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            if with_flat:
+                return _tree_and_flat(fd, ranges, chunk_size, file_size, pool, workers, progress_callback,
+                                      drop_cache)
+
+            futures = [pool.submit(_hash_range, fd, offset, length, drop_cache) for offset, length in ranges]
+            done = 0
+            leaves = []
+            for (offset, length), future in zip(ranges, futures):
+                leaves.append(future.result())
+                done += length
+                if progress_callback:
+                    progress_callback(done, file_size)
+            return TreeHash(leaves, chunk_size, file_size), None
+    finally:
+        os.close(fd)
+
+
+def _tree_and_flat(fd, ranges, chunk_size, file_size, pool, workers, progress_callback, drop_cache=False):
+    """One sequential read feeding the flat digest; leaves hashed on the pool"""
+    flat = hashlib.sha256()
+    futures = []
+    in_flight_limit = max(2, workers + 1)  # bounds memory to ~workers chunks
+    done = 0
+
+    for offset, length in ranges:
+        if drop_cache:
+            _evict(fd, offset, length)
+        data = os.pread(fd, length, offset) if length else b""
+        if len(data) != length:
+            raise OSError(f"Unexpected end of file at byte {offset + len(data)}")
+        if drop_cache:
+            _evict(fd, offset, length)
+        flat.update(data)
+        futures.append(pool.submit(lambda chunk: hashlib.sha256(chunk).hexdigest(), data))
+        del data
+
+        pending = [f for f in futures if not f.done()]
+        if len(pending) >= in_flight_limit:
+            pending[0].result()
+
+        done += length
+        if progress_callback:
+            progress_callback(done, file_size)
+
+    leaves = [future.result() for future in futures]
+    return TreeHash(leaves, chunk_size, file_size), flat.hexdigest()
+
+
+def hash_chunk(path: str, tree: TreeHash, index: int, drop_cache: bool = False) -> str:
+    """Re-hash a single chunk of path with tree's chunking (after a repair: from storage)"""
+    start, end = tree.chunk_range(index)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if drop_cache:
+            sync_file(fd, "fsync")
+        return _hash_range(fd, start, end - start, drop_cache)
+    finally:
+        os.close(fd)
+
+
+def repair_ranges(source_path: str, dest_path: str, ranges: List[Tuple[int, int]]) -> int:
+    """
+    Copy only the given byte ranges from source over destination
+
+    Returns:
+        int: Bytes rewritten
+    """
+    written = 0
+    src = os.open(source_path, os.O_RDONLY)
+    try:
+        dst = os.open(dest_path, os.O_WRONLY)
+        try:
+            for start, end in ranges:
+                position = start
+                while position < end:
+                    data = os.pread(src, min(READ_BYTES, end - position), position)
+                    if not data:
+                        raise OSError(f"Source ended at byte {position} while repairing")
+                    os.pwrite(dst, data, position)
+                    position += len(data)
+                    written += len(data)
+            os.ftruncate(dst, os.fstat(src).st_size)
+            sync_file(dst, "fsync")
+        finally:
+            os.close(dst)
+    finally:
+        os.close(src)
+    return written
@@ -12,12 +12,23 @@ Use Case:
 - Pro Tools sessions with 1000+ audio files (WAV, MP3, AAC)
 - Audio is already compressed - additional compression is wasteful
 - STORE mode = instant "packaging" without CPU overhead
+
+Adaptive mode (opt-in, KETTER_ZIP_COMPRESSION=adaptive or a volume's
+zip_compression): for slow links, entries that compress well (MIDI, XML,
+text exports, uncompressed proxies) are written with DEFLATE level 1 or
+LZMA; media extensions and entries whose sample does not compress stay
+STORED. A thread pool reads and samples entries ahead of the writer; the
+decision is recorded in each entry's comment ("ketter:deflate ratio=0.31",
+"ketter:store media"), see get_zip_info()['decisions'].
 """
 
 import hashlib
 import os
 import zipfile
+import zlib
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Callable, Tuple
 from pathlib import Path
@@ -25,6 +36,25 @@ from pathlib import Path
 MAX_ZIP_ENTRY_BYTES = int(os.getenv("KETTER_ZIP_MAX_ENTRY_BYTES", 10 * 1024 * 1024))
 MAX_ZIP_TOTAL_BYTES = int(os.getenv("KETTER_ZIP_MAX_TOTAL_BYTES", 500 * 1024 * 1024))
 
+ZIP_COMPRESSION_MODES = ("store", "adaptive")
+ZIP_COMPRESSION = os.getenv("KETTER_ZIP_COMPRESSION", "store")
+ZIP_CODEC = os.getenv("KETTER_ZIP_CODEC", "deflate")  # deflate (level 1) | lzma
+ZIP_WORKERS = int(os.getenv("KETTER_ZIP_WORKERS", "4"))
+ZIP_MIN_SAVING = float(os.getenv("KETTER_ZIP_MIN_SAVING", "0.10"))  # below this: STORED
+ZIP_SAMPLE_BYTES = 64 * 1024
+ZIP_MIN_COMPRESS_BYTES = 512  # Header overhead eats the saving on tinier entries
+ZIP_DECISION_PREFIX = "ketter:"
+
+# Already compressed (or compressed by design): never worth a codec pass
+STORED_EXTENSIONS = {
+    ".wav", ".aif", ".aiff", ".mp3", ".aac", ".m4a", ".flac", ".ogg", ".opus",
+    ".mov", ".mp4", ".mxf", ".m4v", ".avi", ".mkv", ".r3d", ".braw",
+    ".jpg", ".jpeg", ".png", ".gif", ".heic", ".webp",
+    ".zip", ".gz", ".bz2", ".xz", ".7z", ".rar", ".zst",
+}
+
+_CODECS = {"deflate": zipfile.ZIP_DEFLATED, "lzma": zipfile.ZIP_LZMA}
+
 
 class ZipEngineError(Exception):
     """Base exception for ZIP Smart Engine errors"""
@@ -95,10 +125,60 @@ def count_files_recursive(path: str) -> Tuple[int, int]:
     return file_count, total_bytes
 
 
+def get_zip_compression(path: str) -> str:
+    """
+    ZIP compression mode for a destination path
+
+    The configured volume's `zip_compression` (ketter.config.yml) wins over
+    KETTER_ZIP_COMPRESSION, so only slow-link volumes pay the CPU cost.
+    """
+    from app.config import get_config
+
+    volume = get_config().get_volume_for_path(path)
+    mode = (volume.zip_compression if volume is not None and volume.zip_compression else ZIP_COMPRESSION)
+    if mode not in ZIP_COMPRESSION_MODES:
+        raise ValueError(f"Unknown ZIP compression mode '{mode}' (expected one of {', '.join(ZIP_COMPRESSION_MODES)})")
+    return mode
+
+
+def choose_entry_compression(arcname: str, data: bytes, codec: str = ZIP_CODEC) -> Tuple[int, str]:
+    """
+    Adaptive per-entry decision: (compress_type, decision)
+
+    A DEFLATE level 1 pass over a sample (head + middle) estimates the
+    saving; the codec is used only if it saves at least ZIP_MIN_SAVING.
+    """
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, "store media"
+    if len(data) < ZIP_MIN_COMPRESS_BYTES:
+        return zipfile.ZIP_STORED, "store small"
+
+    sample = data[:ZIP_SAMPLE_BYTES]
+    if len(data) > 2 * ZIP_SAMPLE_BYTES:
+        middle = len(data) // 2
+        sample += data[middle:middle + ZIP_SAMPLE_BYTES]
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if 1 - ratio < ZIP_MIN_SAVING:
+        return zipfile.ZIP_STORED, f"store ratio={ratio:.2f}"
+    return _CODECS[codec], f"{codec} ratio={ratio:.2f}"
+
+
+def _prepare_entry(file_path: str, arcname: str, codec: str) -> Tuple[zipfile.ZipInfo, bytes]:
+    """Read and classify one entry (runs on the packager's thread pool)"""
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    zinfo.compress_type, decision = choose_entry_compression(arcname, data, codec)
+    zinfo.comment = f"{ZIP_DECISION_PREFIX}{decision}".encode()
+    return zinfo, data
+
+
 def zip_folder_smart(
     source_folder: str,
     zip_path: str,
-    progress_callback: Optional[Callable[[int, int, str], None]] = None
+    progress_callback: Optional[Callable[[int, int, str], None]] = None,
+    compression: str = "store",
+    codec: str = ZIP_CODEC
 ) -> str:
     """
     Package folder into ZIP using STORE mode (no compression)
@@ -111,10 +191,15 @@ def zip_folder_smart(
     - Bit-perfect: No compression artifacts
     - Still provides container benefits (single file, metadata)
 
+    compression="adaptive" compresses only the entries worth it (see
+    choose_entry_compression); the default keeps every entry STORED.
+
     Args:
         source_folder: Path to folder to zip
         zip_path: Destination ZIP file path
         progress_callback: Optional callback(files_done, total_files, current_file)
+        compression: "store" or "adaptive"
+        codec: Adaptive codec, "deflate" (level 1) or "lzma"
 
     Returns:
         str: Path to created ZIP file
@@ -129,6 +214,11 @@ def zip_folder_smart(
     if not os.path.isdir(source_folder):
         raise InvalidPathError(f"Source is not a directory: {source_folder}")
 
+    if compression not in ZIP_COMPRESSION_MODES:
+        raise ZipEngineError(f"Unknown ZIP compression mode: {compression}")
+    if codec not in _CODECS:
+        raise ZipEngineError(f"Unknown ZIP codec: {codec}")
+
     # Count files for progress tracking
     try:
         file_count, total_bytes = count_files_recursive(source_folder)
@@ -137,6 +227,8 @@ def zip_folder_smart(
 
     # Create ZIP with STORE mode (no compression)
     files_processed = 0
+    adaptive = compression == "adaptive"
+    pool = ThreadPoolExecutor(max_workers=max(1, ZIP_WORKERS)) if adaptive else None
 
     try:
         # Get absolute path of zip file to exclude it from being zipped
@@ -147,6 +239,24 @@ def zip_folder_smart(
             source_path = Path(source_folder)
             total_bytes = 0
 
+            # Adaptive: entries read/sampled ahead on the pool, written in
+            # walk order (bounded: ~2 entries per worker in memory)
+            in_flight = deque()
+
+            def write_prepared(keep: int) -> None:
+                nonlocal files_processed
+                while len(in_flight) > keep:
+                    entry_path, entry_name, future = in_flight.popleft()
+                    try:
+                        zinfo, data = future.result()
+                    except (OSError, IOError) as e:
+                        print(f"Warning: Skipping file {entry_path}: {e}")
+                        continue
+                    zipf.writestr(zinfo, data, compresslevel=1)
+                    files_processed += 1
+                    if progress_callback:
+                        progress_callback(files_processed, file_count, entry_name)
+
             for root, dirs, files in os.walk(source_folder):
                     # Skip hidden directories
                     dirs[:] = [d for d in dirs if not d.startswith('.')]
@@ -187,6 +297,11 @@ def zip_folder_smart(
                                 f"ZIP total exceeds limit ({total_bytes} bytes) at {file_path}"
                             )
 
+                        if adaptive:
+                            in_flight.append((file_path, arcname, pool.submit(_prepare_entry, file_path, arcname, codec)))
+                            write_prepared(keep=2 * ZIP_WORKERS)
+                            continue
+
                         try:
                             # Add file to ZIP
                             zipf.write(file_path, arcname)
@@ -201,13 +316,18 @@ def zip_folder_smart(
                             print(f"Warning: Skipping file {file_path}: {e}")
                         continue
 
+            write_prepared(keep=0)
+
         # Verify ZIP was created
         if not os.path.exists(zip_path):
             raise ZipEngineError(f"ZIP file was not created: {zip_path}")
 
-        # Validate store-only header for all entries
+        # Validate store-only header for all entries (adaptive: for every
+        # entry not recorded as compressed)
         with zipfile.ZipFile(zip_path, 'r') as verify_zip:
             for info in verify_zip.infolist():
+                if adaptive and info.comment and not info.comment.startswith(f"{ZIP_DECISION_PREFIX}store".encode()):
+                    continue
                 if info.compress_type != zipfile.ZIP_STORED:
                     raise ZipEngineError(
                         f"ZIP entry '{info.filename}' not stored (compress_type={info.compress_type})"
@@ -225,6 +345,9 @@ def zip_folder_smart(
         raise ZipEngineError(f"Failed to create ZIP: {e}") from e
     except Exception as e:
         raise ZipEngineError(f"Unexpected error during ZIP creation: {e}") from e
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
 
 
 def _ensure_zip_entry_safe(entry_name: str) -> None:
@@ -342,7 +465,8 @@ def get_zip_info(zip_path: str) -> dict:
             'compressed_size': int,
             'uncompressed_size': int,
             'compression_ratio': float,
-            'files': list[str]
+            'files': list[str],
+            'decisions': {filename: decision} (adaptive packaging only)
         }
 
     Raises:
@@ -367,13 +491,19 @@ def get_zip_info(zip_path: str) -> dict:
                 compression_ratio = (1 - compressed_size / uncompressed_size) * 100
 
             files = [info.filename for info in info_list]
+            prefix = ZIP_DECISION_PREFIX.encode()
+            decisions = {
+                info.filename: info.comment[len(prefix):].decode()
+                for info in info_list if info.comment.startswith(prefix)
+            }
 
             return {
                 'file_count': file_count,
                 'compressed_size': compressed_size,
                 'uncompressed_size': uncompressed_size,
                 'compression_ratio': compression_ratio,
-                'files': files
+                'files': files,
+                'decisions': decisions
             }
     except Exception as e:
         raise ZipEngineError(f"Failed to read ZIP info: {e}") from e
@@ -10,7 +10,7 @@ import os
 from datetime import datetime, timezone
 import redis
 
-from app.database import get_db, check_db_connection
+from app.database import get_db, check_db_connection, get_pool_status
 from app.routers import transfers, volumes
 
 # Inicializa FastAPI app
@@ -97,6 +97,9 @@ async def status():
     - Database: Conexão PostgreSQL
     - Redis: Conexão Redis (para RQ)
     - Worker: Status do RQ worker (via Redis)
+    - Lanes: Profundidade e tempo de espera por lane de prioridade
+    - Volume streams: Slots de I/O em uso por volume
+    - Database pools: Conexões em uso e espera de checkout (API + cada worker)
     """
     # Check database
     db_status = "connected" if check_db_connection() else "disconnected"
@@ -121,11 +124,41 @@ async def status():
     except Exception:
         pass
 
+    # Scheduling lanes: queue depth and wait time per lane
+    lanes = []
+    try:
+        if redis_status == "connected":
+            from app.services.scheduling import get_lane_stats
+            lanes = get_lane_stats(redis_client)
+    except Exception:
+        pass
+
+    # Per-volume stream slots (distributed semaphore usage)
+    volume_streams = []
+    try:
+        if redis_status == "connected":
+            from app.services.volume_limits import get_volume_stream_usage
+            volume_streams = get_volume_stream_usage(redis_client)
+    except Exception:
+        pass
+
+    # DB connection pools: this API process + what each worker process published
+    database_pools = {"api": get_pool_status(), "workers": []}
+    try:
+        if redis_status == "connected":
+            from app.services.worker_pool import get_published_pool_status
+            database_pools["workers"] = get_published_pool_status(redis_client)
+    except Exception:
+        pass
+
     return {
         "api": "operational",
         "database": db_status,
         "redis": redis_status,
         "worker": worker_status,
+        "lanes": lanes,
+        "volume_streams": volume_streams,
+        "database_pools": database_pools,
         "version": "3.0.0",
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
@@ -13,8 +13,9 @@ from datetime import datetime, timezone
 from enum import Enum
 from sqlalchemy import (
     Column, Integer, String, BigInteger, DateTime,
-    Text, ForeignKey, Index, Enum as SQLEnum, JSON
+    Text, ForeignKey, Index, Enum as SQLEnum, JSON, Float
 )
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -23,11 +24,13 @@ from app.database import Base
 class TransferStatus(str, Enum):
     """Status possíveis de uma transferência"""
     PENDING = "pending"           # Aguardando início
+    QUEUED_FOR_VOLUME = "queued_for_volume"  # Aguardando slot de I/O no volume
     VALIDATING = "validating"     # Validando espaço/permissões
     COPYING = "copying"           # Copiando arquivo
     VERIFYING = "verifying"       # Verificando checksums
     COMPLETED = "completed"       # Concluído com sucesso
     FAILED = "failed"             # Falhou
+    COPIED_UNVERIFIED = "copied_unverified"  # Copiado, verificação adiada
     CANCELLED = "cancelled"       # Cancelado pelo operador
 
 
@@ -48,6 +51,8 @@ class AuditEventType(str, Enum):
     TRANSFER_COMPLETED = "transfer_completed"
     TRANSFER_FAILED = "transfer_failed"
     TRANSFER_CANCELLED = "transfer_cancelled"
+    SCRUB_PASSED = "scrub_passed"         # Destino re-verificado pelo scrubber
+    SCRUB_FAILED = "scrub_failed"         # Bit rot, alteração ou destino ausente
     ERROR = "error"
 
 
@@ -122,8 +127,41 @@ class Transfer(Base):
     # Week 6: Operation Mode (NEW) - COPY vs MOVE 
     operation_mode = Column(String(10), default="copy")  # "copy"=keep originals, "move"=delete after verification
 
+    # MOVE lock: fencing token of the latest lease holder (see app.services.transfer_lock)
+    lock_token = Column(BigInteger, nullable=True)
+
+    # Folder resync: "full" = zip/copy/unzip everything, "resync" = copy only
+    # files changed since the last completed run (app.core.folder_manifest)
+    sync_mode = Column(String(10), default="full")
+    delete_removed = Column(Integer, default=0)  # 1 = resync deletes files removed at the source
+
+    # Bandwidth shaping (app.services.bandwidth): requested cap and the
+    # allowed/achieved rate of the running byte loop, in MB/s
+    max_mbps = Column(Integer, nullable=True)  # None = unlimited (volume limits still apply)
+    rate_allowed_mbps = Column(Integer, nullable=True)
+    rate_achieved_mbps = Column(Float, nullable=True)
+
+    # Small-file bundle (app.core.bundle): one [relpath, size, sha256, error]
+    # row per file; None for ordinary transfers
+    bundle_files = Column(JSON, nullable=True)
+
+    # Deduplication (app.services.transfer_dedupe): hash of the normalized
+    # (source, destination, mode, source mtime); set only while the transfer
+    # is queued or in flight, cleared on a terminal status
+    dedupe_key = Column(String(64), nullable=True)
+
+    # Integrity scrubbing: last background re-hash of the destination (app.services.scrubber)
+    last_scrubbed_at = Column(DateTime, nullable=True, index=True)
+
+    # Scheduling: priority class -> RQ lane (high, small, default, low)
+    priority = Column(String(10), default="normal")  # "high", "normal", "low"
+    queue_name = Column(String(20), nullable=True)  # Lane the job was enqueued on
+    job_id = Column(String(100), nullable=True)  # Latest RQ job enqueued for this transfer (liveness checks)
+
     # Relationships
     checksums = relationship("Checksum", back_populates="transfer", cascade="all, delete-orphan")
+    checksum_trees = relationship("ChecksumTree", back_populates="transfer", cascade="all, delete-orphan")
+    folder_manifests = relationship("FolderManifest", back_populates="transfer", cascade="all, delete-orphan")
     audit_logs = relationship("AuditLog", back_populates="transfer", cascade="all, delete-orphan")
     watch_files = relationship("WatchFile", back_populates="transfer", cascade="all, delete-orphan")
 
@@ -131,12 +169,32 @@ class Transfer(Base):
     __table_args__ = (
         Index('idx_transfer_status_created', 'status', 'created_at'),
         Index('idx_transfer_created_at', 'created_at'),
+        Index('uq_transfer_dedupe_key', 'dedupe_key', unique=True),
     )
 
     def __repr__(self):
         return f"<Transfer(id={self.id}, file={self.file_name}, status={self.status})>"
 
 
+# Status sem trabalho pendente: a mesma origem/destino pode ser enviada de novo
+TERMINAL_STATUSES = (TransferStatus.COMPLETED, TransferStatus.FAILED, TransferStatus.CANCELLED)
+
+
+@event.listens_for(Transfer.status, "set")
+def _release_dedupe_key(target, value, oldvalue, initiator):
+    """Free the dedupe key as soon as a transfer reaches a terminal status"""
+    if value in TERMINAL_STATUSES:
+        target.dedupe_key = None
+
+
+@event.listens_for(Transfer.status, "set")
+def _write_back_live_progress(target, value, oldvalue, initiator):
+    """Phase change: the live progress (app.services.progress) lands on the row"""
+    live = target.__dict__.get("_live_progress")
+    if live is not None:
+        live.write_back()
+
+
 class Checksum(Base):
     """
     Tabela de checksums SHA-256
@@ -158,7 +216,8 @@ class Checksum(Base):
 
     # Checksum data
     checksum_type = Column(SQLEnum(ChecksumType), nullable=False)
-    checksum_value = Column(String(64), nullable=False)  # SHA-256 = 64 hex chars
+    algorithm = Column(String(16), nullable=False, default="sha256")  # app.core.hashing registry name
+    checksum_value = Column(String(128), nullable=False)  # Hex digest (SHA-256 = 64, BLAKE2b = 128)
 
     # Metadata
     calculated_at = Column(DateTime, nullable=False, default=now_utc)
@@ -176,6 +235,87 @@ class Checksum(Base):
         return f"<Checksum(id={self.id}, type={self.checksum_type}, value={self.checksum_value[:8]}...)>"
 
 
+class ChecksumTree(Base):
+    """
+    Árvore de Merkle (tree hash) de um arquivo grande
+
+    Guarda o SHA-256 de cada chunk de chunk_size bytes e a raiz da árvore.
+    Fica ao lado do Checksum (o SHA-256 plano continua sendo o valor de
+    compatibilidade); num mismatch, os chunks divergentes apontam o range
+    exato a reparar. Ver app.core.tree_hash.
+    """
+    __tablename__ = "checksum_trees"
+
+    # Primary key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Foreign key
+    transfer_id = Column(Integer, ForeignKey("transfers.id"), nullable=False, index=True)
+
+    # Tree data
+    checksum_type = Column(SQLEnum(ChecksumType), nullable=False)
+    algorithm = Column(String(32), nullable=False, default="sha256-merkle")
+    chunk_size = Column(BigInteger, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    root = Column(String(64), nullable=False)
+    leaves = Column(JSON, nullable=False)  # Hex SHA-256 per chunk, in file order
+
+    # Metadata
+    calculated_at = Column(DateTime, nullable=False, default=now_utc)
+
+    # Relationship
+    transfer = relationship("Transfer", back_populates="checksum_trees")
+
+    __table_args__ = (
+        Index('idx_checksum_tree_transfer_type', 'transfer_id', 'checksum_type'),
+    )
+
+    def __repr__(self):
+        return f"<ChecksumTree(id={self.id}, type={self.checksum_type}, root={self.root[:8]}..., chunks={len(self.leaves)})>"
+
+
+class FolderManifest(Base):
+    """
+    Manifesto de uma transferência de pasta (modo resync)
+
+    Lista cada arquivo (caminho relativo, tamanho, mtime, SHA-256) e o
+    digest da pasta inteira. A próxima execução para o mesmo destino
+    compara a origem com este manifesto e copia só o que mudou.
+    Ver app.core.folder_manifest.
+    """
+    __tablename__ = "folder_manifests"
+
+    # Primary key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Foreign key
+    transfer_id = Column(Integer, ForeignKey("transfers.id"), nullable=False, index=True)
+
+    # Folder pair
+    source_root = Column(String(4096), nullable=False)
+    destination_root = Column(String(4096), nullable=False)
+
+    # Manifest data
+    file_count = Column(Integer, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    digest = Column(String(64), nullable=True)  # NULL until the run completed
+    entries = Column(JSON, nullable=False)  # relpath -> [size, mtime_ns, sha256]
+
+    # Metadata
+    created_at = Column(DateTime, nullable=False, default=now_utc)
+
+    # Relationship
+    transfer = relationship("Transfer", back_populates="folder_manifests")
+
+    __table_args__ = (
+        Index('idx_folder_manifest_destination', 'destination_root', 'created_at'),
+    )
+
+    def __repr__(self):
+        digest = self.digest[:8] if self.digest else None
+        return f"<FolderManifest(id={self.id}, transfer_id={self.transfer_id}, files={self.file_count}, digest={digest})>"
+
+
 class AuditLog(Base):
     """
     Tabela de logs de auditoria
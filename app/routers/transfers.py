@@ -13,14 +13,16 @@ from datetime import datetime, timezone
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from rq import Queue
 from redis import Redis
 
 from app.database import get_db
-from app.models import Transfer, Checksum, AuditLog, TransferStatus, AuditEventType, WatchFile
+from app.models import Transfer, Checksum, AuditLog, TransferStatus, AuditEventType, WatchFile, TERMINAL_STATUSES
 from app.schemas import (
-    TransferCreate, TransferResponse, TransferListResponse,
+    TransferCreate, TransferResponse, RateLimitUpdate,
+    BundleCreate, BundleFilesResponse, BundleFileResponse, TransferListResponse,
     ChecksumResponse, ChecksumListResponse,
     AuditLogResponse, AuditLogListResponse,
     WatchFileResponse, WatchHistoryResponse,
@@ -32,7 +34,12 @@ from app.services.worker_jobs import (
     TRANSFER_JOB_CONFIG,
     WATCH_TRANSFER_JOB_CONFIG,
 )
-from app.utils.pdf_generator import generate_transfer_report, get_transfer_report_filename
+from app.services.scheduling import select_lane, get_lane_queue, promote_starved_jobs
+from app.services.job_lease import expected_transfer_bytes, transfer_job_timeout
+from app.services.bandwidth import set_rate_override
+from app.services.transfer_dedupe import DEDUPE_ENABLED, transfer_dedupe_key, find_duplicate
+from app.services.progress import read_live_progress
+from app.core.bundle import BUNDLE_MAX_FILE_BYTES, BUNDLE_MAX_FILES, new_bundle_transfer
 
 # Redis/RQ setup
 redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
@@ -49,6 +56,7 @@ router = APIRouter(
 @router.post("", response_model=TransferResponse, status_code=201)
 def create_transfer(
     transfer: TransferCreate,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -56,8 +64,13 @@ def create_transfer(
 
     **Week 5: Supports ZIP Smart + Watch Mode**
     - Aceita arquivo ou pasta
+    - priority: high/normal/low -> lane RQ separada (small lane opcional por tamanho)
     - Se pasta: será zipado automaticamente (STORE mode)
+    - sync_mode=resync (pasta): copia só o que mudou desde a última execução
     - Se watch_mode: aguarda estabilidade antes de transferir
+    - Pedido idêntico já na fila/em andamento (mesma origem, destino, modo e
+      mtime da origem): on_duplicate=attach devolve a transferência existente
+      (200), on_duplicate=reject responde 409 apontando para ela
     - Calcula file_size
     - Extrai file_name
     - Cria registro no database
@@ -93,6 +106,21 @@ def create_transfer(
         file_size = 0
         file_name = os.path.basename(transfer.source_path.rstrip('/'))
 
+    # Deduplicação: pedido idêntico na fila ou em andamento não gera outro job
+    # (continuous watchers are long-lived and never coalesced)
+    dedupe_key = None
+    if DEDUPE_ENABLED and not transfer.watch_continuous:
+        dedupe_key = transfer_dedupe_key(
+            transfer.source_path,
+            transfer.destination_path,
+            transfer.operation_mode,
+            transfer.sync_mode
+        )
+        # A holder whose job was lost gives its key up (see transfer_dedupe)
+        existing = find_duplicate(db, dedupe_key, redis_conn)
+        if existing is not None:
+            return _coalesce_duplicate(db, existing, transfer, response)
+
     # Criar transferência
     db_transfer = Transfer(
         source_path=transfer.source_path,
@@ -106,10 +134,28 @@ def create_transfer(
         # Week 6: Continuous Watch Mode (NEW)
         watch_continuous=1 if transfer.watch_continuous else 0,
         # Week 6: Operation Mode (NEW) - COPY vs MOVE
-        operation_mode=transfer.operation_mode
+        operation_mode=transfer.operation_mode,
+        # Scheduling lane
+        priority=transfer.priority,
+        # Folder resync
+        sync_mode=transfer.sync_mode,
+        delete_removed=1 if transfer.delete_removed else 0,
+        max_mbps=transfer.max_mbps,
+        dedupe_key=dedupe_key
     )
     db.add(db_transfer)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost the race against an identical request: the unique index decides
+        db.rollback()
+        existing = find_duplicate(db, dedupe_key) if dedupe_key else None
+        if existing is None:
+            raise HTTPException(
+                status_code=409,
+                detail="An identical transfer was created concurrently, retry the request"
+            )
+        return _coalesce_duplicate(db, existing, transfer, response)
     db.refresh(db_transfer)
 
     # Criar audit log inicial
@@ -129,6 +175,8 @@ def create_transfer(
     # Enfileirar job RQ para processar transferência
     # Week 5: Use watch_and_transfer_job if watch mode is enabled
     # Week 6: Use watcher_continuous_job if continuous watch mode is enabled
+    # Job timeout: a folder (file_size=0 until zipped) is sized by walking it
+    expected_bytes = 0 if transfer.watch_continuous else expected_transfer_bytes(transfer.source_path, file_size)
     try:
         if transfer.watch_continuous:
             # Continuous watch mode (Week 6): enqueue watcher_continuous_job
@@ -165,14 +213,22 @@ def create_transfer(
 
         elif transfer.watch_mode_enabled:
             # Watch mode (settle-time once): enqueue watch_and_transfer_job
-            job = transfer_queue.enqueue(
+            lane = select_lane(transfer.priority, file_size)
+            job = get_lane_queue(lane, redis_conn).enqueue(
                 watch_and_transfer_job,
                 db_transfer.id,
-                job_timeout=WATCH_TRANSFER_JOB_CONFIG["timeout"],
+                # Max 1h watching + size-based transfer timeout
+                job_timeout=max(
+                    WATCH_TRANSFER_JOB_CONFIG["timeout"],
+                    3600 + transfer_job_timeout(redis_conn, expected_bytes)
+                ),
                 result_ttl=WATCH_TRANSFER_JOB_CONFIG["result_ttl"],
                 failure_ttl=WATCH_TRANSFER_JOB_CONFIG["failure_ttl"]
             )
 
+            db_transfer.queue_name = lane
+            db_transfer.job_id = job.id
+
             # Log job enqueued
             job_log = AuditLog(
                 transfer_id=db_transfer.id,
@@ -180,7 +236,7 @@ def create_transfer(
                 message=f"Watch + Transfer job enqueued: {job.id} (settle time: {transfer.settle_time_seconds}s)",
                 event_metadata={
                     "job_id": job.id,
-                    "queue": "default",
+                    "queue": lane,
                     "watch_mode": True,
                     "settle_time": transfer.settle_time_seconds
                 }
@@ -188,21 +244,24 @@ def create_transfer(
             db.add(job_log)
             db.commit()
         else:
-            # Normal mode: enqueue transfer_file_job
-            job = transfer_queue.enqueue(
+            # Normal mode: enqueue transfer_file_job on its priority lane
+            lane = select_lane(transfer.priority, file_size)
+            job = get_lane_queue(lane, redis_conn).enqueue(
                 transfer_file_job,
                 db_transfer.id,
-                job_timeout=TRANSFER_JOB_CONFIG["timeout"],
+                job_timeout=transfer_job_timeout(redis_conn, expected_bytes),
                 result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
                 failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
             )
+            db_transfer.queue_name = lane
+            db_transfer.job_id = job.id
 
             # Log job enqueued
             job_log = AuditLog(
                 transfer_id=db_transfer.id,
                 event_type=AuditEventType.TRANSFER_PROGRESS,
-                message=f"Transfer job enqueued: {job.id}",
-                event_metadata={"job_id": job.id, "queue": "default"}
+                message=f"Transfer job enqueued: {job.id} (lane: {lane})",
+                event_metadata={"job_id": job.id, "queue": lane, "priority": transfer.priority}
             )
             db.add(job_log)
             db.commit()
@@ -218,9 +277,157 @@ def create_transfer(
             detail=f"Failed to enqueue transfer job: {str(e)}"
         )
 
+    # Starvation protection: opportunistically lift jobs that waited too long
+    try:
+        promote_starved_jobs(redis_conn)
+    except Exception as e:
+        print(f"[Scheduling] Warning: starvation check failed: {str(e)}")
+
     return db_transfer
 
 
+def _coalesce_duplicate(
+    db: Session,
+    existing: Transfer,
+    request: TransferCreate,
+    response: Response
+) -> Transfer:
+    """Attach a duplicate request to the existing transfer, or reject it (409)"""
+    status = existing.status.value if hasattr(existing.status, 'value') else str(existing.status)
+    if request.on_duplicate == "reject":
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": f"Identical transfer already {status}: {existing.id}",
+                "transfer_id": existing.id,
+                "status": status,
+                "url": f"/transfers/{existing.id}"
+            }
+        )
+
+    db.add(AuditLog(
+        transfer_id=existing.id,
+        event_type=AuditEventType.TRANSFER_PROGRESS,
+        message=f"Duplicate request attached (status: {status})",
+        event_metadata={
+            "deduplicated": True,
+            "source": request.source_path,
+            "destination": request.destination_path
+        }
+    ))
+    db.commit()
+    db.refresh(existing)
+    response.status_code = 200
+    return existing
+
+
+@router.post("/bundle", response_model=TransferListResponse, status_code=201)
+def create_bundle(
+    bundle: BundleCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Transfere muitos arquivos pequenos como bundles (lote)
+
+    - Cada arquivo deve ter até KETTER_BUNDLE_MAX_FILE_KB (maiores: POST /transfers)
+    - Até KETTER_BUNDLE_MAX_FILES arquivos por bundle; um job RQ por bundle
+    - Resultado por arquivo: GET /transfers/{id}/bundle
+
+    Returns:
+        TransferListResponse: Bundles criados com status PENDING
+    """
+    for path in bundle.source_paths:
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=400, detail=f"Source path is not a file: {path}")
+        if os.path.getsize(path) > BUNDLE_MAX_FILE_BYTES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large for a bundle ({BUNDLE_MAX_FILE_BYTES} bytes max), use POST /transfers: {path}"
+            )
+
+    paths = sorted(set(bundle.source_paths))
+    created = []
+    for start in range(0, len(paths), BUNDLE_MAX_FILES):
+        db_transfer = new_bundle_transfer(
+            paths[start:start + BUNDLE_MAX_FILES],
+            bundle.destination_path,
+            operation_mode=bundle.operation_mode,
+            priority=bundle.priority
+        )
+        db.add(db_transfer)
+        db.commit()
+        db.refresh(db_transfer)
+
+        try:
+            lane = select_lane(bundle.priority, db_transfer.file_size)
+            job = get_lane_queue(lane, redis_conn).enqueue(
+                transfer_file_job,
+                db_transfer.id,
+                job_timeout=transfer_job_timeout(redis_conn, db_transfer.file_size),
+                result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+                failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
+            )
+            db_transfer.queue_name = lane
+            db_transfer.job_id = job.id
+        except Exception as e:
+            db_transfer.status = TransferStatus.FAILED
+            db_transfer.error_message = f"Failed to enqueue job: {str(e)}"
+            db.commit()
+            raise HTTPException(status_code=500, detail=f"Failed to enqueue bundle job: {str(e)}")
+
+        db.add(AuditLog(
+            transfer_id=db_transfer.id,
+            event_type=AuditEventType.TRANSFER_CREATED,
+            message=f"Bundle created: {db_transfer.file_count} files ({db_transfer.file_size} bytes), job {job.id}",
+            event_metadata={
+                "source": db_transfer.source_path,
+                "destination": db_transfer.destination_path,
+                "files": db_transfer.file_count,
+                "job_id": job.id,
+                "queue": lane
+            }
+        ))
+        db.commit()
+        created.append(db_transfer)
+
+    return {"total": len(created), "items": created}
+
+
+@router.get("/{transfer_id}/bundle", response_model=BundleFilesResponse)
+def get_bundle_files(
+    transfer_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    Resultado por arquivo de um bundle: path, size, sha256, error
+    """
+    transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
+    if not transfer:
+        raise HTTPException(status_code=404, detail=f"Transfer {transfer_id} not found")
+    if transfer.bundle_files is None:
+        raise HTTPException(status_code=400, detail=f"Transfer {transfer_id} is not a bundle")
+
+    files = [BundleFileResponse(path=path, size=size, sha256=sha256, error=error)
+             for path, size, sha256, error in transfer.bundle_files]
+    return BundleFilesResponse(
+        transfer_id=transfer_id,
+        total=len(files),
+        failed=sum(1 for f in files if f.error),
+        files=files
+    )
+
+
+def _with_live_progress(transfers: List[Transfer]) -> List[TransferResponse]:
+    """Overlay the live progress (Redis) on running transfers; the row is current otherwise"""
+    running = [t.id for t in transfers if t.status not in TERMINAL_STATUSES]
+    live = read_live_progress(running) if running else {}
+    return [
+        TransferResponse.model_validate(t).model_copy(update=live[t.id]) if t.id in live
+        else TransferResponse.model_validate(t)
+        for t in transfers
+    ]
+
+
 @router.get("", response_model=TransferListResponse)
 def list_transfers(
     status: Optional[TransferStatus] = Query(None, description="Filter by status"),
@@ -254,7 +461,7 @@ def list_transfers(
     # Aplicar ordenação e paginação
     transfers = query.order_by(Transfer.created_at.desc()).limit(limit).offset(offset).all()
 
-    return TransferListResponse(total=total, items=transfers)
+    return TransferListResponse(total=total, items=_with_live_progress(transfers))
 
 
 @router.get("/{transfer_id}", response_model=TransferResponse)
@@ -282,7 +489,7 @@ def get_transfer(
             detail=f"Transfer with ID {transfer_id} not found"
         )
 
-    return transfer
+    return _with_live_progress([transfer])[0]
 
 
 @router.get("/{transfer_id}/checksums", response_model=ChecksumListResponse)
@@ -459,7 +666,9 @@ def get_transfer_report(
         AuditLog.transfer_id == transfer_id
     ).order_by(AuditLog.created_at).all()
 
-    # Gera PDF
+    # Gera PDF (reportlab is imported on the first report, not at API startup)
+    from app.utils.pdf_generator import generate_transfer_report, get_transfer_report_filename
+
     try:
         pdf_buffer = generate_transfer_report(transfer, checksums, audit_logs)
         pdf_content = pdf_buffer.read()
@@ -505,7 +714,7 @@ def get_recent_transfers(
         Transfer.created_at >= cutoff_date
     ).order_by(Transfer.created_at.desc()).all()
 
-    return TransferListResponse(total=len(transfers), items=transfers)
+    return TransferListResponse(total=len(transfers), items=_with_live_progress(transfers))
 
 
 # ============================================
@@ -760,6 +969,43 @@ def get_watch_history(
     )
 
 
+@router.patch("/{transfer_id}/rate-limit", response_model=TransferResponse)
+def update_transfer_rate_limit(
+    transfer_id: int,
+    update: RateLimitUpdate,
+    db: Session = Depends(get_db)
+):
+    """
+    Change the bandwidth cap of a transfer (MB/s, null = unlimited)
+
+    A running job picks the new limit up within a few seconds, without
+    restarting (app.services.bandwidth). Volume limits still apply.
+    """
+    transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
+    if not transfer:
+        raise HTTPException(status_code=404, detail=f"Transfer {transfer_id} not found")
+
+    old_limit = transfer.max_mbps
+    transfer.max_mbps = update.max_mbps
+    db.commit()
+
+    try:
+        # 0 = explicitly unlimited (overrides the value the job started with)
+        set_rate_override(f"transfer:{transfer_id}", update.max_mbps or 0)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to publish rate limit: {str(e)}")
+
+    db.add(AuditLog(
+        transfer_id=transfer_id,
+        event_type=AuditEventType.TRANSFER_PROGRESS,
+        message=f"Rate limit changed: {old_limit or 'unlimited'} -> {update.max_mbps or 'unlimited'} MB/s",
+        event_metadata={"previous_max_mbps": old_limit, "max_mbps": update.max_mbps}
+    ))
+    db.commit()
+    db.refresh(transfer)
+    return transfer
+
+
 @router.post("/{transfer_id}/cancel", status_code=200)
 def cancel_transfer(
     transfer_id: int,
@@ -770,9 +1016,11 @@ def cancel_transfer(
 
     Transfers can be cancelled in any active state:
     - pending: Not yet started
+    - queued_for_volume: Waiting for a free stream slot on a volume
     - validating: Pre-transfer checks
     - copying: File copy in progress
     - verifying: Checksum verification
+    - copied_unverified: Copied, deferred verification pending (source kept)
 
     Completed and failed transfers cannot be cancelled.
     """
@@ -780,13 +1028,13 @@ def cancel_transfer(
     if not transfer:
         raise HTTPException(status_code=404, detail=f"Transfer {transfer_id} not found")
 
-    active_statuses = ["pending", "validating", "copying", "verifying"]
+    active_statuses = ["pending", "queued_for_volume", "validating", "copying", "verifying", "copied_unverified"]
     transfer_status = transfer.status.value if hasattr(transfer.status, 'value') else str(transfer.status).lower()
 
     if transfer_status not in active_statuses:
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot cancel transfer with status '{transfer_status}'. Only active transfers (pending, validating, copying, verifying) can be cancelled."
+            detail=f"Cannot cancel transfer with status '{transfer_status}'. Only active transfers (pending, queued_for_volume, validating, copying, verifying, copied_unverified) can be cancelled."
         )
 
     try:
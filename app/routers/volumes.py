@@ -7,6 +7,8 @@ Endpoints for volume management and discovery
 from fastapi import APIRouter, HTTPException
 from typing import List
 from app.config import get_config, reload_config
+from app.schemas import RateLimitUpdate
+from app.services.bandwidth import set_rate_override, get_rate_overrides, volume_limit_mbps
 
 router = APIRouter(prefix="/volumes", tags=["volumes"])
 
@@ -86,3 +88,32 @@ async def validate_path(path: str):
         "valid": True,
         "path": path
     }
+
+
+@router.put("/rate-limit")
+async def update_volume_rate_limit(update: RateLimitUpdate):
+    """
+    Override the bandwidth cap of a volume at runtime (MB/s)
+
+    Applies to every running and future transfer touching the volume
+    within a few seconds. max_mbps null removes the override (back to
+    max_mbps / rate_windows from ketter.config.yml).
+    """
+    config = get_config()
+    volume = config.get_volume_for_path(update.path) if update.path else None
+    if volume is None:
+        raise HTTPException(status_code=404, detail=f"No configured volume for path: {update.path}")
+
+    scope = f"volume:{volume.path}"
+    try:
+        set_rate_override(scope, update.max_mbps)
+        override = get_rate_overrides().get(scope)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to publish rate limit: {str(e)}")
+
+    return {
+        "path": volume.path,
+        "override_mbps": override,
+        "configured_mbps": volume_limit_mbps(volume),
+        "effective_mbps": override if override is not None else volume_limit_mbps(volume)
+    }
@@ -38,6 +38,19 @@ class TransferCreate(BaseModel):
     # Week 6: Operation Mode (NEW) - COPY vs MOVE
     operation_mode: str = Field(default="copy", description="'copy' keeps originals, 'move' deletes after verification", pattern="^(copy|move)$")
 
+    # Scheduling: priority class mapped to a separate RQ lane
+    priority: str = Field(default="normal", description="'high', 'normal' or 'low' scheduling lane", pattern="^(high|normal|low)$")
+
+    # Folder resync: copy only files changed since the last completed run
+    sync_mode: str = Field(default="full", description="'full' copies the whole folder, 'resync' only added/changed files", pattern="^(full|resync)$")
+    delete_removed: bool = Field(default=False, description="Resync: delete destination files removed at the source")
+
+    # Bandwidth shaping: cap for this transfer (volume limits still apply)
+    max_mbps: Optional[int] = Field(default=None, ge=1, description="Rate limit in MB/s (None = unlimited)")
+
+    # Deduplication: identical queued/in-flight request -> attach to it or 409
+    on_duplicate: str = Field(default="attach", description="'attach' returns the existing transfer, 'reject' answers 409", pattern="^(attach|reject)$")
+
     @field_validator('source_path')
     @classmethod
     def validate_source_path(cls, v: str) -> str:
@@ -86,7 +99,11 @@ class TransferCreate(BaseModel):
                 "watch_mode_enabled": True,
                 "settle_time_seconds": 30,
                 "watch_continuous": True,
-                "operation_mode": "copy"
+                "operation_mode": "copy",
+                "priority": "normal",
+                "sync_mode": "full",
+                "delete_removed": False,
+                "max_mbps": None
             }
         }
     )
@@ -103,6 +120,66 @@ class TransferUpdate(BaseModel):
     error_message: Optional[str] = None
 
 
+class BundleCreate(BaseModel):
+    """
+    Schema para transferir muitos arquivos pequenos em lote
+    Request: POST /transfers/bundle
+
+    Small files (<= KETTER_BUNDLE_MAX_FILE_KB) are grouped into bundled
+    transfers (one job each); larger files are rejected - use POST /transfers.
+    """
+    source_paths: List[str] = Field(..., min_length=1, description="Arquivos de origem")
+    destination_path: str = Field(..., min_length=1, max_length=4096, description="Pasta de destino")
+    operation_mode: str = Field(default="copy", pattern="^(copy|move)$")
+    priority: str = Field(default="normal", pattern="^(high|normal|low)$")
+
+    @field_validator('source_paths')
+    @classmethod
+    def validate_source_paths(cls, v: List[str]) -> List[str]:
+        """SECURITY VALIDATION: Sanitize every source path (see TransferCreate)"""
+        try:
+            return [sanitize_path(path, allow_symlinks=True) for path in v]
+        except PathSecurityError as e:
+            raise ValueError(f"Invalid source path: {e}")
+
+    @field_validator('destination_path')
+    @classmethod
+    def validate_destination_path(cls, v: str) -> str:
+        """SECURITY VALIDATION: Sanitize destination path (see TransferCreate)"""
+        try:
+            return sanitize_path(v, allow_symlinks=False)
+        except PathSecurityError as e:
+            raise ValueError(f"Invalid destination path: {e}")
+
+
+class BundleFileResponse(BaseModel):
+    """One file of a bundled transfer"""
+    path: str
+    size: int
+    sha256: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BundleFilesResponse(BaseModel):
+    """
+    Schema de resposta com o resultado por arquivo de um bundle
+    Response: GET /transfers/{id}/bundle
+    """
+    transfer_id: int
+    total: int
+    failed: int
+    files: List[BundleFileResponse]
+
+
+class RateLimitUpdate(BaseModel):
+    """
+    Schema para alterar o limite de banda em tempo de execução
+    Request: PATCH /transfers/{id}/rate-limit, PUT /volumes/rate-limit
+    """
+    max_mbps: Optional[int] = Field(None, ge=1, description="Rate limit in MB/s (None = unlimited / back to config)")
+    path: Optional[str] = Field(None, max_length=4096, description="Volume path (PUT /volumes/rate-limit only)")
+
+
 class TransferResponse(BaseModel):
     """
     Schema de resposta de uma transferência
@@ -124,6 +201,7 @@ class TransferResponse(BaseModel):
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     updated_at: datetime
+    last_scrubbed_at: Optional[datetime] = None
 
     # Week 5: ZIP Smart fields
     is_folder_transfer: bool = False
@@ -147,6 +225,19 @@ class TransferResponse(BaseModel):
     # Week 6: Operation Mode fields (NEW) - COPY vs MOVE 
     operation_mode: str = "copy"
 
+    # Scheduling lane
+    priority: Optional[str] = "normal"
+    queue_name: Optional[str] = None
+
+    # Folder resync
+    sync_mode: Optional[str] = "full"
+    delete_removed: bool = False
+
+    # Bandwidth shaping (allowed vs achieved while a byte loop runs)
+    max_mbps: Optional[int] = None
+    rate_allowed_mbps: Optional[int] = None
+    rate_achieved_mbps: Optional[float] = None
+
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -171,6 +262,7 @@ class ChecksumResponse(BaseModel):
     id: int
     transfer_id: int
     checksum_type: ChecksumType
+    algorithm: str = "sha256"
     checksum_value: str
     calculated_at: datetime
     calculation_duration_seconds: Optional[int] = None
@@ -0,0 +1,288 @@
+"""
+Ketter 3.0 - Bandwidth Shaping
+Rate limits per transfer, per volume and per time-of-day window (token buckets)
+
+MRC Principles:
+- Simple: one token bucket per limit, a byte loop takes tokens and sleeps
+- Shared: buckets live in Redis, so every worker process drawing on the
+  same volume shares one budget
+- Adjustable: limits are re-read while the job runs, no restart needed
+
+Limits (the strictest active one wins):
+- Transfer: TransferCreate.max_mbps, changed at runtime with
+  PATCH /transfers/{id}/rate-limit
+- Volume: ketter.config.yml volumes[].max_mbps, or the first matching
+  volumes[].rate_windows entry ({window: "09:00-19:00", max_mbps: 200}),
+  overridden at runtime with PUT /volumes/rate-limit
+
+Buckets use a debt model: a take always succeeds, the balance may go
+negative and the caller sleeps until it is repaid. Every process sees the
+same balance, so N transfers on one volume get about 1/N of it each.
+
+If Redis is unreachable the shaper falls back to an in-process bucket
+(fail-open across processes): rate limits tune throughput, they don't
+protect data.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.config import VolumeConfig, get_config
+from app.services.scrubber import parse_window, seconds_until_window
+
+RATE_BATCH_BYTES = int(os.getenv("KETTER_RATE_BATCH_KB", "1024")) * 1024
+RATE_REFRESH_SECONDS = float(os.getenv("KETTER_RATE_REFRESH_SECONDS", "2"))
+RATE_BURST_SECONDS = 1.0
+RATE_REPORT_SECONDS = 2.0
+
+OVERRIDES_KEY = "ketter:rate:limits"
+
+# KEYS[1] = bucket | ARGV = bytes per second, burst bytes, bytes taken
+# Returns the milliseconds to wait until the balance is back to zero.
+# Uses Redis server time so hosts with skewed clocks share one bucket.
+_TAKE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000) - tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], 60000)
+if tokens >= 0 then
+  return 0
+end
+return math.ceil(-tokens * 1000 / rate)
+"""
+
+
+def mbps_to_bytes(mbps: float) -> float:
+    """MB/s (as shown in progress data) -> bytes per second"""
+    return float(mbps) * 1024 * 1024
+
+
+class RedisTokenBucket:
+    """Token buckets shared by all workers via Redis"""
+
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+        self._take = redis_conn.register_script(_TAKE_LUA)
+
+    def take(self, key: str, nbytes: int, bytes_per_second: float) -> float:
+        """Take nbytes from the bucket; returns seconds to sleep"""
+        burst = bytes_per_second * RATE_BURST_SECONDS
+        wait_ms = self._take(keys=[f"ketter:rate:bucket:{key}"],
+                             args=[bytes_per_second, burst, nbytes])
+        return int(wait_ms) / 1000.0
+
+
+class LocalTokenBucket:
+    """In-process buckets with the same semantics (SQLite test profile, Redis down)"""
+
+    _guard = threading.Lock()
+    _buckets: Dict[str, Tuple[float, float]] = {}
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+
+    def take(self, key: str, nbytes: int, bytes_per_second: float) -> float:
+        burst = bytes_per_second * RATE_BURST_SECONDS
+        now = self._clock()
+        with self._guard:
+            tokens, ts = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * bytes_per_second) - nbytes
+            self._buckets[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens / bytes_per_second
+
+
+def get_bucket_backend():
+    """Redis buckets in production, in-process buckets for the SQLite test profile"""
+    from app.database import TESTING
+
+    if TESTING:
+        return LocalTokenBucket()
+
+    from app.services.redis_client import get_redis
+    return RedisTokenBucket(get_redis())
+
+
+# Runtime overrides: scope ("transfer:<id>" / "volume:<path>") -> MB/s
+# (0 = unlimited). In Redis so the API process can change a running job.
+_local_overrides: Dict[str, int] = {}
+_local_overrides_guard = threading.Lock()
+
+
+def _override_store():
+    from app.database import TESTING
+
+    if TESTING:
+        return None
+    from app.services.redis_client import get_redis
+    return get_redis()
+
+
+def set_rate_override(scope: str, mbps: Optional[int]) -> None:
+    """Set (or with None, clear) the runtime limit of a scope"""
+    store = _override_store()
+    if store is None:
+        with _local_overrides_guard:
+            if mbps is None:
+                _local_overrides.pop(scope, None)
+            else:
+                _local_overrides[scope] = int(mbps)
+        return
+    if mbps is None:
+        store.hdel(OVERRIDES_KEY, scope)
+    else:
+        store.hset(OVERRIDES_KEY, scope, int(mbps))
+
+
+def get_rate_overrides() -> Dict[str, int]:
+    """All runtime overrides (raises RedisError if Redis is unreachable)"""
+    store = _override_store()
+    if store is None:
+        with _local_overrides_guard:
+            return dict(_local_overrides)
+    return {
+        (k.decode() if isinstance(k, bytes) else k): int(v)
+        for k, v in store.hgetall(OVERRIDES_KEY).items()
+    }
+
+
+def volume_limit_mbps(volume: VolumeConfig, now: Optional[datetime] = None) -> Optional[int]:
+    """
+    Configured limit of a volume at `now`
+
+    The first rate_windows entry whose window contains now wins, otherwise
+    the volume's max_mbps (None = unlimited).
+    """
+    now = now or datetime.now()
+    for entry in volume.rate_windows or []:
+        if seconds_until_window(parse_window(entry.get("window", "")), now) <= 0:
+            return entry.get("max_mbps") or None
+    return volume.max_mbps or None
+
+
+class RateShaper:
+    """
+    Progress callback that enforces the transfer and volume rate limits
+
+    Wraps the byte loops of a transfer (source hash, copy, verification).
+    Bytes are batched (RATE_BATCH_BYTES) before the shared buckets are
+    touched, so Redis sees a few calls per second, not one per chunk.
+    A loop restarting from zero (next phase) starts a new delta.
+    """
+
+    def __init__(
+        self,
+        transfer_id: int,
+        paths: List[str],
+        max_mbps: Optional[int] = None,
+        backend=None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        now: Callable[[], datetime] = datetime.now
+    ):
+        self.transfer_id = transfer_id
+        self.max_mbps = max_mbps or None
+        self.backend = backend or get_bucket_backend()
+        self._fallback = None
+        self._clock = clock
+        self._sleep = sleep
+        self._now = now
+
+        config = get_config()
+        volumes = {}
+        for path in paths:
+            volume = config.get_volume_for_path(path)
+            if volume is not None:
+                volumes[volume.path] = volume
+        self.volumes = [volumes[p] for p in sorted(volumes)]
+
+        self.limits: Dict[str, Optional[int]] = {}
+        self._refreshed_at = None
+        self._last_done = 0
+        self._pending = 0
+        self._rate_started = clock()
+        self._rate_bytes = 0
+        self.achieved_mbps: Optional[float] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Re-read the limits (runtime overrides, time-of-day windows)"""
+        try:
+            overrides = get_rate_overrides()
+        except RedisError as e:
+            print(f"[Bandwidth] Warning: could not read rate overrides: {e}")
+            overrides = {}
+        now = self._now()
+
+        limits = {}
+        scope = f"transfer:{self.transfer_id}"
+        limits[scope] = overrides[scope] if scope in overrides else self.max_mbps
+        for volume in self.volumes:
+            scope = f"volume:{volume.path}"
+            limits[scope] = overrides[scope] if scope in overrides else volume_limit_mbps(volume, now)
+        self.limits = {scope: mbps for scope, mbps in limits.items() if mbps}
+        self._refreshed_at = self._clock()
+
+    @property
+    def allowed_mbps(self) -> Optional[int]:
+        return min(self.limits.values()) if self.limits else None
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.limits)
+
+    def __call__(self, done: int, total: int) -> None:
+        delta = done - self._last_done if done >= self._last_done else done
+        self._last_done = done
+        self._pending += delta
+        self._rate_bytes += delta
+        if self._pending >= RATE_BATCH_BYTES or (total and done >= total):
+            self._flush()
+
+    def wrap(self, callback: Optional[Callable]) -> Callable:
+        """Callback(done, total) that shapes, then calls callback"""
+        def shaped(done, total):
+            self(done, total)
+            if callback:
+                callback(done, total)
+        return shaped
+
+    def _flush(self) -> None:
+        nbytes, self._pending = self._pending, 0
+        if self._clock() - self._refreshed_at >= RATE_REFRESH_SECONDS:
+            self.refresh()
+
+        wait = 0.0
+        for scope, mbps in self.limits.items():
+            wait = max(wait, self._take(scope, nbytes, mbps_to_bytes(mbps)))
+        if wait > 0:
+            self._sleep(wait)
+
+        elapsed = self._clock() - self._rate_started
+        if elapsed >= RATE_REPORT_SECONDS:
+            self.achieved_mbps = round(self._rate_bytes / (1024 * 1024) / elapsed, 1)
+            self._rate_started = self._clock()
+            self._rate_bytes = 0
+
+    def _take(self, scope: str, nbytes: int, bytes_per_second: float) -> float:
+        if self._fallback is None:
+            try:
+                return self.backend.take(scope, nbytes, bytes_per_second)
+            except RedisError as e:
+                print(f"[Bandwidth] Warning: Redis unavailable, rate limits enforced per process: {e}")
+                self._fallback = LocalTokenBucket(self._clock)
+        return self._fallback.take(scope, nbytes, bytes_per_second)
+
+    def report(self) -> dict:
+        """Allowed vs achieved rate, for progress data and audit metadata"""
+        return {"allowed_mbps": self.allowed_mbps, "achieved_mbps": self.achieved_mbps}
@@ -0,0 +1,266 @@
+"""
+Ketter 3.0 - Transfer Job Leases
+Heartbeat lease, stall detection and size-based job timeouts
+
+MRC Principles:
+- Simple: progress loops call beat(), a background thread does the rest
+- Reliable: a lease key in Redis lives only while bytes keep moving
+- Explicit: stalled transfers fail fast with TransferStalledError
+
+The RQ job timeout becomes a generous cap derived from the transfer size
+and measured throughput; liveness is enforced by the stall detector, so
+long transfers are not killed mid-copy and hung reads (e.g. a dead NFS
+server) free the worker after KETTER_STALL_TIMEOUT seconds.
+"""
+
+import os
+import signal
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from redis.exceptions import RedisError
+
+# Default effective throughput (transfer bytes per second of job time)
+# when nothing has been measured yet: 60 MB/s spread over the three data
+# passes of a transfer (source hash, copy, destination hash).
+DATA_PASSES = 3
+DEFAULT_THROUGHPUT_BPS = int(os.getenv("KETTER_EXPECTED_THROUGHPUT_MBPS", "60")) * 1024 * 1024 // DATA_PASSES
+
+TIMEOUT_SAFETY_FACTOR = float(os.getenv("KETTER_TIMEOUT_SAFETY_FACTOR", "2.0"))
+MIN_JOB_TIMEOUT_SECONDS = int(os.getenv("KETTER_MIN_JOB_TIMEOUT", "7200"))
+MAX_JOB_TIMEOUT_SECONDS = int(os.getenv("KETTER_MAX_JOB_TIMEOUT", "172800"))  # 48 hours
+
+STALL_TIMEOUT_SECONDS = int(os.getenv("KETTER_STALL_TIMEOUT", "300"))
+LEASE_TTL_SECONDS = int(os.getenv("KETTER_JOB_LEASE_TTL", "60"))
+
+THROUGHPUT_KEY = "ketter:throughput:effective_bps"
+THROUGHPUT_EWMA_ALPHA = 0.2
+
+# RQ job states that will still run (finished, failed, stopped, canceled
+# or an expired job hash mean nobody is going to work on the transfer)
+LIVE_JOB_STATUSES = ("queued", "started", "deferred", "scheduled")
+
+
+class TransferStalledError(Exception):
+    """Raised when no transfer progress happened for stall_timeout seconds"""
+    pass
+
+
+def lease_key(transfer_id: int) -> str:
+    """Redis key that exists while a worker is actively moving a transfer's bytes"""
+    return f"ketter:lease:transfer:{transfer_id}"
+
+
+def leased_transfer_ids(redis_conn, transfer_ids: Iterable[int]) -> set:
+    """IDs with a live heartbeat lease (single pipelined round-trip)"""
+    transfer_ids = list(transfer_ids)
+    if not transfer_ids:
+        return set()
+    pipe = redis_conn.pipeline(transaction=False)
+    for transfer_id in transfer_ids:
+        pipe.exists(lease_key(transfer_id))
+    return {tid for tid, exists in zip(transfer_ids, pipe.execute()) if exists}
+
+
+def live_job_ids(redis_conn, job_ids: Iterable[str]) -> set:
+    """RQ job IDs that are still queued, scheduled or running (single pipelined round-trip)"""
+    from rq.job import Job
+
+    job_ids = list(job_ids)
+    if not job_ids:
+        return set()
+    pipe = redis_conn.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hget(Job.key_for(job_id), "status")
+    live = set()
+    for job_id, status in zip(job_ids, pipe.execute()):
+        if isinstance(status, bytes):
+            status = status.decode()
+        if status in LIVE_JOB_STATUSES:
+            live.add(job_id)
+    return live
+
+
+def compute_job_timeout(expected_bytes: int, throughput_bps: Optional[float] = None) -> int:
+    """
+    Job timeout from expected size and effective throughput
+
+    timeout = size / throughput * safety factor, clamped to
+    [MIN_JOB_TIMEOUT_SECONDS, MAX_JOB_TIMEOUT_SECONDS].
+
+    Example: 500 GB at the default 20 MB/s effective (60 MB/s raw over
+    three passes) = ~7.1 h, x2 safety = ~14.2 h.
+
+    Args:
+        expected_bytes: Transfer size (0 if unknown, e.g. folder before zipping)
+        throughput_bps: Measured effective throughput (None = default)
+
+    Returns:
+        int: Timeout in seconds
+    """
+    throughput = throughput_bps if throughput_bps and throughput_bps > 0 else DEFAULT_THROUGHPUT_BPS
+    seconds = (expected_bytes / throughput) * TIMEOUT_SAFETY_FACTOR
+    return int(min(MAX_JOB_TIMEOUT_SECONDS, max(MIN_JOB_TIMEOUT_SECONDS, seconds)))
+
+
+def get_measured_throughput(redis_conn) -> Optional[float]:
+    """Effective throughput (bytes/s) measured over recent transfers, if any"""
+    value = redis_conn.get(THROUGHPUT_KEY)
+    return float(value) if value else None
+
+
+def record_throughput(redis_conn, transferred_bytes: int, duration_seconds: float) -> None:
+    """
+    Fold a finished transfer into the moving average (EWMA)
+
+    Read-modify-write without a lock: concurrent updates may drop a sample,
+    which is fine for an estimate.
+    """
+    if transferred_bytes <= 0 or duration_seconds <= 0:
+        return
+    sample = transferred_bytes / duration_seconds
+    current = get_measured_throughput(redis_conn)
+    if current is None:
+        updated = sample
+    else:
+        updated = (1 - THROUGHPUT_EWMA_ALPHA) * current + THROUGHPUT_EWMA_ALPHA * sample
+    redis_conn.set(THROUGHPUT_KEY, updated)
+
+
+def expected_transfer_bytes(source_path: Optional[str], file_size: Optional[int]) -> int:
+    """
+    Bytes a transfer job will move, for its timeout
+
+    file_size when known; a folder is stored with file_size=0 until the ZIP
+    engine sizes it, so its tree is walked (count_files_recursive) instead -
+    otherwise every folder would get the MIN_JOB_TIMEOUT floor.
+    """
+    if file_size:
+        return file_size
+    if source_path and os.path.isdir(source_path):
+        from app.core.zip_engine import count_files_recursive
+
+        try:
+            return count_files_recursive(source_path)[1]
+        except Exception as e:
+            print(f"[JobLease] Warning: could not size folder {source_path}: {e}")
+    return 0
+
+
+def transfer_job_timeout(redis_conn, expected_bytes: int) -> int:
+    """compute_job_timeout() using measured throughput when Redis has it"""
+    try:
+        throughput = get_measured_throughput(redis_conn)
+    except RedisError:
+        throughput = None
+    return compute_job_timeout(expected_bytes, throughput)
+
+
+class TransferHeartbeat:
+    """
+    Heartbeat lease + stall detector for one running transfer
+
+    Usage:
+        with TransferHeartbeat(redis_conn, transfer_id, holder=job.id) as heartbeat:
+            transfer_file_with_verification(..., heartbeat_callback=heartbeat.beat)
+
+    beat() is called from the hash/copy/zip loops and only records the time
+    (no I/O). A daemon thread renews the Redis lease every LEASE_TTL/3 while
+    progress is recent. After stall_timeout seconds without a beat it stops
+    renewing and interrupts the main thread with SIGUSR1, which raises
+    TransferStalledError even if the main thread is blocked in a read.
+    """
+
+    def __init__(
+        self,
+        redis_conn,
+        transfer_id: int,
+        holder: str,
+        stall_timeout: int = STALL_TIMEOUT_SECONDS,
+        lease_ttl: int = LEASE_TTL_SECONDS,
+        on_stall: Optional[Callable[["TransferHeartbeat"], None]] = None
+    ):
+        self.redis = redis_conn
+        self.transfer_id = transfer_id
+        self.holder = holder
+        self.stall_timeout = stall_timeout
+        self.lease_ttl = lease_ttl
+        self.on_stall = on_stall
+        self.stalled = False
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._main_thread_id: Optional[int] = None
+        self._previous_handler = None
+
+    def beat(self, *progress) -> None:
+        """Record progress (accepts any progress callback signature)"""
+        if self.stalled:
+            raise TransferStalledError(self._stall_message())
+        self._last_beat = time.monotonic()
+
+    def seconds_since_progress(self) -> float:
+        return time.monotonic() - self._last_beat
+
+    def start(self) -> "TransferHeartbeat":
+        self._last_beat = time.monotonic()
+        self._renew_lease()
+
+        if threading.current_thread() is threading.main_thread():
+            self._main_thread_id = threading.get_ident()
+            self._previous_handler = signal.signal(signal.SIGUSR1, self._handle_stall_signal)
+
+        interval = max(1, self.lease_ttl // 3)
+        self._thread = threading.Thread(
+            target=self._monitor, args=(interval,),
+            name=f"transfer-heartbeat-{self.transfer_id}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._main_thread_id is not None:
+            signal.signal(signal.SIGUSR1, self._previous_handler or signal.SIG_DFL)
+            self._main_thread_id = None
+        try:
+            self.redis.delete(lease_key(self.transfer_id))
+        except RedisError as e:
+            print(f"[Heartbeat {self.transfer_id}] Warning: could not drop lease: {e}")
+
+    def __enter__(self) -> "TransferHeartbeat":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def _renew_lease(self) -> None:
+        try:
+            self.redis.set(lease_key(self.transfer_id), self.holder, ex=self.lease_ttl)
+        except RedisError as e:
+            print(f"[Heartbeat {self.transfer_id}] Warning: could not renew lease: {e}")
+
+    def _monitor(self, interval: int) -> None:
+        while not self._stop.wait(interval):
+            if self.seconds_since_progress() < self.stall_timeout:
+                self._renew_lease()
+                continue
+
+            # Stalled: let the lease lapse and interrupt the transfer
+            self.stalled = True
+            print(f"[Heartbeat {self.transfer_id}] {self._stall_message()}")
+            if self.on_stall:
+                self.on_stall(self)
+            if self._main_thread_id is not None:
+                signal.pthread_kill(self._main_thread_id, signal.SIGUSR1)
+            return
+
+    def _handle_stall_signal(self, signum, frame) -> None:
+        if self.stalled:
+            raise TransferStalledError(self._stall_message())
+
+    def _stall_message(self) -> str:
+        return f"Transfer stalled: no progress for {self.stall_timeout}s"
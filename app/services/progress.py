@@ -0,0 +1,186 @@
+"""
+Ketter 3.0 - Live Transfer Progress
+Hot progress counters in Redis; the transfers row is written on phase changes only
+
+MRC Principles:
+- Simple: one Redis hash per running transfer, overlaid on API responses
+- Cheap: the copy loops no longer UPDATE the heavily indexed transfers row
+  once per chunk (every UPDATE is a new Postgres tuple plus index entries
+  and autovacuum work); they write a small hash a few times per second
+- Reliable: on every status change the latest values land on the row in
+  the same commit as the status (app.models._write_back_live_progress),
+  so the table is always right at phase boundaries
+
+Fields: bytes_transferred, progress_percent, rate_allowed_mbps,
+rate_achieved_mbps and updated_at (epoch seconds).
+
+If Redis is unreachable the writer keeps the values in process (fail-open):
+readers then see the row, which is still updated at every phase change.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from redis.exceptions import RedisError
+
+PROGRESS_FIELDS = ("bytes_transferred", "progress_percent", "rate_allowed_mbps", "rate_achieved_mbps")
+PROGRESS_PUBLISH_SECONDS = float(os.getenv("KETTER_PROGRESS_PUBLISH_SECONDS", "0.5"))
+PROGRESS_TTL_SECONDS = 86400
+
+_FIELD_TYPES = {
+    "bytes_transferred": int,
+    "progress_percent": int,
+    "rate_allowed_mbps": int,
+    "rate_achieved_mbps": float,
+    "updated_at": float,
+}
+
+
+def progress_key(transfer_id: int) -> str:
+    return f"ketter:progress:{transfer_id}"
+
+
+def _encode(values: dict) -> dict:
+    return {name: "" if value is None else value for name, value in values.items()}
+
+
+def _decode(raw: dict) -> dict:
+    values = {}
+    for name, value in raw.items():
+        name = name.decode() if isinstance(name, bytes) else name
+        value = value.decode() if isinstance(value, bytes) else value
+        if name in _FIELD_TYPES:
+            values[name] = None if value == "" else _FIELD_TYPES[name](float(value))
+    if "updated_at" in values:
+        values["updated_at"] = datetime.fromtimestamp(values["updated_at"], timezone.utc)
+    return values
+
+
+class RedisProgressStore:
+    """Progress hashes shared by workers (writers) and the API (reader)"""
+
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+
+    def write(self, transfer_id: int, values: dict) -> None:
+        key = progress_key(transfer_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=_encode(values))
+        pipe.expire(key, PROGRESS_TTL_SECONDS)
+        pipe.execute()
+
+    def read_many(self, transfer_ids: Iterable[int]) -> Dict[int, dict]:
+        transfer_ids = list(transfer_ids)
+        if not transfer_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for transfer_id in transfer_ids:
+            pipe.hgetall(progress_key(transfer_id))
+        return {tid: _decode(raw) for tid, raw in zip(transfer_ids, pipe.execute()) if raw}
+
+    def clear(self, transfer_ids: Iterable[int]) -> None:
+        keys = [progress_key(tid) for tid in transfer_ids]
+        if keys:
+            self.redis.delete(*keys)
+
+
+class LocalProgressStore:
+    """In-process store with the same interface (SQLite test profile, Redis down)"""
+
+    _guard = threading.Lock()
+    _progress: Dict[int, dict] = {}
+
+    def write(self, transfer_id: int, values: dict) -> None:
+        with self._guard:
+            self._progress.setdefault(transfer_id, {}).update(_encode(values))
+
+    def read_many(self, transfer_ids: Iterable[int]) -> Dict[int, dict]:
+        with self._guard:
+            return {tid: _decode(self._progress[tid]) for tid in transfer_ids if tid in self._progress}
+
+    def clear(self, transfer_ids: Iterable[int]) -> None:
+        with self._guard:
+            for tid in transfer_ids:
+                self._progress.pop(tid, None)
+
+
+def get_progress_store():
+    """Redis store in production, in-process store for the SQLite test profile"""
+    from app.database import TESTING
+
+    if TESTING:
+        return LocalProgressStore()
+
+    from app.services.redis_client import get_redis
+    return RedisProgressStore(get_redis())
+
+
+def read_live_progress(transfer_ids: Iterable[int]) -> Dict[int, dict]:
+    """Live progress of running transfers ({} if Redis is unreachable)"""
+    try:
+        return get_progress_store().read_many(transfer_ids)
+    except RedisError as e:
+        print(f"[Progress] Warning: live progress unavailable: {e}")
+        return {}
+
+
+def clear_live_progress(transfer_ids: Iterable[int]) -> None:
+    """Drop stale live progress (transfer requeued from scratch)"""
+    try:
+        get_progress_store().clear(transfer_ids)
+    except RedisError as e:
+        print(f"[Progress] Warning: could not clear live progress: {e}")
+
+
+class LiveProgress:
+    """
+    Progress writer of one running transfer
+
+    update() publishes at most every PROGRESS_PUBLISH_SECONDS (and whenever
+    the percentage moves); write_back() copies the latest values onto the
+    ORM row and is called by the status change listener, so they are
+    committed with the new phase.
+    """
+
+    def __init__(self, transfer, store=None, clock=time.monotonic):
+        self.transfer = transfer
+        self.store = store or get_progress_store()
+        self.values: dict = {}
+        self._clock = clock
+        self._published_at: Optional[float] = None
+        self._published_percent: Optional[int] = None
+        self._safe(self.store.clear, [transfer.id])  # Leftovers of a previous run
+
+    def update(self, **values) -> None:
+        self.values.update(values)
+        percent = self.values.get("progress_percent")
+        now = self._clock()
+        if (self._published_at is not None and percent == self._published_percent
+                and now - self._published_at < PROGRESS_PUBLISH_SECONDS):
+            return
+        self._published_at = now
+        self._published_percent = percent
+        self._safe(self.store.write, self.transfer.id, dict(self.values, updated_at=time.time()))
+
+    def write_back(self) -> None:
+        for name, value in self.values.items():
+            setattr(self.transfer, name, value)
+
+    def _safe(self, method, *args) -> None:
+        try:
+            method(*args)
+        except RedisError as e:
+            print(f"[Progress] Warning: Redis unavailable, progress written at phase changes only: {e}")
+            self.store = LocalProgressStore()
+
+
+def get_live_progress(transfer) -> LiveProgress:
+    """The LiveProgress attached to a Transfer instance (created on first use)"""
+    live = transfer.__dict__.get("_live_progress")
+    if live is None:
+        live = LiveProgress(transfer)
+        transfer._live_progress = live
+    return live
@@ -0,0 +1,405 @@
+"""
+Ketter 3.0 - Crash Recovery Sweeper
+Reconciles state left behind by killed workers and host reboots
+
+MRC Principles:
+- Simple: one pass = find, reclaim, requeue-or-fail
+- Reliable: a transfer is only touched when its heartbeat lease is gone
+  AND its row has not changed for KETTER_RECOVERY_GRACE seconds
+- Cheap: one SELECT, one pipelined EXISTS round-trip, bulk UPDATEs
+
+What a crash leaves behind:
+- ketter_temp_<id>_<folder>.zip in tempfile.gettempdir() (source ZIP)
+- <folder>.zip next to the destination (half-written destination ZIP)
+- partial destination file (file transfers)
+- Transfer rows stuck in VALIDATING / COPYING / VERIFYING
+- COPIED_UNVERIFIED rows whose verify job was lost (verification re-queued)
+- Dedupe keys held by waiting rows no job will run (app.services.transfer_dedupe)
+
+Each pass also promotes jobs starved in the lower lanes (app.services.scheduling),
+so promotion does not depend on new transfers being submitted.
+
+Run periodically:
+    python -m app.services.recovery            (loop, KETTER_RECOVERY_INTERVAL)
+    python -m app.services.recovery --once
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.models import Transfer, AuditLog, AuditEventType, TransferStatus
+from app.services.job_lease import leased_transfer_ids, live_job_ids
+from app.services.progress import clear_live_progress
+
+# Stuck rows and scratch files younger than this are never touched
+RECOVERY_GRACE_SECONDS = int(os.getenv("KETTER_RECOVERY_GRACE", "900"))
+RECOVERY_INTERVAL_SECONDS = int(os.getenv("KETTER_RECOVERY_INTERVAL", "300"))
+
+# "requeue": run stuck transfers again (up to MAX_RETRIES), "fail": mark FAILED
+RECOVERY_POLICY = os.getenv("KETTER_RECOVERY_POLICY", "requeue")
+RECOVERY_MAX_RETRIES = int(os.getenv("KETTER_RECOVERY_MAX_RETRIES", "3"))
+
+IN_FLIGHT_STATUSES = (
+    TransferStatus.VALIDATING,
+    TransferStatus.COPYING,
+    TransferStatus.VERIFYING,
+)
+
+TEMP_ZIP_PATTERN = re.compile(r"^ketter_temp_(\d+)_.*\.zip$")
+
+
+def find_stale_transfers(db, redis_conn, grace_seconds: int = RECOVERY_GRACE_SECONDS) -> List[Transfer]:
+    """
+    In-flight transfers whose worker is gone
+
+    Args:
+        db: Database session
+        redis_conn: Redis connection (heartbeat leases)
+        grace_seconds: Minimum age of the last row update
+
+    Returns:
+        list[Transfer]: Transfers with no heartbeat lease and no recent update
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    candidates = (
+        db.query(Transfer)
+        .filter(Transfer.status.in_(IN_FLIGHT_STATUSES))
+        .filter(Transfer.updated_at < cutoff)
+        .filter(Transfer.watch_continuous != 1)
+        .all()
+    )
+    if not candidates:
+        return []
+
+    leased = leased_transfer_ids(redis_conn, [t.id for t in candidates])
+    return [t for t in candidates if t.id not in leased]
+
+
+def find_unverified_transfers(db, redis_conn, grace_seconds: int = RECOVERY_GRACE_SECONDS) -> List[Transfer]:
+    """
+    COPIED_UNVERIFIED transfers whose deferred verification was lost
+
+    Returns:
+        list[Transfer]: No heartbeat lease, no live verify job, no recent update
+    """
+    from app.services.worker_jobs import verify_job_id
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    candidates = (
+        db.query(Transfer)
+        .filter(Transfer.status == TransferStatus.COPIED_UNVERIFIED)
+        .filter(Transfer.updated_at < cutoff)
+        .all()
+    )
+    if not candidates:
+        return []
+
+    leased = leased_transfer_ids(redis_conn, [t.id for t in candidates])
+    queued = live_job_ids(redis_conn, [verify_job_id(t.id) for t in candidates])
+    return [t for t in candidates if t.id not in leased and verify_job_id(t.id) not in queued]
+
+
+def requeue_lost_verifications(db, redis_conn, grace_seconds: int = RECOVERY_GRACE_SECONDS) -> List[int]:
+    """
+    Queue the verification of copied transfers again (the copy stays)
+
+    Returns:
+        list[int]: Transfer IDs whose verification was re-queued
+    """
+    from app.services.worker_jobs import enqueue_verification
+
+    requeued = []
+    for transfer in find_unverified_transfers(db, redis_conn, grace_seconds):
+        enqueue_verification(redis_conn, transfer)
+        db.add(AuditLog(
+            transfer_id=transfer.id,
+            event_type=AuditEventType.TRANSFER_PROGRESS,
+            message="Recovered: deferred verification job was lost, re-queued",
+            event_metadata={"recovery": True, "previous_status": transfer.status.value}
+        ))
+        requeued.append(transfer.id)
+    db.commit()
+    return requeued
+
+
+def destination_scratch_path(transfer: Transfer) -> Optional[str]:
+    """
+    Partial destination artifact of an interrupted transfer
+
+    Folder transfers copy <folder>.zip next to the destination before
+    unzipping; file transfers write the destination file directly. Returns
+    None when removing it could lose data: the source is gone (a MOVE may
+    already have deleted it) or the folder was already unzipped.
+    """
+    if transfer.is_folder_transfer:
+        source = transfer.original_folder_path or transfer.source_path
+        if transfer.unzip_completed or not source or not os.path.isdir(source):
+            return None
+        folder_name = os.path.basename(source.rstrip('/'))
+        return os.path.join(os.path.dirname(transfer.destination_path), f"{folder_name}.zip")
+
+    if not os.path.isfile(transfer.source_path):
+        return None
+    return transfer.destination_path
+
+
+def reclaim_temp_zips(
+    db,
+    redis_conn,
+    temp_dir: Optional[str] = None,
+    grace_seconds: int = RECOVERY_GRACE_SECONDS
+) -> Dict[str, int]:
+    """
+    Delete orphaned ketter_temp_*.zip files
+
+    A temp ZIP is orphaned when it is older than the grace period and its
+    transfer is missing, finished, or has no heartbeat lease.
+
+    Returns:
+        dict: files, bytes reclaimed
+    """
+    temp_dir = temp_dir or tempfile.gettempdir()
+    now = time.time()
+    found = {}
+
+    try:
+        entries = list(os.scandir(temp_dir))
+    except OSError as e:
+        print(f"[Recovery] Cannot scan {temp_dir}: {e}")
+        return {"files": 0, "bytes": 0}
+
+    for entry in entries:
+        match = TEMP_ZIP_PATTERN.match(entry.name)
+        if not match or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if now - stat.st_mtime < grace_seconds:
+            continue
+        found[entry.path] = (int(match.group(1)), stat.st_size)
+
+    if not found:
+        return {"files": 0, "bytes": 0}
+
+    transfer_ids = {tid for tid, _ in found.values()}
+    in_flight = {
+        tid for (tid,) in db.query(Transfer.id)
+        .filter(Transfer.id.in_(transfer_ids))
+        .filter(Transfer.status.in_(IN_FLIGHT_STATUSES + (TransferStatus.PENDING,)))
+        .all()
+    }
+    leased = leased_transfer_ids(redis_conn, in_flight) if in_flight else set()
+
+    reclaimed = {"files": 0, "bytes": 0}
+    for path, (tid, size) in found.items():
+        if tid in leased:
+            continue
+        if _remove_file(path):
+            reclaimed["files"] += 1
+            reclaimed["bytes"] += size
+    return reclaimed
+
+
+def recover_stale_transfers(
+    db,
+    redis_conn,
+    policy: str = RECOVERY_POLICY,
+    max_retries: int = RECOVERY_MAX_RETRIES,
+    grace_seconds: int = RECOVERY_GRACE_SECONDS
+) -> Dict[str, list]:
+    """
+    Requeue or fail stuck transfers and remove their partial destinations
+
+    Policy:
+        requeue - back to PENDING and re-enqueued on its lane, while
+                  retry_count < max_retries and the source still exists
+        fail    - marked FAILED for operator review
+
+    Returns:
+        dict: requeued, failed (lists of transfer IDs)
+    """
+    stale = find_stale_transfers(db, redis_conn, grace_seconds)
+    if not stale:
+        return {"requeued": [], "failed": []}
+
+    requeue, failed = [], []
+    logs = []
+    for transfer in stale:
+        scratch = destination_scratch_path(transfer)
+        if scratch:
+            _remove_file(scratch)
+        _release_space(transfer)
+
+        source_exists = os.path.exists(transfer.original_folder_path or transfer.source_path)
+        if policy == "requeue" and source_exists and (transfer.retry_count or 0) < max_retries:
+            requeue.append(transfer)
+            message = f"Recovered after worker loss (was {transfer.status.value}): requeued"
+            event_type = AuditEventType.TRANSFER_PROGRESS
+        else:
+            failed.append(transfer)
+            reason = "source missing" if not source_exists else f"policy={policy}, retries={transfer.retry_count or 0}"
+            message = f"Recovered after worker loss (was {transfer.status.value}): marked FAILED ({reason})"
+            event_type = AuditEventType.TRANSFER_FAILED
+        logs.append(AuditLog(
+            transfer_id=transfer.id,
+            event_type=event_type,
+            message=message,
+            event_metadata={"recovery": True, "previous_status": transfer.status.value}
+        ))
+
+    requeue_ids = [t.id for t in requeue]
+    failed_ids = [t.id for t in failed]
+
+    if requeue_ids:
+        db.query(Transfer).filter(Transfer.id.in_(requeue_ids)).update({
+            Transfer.status: TransferStatus.PENDING,
+            Transfer.bytes_transferred: 0,
+            Transfer.progress_percent: 0,
+            Transfer.unzip_completed: 0,
+            Transfer.retry_count: Transfer.retry_count + 1,
+            Transfer.error_message: "Requeued by recovery sweeper after worker loss",
+        }, synchronize_session=False)
+    if failed_ids:
+        db.query(Transfer).filter(Transfer.id.in_(failed_ids)).update({
+            Transfer.status: TransferStatus.FAILED,
+            Transfer.error_message: "Worker lost mid-transfer (recovery sweeper)",
+            Transfer.dedupe_key: None,  # Bulk update skips the ORM status event
+        }, synchronize_session=False)
+    db.add_all(logs)
+    db.commit()
+    clear_live_progress(requeue_ids + failed_ids)
+
+    if requeue:
+        _enqueue_recovered(redis_conn, requeue)
+        db.commit()  # New job IDs
+
+    return {"requeued": requeue_ids, "failed": failed_ids}
+
+
+def _enqueue_recovered(redis_conn, transfers: List[Transfer]) -> None:
+    """Re-enqueue recovered transfers on their lanes (one pipeline per lane), setting job_id"""
+    from rq import Queue
+    from app.services.scheduling import select_lane, get_lane_queue
+    from app.services.job_lease import expected_transfer_bytes, transfer_job_timeout
+    from app.services.worker_jobs import transfer_file_job, TRANSFER_JOB_CONFIG
+
+    by_lane: Dict[str, List[Transfer]] = {}
+    for transfer in transfers:
+        lane = transfer.queue_name or select_lane(transfer.priority or "normal", transfer.file_size or 0)
+        by_lane.setdefault(lane, []).append(transfer)
+
+    for lane, lane_transfers in by_lane.items():
+        queue = get_lane_queue(lane, redis_conn)
+        jobs = queue.enqueue_many([
+            Queue.prepare_data(
+                transfer_file_job,
+                args=(transfer.id,),
+                timeout=transfer_job_timeout(
+                    redis_conn, expected_transfer_bytes(transfer.source_path, transfer.file_size)
+                ),
+                result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+                failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"],
+            )
+            for transfer in lane_transfers
+        ])
+        for transfer, job in zip(lane_transfers, jobs):
+            transfer.job_id = job.id
+
+
+def _release_space(transfer: Transfer) -> None:
+    """Drop the dead worker's disk-space reservation instead of waiting for it to expire"""
+    from app.services.space_ledger import filesystem_id, get_space_ledger
+
+    try:
+        fs_id = filesystem_id(os.path.dirname(transfer.destination_path))
+        get_space_ledger().release(fs_id, str(transfer.id))
+    except Exception as e:
+        print(f"[Recovery] Could not release space reservation of transfer {transfer.id}: {e}")
+
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        print(f"[Recovery] Removed {path}")
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"[Recovery] Could not remove {path}: {e}")
+        return False
+
+
+def run_recovery_sweep(db, redis_conn) -> dict:
+    """
+    One reconciliation pass (stuck transfers, lost verifications, dead
+    dedupe holders, temp ZIPs, starved lane jobs)
+
+    Returns:
+        dict: requeued, failed, reverified, released_keys, promoted,
+            reclaimed_files, reclaimed_bytes
+    """
+    from app.services.scheduling import promote_starved_jobs
+    from app.services.transfer_dedupe import release_stale_dedupe_keys
+
+    recovered = recover_stale_transfers(db, redis_conn)
+    reverified = requeue_lost_verifications(db, redis_conn)
+    released_keys = release_stale_dedupe_keys(db, redis_conn, RECOVERY_GRACE_SECONDS)
+    reclaimed = reclaim_temp_zips(db, redis_conn)
+
+    # Starvation protection must not wait for the next POST /transfers
+    try:
+        promoted = promote_starved_jobs(redis_conn)
+    except Exception as e:
+        promoted = 0
+        print(f"[Recovery] Warning: starvation check failed: {str(e)}")
+
+    result = {
+        "requeued": recovered["requeued"],
+        "failed": recovered["failed"],
+        "reverified": reverified,
+        "released_keys": released_keys,
+        "promoted": promoted,
+        "reclaimed_files": reclaimed["files"],
+        "reclaimed_bytes": reclaimed["bytes"],
+    }
+    if recovered["requeued"] or recovered["failed"] or reverified or released_keys or promoted or reclaimed["files"]:
+        print(
+            f"[Recovery] requeued={recovered['requeued']} failed={recovered['failed']} reverified={reverified} "
+            f"released_keys={released_keys} promoted={promoted} "
+            f"reclaimed {reclaimed['files']} files ({reclaimed['bytes'] / (1024**3):.2f} GB)"
+        )
+    return result
+
+
+def main(argv: List[str]) -> int:
+    from app.database import SessionLocal
+    from app.services.redis_client import get_redis
+
+    once = "--once" in argv
+    print(f"[Recovery] Sweeper started (interval {RECOVERY_INTERVAL_SECONDS}s, "
+          f"grace {RECOVERY_GRACE_SECONDS}s, policy {RECOVERY_POLICY})")
+
+    while True:
+        db = SessionLocal()
+        try:
+            run_recovery_sweep(db, get_redis())
+        except Exception as e:
+            db.rollback()
+            print(f"[Recovery] Sweep failed: {e}")
+        finally:
+            db.close()
+
+        if once:
+            return 0
+        time.sleep(RECOVERY_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
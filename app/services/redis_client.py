@@ -0,0 +1,23 @@
+"""
+Ketter 3.0 - Shared Redis Connection
+Single lazily-created Redis client for coordination services
+
+MRC: One connection pool per process, same REDIS_URL everywhere
+"""
+
+import os
+from typing import Optional
+
+from redis import Redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+_redis_conn: Optional[Redis] = None
+
+
+def get_redis() -> Redis:
+    """Get the process-wide Redis client (created on first use)"""
+    global _redis_conn
+    if _redis_conn is None:
+        _redis_conn = Redis.from_url(REDIS_URL)
+    return _redis_conn
@@ -0,0 +1,176 @@
+"""
+Ketter 3.0 - Transfer Scheduling Lanes
+Priority classes and size-aware routing onto separate RQ queues
+
+MRC Principles:
+- Simple: one RQ queue per lane, workers listen in strict lane order
+- Reliable: starvation protection promotes jobs that waited too long
+- Transparent: depth and wait time per lane exposed on /status
+
+Lanes (worker listen order):
+    high    - priority="high"
+    small   - size-aware lane: small normal-priority transfers bypass large ones
+    default - priority="normal" (historical queue name, kept for compatibility)
+    low     - priority="low"
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from rq import Queue
+from rq.job import Job
+
+TRANSFER_PRIORITIES = ("high", "normal", "low")
+
+# Strict order used by workers: rq worker high small default low
+LANE_ORDER = ["high", "small", "default", "low"]
+
+PRIORITY_LANES = {
+    "high": "high",
+    "normal": "default",
+    "low": "low",
+}
+
+# Size-aware policy (opt-in): normal transfers up to this size use the "small" lane
+SIZE_AWARE_SCHEDULING = os.getenv("KETTER_SIZE_AWARE_SCHEDULING", "0") == "1"
+SMALL_TRANSFER_BYTES = int(os.getenv("KETTER_SMALL_TRANSFER_BYTES", 256 * 1024 * 1024))
+
+# Starvation protection: jobs older than this move one lane up
+STARVATION_MAX_WAIT_SECONDS = int(os.getenv("KETTER_STARVATION_MAX_WAIT", "900"))
+STARVATION_SCAN_LIMIT = 50
+
+# Recent start-wait samples kept per lane for /status
+LANE_WAIT_SAMPLES = 100
+
+
+def select_lane(priority: str, file_size: int) -> str:
+    """
+    Pick the RQ queue name for a transfer
+
+    Args:
+        priority: "high", "normal" or "low"
+        file_size: Known size in bytes (0 for folders, sized later by the ZIP engine)
+
+    Returns:
+        str: Queue name (one of LANE_ORDER)
+    """
+    lane = PRIORITY_LANES.get(priority, "default")
+    if (
+        lane == "default"
+        and SIZE_AWARE_SCHEDULING
+        and 0 < file_size <= SMALL_TRANSFER_BYTES
+    ):
+        return "small"
+    return lane
+
+
+def get_lane_queue(lane: str, connection) -> Queue:
+    """RQ queue for a lane"""
+    return Queue(lane, connection=connection)
+
+
+def _lane_above(lane: str) -> Optional[str]:
+    index = LANE_ORDER.index(lane)
+    return LANE_ORDER[index - 1] if index > 0 else None
+
+
+def promote_starved_jobs(connection, max_wait_seconds: int = STARVATION_MAX_WAIT_SECONDS) -> int:
+    """
+    Move jobs that waited longer than max_wait_seconds one lane up
+
+    Queues are FIFO, so each lane is scanned from its head and the scan
+    stops at the first job that is not starved. A promoted job gets a fresh
+    enqueued_at, so a job still waiting after another max_wait climbs again.
+
+    Called on every recovery sweep (app.services.recovery) and
+    opportunistically on POST /transfers.
+
+    Args:
+        connection: Redis connection
+        max_wait_seconds: Max time a job may wait in its lane
+
+    Returns:
+        int: Number of jobs promoted
+    """
+    now = datetime.now(timezone.utc)
+    promoted = 0
+
+    # Lowest lane first so a job climbs at most one lane per call
+    for lane in reversed(LANE_ORDER):
+        target_lane = _lane_above(lane)
+        if target_lane is None:
+            continue
+
+        queue = get_lane_queue(lane, connection)
+        target = get_lane_queue(target_lane, connection)
+
+        for job_id in queue.get_job_ids(0, STARVATION_SCAN_LIMIT):
+            job = Job.fetch(job_id, connection=connection)
+            if job.enqueued_at is None:
+                continue
+            waited = (now - _as_utc(job.enqueued_at)).total_seconds()
+            if waited < max_wait_seconds:
+                break
+
+            queue.remove(job)
+            job.meta.setdefault("promoted_from", []).append(lane)
+            job.save_meta()
+            target.enqueue_job(job)
+            promoted += 1
+            print(f"[Scheduling] Job {job.id} promoted {lane} -> {target_lane} after {int(waited)}s")
+
+    return promoted
+
+
+def record_lane_wait(connection, job: Job) -> None:
+    """Record how long a job waited in its lane before a worker picked it up"""
+    if job is None or job.enqueued_at is None:
+        return
+    waited = (datetime.now(timezone.utc) - _as_utc(job.enqueued_at)).total_seconds()
+    key = f"ketter:lane:{job.origin}:waits"
+    pipe = connection.pipeline()
+    pipe.lpush(key, round(waited, 3))
+    pipe.ltrim(key, 0, LANE_WAIT_SAMPLES - 1)
+    pipe.execute()
+
+
+def get_lane_stats(connection) -> List[dict]:
+    """
+    Depth and wait time per lane (for /status)
+
+    Returns:
+        list[dict]: lane, depth, oldest_wait_seconds, avg_wait_seconds
+            (avg over the last LANE_WAIT_SAMPLES jobs that started)
+    """
+    now = datetime.now(timezone.utc)
+    stats = []
+
+    for lane in LANE_ORDER:
+        queue = get_lane_queue(lane, connection)
+
+        oldest_wait = 0.0
+        head_ids = queue.get_job_ids(0, 1)
+        if head_ids:
+            head = Job.fetch(head_ids[0], connection=connection)
+            if head.enqueued_at is not None:
+                oldest_wait = (now - _as_utc(head.enqueued_at)).total_seconds()
+
+        samples = [float(v) for v in connection.lrange(f"ketter:lane:{lane}:waits", 0, -1)]
+        avg_wait = sum(samples) / len(samples) if samples else 0.0
+
+        stats.append({
+            "lane": lane,
+            "depth": queue.count,
+            "oldest_wait_seconds": round(oldest_wait, 1),
+            "avg_wait_seconds": round(avg_wait, 1)
+        })
+
+    return stats
+
+
+def _as_utc(value: datetime) -> datetime:
+    """RQ stores naive UTC datetimes"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
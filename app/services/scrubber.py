@@ -0,0 +1,266 @@
+"""
+Ketter 3.0 - Integrity Scrubber
+Re-hashes delivered destinations to catch bit rot and tampering
+
+MRC Principles:
+- Simple: one completed transfer at a time, compared to its FINAL checksum
+- Gentle: idle I/O class, MB/s budget, quiet-hours window only
+- Explicit: every scrub leaves a SCRUB_PASSED / SCRUB_FAILED audit event
+
+Scheduling:
+- Due = COMPLETED file transfers never scrubbed, or last scrubbed more
+  than KETTER_SCRUB_INTERVAL_DAYS ago
+- Never-scrubbed first (oldest delivery first), then least recently scrubbed
+- Progress is the last_scrubbed_at column, so a restart resumes with the
+  next due transfer (a file interrupted mid-hash is re-hashed from the start)
+
+Folder transfers are skipped: their FINAL checksum is of the transfer ZIP,
+which no longer exists once unzipped at the destination.
+
+Run:
+    python -m app.services.scrubber            (loop)
+    python -m app.services.scrubber --once     (one batch, ignores the window)
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.models import Transfer, Checksum, AuditLog, AuditEventType, TransferStatus, ChecksumType
+
+SCRUB_INTERVAL_DAYS = int(os.getenv("KETTER_SCRUB_INTERVAL_DAYS", "30"))
+SCRUB_MAX_MBPS = int(os.getenv("KETTER_SCRUB_MAX_MBPS", "50"))  # 0 = uncapped
+SCRUB_WINDOW = os.getenv("KETTER_SCRUB_WINDOW", "22:00-06:00")  # local time; empty = always
+SCRUB_BATCH_SIZE = int(os.getenv("KETTER_SCRUB_BATCH", "50"))
+SCRUB_IDLE_SECONDS = int(os.getenv("KETTER_SCRUB_IDLE", "600"))
+SCRUB_IO_CLASS = os.getenv("KETTER_SCRUB_IO_CLASS", "idle")
+
+
+def parse_window(window: str) -> Optional[Tuple[int, int]]:
+    """
+    "HH:MM-HH:MM" -> (start, end) in minutes after midnight
+
+    Returns None for an empty window (scrub at any time). The window may
+    wrap midnight ("22:00-06:00").
+    """
+    window = (window or "").strip()
+    if not window:
+        return None
+    try:
+        start, end = window.split("-")
+        minutes = []
+        for part in (start, end):
+            hours, mins = part.strip().split(":")
+            if not (0 <= int(hours) < 24 and 0 <= int(mins) < 60):
+                raise ValueError
+            minutes.append(int(hours) * 60 + int(mins))
+    except ValueError:
+        raise ValueError(f"Invalid scrub window '{window}'. Expected HH:MM-HH:MM")
+    return minutes[0], minutes[1]
+
+
+def seconds_until_window(window: Optional[Tuple[int, int]], now: datetime) -> float:
+    """0 while inside the quiet-hours window, else seconds until it opens"""
+    if window is None:
+        return 0
+    start, end = window
+    current = now.hour * 60 + now.minute
+    inside = start <= current < end if start < end else (current >= start or current < end)
+    if inside or start == end:
+        return 0
+    minutes = (start - current) % (24 * 60)
+    return minutes * 60 - now.second
+
+
+class ScrubPacer:
+    """
+    Progress callback that enforces the MB/s budget and the quiet-hours window
+
+    The budget is shared by every file of a pass. Outside the window the
+    current read pauses in place and resumes when the window reopens; the
+    rate baseline restarts then, so the pause is not "caught up" in a burst.
+    """
+
+    def __init__(
+        self,
+        max_bytes_per_second: Optional[float] = None,
+        window: Optional[Tuple[int, int]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        now: Callable[[], datetime] = datetime.now
+    ):
+        self.max_bytes_per_second = max_bytes_per_second or None
+        self.window = window
+        self._clock = clock
+        self._sleep = sleep
+        self._now = now
+        self._restart()
+        self._last_done = 0
+
+    def _restart(self) -> None:
+        self._started = self._clock()
+        self._bytes = 0
+
+    def start_file(self) -> None:
+        self._last_done = 0
+
+    def wait_for_window(self) -> bool:
+        """Block until the window is open; True if it had to wait"""
+        waited = False
+        while True:
+            remaining = seconds_until_window(self.window, self._now())
+            if remaining <= 0:
+                break
+            waited = True
+            self._sleep(min(remaining, 300))
+        if waited:
+            self._restart()
+        return waited
+
+    def __call__(self, done: int, total: int) -> None:
+        self._bytes += max(0, done - self._last_done)
+        self._last_done = done
+
+        if self.wait_for_window():
+            return
+
+        if self.max_bytes_per_second:
+            ahead = self._bytes / self.max_bytes_per_second - (self._clock() - self._started)
+            if ahead > 0:
+                self._sleep(ahead)
+
+
+def find_due_transfers(db, limit: int = SCRUB_BATCH_SIZE, interval_days: int = SCRUB_INTERVAL_DAYS) -> List[Transfer]:
+    """
+    Completed file transfers due for a scrub, oldest unverified data first
+
+    Returns:
+        list[Transfer]: Up to `limit` transfers
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=interval_days)
+    return (
+        db.query(Transfer)
+        .filter(Transfer.status == TransferStatus.COMPLETED)
+        .filter(Transfer.is_folder_transfer != 1)
+        .filter((Transfer.last_scrubbed_at.is_(None)) | (Transfer.last_scrubbed_at < cutoff))
+        .order_by(
+            Transfer.last_scrubbed_at.isnot(None),
+            Transfer.last_scrubbed_at,
+            Transfer.completed_at,
+            Transfer.id
+        )
+        .limit(limit)
+        .all()
+    )
+
+
+def scrub_transfer(db, transfer: Transfer, pacer: Optional[ScrubPacer] = None) -> str:
+    """
+    Re-hash one destination and record the outcome
+
+    Returns:
+        str: "passed", "mismatch", "missing", "unreadable" or "no_checksum"
+    """
+    from app.core.copy_engine import calculate_sha256_from_storage
+
+    final = db.query(Checksum).filter(
+        Checksum.transfer_id == transfer.id,
+        Checksum.checksum_type == ChecksumType.FINAL
+    ).first()
+
+    metadata = {"destination": transfer.destination_path}
+    actual = None
+    if final is None:
+        result = "no_checksum"
+    elif not os.path.isfile(transfer.destination_path):
+        result = "missing"
+    else:
+        if pacer:
+            pacer.start_file()
+        try:
+            actual, read_stats = calculate_sha256_from_storage(
+                transfer.destination_path, progress_callback=pacer
+            )
+            metadata["read"] = read_stats
+            result = "passed" if actual == final.checksum_value else "mismatch"
+        except OSError as e:
+            metadata["error"] = str(e)
+            result = "unreadable"
+
+    if final is not None:
+        metadata["expected"] = final.checksum_value
+    if actual is not None:
+        metadata["actual"] = actual
+    metadata["result"] = result
+
+    if result == "passed":
+        event_type = AuditEventType.SCRUB_PASSED
+        message = f"Scrub passed: destination matches FINAL checksum {actual[:16]}..."
+    else:
+        event_type = AuditEventType.SCRUB_FAILED
+        message = f"Scrub FAILED ({result}): {transfer.destination_path}"
+        print(f"[Scrubber] Transfer {transfer.id}: {message}")
+
+    transfer.last_scrubbed_at = datetime.now(timezone.utc)
+    db.add(AuditLog(
+        transfer_id=transfer.id,
+        event_type=event_type,
+        message=message,
+        event_metadata=metadata
+    ))
+    db.commit()
+    return result
+
+
+def run_scrub_pass(db, pacer: Optional[ScrubPacer] = None, limit: int = SCRUB_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Scrub one batch of due transfers
+
+    Returns:
+        dict: Count per result ("passed", "mismatch", ...) plus "scrubbed"
+    """
+    counts: Dict[str, int] = {"scrubbed": 0}
+    for transfer in find_due_transfers(db, limit=limit):
+        result = scrub_transfer(db, transfer, pacer)
+        counts[result] = counts.get(result, 0) + 1
+        counts["scrubbed"] += 1
+
+    if counts["scrubbed"]:
+        print(f"[Scrubber] {counts}")
+    return counts
+
+
+def main(argv: List[str]) -> int:
+    from app.core.file_io import lowered_io_priority
+    from app.database import SessionLocal
+
+    once = "--once" in argv
+    window = None if once else parse_window(SCRUB_WINDOW)
+    pacer = ScrubPacer(SCRUB_MAX_MBPS * 1024 * 1024, window)
+    print(f"[Scrubber] Started (window {SCRUB_WINDOW or 'always'}, budget "
+          f"{SCRUB_MAX_MBPS or 'unlimited'} MB/s, every {SCRUB_INTERVAL_DAYS} days)")
+
+    with lowered_io_priority(SCRUB_IO_CLASS):
+        while True:
+            pacer.wait_for_window()
+
+            db = SessionLocal()
+            try:
+                counts = run_scrub_pass(db, pacer)
+            except Exception as e:
+                db.rollback()
+                print(f"[Scrubber] Pass failed: {e}")
+                counts = {"scrubbed": 0}
+            finally:
+                db.close()
+
+            if once:
+                return 0
+            if not counts["scrubbed"]:
+                time.sleep(SCRUB_IDLE_SECONDS)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
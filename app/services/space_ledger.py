@@ -0,0 +1,279 @@
+"""
+Ketter 3.0 - Disk Space Reservation Ledger
+Bytes reserved per destination filesystem, shared by concurrent transfers
+
+MRC Principles:
+- Simple: one Redis hash per filesystem (transfer -> reserved bytes)
+- Reliable: reserve is check-and-set in one Lua script; reservations expire
+- Cheap: statvfs results are cached for KETTER_STATVFS_CACHE_SECONDS
+
+Preflight used to compare free space with a single transfer's size, so ten
+concurrent 100 GB transfers to a volume with 500 GB free all passed and
+then failed halfway with ENOSPC. Now a transfer only passes if its size
+plus everything already reserved on the same filesystem still fits.
+
+Free space comes from statvfs, which already excludes what running
+transfers have written (or preallocated). Each reservation therefore
+shrinks to the bytes its transfer has still to write
+(SpaceReservation.written), so those bytes are not counted twice.
+
+Filesystem identity: st_dev of the destination directory, qualified by
+hostname because device numbers are only unique per host. Destinations
+inside a configured network volume (ketter.config.yml) use the volume
+path instead, so workers on different hosts share one ledger per NAS.
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+STATVFS_CACHE_SECONDS = float(os.getenv("KETTER_STATVFS_CACHE_SECONDS", "2"))
+
+# KEYS[1] = reservations hash, KEYS[2] = expiry zset
+# ARGV = member, bytes, available_bytes, ttl_seconds
+# Returns {granted (0/1), bytes reserved by others}
+_RESERVE_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+for _, member in ipairs(expired) do
+  redis.call('HDEL', KEYS[1], member)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+redis.call('HDEL', KEYS[1], ARGV[1])
+local reserved = 0
+for _, value in ipairs(redis.call('HVALS', KEYS[1])) do
+  reserved = reserved + tonumber(value)
+end
+if reserved + tonumber(ARGV[2]) > tonumber(ARGV[3]) then
+  return {0, reserved}
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[4]), ARGV[1])
+return {1, reserved}
+"""
+
+# KEYS[1] = reservations hash; ARGV = member, bytes
+# Only lowers an existing reservation (released/expired ones stay gone)
+_SHRINK_LUA = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current and tonumber(ARGV[2]) < tonumber(current) then
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+_statvfs_cache: Dict[str, Tuple[float, int, int]] = {}
+_statvfs_guard = threading.Lock()
+
+
+def filesystem_id(directory: str) -> str:
+    """Ledger identity of the filesystem holding directory"""
+    from app.config import get_config
+
+    volume = get_config().get_volume_for_path(directory)
+    if volume is not None and volume.type == "network":
+        return f"volume:{volume.path}"
+    return f"dev:{socket.gethostname()}:{os.stat(directory).st_dev}"
+
+
+def get_disk_usage(directory: str, fs_id: str) -> Tuple[int, int]:
+    """
+    (free, total) bytes for the filesystem, cached briefly per filesystem
+
+    Free is f_bavail (space usable by unprivileged writers), as in
+    shutil.disk_usage.
+    """
+    now = time.monotonic()
+    with _statvfs_guard:
+        cached = _statvfs_cache.get(fs_id)
+        if cached and now - cached[0] < STATVFS_CACHE_SECONDS:
+            return cached[1], cached[2]
+
+    st = os.statvfs(directory)
+    free, total = st.f_bavail * st.f_frsize, st.f_blocks * st.f_frsize
+    with _statvfs_guard:
+        _statvfs_cache[fs_id] = (now, free, total)
+    return free, total
+
+
+class RedisSpaceLedger:
+    """Reservations shared by every worker via Redis"""
+
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+        self._reserve = redis_conn.register_script(_RESERVE_LUA)
+        self._shrink = redis_conn.register_script(_SHRINK_LUA)
+
+    @staticmethod
+    def _keys(fs_id: str):
+        return f"ketter:space:{fs_id}:reserved", f"ketter:space:{fs_id}:expiry"
+
+    def reserve(self, fs_id: str, member: str, nbytes: int, available: int, ttl_seconds: int) -> Tuple[bool, int]:
+        granted, reserved = self._reserve(keys=list(self._keys(fs_id)), args=[member, nbytes, available, ttl_seconds])
+        return bool(granted), int(reserved)
+
+    def shrink(self, fs_id: str, member: str, nbytes: int) -> None:
+        self._shrink(keys=[self._keys(fs_id)[0]], args=[member, nbytes])
+
+    def release(self, fs_id: str, member: str) -> None:
+        reserved_key, expiry_key = self._keys(fs_id)
+        pipe = self.redis.pipeline()
+        pipe.hdel(reserved_key, member)
+        pipe.zrem(expiry_key, member)
+        pipe.execute()
+
+    def reserved(self, fs_id: str) -> int:
+        return sum(int(float(v)) for v in self.redis.hvals(self._keys(fs_id)[0]))
+
+
+class LocalSpaceLedger:
+    """In-process ledger with the same semantics (SQLite test profile, no Redis)"""
+
+    _guard = threading.Lock()
+    _reservations: Dict[str, Dict[str, Tuple[int, float]]] = {}
+
+    def reserve(self, fs_id: str, member: str, nbytes: int, available: int, ttl_seconds: int) -> Tuple[bool, int]:
+        now = time.monotonic()
+        with self._guard:
+            entries = self._reservations.setdefault(fs_id, {})
+            for key in [k for k, (_, expiry) in entries.items() if expiry <= now or k == member]:
+                del entries[key]
+            reserved = sum(nbytes_ for nbytes_, _ in entries.values())
+            if reserved + nbytes > available:
+                return False, reserved
+            entries[member] = (nbytes, now + ttl_seconds)
+            return True, reserved
+
+    def shrink(self, fs_id: str, member: str, nbytes: int) -> None:
+        with self._guard:
+            entry = self._reservations.get(fs_id, {}).get(member)
+            if entry is not None and nbytes < entry[0]:
+                self._reservations[fs_id][member] = (nbytes, entry[1])
+
+    def release(self, fs_id: str, member: str) -> None:
+        with self._guard:
+            self._reservations.get(fs_id, {}).pop(member, None)
+
+    def reserved(self, fs_id: str) -> int:
+        now = time.monotonic()
+        with self._guard:
+            return sum(n for n, expiry in self._reservations.get(fs_id, {}).values() if expiry > now)
+
+
+def get_space_ledger():
+    """Redis ledger in production, in-process ledger for the SQLite test profile"""
+    from app.database import TESTING
+
+    if TESTING:
+        return LocalSpaceLedger()
+
+    from app.services.redis_client import get_redis
+    return RedisSpaceLedger(get_redis())
+
+
+class SpaceReservation:
+    """
+    Bytes held on one filesystem for one transfer
+
+    Attributes:
+        fs_id: Filesystem identity (see filesystem_id)
+        transfer_id: Owner
+        nbytes: Reserved bytes
+        free_bytes, total_bytes: statvfs figures used for the decision
+        reserved_by_others: Bytes already reserved by other transfers
+        on_disk: Bytes of the reservation already allocated on disk
+    """
+
+    def __init__(self, ledger, fs_id: str, transfer_id: int, nbytes: int,
+                 free_bytes: int, total_bytes: int, reserved_by_others: int):
+        self.ledger = ledger
+        self.fs_id = fs_id
+        self.transfer_id = transfer_id
+        self.nbytes = nbytes
+        self.free_bytes = free_bytes
+        self.total_bytes = total_bytes
+        self.reserved_by_others = reserved_by_others
+        self.granted = False
+        self.on_disk = 0
+        self._published = nbytes
+
+    def written(self, nbytes_on_disk: int) -> None:
+        """
+        The transfer has nbytes_on_disk of its reservation on disk (written
+        or preallocated): statvfs free space no longer includes them, so the
+        ledger keeps only the rest. Published in steps of 1% of the size.
+        """
+        if not self.granted or self.ledger is None or nbytes_on_disk <= self.on_disk:
+            return
+        self.on_disk = min(nbytes_on_disk, self.nbytes)
+        remaining = self.nbytes - self.on_disk
+        if remaining and self._published - remaining < max(self.nbytes // 100, 1):
+            return
+        self._published = remaining
+        try:
+            self.ledger.shrink(self.fs_id, str(self.transfer_id), remaining)
+        except RedisError as e:
+            print(f"[Transfer {self.transfer_id}] Warning: space reservation not shrunk (kept until release): {e}")
+
+    def release(self) -> None:
+        if not self.granted or self.ledger is None:
+            return
+        try:
+            self.ledger.release(self.fs_id, str(self.transfer_id))
+        except RedisError as e:
+            print(f"[Transfer {self.transfer_id}] Warning: space reservation release failed (will expire): {e}")
+        self.granted = False
+
+
+def reserve_space(
+    directory: str,
+    transfer_id: int,
+    nbytes: int,
+    min_free_percent: int = 10,
+    ttl_seconds: Optional[int] = None,
+    ledger=None
+) -> SpaceReservation:
+    """
+    Atomically reserve nbytes on the filesystem holding directory
+
+    The request fits when
+        nbytes + reserved_by_others <= free - total * min_free_percent / 100
+    (the same min-free rule check_disk_space always applied).
+
+    Args:
+        directory: Existing destination directory
+        transfer_id: Reservation owner (re-reserving replaces the old amount)
+        nbytes: Bytes to reserve
+        min_free_percent: Free space that must remain after all reservations
+        ttl_seconds: Reservation expiry (default: the job timeout for nbytes,
+            after which the job cannot be alive anyway)
+        ledger: Ledger backend (default: get_space_ledger())
+
+    Returns:
+        SpaceReservation: check .granted; release() when the transfer ends.
+        If Redis is unreachable the reservation is granted without a ledger
+        entry (plain single-transfer check), like the volume stream limits.
+    """
+    from app.services.job_lease import compute_job_timeout
+
+    fs_id = filesystem_id(directory)
+    free, total = get_disk_usage(directory, fs_id)
+    available = free - (total * min_free_percent) // 100
+    ttl_seconds = ttl_seconds or compute_job_timeout(nbytes)
+
+    try:
+        ledger = ledger or get_space_ledger()
+        granted, reserved = ledger.reserve(fs_id, str(transfer_id), int(nbytes), int(available), int(ttl_seconds))
+    except RedisError as e:
+        print(f"[Transfer {transfer_id}] Warning: space ledger unavailable, single-transfer check only: {e}")
+        reservation = SpaceReservation(None, fs_id, transfer_id, nbytes, free, total, 0)
+        reservation.granted = nbytes <= available
+        return reservation
+
+    reservation = SpaceReservation(ledger, fs_id, transfer_id, nbytes, free, total, reserved)
+    reservation.granted = granted
+    return reservation
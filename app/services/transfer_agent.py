@@ -0,0 +1,517 @@
+"""
+Ketter 3.0 - Transfer Agent
+Node-to-node streaming of one file over TCP (TRANSFER_NODE_MODE)
+
+MRC Principles:
+- Simple: one connection per file, length-prefixed frames, JSON control
+- Reliable: CRC-32 per chunk, end-to-end SHA-256, resumable partial files
+- Explicit: every refusal is an ERROR frame saying whether a retry helps
+
+The agent runs on the host that mounts a destination volume (the volume's
+`agent: host:port` in ketter.config.yml). A sending worker streams the
+source straight to it, so transfers between VLANs no longer go through a
+shared mount twice.
+
+Protocol (frame = type:u8, length:u32, payload):
+  agent  -> CHALLENGE {nonce}           fresh random nonce per connection
+  sender -> HELLO  {path, size, sha256, algorithm, chunk_size, mac}
+  agent  -> READY  {offset, window}     resume offset (0 = fresh)
+  sender -> DATA   offset:u64 crc32:u32 bytes    (pipelined, up to `window`
+  agent  -> ACK    end:u64                        chunks unacknowledged)
+  sender -> END    {}
+  agent  -> DONE   {sha256, checksum, algorithm, read}
+  agent  -> ERROR  {message, retryable, offset}
+
+Authentication: mac = HMAC-SHA256(KETTER_AGENT_TOKEN, nonce + HELLO fields).
+The token never travels, a captured HELLO cannot be replayed on another
+connection, and the expected SHA-256 is covered by the MAC, so injected
+DATA frames fail the end-to-end check. The agent refuses to start without
+a token and only accepts destinations on the volumes it serves: those
+whose `agent` in ketter.config.yml names this node (KETTER_AGENT_NODE,
+default: hostname) and its port.
+
+The agent writes to <path>.ketter-partial (+ .json sidecar with the
+expected SHA-256 and size). A reconnect for the same file resumes at the
+last whole chunk on disk. At END the partial is synced and checked
+against the expected SHA-256, renamed into place, and re-read from
+storage (not page cache) for the DESTINATION checksum.
+
+Run:
+    python -m app.services.transfer_agent [--host 0.0.0.0] [--port 9470]
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import shutil
+import socket
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+AGENT_PORT = int(os.getenv("KETTER_AGENT_PORT", "9470"))
+AGENT_TOKEN = os.getenv("KETTER_AGENT_TOKEN", "")
+AGENT_NODE = os.getenv("KETTER_AGENT_NODE") or socket.gethostname()
+AGENT_CHUNK_BYTES = int(os.getenv("KETTER_AGENT_CHUNK_KB", "1024")) * 1024
+AGENT_WINDOW = int(os.getenv("KETTER_AGENT_WINDOW", "16"))
+AGENT_RETRIES = int(os.getenv("KETTER_AGENT_RETRIES", "3"))
+AGENT_TIMEOUT_SECONDS = int(os.getenv("KETTER_AGENT_TIMEOUT", "60"))
+
+HELLO, READY, DATA, ACK, END, DONE, ERROR, CHALLENGE = range(1, 9)
+FRAME = struct.Struct("!BI")
+DATA_HEADER = struct.Struct("!QI")
+ACK_BODY = struct.Struct("!Q")
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+PARTIAL_SUFFIX = ".ketter-partial"
+
+
+class AgentError(Exception):
+    """Transfer refused or broken; retryable errors can resume"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _agent_address(volume) -> Tuple[str, int]:
+    host, _, port = str(volume.agent).rpartition(":")
+    return (host or str(volume.agent)), int(port or AGENT_PORT)
+
+
+def agent_for_path(path: str) -> Optional[Tuple[str, int]]:
+    """(host, port) of the agent owning path's volume (TRANSFER_NODE_MODE only)"""
+    from app.config import get_config
+    from app.security.path_security import TRANSFER_NODE_MODE
+
+    if not TRANSFER_NODE_MODE:
+        return None
+    volume = get_config().get_volume_for_path(path)
+    if volume is None or not volume.agent:
+        return None
+    return _agent_address(volume)
+
+
+def served_volume_paths(node: str = AGENT_NODE, port: int = AGENT_PORT) -> List[str]:
+    """Paths of the configured volumes whose `agent` is node:port"""
+    from app.config import get_config
+
+    return [
+        volume.path for volume in get_config().volumes
+        if volume.agent and _agent_address(volume) == (node, port)
+    ]
+
+
+def hello_mac(token: str, nonce: str, hello: dict) -> str:
+    """HMAC-SHA256 binding the HELLO fields to the agent's nonce"""
+    fields = {name: value for name, value in hello.items() if name != "mac"}
+    message = nonce.encode() + b"\n" + json.dumps(fields, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(token.encode(), message, hashlib.sha256).hexdigest()
+
+
+# ============================================================================
+# Framing
+# ============================================================================
+
+async def _send(writer: asyncio.StreamWriter, kind: int, payload: bytes = b"") -> None:
+    writer.write(FRAME.pack(kind, len(payload)))
+    writer.write(payload)
+    await writer.drain()
+
+
+async def _send_json(writer: asyncio.StreamWriter, kind: int, body: dict) -> None:
+    await _send(writer, kind, json.dumps(body).encode())
+
+
+async def _recv(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    header = await asyncio.wait_for(reader.readexactly(FRAME.size), AGENT_TIMEOUT_SECONDS)
+    kind, length = FRAME.unpack(header)
+    if length > MAX_CHUNK_BYTES + DATA_HEADER.size:
+        raise AgentError(f"Frame too large ({length} bytes)")
+    payload = await asyncio.wait_for(reader.readexactly(length), AGENT_TIMEOUT_SECONDS)
+    return kind, payload
+
+
+def _error_from(payload: bytes) -> AgentError:
+    body = json.loads(payload or b"{}")
+    return AgentError(body.get("message", "Agent error"), retryable=bool(body.get("retryable")))
+
+
+# ============================================================================
+# Receiving side
+# ============================================================================
+
+class _Receive:
+    """One incoming file: partial file, running SHA-256, resume state"""
+
+    def __init__(self, hello: dict, served: List[str]):
+        from app.config import get_config
+        from app.security.path_security import sanitize_path, PathSecurityError
+
+        try:
+            self.path = sanitize_path(hello["path"], allow_symlinks=False)
+        except (KeyError, PathSecurityError) as e:
+            raise AgentError(f"Destination refused: {e}")
+        # Whitelisted is not enough: the (most specific) volume must be ours
+        volume = get_config().get_volume_for_path(self.path)
+        if volume is None or volume.path not in served:
+            raise AgentError(f"Destination refused: {self.path} is not on a volume served by this agent")
+
+        self.size = int(hello["size"])
+        self.expected = str(hello["sha256"])
+        self.algorithm = hello.get("algorithm", "sha256")
+        self.chunk_size = min(int(hello.get("chunk_size") or AGENT_CHUNK_BYTES), MAX_CHUNK_BYTES)
+        self.partial = self.path + PARTIAL_SUFFIX
+        self.sidecar = self.partial + ".json"
+        self.digest = hashlib.sha256()
+        self.fd = None
+        self.position = 0
+
+    def open(self) -> int:
+        """Open (or resume) the partial file; returns the resume offset"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        resume = 0
+        if os.path.exists(self.partial) and self._sidecar_matches():
+            resume = os.path.getsize(self.partial) // self.chunk_size * self.chunk_size
+            resume = min(resume, self.size)
+        else:
+            with open(self.sidecar, "w") as f:
+                json.dump({"sha256": self.expected, "size": self.size}, f)
+
+        free = shutil.disk_usage(os.path.dirname(self.path)).free
+        if free < self.size - resume:
+            raise AgentError(f"Insufficient disk space at {self.path}: {self.size - resume} bytes needed, {free} free")
+
+        self.fd = os.open(self.partial, os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self.fd, resume)
+        position = 0
+        while position < resume:  # Running hash over the kept prefix
+            data = os.pread(self.fd, min(8 * 1024 * 1024, resume - position), position)
+            self.digest.update(data)
+            position += len(data)
+        self.position = resume
+        return resume
+
+    def _sidecar_matches(self) -> bool:
+        try:
+            with open(self.sidecar) as f:
+                state = json.load(f)
+            return state.get("sha256") == self.expected and state.get("size") == self.size
+        except (OSError, ValueError):
+            return False
+
+    def write(self, offset: int, crc: int, data: bytes) -> None:
+        if offset != self.position:
+            raise AgentError(f"Out-of-order chunk at {offset} (expected {self.position})", retryable=True)
+        if zlib.crc32(data) != crc:
+            raise AgentError(f"CRC mismatch in chunk at {offset}", retryable=True)
+        if offset + len(data) > self.size:
+            raise AgentError(f"Chunk at {offset} runs past the announced size {self.size}")
+        written = 0
+        while written < len(data):
+            written += os.pwrite(self.fd, data[written:], offset + written)
+        self.position = offset + len(data)
+        self.digest.update(data)
+
+    def finish(self) -> dict:
+        from app.core.copy_engine import calculate_sha256_from_storage
+        from app.core.file_io import get_durability, sync_file, fsync_directory
+
+        if self.position != self.size:
+            raise AgentError(f"Stream ended at {self.position} of {self.size} bytes", retryable=True)
+        streamed = self.digest.hexdigest()
+        if streamed != self.expected:
+            self.discard()
+            raise AgentError(f"End-to-end SHA-256 mismatch: expected {self.expected}, received {streamed}")
+
+        level = get_durability(self.path)
+        sync_file(self.fd, level)
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.partial, self.path)
+        os.remove(self.sidecar)
+        if level == "full":
+            fsync_directory(os.path.dirname(self.path))
+
+        checksum, read_stats = calculate_sha256_from_storage(self.path, algorithm=self.algorithm)
+        return {"sha256": streamed, "checksum": checksum, "algorithm": self.algorithm, "read": read_stats}
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def discard(self) -> None:
+        self.close()
+        for path in (self.partial, self.sidecar):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class TransferAgent:
+    """TCP server receiving files from sending workers"""
+
+    def __init__(self, host: str = "0.0.0.0", port: int = AGENT_PORT, token: str = AGENT_TOKEN,
+                 window: int = AGENT_WINDOW, volumes: Optional[List[str]] = None):
+        if not token:
+            raise AgentError("KETTER_AGENT_TOKEN is not set: refusing to accept unauthenticated writes")
+        self.host = host
+        self.port = port
+        self.token = token
+        self.window = window
+        # Volume paths this agent writes to (default: ketter.config.yml)
+        self.volumes = list(volumes) if volumes is not None else served_volume_paths(AGENT_NODE, port)
+        self.server: Optional[asyncio.AbstractServer] = None
+        # One stream per destination: a resume waits for the dropped
+        # connection's handler to finish with the partial file
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def start(self) -> int:
+        """Start listening; returns the bound port (port=0 picks a free one)"""
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"[Agent] Listening on {self.host}:{self.port}")
+        return self.port
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _receive(self, reader, writer, receive: _Receive, peer) -> None:
+        offset = await asyncio.to_thread(receive.open)
+        print(f"[Agent] {peer}: receiving {receive.path} ({receive.size} bytes, resume at {offset})")
+        await _send_json(writer, READY, {"offset": offset, "window": self.window})
+
+        while True:
+            kind, payload = await _recv(reader)
+            if kind == DATA:
+                offset, crc = DATA_HEADER.unpack_from(payload)
+                await asyncio.to_thread(receive.write, offset, crc, payload[DATA_HEADER.size:])
+                await _send(writer, ACK, ACK_BODY.pack(receive.position))
+            elif kind == END:
+                result = await asyncio.to_thread(receive.finish)
+                await _send_json(writer, DONE, result)
+                print(f"[Agent] {peer}: {receive.path} verified ({result['sha256'][:16]}...)")
+                return
+            else:
+                raise AgentError(f"Unexpected frame type {kind}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        receive = None
+        try:
+            nonce = secrets.token_hex(16)
+            await _send_json(writer, CHALLENGE, {"nonce": nonce})
+            kind, payload = await _recv(reader)
+            if kind != HELLO:
+                raise AgentError("Expected HELLO")
+            hello = json.loads(payload)
+            if not hmac.compare_digest(str(hello.get("mac", "")), hello_mac(self.token, nonce, hello)):
+                raise AgentError("Authentication failed (check KETTER_AGENT_TOKEN)")
+
+            receive = _Receive(hello, self.volumes)
+            async with self._locks.setdefault(receive.path, asyncio.Lock()):
+                await self._receive(reader, writer, receive, peer)
+
+        except AgentError as e:
+            print(f"[Agent] {peer}: {e}")
+            try:
+                await _send_json(writer, ERROR, {
+                    "message": str(e),
+                    "retryable": e.retryable,
+                    "offset": receive.position if receive else 0
+                })
+            except (ConnectionError, OSError):
+                pass
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError) as e:
+            # Sender went away: the partial file stays for a resume
+            print(f"[Agent] {peer}: connection lost ({type(e).__name__})")
+        finally:
+            if receive is not None:
+                receive.close()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+# ============================================================================
+# Sending side
+# ============================================================================
+
+async def send_file(
+    host: str,
+    port: int,
+    source_path: str,
+    dest_path: str,
+    expected_sha256: str,
+    algorithm: str = "sha256",
+    chunk_size: int = AGENT_CHUNK_BYTES,
+    token: Optional[str] = None,
+    progress_callback: Optional[Callable] = None
+) -> dict:
+    """
+    Stream source_path to dest_path on the agent at host:port
+
+    Args:
+        expected_sha256: SHA-256 of the source (the SOURCE/FINAL value)
+        algorithm: In-flight algorithm for the agent's storage re-read
+        token: Shared secret (default: KETTER_AGENT_TOKEN)
+        progress_callback: Callback(bytes_acked, total_bytes)
+
+    Returns:
+        dict: sha256 (end-to-end), checksum (storage re-read, `algorithm`),
+        algorithm, read (stats), resumed_from, bytes_sent
+
+    Raises:
+        AgentError: Refused, CRC/SHA-256 mismatch, or protocol error
+    """
+    token = token or AGENT_TOKEN
+    if not token:
+        raise AgentError("KETTER_AGENT_TOKEN is not set: cannot authenticate to the agent")
+    size = os.path.getsize(source_path)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), AGENT_TIMEOUT_SECONDS)
+    try:
+        kind, payload = await _recv(reader)
+        if kind != CHALLENGE:
+            raise AgentError(f"Expected CHALLENGE, got frame type {kind}")
+        hello = {
+            "path": dest_path,
+            "size": size,
+            "sha256": expected_sha256,
+            "algorithm": algorithm,
+            "chunk_size": chunk_size
+        }
+        hello["mac"] = hello_mac(token, json.loads(payload)["nonce"], hello)
+        await _send_json(writer, HELLO, hello)
+        kind, payload = await _recv(reader)
+        if kind == ERROR:
+            raise _error_from(payload)
+        if kind != READY:
+            raise AgentError(f"Expected READY, got frame type {kind}")
+        ready = json.loads(payload)
+        resumed_from = int(ready["offset"])
+        window_bytes = max(1, int(ready.get("window") or AGENT_WINDOW)) * chunk_size
+
+        # End-to-end hash covers the kept prefix too
+        digest = hashlib.sha256()
+        sent = acked = resumed_from
+        with open(source_path, "rb") as f:
+            while f.tell() < resumed_from:
+                data = f.read(min(8 * 1024 * 1024, resumed_from - f.tell()))
+                if not data:
+                    raise AgentError(f"Source is shorter than the agent's resume offset {resumed_from}")
+                digest.update(data)
+
+            async def read_ack() -> int:
+                kind, payload = await _recv(reader)
+                if kind == ERROR:
+                    raise _error_from(payload)
+                if kind != ACK:
+                    raise AgentError(f"Expected ACK, got frame type {kind}")
+                end, = ACK_BODY.unpack(payload)
+                if progress_callback:
+                    progress_callback(end, size)
+                return end
+
+            f.seek(resumed_from)
+            while sent < size:
+                while sent - acked >= window_bytes:
+                    acked = await read_ack()
+                data = f.read(min(chunk_size, size - sent))
+                if not data:
+                    raise AgentError(f"Source ended at byte {sent} of {size}")
+                digest.update(data)
+                writer.write(FRAME.pack(DATA, DATA_HEADER.size + len(data)))
+                writer.write(DATA_HEADER.pack(sent, zlib.crc32(data)))
+                writer.write(data)
+                await writer.drain()
+                sent += len(data)
+            while acked < sent:
+                acked = await read_ack()
+
+        if digest.hexdigest() != expected_sha256:
+            raise AgentError("Source changed during transfer (streamed SHA-256 differs from the SOURCE checksum)")
+
+        await _send_json(writer, END, {})
+        kind, payload = await _recv(reader)
+        if kind == ERROR:
+            raise _error_from(payload)
+        if kind != DONE:
+            raise AgentError(f"Expected DONE, got frame type {kind}")
+        result = json.loads(payload)
+        if result["sha256"] != expected_sha256:
+            raise AgentError(f"End-to-end SHA-256 mismatch: sent {expected_sha256}, agent has {result['sha256']}")
+
+        result["resumed_from"] = resumed_from
+        result["bytes_sent"] = size - resumed_from
+        return result
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+def send_file_sync(
+    host: str,
+    port: int,
+    source_path: str,
+    dest_path: str,
+    expected_sha256: str,
+    retries: int = AGENT_RETRIES,
+    **kwargs
+) -> dict:
+    """
+    send_file() from synchronous code (workers), resuming on retryable errors
+
+    Callbacks run on the calling thread.
+    """
+    attempt = 0
+    while True:
+        try:
+            return asyncio.run(send_file(host, port, source_path, dest_path, expected_sha256, **kwargs))
+        except (AgentError, ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            retryable = not isinstance(e, AgentError) or e.retryable
+            attempt += 1
+            if not retryable or attempt > retries:
+                raise
+            print(f"[Agent] Send to {host}:{port} interrupted ({e}); resuming, attempt {attempt}/{retries}")
+
+
+def main(argv: List[str]) -> int:
+    host = "0.0.0.0"
+    port = AGENT_PORT
+    if "--host" in argv:
+        host = argv[argv.index("--host") + 1]
+    if "--port" in argv:
+        port = int(argv[argv.index("--port") + 1])
+    if not AGENT_TOKEN:
+        print("[Agent] Error: KETTER_AGENT_TOKEN is not set - refusing to start")
+        return 1
+    volumes = served_volume_paths(AGENT_NODE, port)
+    if not volumes:
+        print(f"[Agent] Error: no volume in ketter.config.yml has agent {AGENT_NODE}:{port} "
+              f"(set KETTER_AGENT_NODE to the host name used there) - refusing to start")
+        return 1
+
+    print(f"[Agent] Serving {', '.join(volumes)}")
+    asyncio.run(TransferAgent(host, port, volumes=volumes).serve_forever())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+"""
+Ketter 3.0 - Transfer Deduplication
+Identical queued or in-flight transfers are coalesced before reaching a worker
+
+MRC Principles:
+- Simple: one key per request, a unique index does the arbitration
+- Reliable: two API processes racing on the same request cannot both
+  insert; the loser finds the winner and attaches to it
+- Transparent: an attached or rejected duplicate points at the existing job
+
+Key = SHA-256 of the normalized source path, destination path, operation
+mode, sync mode and the source mtime (ns). A changed source is new work, a
+double-click or a script retry is not. The key lives on Transfer.dedupe_key
+only while the transfer is queued or running; a terminal status clears it
+(app.models._release_dedupe_key), so the same copy can be requested again.
+
+Folders use the mtime of the folder itself, which changes when entries are
+added or removed, not when a file inside is rewritten in place.
+
+A key only counts while a worker will still run its holder: a heartbeat
+lease is held, or Transfer.job_id is queued, scheduled or running in RQ.
+A holder left behind by a lost job (PENDING, QUEUED_FOR_VOLUME or
+COPIED_UNVERIFIED forever) gives its key up, so a retry goes through
+instead of attaching to a dead transfer; the recovery sweeper releases
+such keys too (release_stale_dedupe_keys).
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from app.models import AuditEventType, AuditLog, Transfer, TransferStatus
+from app.services.job_lease import leased_transfer_ids, live_job_ids
+
+DEDUPE_ENABLED = os.getenv("KETTER_DEDUPE", "1") == "1"
+DEDUPE_POLICIES = ("attach", "reject")
+
+# A holder updated this recently is live: its job may not be enqueued yet
+DEDUPE_STALE_SECONDS = int(os.getenv("KETTER_DEDUPE_STALE_SECONDS", "60"))
+
+# Statuses that wait for a job; the in-flight ones are the sweeper's (recovery)
+WAITING_STATUSES = (
+    TransferStatus.PENDING,
+    TransferStatus.QUEUED_FOR_VOLUME,
+    TransferStatus.COPIED_UNVERIFIED,
+)
+
+
+def _normalize(path: str) -> str:
+    return os.path.normcase(os.path.realpath(path))
+
+
+def transfer_dedupe_key(
+    source_path: str,
+    destination_path: str,
+    operation_mode: str = "copy",
+    sync_mode: str = "full"
+) -> str:
+    """
+    Dedupe key of a transfer request
+
+    Raises:
+        OSError: Source path cannot be stat'ed
+    """
+    mtime_ns = os.stat(source_path).st_mtime_ns
+    parts = (
+        _normalize(source_path),
+        _normalize(destination_path),
+        operation_mode or "copy",
+        sync_mode or "full",
+        str(mtime_ns),
+    )
+    return hashlib.sha256("\0".join(parts).encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def live_transfer_ids(redis_conn, transfers: Iterable[Transfer],
+                      stale_seconds: int = DEDUPE_STALE_SECONDS) -> set:
+    """
+    IDs of the transfers a worker will still pick up
+
+    Live = updated in the last stale_seconds, heartbeat lease held, or
+    job_id still queued/scheduled/running in RQ.
+
+    Raises:
+        RedisError: Redis unreachable (callers decide how to fail)
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+    transfers = list(transfers)
+    live = {t.id for t in transfers if t.updated_at is not None and _as_utc(t.updated_at) >= cutoff}
+    rest = [t for t in transfers if t.id not in live]
+    if not rest:
+        return live
+
+    live |= leased_transfer_ids(redis_conn, [t.id for t in rest])
+    queued = live_job_ids(redis_conn, [t.job_id for t in rest if t.job_id])
+    live |= {t.id for t in rest if t.job_id in queued}
+    return live
+
+
+def release_dedupe_key(db: Session, transfer: Transfer, reason: str) -> None:
+    """Give up a dead holder's key (the row itself is left for the operator/sweeper)"""
+    transfer.dedupe_key = None
+    db.add(AuditLog(
+        transfer_id=transfer.id,
+        event_type=AuditEventType.TRANSFER_PROGRESS,
+        message=f"Dedupe key released: {reason}",
+        event_metadata={"status": transfer.status.value, "job_id": transfer.job_id}
+    ))
+    db.commit()
+
+
+def find_duplicate(db: Session, key: str, redis_conn=None) -> Optional[Transfer]:
+    """
+    Queued or in-flight transfer holding this key, if any
+
+    With redis_conn, a holder no worker will pick up releases the key and
+    None is returned. If Redis is unreachable the holder is kept (attach).
+    """
+    existing = db.query(Transfer).filter(Transfer.dedupe_key == key).first()
+    if existing is None or redis_conn is None:
+        return existing
+
+    try:
+        if existing.id in live_transfer_ids(redis_conn, [existing]):
+            return existing
+    except RedisError as e:
+        print(f"[Dedupe] Warning: cannot check transfer {existing.id} liveness: {e}")
+        return existing
+
+    release_dedupe_key(db, existing, "no live job or worker, identical request accepted as new work")
+    return None
+
+
+def release_stale_dedupe_keys(db: Session, redis_conn,
+                              stale_seconds: int = DEDUPE_STALE_SECONDS) -> List[int]:
+    """
+    Release the keys of waiting transfers that no job will run (recovery sweeper)
+
+    Returns:
+        list[int]: Transfer IDs whose key was released
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+    candidates = (
+        db.query(Transfer)
+        .filter(Transfer.dedupe_key.isnot(None))
+        .filter(Transfer.status.in_(WAITING_STATUSES))
+        .filter(Transfer.updated_at < cutoff)
+        .all()
+    )
+    if not candidates:
+        return []
+
+    live = live_transfer_ids(redis_conn, candidates, stale_seconds)
+    released = []
+    for transfer in candidates:
+        if transfer.id not in live:
+            release_dedupe_key(db, transfer, "no live job or worker (recovery sweeper)")
+            released.append(transfer.id)
+    return released
@@ -0,0 +1,277 @@
+"""
+Ketter 3.0 - Fenced Transfer Locks
+Lease-based MOVE lock (Redis) with fencing tokens
+
+MRC Principles:
+- Simple: SET NX PX for the lease, INCR for the fencing token
+- Reliable: leases expire if the holder dies; tokens only ever grow
+- Cheap: no database transaction is held open while copying
+
+Why fencing: a lease can expire while its holder is paused (GC, swap,
+hung NFS read). Every acquisition gets a strictly larger token, recorded
+on transfers.lock_token with a conditional UPDATE. Before a destructive
+step (deleting the MOVE source) the holder verifies that its token is
+still the current one, so a stale holder can never delete data.
+"""
+
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import or_, update
+
+LOCK_TTL_SECONDS = int(os.getenv("KETTER_TRANSFER_LOCK_TTL", "60"))
+LOCK_RETRY_INTERVAL_SECONDS = 0.5
+
+# KEYS[1] = lease key, KEYS[2] = fence counter | ARGV = owner, ttl_ms
+_ACQUIRE_LUA = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+  return redis.call('INCR', KEYS[2])
+end
+return 0
+"""
+
+# KEYS[1] = lease key | ARGV = owner, ttl_ms
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] = lease key | ARGV = owner
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLockBackend:
+    """Lease storage shared by every worker process and host"""
+
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+        self._acquire = redis_conn.register_script(_ACQUIRE_LUA)
+        self._renew = redis_conn.register_script(_RENEW_LUA)
+        self._release = redis_conn.register_script(_RELEASE_LUA)
+
+    def acquire(self, key: str, owner: str, ttl_seconds: int) -> Optional[int]:
+        token = self._acquire(keys=[key, f"{key}:fence"], args=[owner, int(ttl_seconds * 1000)])
+        return int(token) if token else None
+
+    def renew(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        return bool(self._renew(keys=[key], args=[owner, int(ttl_seconds * 1000)]))
+
+    def release(self, key: str, owner: str) -> None:
+        self._release(keys=[key], args=[owner])
+
+    def holder(self, key: str) -> Optional[str]:
+        value = self.redis.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+
+class LocalLockBackend:
+    """
+    In-process lease storage with the same semantics
+
+    Used for the SQLite test profile (no Redis); only protects against
+    concurrent holders inside one process.
+    """
+
+    _guard = threading.Lock()
+    _leases: Dict[str, Tuple[str, float]] = {}
+    _fences: Dict[str, int] = {}
+
+    def acquire(self, key: str, owner: str, ttl_seconds: int) -> Optional[int]:
+        with self._guard:
+            current = self._leases.get(key)
+            if current and current[1] > time.monotonic():
+                return None
+            self._leases[key] = (owner, time.monotonic() + ttl_seconds)
+            self._fences[key] = self._fences.get(key, 0) + 1
+            return self._fences[key]
+
+    def renew(self, key: str, owner: str, ttl_seconds: int) -> bool:
+        with self._guard:
+            current = self._leases.get(key)
+            if not current or current[0] != owner or current[1] <= time.monotonic():
+                return False
+            self._leases[key] = (owner, time.monotonic() + ttl_seconds)
+            return True
+
+    def release(self, key: str, owner: str) -> None:
+        with self._guard:
+            current = self._leases.get(key)
+            if current and current[0] == owner:
+                del self._leases[key]
+
+    def holder(self, key: str) -> Optional[str]:
+        with self._guard:
+            current = self._leases.get(key)
+            if current and current[1] > time.monotonic():
+                return current[0]
+            return None
+
+
+def get_lock_backend():
+    """Redis backend in production, in-process backend for the SQLite test profile"""
+    from app.database import TESTING
+
+    if TESTING:
+        return LocalLockBackend()
+
+    from app.services.redis_client import get_redis
+    return RedisLockBackend(get_redis())
+
+
+class TransferLease:
+    """
+    A held MOVE lease for one transfer
+
+    Attributes:
+        transfer_id: Locked transfer
+        token: Fencing token (strictly increasing per transfer)
+        owner: Random holder ID
+    """
+
+    def __init__(self, backend, transfer_id: int, owner: str, token: int, ttl_seconds: int):
+        self.backend = backend
+        self.transfer_id = transfer_id
+        self.owner = owner
+        self.token = token
+        self.ttl_seconds = ttl_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def key(self) -> str:
+        return transfer_lock_key(self.transfer_id)
+
+    def renew(self) -> bool:
+        try:
+            held = self.backend.renew(self.key, self.owner, self.ttl_seconds)
+        except RedisError as e:
+            print(f"[Transfer {self.transfer_id}] Warning: lock renewal failed: {e}")
+            return not self.lost
+        if not held:
+            self.lost = True
+        return held
+
+    def is_held(self) -> bool:
+        if self.lost:
+            return False
+        try:
+            return self.backend.holder(self.key) == self.owner
+        except RedisError:
+            return False
+
+    def start_renewal(self) -> None:
+        """Renew the lease every ttl/3 in a daemon thread until released"""
+        if self._thread is not None:
+            return
+        interval = max(1.0, self.ttl_seconds / 3)
+        self._thread = threading.Thread(
+            target=self._renew_loop, args=(interval,),
+            name=f"transfer-lock-{self.transfer_id}", daemon=True
+        )
+        self._thread.start()
+
+    def _renew_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            if not self.renew():
+                print(f"[Transfer {self.transfer_id}] Warning: MOVE lease lost (token {self.token})")
+                return
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.backend.release(self.key, self.owner)
+        except RedisError as e:
+            print(f"[Transfer {self.transfer_id}] Warning: lock release failed (lease will expire): {e}")
+
+
+def transfer_lock_key(transfer_id: int) -> str:
+    return f"ketter:lock:transfer:{transfer_id}"
+
+
+def acquire_transfer_lease(
+    transfer_id: int,
+    timeout_seconds: float = 30,
+    ttl_seconds: int = LOCK_TTL_SECONDS,
+    backend=None
+) -> Optional[TransferLease]:
+    """
+    Try to take the MOVE lease, retrying until timeout_seconds
+
+    Args:
+        transfer_id: Transfer to lock
+        timeout_seconds: How long to wait for a concurrent holder
+        ttl_seconds: Lease TTL (renewed by start_renewal)
+        backend: Lock backend (default: get_lock_backend())
+
+    Returns:
+        TransferLease: Held lease
+        None: Timeout, or Redis unreachable (fail closed: MOVE must not run unlocked)
+    """
+    backend = backend or get_lock_backend()
+    owner = uuid.uuid4().hex
+    key = transfer_lock_key(transfer_id)
+    deadline = time.monotonic() + timeout_seconds
+
+    while True:
+        try:
+            token = backend.acquire(key, owner, ttl_seconds)
+        except RedisError as e:
+            print(f"[Transfer {transfer_id}] Lock backend unavailable: {e}")
+            return None
+
+        if token:
+            return TransferLease(backend, transfer_id, owner, token, ttl_seconds)
+
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(LOCK_RETRY_INTERVAL_SECONDS)
+
+
+def record_fence_token(db, lease: TransferLease) -> bool:
+    """
+    Store the lease token on the transfer if it is newer than the current one
+
+    Single conditional UPDATE, committed immediately.
+
+    Returns:
+        bool: False if a newer token was already recorded (this lease is stale)
+    """
+    from app.models import Transfer
+
+    result = db.execute(
+        update(Transfer)
+        .where(Transfer.id == lease.transfer_id)
+        .where(or_(Transfer.lock_token.is_(None), Transfer.lock_token < lease.token))
+        .values(lock_token=lease.token)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def verify_transfer_fence(db, lease: TransferLease) -> bool:
+    """
+    Check, right before a destructive step, that this lease is still current
+
+    Both conditions must hold: the lease key is still ours and no newer
+    token has been recorded on the transfer.
+    """
+    from app.models import Transfer
+
+    if not lease.is_held():
+        return False
+    current = db.query(Transfer.lock_token).filter(Transfer.id == lease.transfer_id).scalar()
+    return current == lease.token
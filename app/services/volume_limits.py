@@ -0,0 +1,210 @@
+"""
+Ketter 3.0 - Per-Volume I/O Concurrency Limits
+Distributed semaphore (Redis) bounding concurrent transfer streams per volume
+
+MRC Principles:
+- Simple: one sorted set per volume, one member per stream lease
+- Reliable: leases expire on their own if a worker dies mid-transfer
+- Transparent: saturated volumes park transfers as QUEUED_FOR_VOLUME
+
+Each transfer takes one slot on every distinct volume it touches (source
+volume for reads, destination volume for writes). Slots are taken with a
+non-blocking try, so a worker never waits while holding a slot and two
+transfers can never deadlock on each other's volumes.
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+
+from app.config import VolumeConfig, get_config
+
+VOLUME_LEASE_TTL_SECONDS = int(os.getenv("KETTER_VOLUME_LEASE_TTL", "120"))
+VOLUME_RETRY_DELAY_SECONDS = int(os.getenv("KETTER_VOLUME_RETRY_DELAY", "15"))
+
+# KEYS[1] = semaphore key | ARGV = holder, limit, ttl_seconds
+# Uses Redis server time so hosts with skewed clocks agree on expiry.
+_ACQUIRE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+  return 1
+end
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+  redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]) * 2)
+  return 1
+end
+return 0
+"""
+
+# KEYS[1] = semaphore key | ARGV = holder, ttl_seconds
+_RENEW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local expiry = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if (not expiry) or tonumber(expiry) < now then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+return 1
+"""
+
+
+class VolumeSemaphore:
+    """
+    Counting semaphore for one volume, shared by all workers via Redis
+
+    Members of the sorted set are lease holders, scores are lease expiry
+    times. Expired leases are purged on every acquire.
+    """
+
+    def __init__(self, redis_conn, volume: VolumeConfig, ttl_seconds: int = VOLUME_LEASE_TTL_SECONDS):
+        self.redis = redis_conn
+        self.volume = volume
+        self.limit = int(volume.max_streams)
+        self.ttl_seconds = ttl_seconds
+        self.key = f"ketter:volume:{volume.path}:streams"
+        self._acquire = redis_conn.register_script(_ACQUIRE_LUA)
+        self._renew = redis_conn.register_script(_RENEW_LUA)
+
+    def acquire(self, holder: str) -> bool:
+        """Try to take a stream slot (non-blocking). Re-acquire by the same holder is idempotent."""
+        return bool(self._acquire(keys=[self.key], args=[holder, self.limit, self.ttl_seconds]))
+
+    def renew(self, holder: str) -> bool:
+        """Extend a held lease. Returns False if the lease already expired."""
+        return bool(self._renew(keys=[self.key], args=[holder, self.ttl_seconds]))
+
+    def release(self, holder: str) -> None:
+        """Give the slot back"""
+        self.redis.zrem(self.key, holder)
+
+    def in_use(self) -> int:
+        """Number of live leases (expired ones may be counted until next acquire)"""
+        return int(self.redis.zcard(self.key))
+
+
+class VolumeStreamLeases:
+    """
+    Set of volume slots held by one transfer
+
+    A daemon thread renews every lease at a third of the TTL, so the slots
+    stay held through long hashing phases and vanish shortly after a crash.
+    """
+
+    def __init__(self, holder: str, semaphores: List[VolumeSemaphore]):
+        self.holder = holder
+        self.semaphores = semaphores
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def volumes(self) -> List[str]:
+        return [sem.volume.path for sem in self.semaphores]
+
+    def start_renewal(self) -> None:
+        if not self.semaphores or self._thread is not None:
+            return
+        interval = max(1, min(sem.ttl_seconds for sem in self.semaphores) // 3)
+        self._thread = threading.Thread(
+            target=self._renew_loop, args=(interval,),
+            name=f"volume-leases-{self.holder}", daemon=True
+        )
+        self._thread.start()
+
+    def _renew_loop(self, interval: int) -> None:
+        while not self._stop.wait(interval):
+            for sem in self.semaphores:
+                try:
+                    if not sem.renew(self.holder):
+                        print(f"[Volume limits] Warning: lease on {sem.volume.path} expired for {self.holder}")
+                except RedisError as e:
+                    print(f"[Volume limits] Warning: could not renew lease on {sem.volume.path}: {e}")
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        for sem in self.semaphores:
+            try:
+                sem.release(self.holder)
+            except RedisError as e:
+                print(f"[Volume limits] Warning: could not release lease on {sem.volume.path}: {e}")
+
+
+def get_limited_volumes(paths: List[str]) -> List[VolumeConfig]:
+    """
+    Resolve paths to the distinct configured volumes that declare max_streams
+
+    Sorted by volume path so every worker takes slots in the same order.
+    """
+    config = get_config()
+    volumes = {}
+    for path in paths:
+        volume = config.get_volume_for_path(path)
+        if volume is not None and volume.max_streams:
+            volumes[volume.path] = volume
+    return [volumes[p] for p in sorted(volumes)]
+
+
+def acquire_volume_streams(redis_conn, holder: str, paths: List[str]) -> Optional[VolumeStreamLeases]:
+    """
+    Take one stream slot on every limited volume touched by a transfer
+
+    All-or-nothing: if any volume is saturated, slots already taken are
+    released and None is returned so the caller can park the transfer.
+
+    If Redis is unreachable the limits are not enforced (fail-open):
+    concurrency limits tune throughput, they don't protect data.
+
+    Args:
+        redis_conn: Redis connection
+        holder: Unique lease holder (RQ job ID)
+        paths: Source and destination paths of the transfer
+
+    Returns:
+        VolumeStreamLeases: Held leases (empty if no volume is limited)
+        None: At least one volume is saturated
+    """
+    volumes = get_limited_volumes(paths)
+    if not volumes:
+        return VolumeStreamLeases(holder, [])
+
+    acquired: List[VolumeSemaphore] = []
+    try:
+        for volume in volumes:
+            sem = VolumeSemaphore(redis_conn, volume)
+            if not sem.acquire(holder):
+                VolumeStreamLeases(holder, acquired).release()
+                return None
+            acquired.append(sem)
+    except RedisError as e:
+        print(f"[Volume limits] Warning: Redis unavailable, volume limits not enforced: {e}")
+        VolumeStreamLeases(holder, acquired).release()
+        return VolumeStreamLeases(holder, [])
+
+    leases = VolumeStreamLeases(holder, acquired)
+    leases.start_renewal()
+    return leases
+
+
+def get_volume_stream_usage(redis_conn) -> List[dict]:
+    """Current slot usage for every limited volume (for /volumes and /status)"""
+    usage = []
+    for volume in get_config().volumes:
+        if not volume.max_streams:
+            continue
+        sem = VolumeSemaphore(redis_conn, volume)
+        usage.append({
+            "path": volume.path,
+            "alias": volume.alias,
+            "max_streams": sem.limit,
+            "in_use": sem.in_use()
+        })
+    return usage
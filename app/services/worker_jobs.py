@@ -12,14 +12,41 @@ Week 5: Watch Folder Intelligence support
 
 import os
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 from rq import get_current_job, Queue
 from app.database import SessionLocal
-from app.core.copy_engine import transfer_file_with_verification, CopyEngineError
+from app.core.copy_engine import (
+    transfer_file_with_verification,
+    verify_copied_transfer,
+    CopyEngineError,
+)
+from app.core.bundle import (
+    plan_bundles, new_bundle_transfer, new_bundle_retry, transfer_bundle_with_verification
+)
+from app.core.file_io import lowered_io_priority
 from app.core.watch_folder import watch_folder_until_stable, WatchFolderError
 from app.models import Transfer, AuditLog, AuditEventType, TransferStatus
+from app.services.redis_client import get_redis
+from app.services.volume_limits import (
+    acquire_volume_streams,
+    VolumeStreamLeases,
+    VOLUME_RETRY_DELAY_SECONDS,
+)
+from app.services.scheduling import select_lane, get_lane_queue, record_lane_wait
+from app.services.job_lease import (
+    TransferHeartbeat,
+    compute_job_timeout,
+    record_throughput,
+    transfer_job_timeout,
+    expected_transfer_bytes,
+)
+
+# Deferred verification runs on its own queue, after the transfer lanes
+VERIFY_QUEUE = "verify"
+VERIFY_IO_CLASS = os.getenv("KETTER_VERIFY_IO_CLASS", "idle")
+VERIFY_MAX_MBPS = int(os.getenv("KETTER_VERIFY_MAX_MBPS", "0"))  # 0 = uncapped
 
 
 def transfer_file_job(transfer_id: int) -> dict:
@@ -50,10 +77,12 @@ def transfer_file_job(transfer_id: int) -> dict:
     """
     job = get_current_job()
     db = SessionLocal()
+    volume_leases = None
 
     try:
         # Log job start
         print(f"[RQ Job {job.id}] Starting transfer {transfer_id}")
+        _record_lane_wait(job)
 
         # Check if transfer was cancelled before processing
         transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
@@ -76,12 +105,29 @@ def transfer_file_job(transfer_id: int) -> dict:
                 "error": "Cancelled"
             }
 
-        # Execute transfer with verification
-        transfer = transfer_file_with_verification(
-            transfer_id=transfer_id,
-            db=db,
-            progress_callback=None  # TODO: Implementar progress via Redis/RQ meta
-        )
+        # Per-volume I/O limits: park the transfer instead of holding this worker
+        volume_leases = _acquire_volume_streams_or_park(job, db, transfer)
+        if volume_leases is None:
+            return {
+                "success": False,
+                "transfer_id": transfer_id,
+                "message": "Transfer queued for volume",
+                "queued_for_volume": True
+            }
+
+        # Execute transfer with verification under a heartbeat lease
+        transfer = _run_transfer_with_heartbeat(job, db, transfer_id,
+                                                bundle=transfer.bundle_files is not None)
+
+        # Bundles report per-file failures instead of raising
+        if transfer.status == TransferStatus.FAILED:
+            print(f"[RQ Job {job.id}] Transfer {transfer_id} failed: {transfer.error_message}")
+            return {
+                "success": False,
+                "transfer_id": transfer_id,
+                "message": "Transfer failed",
+                "error": transfer.error_message
+            }
 
         # Get final checksum
         from app.models import Checksum, ChecksumType
@@ -98,6 +144,9 @@ def transfer_file_job(transfer_id: int) -> dict:
             "file_size": transfer.file_size,
             "bytes_transferred": transfer.bytes_transferred
         }
+        if transfer.status == TransferStatus.COPIED_UNVERIFIED:
+            result["message"] = f"Transfer copied, verification queued: {transfer.file_name}"
+            result["verification_deferred"] = True
 
         print(f"[RQ Job {job.id}] Transfer {transfer_id} completed ")
         return result
@@ -129,6 +178,8 @@ def transfer_file_job(transfer_id: int) -> dict:
         raise
 
     finally:
+        if volume_leases is not None:
+            volume_leases.release()
         db.close()
 
 
@@ -161,8 +212,11 @@ def watch_and_transfer_job(transfer_id: int) -> dict:
     """
     job = get_current_job()
     db = SessionLocal()
+    volume_leases = None
 
     try:
+        _record_lane_wait(job)
+
         # Load transfer
         transfer = db.query(Transfer).filter(Transfer.id == transfer_id).first()
         if not transfer:
@@ -249,14 +303,20 @@ def watch_and_transfer_job(transfer_id: int) -> dict:
 
             print(f"[RQ Job {job.id}] Folder stable after {watch_duration}s ({len(checks_log)} checks), starting transfer")
 
+        # Per-volume I/O limits: if saturated, park and let transfer_file_job resume
+        volume_leases = _acquire_volume_streams_or_park(job, db, transfer)
+        if volume_leases is None:
+            return {
+                "success": False,
+                "transfer_id": transfer_id,
+                "message": "Transfer queued for volume",
+                "queued_for_volume": True
+            }
+
         # Execute normal transfer
         print(f"[RQ Job {job.id}] Starting transfer {transfer_id}")
 
-        transfer_result = transfer_file_with_verification(
-            transfer_id=transfer_id,
-            db=db,
-            progress_callback=None
-        )
+        transfer_result = _run_transfer_with_heartbeat(job, db, transfer_id)
 
         # Get final checksum
         from app.models import Checksum, ChecksumType
@@ -273,6 +333,9 @@ def watch_and_transfer_job(transfer_id: int) -> dict:
             "file_size": transfer_result.file_size,
             "bytes_transferred": transfer_result.bytes_transferred
         }
+        if transfer_result.status == TransferStatus.COPIED_UNVERIFIED:
+            result["message"] = f"Transfer copied, verification queued: {transfer_result.file_name}"
+            result["verification_deferred"] = True
 
         if transfer.watch_mode_enabled and transfer.watch_triggered_at:
             watch_duration = int((transfer.watch_triggered_at - transfer.watch_started_at).total_seconds())
@@ -320,6 +383,8 @@ def watch_and_transfer_job(transfer_id: int) -> dict:
         raise
 
     finally:
+        if volume_leases is not None:
+            volume_leases.release()
         db.close()
 
 
@@ -530,8 +595,18 @@ def watcher_continuous_job(transfer_id: int, stop_after_cycles: Optional[int] =
                 if new_files:
                     print(f"[RQ Job {job.id}] Found {len(new_files)} new files in cycle {watch_cycles}")
 
-                    # Process each new file
-                    for file_path in sorted(new_files):
+                    # Small files: one bundled transfer + one job per group instead
+                    # of a Transfer, WatchFile, audit rows and a job per file
+                    bundles, singles = plan_bundles(_sizes(new_files))
+                    for bundle_paths in bundles:
+                        skipped = _enqueue_watch_bundle(job, db, transfer, bundle_paths, watch_cycles)
+                        # Still being written or not enqueued: not processed,
+                        # picked up next cycle
+                        current_set -= set(skipped)
+                        total_detected += len(bundle_paths) - len(skipped)
+
+                    # Process each remaining file
+                    for file_path in sorted(singles):
                         file_name = os.path.basename(file_path)
 
                         try:
@@ -557,7 +632,8 @@ def watcher_continuous_job(transfer_id: int, stop_after_cycles: Optional[int] =
                                 file_size=os.path.getsize(file_path),
                                 status=TransferStatus.PENDING,
                                 watch_mode_enabled=0,  # Already watched by parent, no need to re-watch
-                                operation_mode=transfer.operation_mode  # Inherit COPY/MOVE from parent
+                                operation_mode=transfer.operation_mode,  # Inherit COPY/MOVE from parent
+                                priority=transfer.priority  # Inherit scheduling lane from parent
                             )
                             db.add(file_transfer)
                             db.commit()
@@ -580,18 +656,21 @@ def watcher_continuous_job(transfer_id: int, stop_after_cycles: Optional[int] =
                                 redis_conn = Redis.from_url(
                                     os.getenv("REDIS_URL", "redis://redis:6379/0")
                                 )
-                                transfer_queue = Queue("default", connection=redis_conn)
+                                lane = select_lane(file_transfer.priority, file_transfer.file_size)
+                                transfer_queue = get_lane_queue(lane, redis_conn)
 
                                 transfer_job = transfer_queue.enqueue(
                                     transfer_file_job,
                                     file_transfer.id,  # Use NEW transfer_id, not parent
-                                    job_timeout=TRANSFER_JOB_CONFIG["timeout"],
+                                    job_timeout=transfer_job_timeout(redis_conn, file_transfer.file_size),
                                     result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
                                     failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
                                 )
 
                                 # Update WatchFile with job ID
                                 watch_file.transfer_job_id = transfer_job.id
+                                file_transfer.queue_name = lane
+                                file_transfer.job_id = transfer_job.id
                                 db.commit()
 
                                 total_detected += 1
@@ -758,6 +837,391 @@ def watcher_continuous_job(transfer_id: int, stop_after_cycles: Optional[int] =
         db.close()
 
 
+def verify_transfer_job(transfer_id: int) -> dict:
+    """
+    RQ Job: Verificação adiada do destino (COPIED_UNVERIFIED -> COMPLETED)
+
+    Runs in the KETTER_VERIFY_IO_CLASS I/O class (idle by default) and reads
+    at most KETTER_VERIFY_MAX_MBPS, so re-reading destinations does not
+    compete with running copies. MOVE sources are deleted here, only after
+    the checksums match.
+
+    Args:
+        transfer_id: ID da transferência copiada
+
+    Returns:
+        dict: Resultado da verificação
+    """
+    job = get_current_job()
+    db = SessionLocal()
+    max_bps = VERIFY_MAX_MBPS * 1024 * 1024 if VERIFY_MAX_MBPS > 0 else None
+
+    try:
+        print(f"[RQ Job {job.id}] Verifying transfer {transfer_id} (io class: {VERIFY_IO_CLASS})")
+
+        with lowered_io_priority(VERIFY_IO_CLASS), \
+             TransferHeartbeat(job.connection, transfer_id, holder=job.id) as heartbeat:
+            transfer = verify_copied_transfer(
+                transfer_id=transfer_id,
+                db=db,
+                heartbeat_callback=heartbeat.beat,
+                max_bytes_per_second=max_bps
+            )
+
+        from app.models import Checksum, ChecksumType
+        final_checksum = db.query(Checksum).filter(
+            Checksum.transfer_id == transfer_id,
+            Checksum.checksum_type == ChecksumType.FINAL
+        ).first()
+
+        print(f"[RQ Job {job.id}] Transfer {transfer_id} verified ")
+        return {
+            "success": True,
+            "transfer_id": transfer_id,
+            "message": f"Transfer verified: {transfer.file_name}",
+            "checksum": final_checksum.checksum_value if final_checksum else None
+        }
+
+    except (CopyEngineError, ValueError) as e:
+        print(f"[RQ Job {job.id}] Verification of transfer {transfer_id} failed: {str(e)}")
+        return {
+            "success": False,
+            "transfer_id": transfer_id,
+            "message": "Verification failed",
+            "error": str(e)
+        }
+
+    finally:
+        db.close()
+
+
+def _run_transfer_with_heartbeat(job, db, transfer_id: int, bundle: bool = False) -> Transfer:
+    """
+    Helper: Run the copy engine under a heartbeat lease with stall detection
+
+    The lease key lives in Redis only while bytes keep moving; if nothing
+    moves for KETTER_STALL_TIMEOUT seconds the transfer fails fast with
+    TransferStalledError instead of holding the worker until the job timeout.
+    On success the effective throughput feeds future job timeouts.
+    bundle=True runs a small-file bundle (app.core.bundle) instead; its
+    failed files are re-queued as a follow-up bundle.
+    """
+    with TransferHeartbeat(job.connection, transfer_id, holder=job.id) as heartbeat:
+        if bundle:
+            # Small-file bundle: one job for all its files (app.core.bundle)
+            transfer = transfer_bundle_with_verification(
+                transfer_id=transfer_id,
+                db=db,
+                heartbeat_callback=heartbeat.beat
+            )
+            if transfer.status == TransferStatus.FAILED:
+                _requeue_failed_bundle_files(job, db, transfer)
+        else:
+            transfer = transfer_file_with_verification(
+                transfer_id=transfer_id,
+                db=db,
+                progress_callback=None,
+                heartbeat_callback=heartbeat.beat
+            )
+
+    if transfer.status == TransferStatus.COPIED_UNVERIFIED:
+        _enqueue_verification(job, db, transfer)
+        return transfer
+
+    if transfer.started_at and transfer.completed_at:
+        try:
+            duration = (transfer.completed_at - transfer.started_at).total_seconds()
+            record_throughput(job.connection, transfer.file_size, duration)
+        except Exception as e:
+            print(f"[RQ Job {job.id}] Warning: could not record throughput: {str(e)}")
+
+    return transfer
+
+
+def verify_job_id(transfer_id: int) -> str:
+    """Fixed RQ job ID of a transfer's deferred verification (the sweeper looks it up)"""
+    return f"ketter-verify-{transfer_id}"
+
+
+def enqueue_verification(redis_conn, transfer: Transfer) -> None:
+    """
+    Queue the deferred destination verification of a copied transfer
+
+    The job timeout accounts for the throughput cap, since a capped verify
+    can legitimately run far slower than a copy. Sets transfer.job_id
+    (the caller commits).
+    """
+    if VERIFY_MAX_MBPS > 0:
+        timeout = compute_job_timeout(transfer.file_size or 0, VERIFY_MAX_MBPS * 1024 * 1024)
+    else:
+        timeout = transfer_job_timeout(redis_conn, transfer.file_size or 0)
+
+    Queue(VERIFY_QUEUE, connection=redis_conn).enqueue(
+        verify_transfer_job,
+        transfer.id,
+        job_id=verify_job_id(transfer.id),
+        job_timeout=timeout,
+        result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+        failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
+    )
+    transfer.job_id = verify_job_id(transfer.id)
+
+
+def _enqueue_verification(job, db, transfer: Transfer) -> None:
+    """
+    Helper: Queue the verification of a copied transfer, or fail it
+
+    A COPIED_UNVERIFIED row without a verify job would never finish (and a
+    MOVE would keep its source forever), so an enqueue error marks it FAILED
+    and raises CopyEngineError. Verify jobs lost after this point are
+    re-queued by the recovery sweeper (app.services.recovery).
+    """
+    try:
+        enqueue_verification(job.connection, transfer)
+    except Exception as e:
+        print(f"[RQ Job {job.id}] Transfer {transfer.id} copied, but verification could not be queued: {str(e)}")
+        transfer.status = TransferStatus.FAILED
+        transfer.error_message = f"Copied, but deferred verification could not be queued: {str(e)}"
+        db.add(AuditLog(
+            transfer_id=transfer.id,
+            event_type=AuditEventType.TRANSFER_FAILED,
+            message="Deferred verification could not be queued: destination left unverified",
+            event_metadata={"error": str(e), "verify_queue": VERIFY_QUEUE}
+        ))
+        db.commit()
+        raise CopyEngineError(transfer.error_message) from e
+    db.commit()
+    print(f"[RQ Job {job.id}] Transfer {transfer.id} copied, verification queued on '{VERIFY_QUEUE}'")
+
+
+def _record_lane_wait(job) -> None:
+    """Helper: Record lane wait time for /status (never fails the job)"""
+    try:
+        record_lane_wait(job.connection, job)
+    except Exception as e:
+        print(f"[RQ Job {job.id}] Warning: could not record lane wait: {str(e)}")
+
+
+def _acquire_volume_streams_or_park(job, db, transfer: Transfer) -> Optional[VolumeStreamLeases]:
+    """
+    Helper: Take stream slots on the transfer's volumes, or park it
+
+    If a volume is saturated the transfer is marked QUEUED_FOR_VOLUME and a
+    new transfer_file_job is scheduled after VOLUME_RETRY_DELAY_SECONDS, so
+    the current worker is freed instead of blocking on the volume.
+    Requires workers started with --with-scheduler.
+
+    Args:
+        job: Current RQ job (job.id is the lease holder)
+        db: Database session
+        transfer: Transfer about to run
+
+    Returns:
+        VolumeStreamLeases: Held leases (caller must release)
+        None: Transfer was parked and re-scheduled
+    """
+    leases = acquire_volume_streams(
+        get_redis(), job.id, [transfer.source_path, transfer.destination_path]
+    )
+
+    if leases is not None:
+        if transfer.status == TransferStatus.QUEUED_FOR_VOLUME:
+            transfer.status = TransferStatus.PENDING
+            db.commit()
+        return leases
+
+    if transfer.status != TransferStatus.QUEUED_FOR_VOLUME:
+        transfer.status = TransferStatus.QUEUED_FOR_VOLUME
+        db.commit()
+
+        log = AuditLog(
+            transfer_id=transfer.id,
+            event_type=AuditEventType.TRANSFER_PROGRESS,
+            message=f"Queued for volume: max concurrent streams reached, retrying every {VOLUME_RETRY_DELAY_SECONDS}s",
+            event_metadata={"job_id": job.id, "retry_delay": VOLUME_RETRY_DELAY_SECONDS}
+        )
+        db.add(log)
+        db.commit()
+
+    queue = Queue(job.origin, connection=job.connection)
+    retry_job = queue.enqueue_in(
+        timedelta(seconds=VOLUME_RETRY_DELAY_SECONDS),
+        transfer_file_job,
+        transfer.id,
+        job_timeout=transfer_job_timeout(
+            job.connection, expected_transfer_bytes(transfer.source_path, transfer.file_size)
+        ),
+        result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+        failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
+    )
+    transfer.job_id = retry_job.id
+    db.commit()
+    print(f"[RQ Job {job.id}] Transfer {transfer.id} queued for volume, retry in {VOLUME_RETRY_DELAY_SECONDS}s")
+    return None
+
+
+def _sizes(paths) -> list:
+    """Helper: (path, size) for every path still present"""
+    sized = []
+    for path in sorted(paths):
+        try:
+            sized.append((path, os.path.getsize(path)))
+        except OSError:
+            continue
+    return sized
+
+
+def _settle_files(paths, settle_time_seconds: int = 30) -> tuple:
+    """
+    Helper: Settle a group of files with one shared wait
+
+    Every file is stat'ed once per second for settle_time_seconds; files
+    whose size or mtime changed (or vanished) are unstable.
+
+    Returns:
+        tuple: (stable paths, unstable paths)
+    """
+    def snapshot(path):
+        try:
+            st = os.stat(path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    first = {path: snapshot(path) for path in paths}
+    unstable = {path for path, state in first.items() if state is None}
+    for _ in range(max(1, settle_time_seconds)):
+        time.sleep(1)
+        for path in paths:
+            if path not in unstable and snapshot(path) != first[path]:
+                unstable.add(path)
+    return [p for p in paths if p not in unstable], [p for p in paths if p in unstable]
+
+
+def _enqueue_watch_bundle(job, db, watch_transfer: Transfer, paths, cycle: int) -> list:
+    """
+    Helper: Settle, record and enqueue one bundle of small watched files
+
+    Writes one Transfer, one WatchFile, one AuditLog and one RQ job for the
+    whole group.
+
+    If the job cannot be enqueued the bundle is marked FAILED (releasing
+    its dedupe key) and its files are returned too, so the next cycle
+    offers them again.
+
+    Returns:
+        list: Paths not handed to a job (still changing or enqueue failed)
+    """
+    from app.models import WatchFile
+
+    stable, unstable = _settle_files(paths, watch_transfer.settle_time_seconds)
+    if not stable:
+        return unstable
+
+    bundle = new_bundle_transfer(
+        stable,
+        watch_transfer.destination_path,
+        watch_mode_enabled=0,
+        operation_mode=watch_transfer.operation_mode,
+        priority=watch_transfer.priority
+    )
+    db.add(bundle)
+    db.commit()
+
+    watch_file = WatchFile(
+        transfer_id=watch_transfer.id,
+        file_name=bundle.file_name,
+        file_path=bundle.source_path,
+        file_size=bundle.file_size,
+        status=TransferStatus.PENDING,
+        detected_at=datetime.now(timezone.utc)
+    )
+    db.add(watch_file)
+
+    try:
+        lane = select_lane(bundle.priority, bundle.file_size)
+        transfer_job = get_lane_queue(lane, get_redis()).enqueue(
+            transfer_file_job,
+            bundle.id,
+            job_timeout=transfer_job_timeout(get_redis(), bundle.file_size),
+            result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+            failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
+        )
+        watch_file.transfer_job_id = transfer_job.id
+        bundle.queue_name = lane
+        bundle.job_id = transfer_job.id
+        message = f"Bundle of {len(stable)} small files enqueued as transfer {bundle.id}"
+        metadata = {"bundle_transfer_id": bundle.id, "files": len(stable),
+                    "bytes": bundle.file_size, "job_id": transfer_job.id, "cycle": cycle}
+    except Exception as e:
+        bundle.status = TransferStatus.FAILED
+        bundle.error_message = f"Failed to enqueue transfer: {str(e)}"
+        watch_file.status = TransferStatus.FAILED
+        watch_file.error_message = bundle.error_message
+        message = f"Bundle of {len(stable)} small files could not be enqueued: {str(e)}"
+        metadata = {"bundle_transfer_id": bundle.id, "files": len(stable), "cycle": cycle}
+        unstable = unstable + stable
+
+    db.add(AuditLog(
+        transfer_id=watch_transfer.id,
+        event_type=AuditEventType.TRANSFER_PROGRESS,
+        message=message,
+        event_metadata=metadata
+    ))
+    db.commit()
+    print(f"[RQ Job {job.id}] {message}")
+    return unstable
+
+
+def _requeue_failed_bundle_files(job, db, transfer: Transfer) -> Optional[Transfer]:
+    """
+    Helper: Re-queue the failed files of a bundle as a new bundle
+
+    The verified files are done (a MOVE already deleted their sources), so
+    only the failed ones run again, same root and destination. Capped by
+    KETTER_BUNDLE_MAX_RETRIES (see new_bundle_retry).
+
+    Returns:
+        Transfer: The follow-up bundle, or None if nothing was re-queued
+    """
+    retry = new_bundle_retry(transfer)
+    if retry is None:
+        return None
+    db.add(retry)
+    db.commit()
+
+    try:
+        lane = select_lane(retry.priority, retry.file_size)
+        retry_job = get_lane_queue(lane, job.connection).enqueue(
+            transfer_file_job,
+            retry.id,
+            job_timeout=transfer_job_timeout(job.connection, retry.file_size),
+            result_ttl=TRANSFER_JOB_CONFIG["result_ttl"],
+            failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"]
+        )
+        retry.queue_name = lane
+        retry.job_id = retry_job.id
+        message = f"{retry.file_count} failed bundle files re-queued as transfer {retry.id}"
+    except Exception as e:
+        retry.status = TransferStatus.FAILED
+        retry.error_message = f"Failed to enqueue transfer: {str(e)}"
+        message = f"{retry.file_count} failed bundle files could not be re-queued: {str(e)}"
+
+    transfer.error_message = f"{transfer.error_message}; {message}"
+    metadata = {"bundle_transfer_id": transfer.id, "retry_transfer_id": retry.id,
+                "files": retry.file_count, "retry_count": retry.retry_count}
+    for transfer_id in (transfer.id, retry.id):
+        db.add(AuditLog(
+            transfer_id=transfer_id,
+            event_type=AuditEventType.TRANSFER_PROGRESS,
+            message=message,
+            event_metadata=metadata
+        ))
+    db.commit()
+    print(f"[RQ Job {job.id}] {message}")
+    return retry
+
+
 def _wait_for_file_settle(file_path: str, settle_time_seconds: int = 30, max_wait: int = 300) -> bool:
     """
     Helper: Aguarda arquivo estabilizar (tamanho não muda por settle_time segundos)
@@ -803,8 +1267,11 @@ def _wait_for_file_settle(file_path: str, settle_time_seconds: int = 30, max_wai
 
 # Job configuration
 # FIXED: Timeout must be in seconds (integer), not strings like "2h"
+# Transfer timeouts are computed per job from size and measured throughput
+# (app.services.job_lease.transfer_job_timeout); "timeout" is the floor used
+# when the size is unknown. Liveness is enforced by the heartbeat stall detector.
 TRANSFER_JOB_CONFIG = {
-    "timeout": 7200,  # 2 hours = 7200 seconds for large files (500GB)
+    "timeout": 7200,  # 2 hours = 7200 seconds (floor for unknown sizes)
     "result_ttl": 86400,  # Keep result for 24h
     "failure_ttl": 86400,  # Keep failures for 24h
     "ttl": None,  # Job doesn't expire until processed
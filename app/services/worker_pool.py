@@ -0,0 +1,299 @@
+"""
+Ketter 3.0 - Pre-forked Worker Pool
+Long-lived RQ worker processes with warm imports and reused DB connections
+
+MRC Principles:
+- Simple: N pre-forked processes, each a SimpleWorker running one job at a
+  time in its main thread (RQ timeouts and the heartbeat stall signal keep
+  working unchanged)
+- Fast: no fork per job; imports, config and the SQLAlchemy connection
+  pool stay warm across jobs, which is what dominates tiny-file bursts
+- Isolated: a crashed process takes down only its own job; the supervisor
+  fails that job in RQ, drops the dead worker and forks a replacement
+
+The stock `rq worker` forks a work-horse per job, so every
+transfer_file_job opens a new DB connection, reloads config and pays
+fork/COW costs. Here the parent imports the job code once (gc.freeze
+before forking keeps those pages shared) and each child keeps its own
+connection pool for its whole life. Children are recycled after
+KETTER_WORKER_MAX_JOBS jobs to bound leaks.
+
+Concurrency = KETTER_WORKER_PROCESSES jobs per container (one per
+process). Processes, not threads: the copy engine relies on signals to the
+main thread (SIGALRM job timeout, SIGUSR1 stall detection).
+
+Config is read once per process: restart the pool after editing
+ketter.config.yml.
+
+Usage:
+    python -m app.services.worker_pool                   # all lanes + verify
+    python -m app.services.worker_pool --processes 8 high small default
+    python -m app.services.worker_pool --burst small     # drain and exit
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import RedisError
+from rq import Queue, SimpleWorker, Worker
+from rq.job import Job
+
+from app.services.redis_client import REDIS_URL
+from app.services.scheduling import LANE_ORDER
+
+WORKER_PROCESSES = int(os.getenv("KETTER_WORKER_PROCESSES", "4"))
+WORKER_MAX_JOBS = int(os.getenv("KETTER_WORKER_MAX_JOBS", "500"))  # 0 = never recycle
+WORKER_NAME = os.getenv("RQ_WORKER_NAME", "ketter-worker")
+WORKER_LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Each process publishes its DB pool usage here after every job (/status)
+POOL_STATUS_PREFIX = "ketter:db:pool:"
+POOL_STATUS_TTL_SECONDS = 600
+
+# Respawn backoff for processes that die right after starting (crash loop)
+RESPAWN_MIN_UPTIME_SECONDS = 10
+RESPAWN_MAX_DELAY_SECONDS = 30
+
+DEFAULT_QUEUES = LANE_ORDER + ["verify"]
+
+# Imported in the supervisor before forking: shared by every child (COW)
+WARM_IMPORTS = (
+    "app.models",
+    "app.services.worker_jobs",
+    "app.core.copy_engine",
+    "app.core.zip_engine",
+    "app.core.bundle",
+    "app.core.tree_hash",
+    "app.core.multistream",
+)
+
+
+def warm_imports() -> None:
+    """Import the job code once, before the children are forked"""
+    for module in WARM_IMPORTS:
+        importlib.import_module(module)
+
+
+def reset_after_fork() -> None:
+    """
+    Drop connections inherited from the supervisor
+
+    The child must not reuse sockets opened by the parent; dispose(close=False)
+    forgets the inherited pool without closing the parent's connections.
+    """
+    from app.database import engine, pool_stats
+    from app.services import redis_client
+
+    engine.dispose(close=False)
+    pool_stats.reset()
+    redis_client._redis_conn = None
+
+
+def publish_pool_status(redis_conn, name: str) -> None:
+    """Store this process's DB pool usage for /status (expires with the process)"""
+    from app.database import get_pool_status
+
+    try:
+        redis_conn.set(POOL_STATUS_PREFIX + name, json.dumps(get_pool_status()), ex=POOL_STATUS_TTL_SECONDS)
+    except RedisError as e:
+        print(f"[WorkerPool] Warning: could not publish pool status: {e}")
+
+
+def get_published_pool_status(redis_conn) -> List[dict]:
+    """DB pool usage of every live worker process"""
+    keys = sorted(redis_conn.scan_iter(match=POOL_STATUS_PREFIX + "*", count=100))
+    pools = []
+    for key, value in zip(keys, redis_conn.mget(keys) if keys else []):
+        if value is None:
+            continue
+        key = key.decode() if isinstance(key, bytes) else key
+        pools.append(dict(json.loads(value), worker=key[len(POOL_STATUS_PREFIX):]))
+    return pools
+
+
+class KetterWorker(SimpleWorker):
+    """SimpleWorker that publishes its DB pool usage after every job"""
+
+    def execute_job(self, job, queue):
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            publish_pool_status(self.connection, self.name)
+
+
+def run_worker_process(name: str, queue_names: List[str], redis_url: str,
+                       max_jobs: int, burst: bool, with_scheduler: bool) -> int:
+    """Child main: one KetterWorker until max_jobs, burst end or shutdown"""
+    redis_conn = Redis.from_url(redis_url)
+    queues = [Queue(queue_name, connection=redis_conn) for queue_name in queue_names]
+    worker = KetterWorker(queues, connection=redis_conn, name=name)
+    worker.work(
+        burst=burst,
+        max_jobs=max_jobs or None,
+        with_scheduler=with_scheduler,
+        logging_level=WORKER_LOG_LEVEL
+    )
+    redis_conn.delete(POOL_STATUS_PREFIX + name)
+    return 0
+
+
+def reap_dead_worker(redis_conn, name: str, exitcode: Optional[int]) -> Optional[str]:
+    """
+    Clean up after a worker process that died without deregistering
+
+    Fails the job it was running (RQ retries apply) and removes the worker
+    and its published pool status from the registry. The transfer itself is recovered by the recovery
+    sweeper once its heartbeat lease lapses.
+
+    Returns:
+        ID of the job that was failed, if any
+    """
+    redis_conn.delete(POOL_STATUS_PREFIX + name)
+    worker = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=redis_conn)
+    if worker is None:
+        return None
+
+    job_id = worker.get_current_job_id()
+    if job_id:
+        job = Job.fetch(job_id, connection=redis_conn)
+        worker.handle_job_failure(
+            job,
+            Queue(job.origin, connection=redis_conn),
+            exc_string=f"Worker process {name} died (exit code {exitcode})"
+        )
+    worker.register_death()
+    return job_id
+
+
+class WorkerPool:
+    """
+    Supervisor of the pre-forked worker processes
+
+    Forks `processes` children, forks a replacement whenever one exits
+    (crash or max_jobs recycle) and forwards SIGTERM/SIGINT as RQ warm
+    shutdowns. In burst mode a child that exits cleanly is not replaced.
+    """
+
+    def __init__(
+        self,
+        queue_names: List[str],
+        processes: int = WORKER_PROCESSES,
+        max_jobs: int = WORKER_MAX_JOBS,
+        burst: bool = False,
+        redis_url: str = REDIS_URL,
+        target: Callable[..., int] = run_worker_process,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.queue_names = list(queue_names)
+        self.processes = max(1, processes)
+        self.max_jobs = max_jobs
+        self.burst = burst
+        self.redis_url = redis_url
+        self.target = target
+        self.restarts = 0
+        self._sleep = sleep
+        self._ctx = multiprocessing.get_context("fork")
+        self._children: Dict[int, Tuple[multiprocessing.Process, str, float]] = {}
+        self._fast_crashes: Dict[int, int] = {}
+        self._stopping = False
+
+    def start(self) -> "WorkerPool":
+        warm_imports()
+        gc.freeze()  # Keep the warm heap out of the collector: fewer COW page copies
+        for index in range(self.processes):
+            self._spawn(index)
+        print(f"[WorkerPool] {self.processes} worker processes on {', '.join(self.queue_names)} "
+              f"(max_jobs={self.max_jobs or 'unlimited'}, burst={self.burst})")
+        return self
+
+    def _spawn(self, index: int) -> None:
+        name = f"{WORKER_NAME}.{index}.{uuid.uuid4().hex[:8]}"
+        process = self._ctx.Process(target=self._child_main, args=(index, name), name=name)
+        process.start()
+        self._children[index] = (process, name, time.monotonic())
+
+    def _child_main(self, index: int, name: str) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        reset_after_fork()
+        sys.exit(self.target(name, self.queue_names, self.redis_url,
+                             self.max_jobs, self.burst, index == 0))
+
+    def supervise(self) -> int:
+        """Run until every child has exited for good; returns the exit code"""
+        while self._children:
+            sentinels = {process.sentinel: index for index, (process, _, _) in self._children.items()}
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=1.0):
+                self._on_exit(sentinels[sentinel])
+        return 0
+
+    def _on_exit(self, index: int) -> None:
+        process, name, started_at = self._children.pop(index)
+        process.join()
+        exitcode = process.exitcode
+
+        if exitcode != 0:
+            print(f"[WorkerPool] Worker {name} died (exit code {exitcode})")
+            try:
+                job_id = reap_dead_worker(Redis.from_url(self.redis_url), name, exitcode)
+                if job_id:
+                    print(f"[WorkerPool] Job {job_id} of {name} marked failed")
+            except RedisError as e:
+                print(f"[WorkerPool] Warning: could not reap {name}: {e}")
+
+        if self._stopping or (self.burst and exitcode == 0):
+            return
+
+        if exitcode != 0 and time.monotonic() - started_at < RESPAWN_MIN_UPTIME_SECONDS:
+            self._fast_crashes[index] = self._fast_crashes.get(index, 0) + 1
+            delay = min(RESPAWN_MAX_DELAY_SECONDS, 2 ** (self._fast_crashes[index] - 1))
+            print(f"[WorkerPool] Worker slot {index} crashing on start, respawn in {delay}s")
+            self._sleep(delay)
+            if self._stopping:
+                return
+        else:
+            self._fast_crashes.pop(index, None)
+
+        self.restarts += 1
+        self._spawn(index)
+
+    def stop(self, signum: int = signal.SIGTERM, frame=None) -> None:
+        """Warm shutdown: children finish their current job, then exit"""
+        self._stopping = True
+        for process, _, _ in self._children.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Ketter pre-forked RQ worker pool")
+    parser.add_argument("queues", nargs="*", default=DEFAULT_QUEUES, help="Queues in priority order")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Worker processes")
+    parser.add_argument("--max-jobs", type=int, default=WORKER_MAX_JOBS, help="Jobs before a process is recycled")
+    parser.add_argument("--burst", action="store_true", help="Exit once the queues are empty")
+    parser.add_argument("--url", default=REDIS_URL, help="Redis URL")
+    args = parser.parse_args(argv)
+
+    # Worker-sized DB pool unless set explicitly (read when app.database is imported)
+    os.environ.setdefault("KETTER_DB_ROLE", "worker")
+    pool = WorkerPool(args.queues, processes=args.processes, max_jobs=args.max_jobs,
+                      burst=args.burst, redis_url=args.url)
+    signal.signal(signal.SIGTERM, pool.stop)
+    signal.signal(signal.SIGINT, pool.stop)
+    pool.start()
+    return pool.supervise()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
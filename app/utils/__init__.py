@@ -1,10 +1,5 @@
 """Utility functions for the Ketter application"""
 
-from .pdf_generator import (
-    generate_transfer_report,
-    get_transfer_report_filename,
-)
-
 from .tmpdir import create_secure_tmpdir
 
 __all__ = [
@@ -12,3 +7,11 @@ __all__ = [
     "get_transfer_report_filename",
     "create_secure_tmpdir",
 ]
+
+
+def __getattr__(name):
+    # PDF reports pull in reportlab: import on first use only
+    if name in ("generate_transfer_report", "get_transfer_report_filename"):
+        from . import pdf_generator
+        return getattr(pdf_generator, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
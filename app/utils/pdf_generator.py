@@ -95,8 +95,13 @@ def get_verification_status(checksums: List[Checksum]) -> Tuple[str, str]:
     """Determine verification status and message"""
     checksum_map = {c.checksum_type: c for c in checksums}
 
-    source_hash = checksum_map.get(ChecksumType.SOURCE)
     dest_hash = checksum_map.get(ChecksumType.DESTINATION)
+    # Compare with the SOURCE row of the same (in-flight) algorithm
+    source_rows = [c for c in checksums if c.checksum_type == ChecksumType.SOURCE]
+    source_hash = next(
+        (c for c in source_rows if dest_hash and getattr(c, "algorithm", None) == getattr(dest_hash, "algorithm", None)),
+        source_rows[0] if source_rows else None
+    )
 
     if source_hash and dest_hash:
         if source_hash.checksum_value == dest_hash.checksum_value:
@@ -179,7 +184,6 @@ def generate_transfer_report(
     normal_style.fontSize = 9
 
     # Calculate metrics
-    checksum_map = {c.checksum_type: c for c in checksums}
     verify_status, verify_message = get_verification_status(checksums)
 
     # Calculate duration and throughput
@@ -298,10 +302,10 @@ def generate_transfer_report(
     verification_data = [['Type', 'Hash Value', 'Calculated At']]
 
     for checksum_type in [ChecksumType.SOURCE, ChecksumType.DESTINATION, ChecksumType.FINAL]:
-        if checksum_type in checksum_map:
-            c = checksum_map[checksum_type]
+        for c in [c for c in checksums if c.checksum_type == checksum_type]:
+            algorithm = getattr(c, "algorithm", None) or "sha256"
             verification_data.append([
-                checksum_type.value.upper(),
+                f"{checksum_type.value.upper()} ({algorithm})",
                 c.checksum_value[:40] + '...',
                 format_datetime(c.calculated_at)
             ])
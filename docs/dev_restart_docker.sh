@@ -49,7 +49,7 @@ echo "Step 4: Subindo RQ Worker..."
 pkill -f "rq worker" || true
 sleep 1
 
-nohup rq worker default \
+nohup rq worker --with-scheduler high small default low verify \
   --url redis://localhost:6379 \
   >/tmp/ketter_worker.log 2>&1 &
 
@@ -10,7 +10,7 @@ function TransferProgress({ transfers = [], isLoading = false, error = null, onC
   const [checksums, setChecksums] = useState(null)
 
   const activeTransfers = transfers.filter((t) =>
-    ['pending', 'validating', 'copying', 'verifying'].includes(t.status)
+    ['pending', 'queued_for_volume', 'validating', 'copying', 'verifying', 'copied_unverified'].includes(t.status)
   )
 
   async function handleStopTransfer(transfer) {
@@ -104,7 +104,7 @@ function TransferProgress({ transfers = [], isLoading = false, error = null, onC
             <button className="btn btn-icon" onClick={() => showChecksums(transfer.id)} title="View SHA-256 checksums">
               View Checksums
             </button>
-            {['pending', 'validating', 'copying', 'verifying'].includes(transfer.status) && (
+            {['pending', 'queued_for_volume', 'validating', 'copying', 'verifying', 'copied_unverified'].includes(transfer.status) && (
               <button
                 className="btn btn-icon btn-danger-icon"
                 onClick={() => handleStopTransfer(transfer)}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Ketter 3.0 - Durability Benchmark
+
+Measures the cost of each durability level on a target volume so the
+right `durability` can be set per volume in ketter.config.yml.
+
+Two workloads per level:
+- large: one big file through copy_file_with_progress
+- folder: many small files, synced per file (fsync each) vs batched
+  (one syncfs, as the copy engine does after unzip)
+
+Usage (from the repository root):
+    python scripts/bench_durability.py /Volumes/Nexis/ketter_bench
+    python scripts/bench_durability.py /data/transfers/bench --size-mb 4096 --files 2000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.copy_engine import copy_file_with_progress  # noqa: E402
+from app.core.file_io import DURABILITY_LEVELS, sync_file, sync_tree  # noqa: E402
+
+
+def _make_source(directory: str, size_bytes: int) -> str:
+    path = os.path.join(directory, "bench_source.bin")
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        written = 0
+        while written < size_bytes:
+            f.write(block[:min(len(block), size_bytes - written)])
+            written += len(block)
+    return path
+
+
+def bench_large(source: str, target_dir: str, level: str) -> float:
+    dest = os.path.join(target_dir, f"large_{level}.bin")
+    start = time.perf_counter()
+    copy_file_with_progress(source, dest, durability=level)
+    elapsed = time.perf_counter() - start
+    os.remove(dest)
+    return elapsed
+
+
+def bench_folder(target_dir: str, level: str, files: int, file_kb: int, batched: bool) -> float:
+    folder = os.path.join(target_dir, f"folder_{level}_{'batched' if batched else 'perfile'}")
+    os.makedirs(folder, exist_ok=True)
+    payload = os.urandom(file_kb * 1024)
+
+    start = time.perf_counter()
+    for i in range(files):
+        with open(os.path.join(folder, f"f{i:06d}.dat"), "wb") as f:
+            f.write(payload)
+            if not batched:
+                f.flush()
+                sync_file(f.fileno(), level)
+    if batched:
+        sync_tree(folder, level)
+    elapsed = time.perf_counter() - start
+
+    shutil.rmtree(folder)
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Ketter durability levels on a volume")
+    parser.add_argument("target", help="Directory on the volume to test (created if missing)")
+    parser.add_argument("--size-mb", type=int, default=1024, help="Large file size (default: 1024)")
+    parser.add_argument("--files", type=int, default=500, help="Small files per folder run (default: 500)")
+    parser.add_argument("--file-kb", type=int, default=64, help="Small file size (default: 64)")
+    parser.add_argument("--levels", default=",".join(DURABILITY_LEVELS), help="Comma-separated levels")
+    args = parser.parse_args()
+
+    os.makedirs(args.target, exist_ok=True)
+    levels = [level.strip() for level in args.levels.split(",")]
+    size_bytes = args.size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory(prefix="ketter_bench_src_") as src_dir:
+        source = _make_source(src_dir, size_bytes)
+
+        print(f"Target: {args.target}")
+        print(f"Large file: {args.size_mb} MB | Folder: {args.files} x {args.file_kb} KB\n")
+        print(f"{'level':<12} {'large MB/s':>11} {'folder per-file s':>18} {'folder batched s':>17}")
+        print("-" * 61)
+
+        for level in levels:
+            large = bench_large(source, args.target, level)
+            per_file = bench_folder(args.target, level, args.files, args.file_kb, batched=False)
+            batched = bench_folder(args.target, level, args.files, args.file_kb, batched=True)
+            print(f"{level:<12} {args.size_mb / large:>11.1f} {per_file:>18.2f} {batched:>17.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Ketter 3.0 - Worker Pool Benchmark
+
+Measures jobs/second for a burst of small-file transfers, run by:
+- stock: N `rq worker --burst` processes (fork per job)
+- pool: `python -m app.services.worker_pool --burst --processes N`
+  (pre-forked SimpleWorkers, warm imports and DB connections)
+
+Each run enqueues the same number of transfer_file_job jobs on a private
+queue, so the numbers include the full job path (DB reads/writes, audit
+events, checksums, copy). Needs the same DATABASE_URL/REDIS_URL as the
+workers; created transfers and copies are removed afterwards.
+
+Usage (from the repository root, e.g. inside the worker container):
+    python scripts/bench_worker_pool.py /data/transfers/bench
+    python scripts/bench_worker_pool.py /data/transfers/bench --jobs 2000 --processes 8 --file-kb 4
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rq import Queue  # noqa: E402
+
+from app.database import SessionLocal  # noqa: E402
+from app.models import Transfer, TransferStatus  # noqa: E402
+from app.services.redis_client import REDIS_URL, get_redis  # noqa: E402
+from app.services.worker_jobs import transfer_file_job, TRANSFER_JOB_CONFIG  # noqa: E402
+
+MODES = ("stock", "pool")
+
+
+def _make_sources(directory: str, files: int, file_kb: int) -> list:
+    payload = os.urandom(file_kb * 1024)
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"f{i:06d}.dat")
+        with open(path, "wb") as f:
+            f.write(payload)
+        paths.append(path)
+    return paths
+
+
+def _enqueue(sources: list, dest_dir: str, queue_name: str) -> list:
+    os.makedirs(dest_dir, exist_ok=True)
+    db = SessionLocal()
+    try:
+        transfers = [
+            Transfer(
+                source_path=source,
+                destination_path=os.path.join(dest_dir, os.path.basename(source)),
+                file_size=os.path.getsize(source),
+                file_name=os.path.basename(source),
+                status=TransferStatus.PENDING
+            )
+            for source in sources
+        ]
+        db.add_all(transfers)
+        db.commit()
+        ids = [t.id for t in transfers]
+    finally:
+        db.close()
+
+    queue = Queue(queue_name, connection=get_redis())
+    for transfer_id in ids:
+        queue.enqueue(transfer_file_job, transfer_id, job_timeout=600,
+                      result_ttl=TRANSFER_JOB_CONFIG["result_ttl"], failure_ttl=TRANSFER_JOB_CONFIG["failure_ttl"])
+    return ids
+
+
+def _run_workers(mode: str, queue_name: str, processes: int, env: dict) -> float:
+    if mode == "stock":
+        commands = [[sys.executable, "-m", "rq.cli", "worker", "--burst", "--url", REDIS_URL, queue_name]
+                    for _ in range(processes)]
+    else:
+        commands = [[sys.executable, "-m", "app.services.worker_pool", "--burst",
+                     "--processes", str(processes), "--url", REDIS_URL, queue_name]]
+
+    start = time.perf_counter()
+    workers = [subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for command in commands]
+    for worker in workers:
+        worker.wait()
+    return time.perf_counter() - start
+
+
+def _collect(ids: list) -> int:
+    db = SessionLocal()
+    try:
+        transfers = db.query(Transfer).filter(Transfer.id.in_(ids)).all()
+        completed = sum(1 for t in transfers if t.status == TransferStatus.COMPLETED)
+        for transfer in transfers:
+            db.delete(transfer)
+        db.commit()
+        return completed
+    finally:
+        db.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Ketter worker pool against the stock RQ worker")
+    parser.add_argument("target", help="Directory for the copies (created if missing)")
+    parser.add_argument("--jobs", type=int, default=500, help="Small-file transfers per run (default: 500)")
+    parser.add_argument("--file-kb", type=int, default=16, help="File size (default: 16)")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes per run (default: 4)")
+    parser.add_argument("--durability", default="none", help="KETTER_DURABILITY for the workers (default: none)")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes")
+    args = parser.parse_args()
+
+    os.makedirs(args.target, exist_ok=True)
+    env = dict(os.environ, KETTER_DURABILITY=args.durability, KETTER_WORKER_MAX_JOBS="0")
+    modes = [mode.strip() for mode in args.modes.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="ketter_bench_jobs_") as src_dir:
+        sources = _make_sources(src_dir, args.jobs, args.file_kb)
+
+        print(f"Target: {args.target}")
+        print(f"Jobs: {args.jobs} x {args.file_kb} KB | Processes: {args.processes} | "
+              f"Durability: {args.durability}\n")
+        print(f"{'mode':<8} {'seconds':>9} {'jobs/s':>9} {'completed':>10}")
+        print("-" * 39)
+
+        for mode in modes:
+            queue_name = f"bench-{mode}-{uuid.uuid4().hex[:8]}"
+            dest_dir = os.path.join(args.target, queue_name)
+            ids = _enqueue(sources, dest_dir, queue_name)
+            elapsed = _run_workers(mode, queue_name, args.processes, env)
+            completed = _collect(ids)
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            print(f"{mode:<8} {elapsed:>9.2f} {args.jobs / elapsed:>9.1f} {completed:>10}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,17 @@ class _TestClientSession:
 requests.Session = _TestClientSession
 
 
+@pytest.fixture(scope="session", autouse=True)
+def fresh_test_schema():
+    """
+    Recreate the SQLite schema once per run so model changes always apply.
+    """
+    from app.database import reset_db
+
+    reset_db()
+    yield
+
+
 @pytest.fixture
 def client():
     """
@@ -0,0 +1,160 @@
+"""
+Ketter 3.0 - Bandwidth Shaping Tests
+
+Tests verify the token-bucket rate limits:
+- The bucket lets one second of burst through, then charges debt as wait time
+- The shaper paces a byte loop to the transfer limit
+- Runtime overrides and time-of-day windows are picked up while running
+- The copy engine reports allowed vs achieved rate in progress data
+"""
+
+import os
+import tempfile
+from datetime import datetime
+from functools import partial
+from unittest.mock import patch
+
+import pytest
+
+from app.config import VolumeConfig
+from app.core import copy_engine
+from app.database import SessionLocal
+from app.models import AuditLog, Transfer, TransferStatus
+from app.services import bandwidth
+from app.services.bandwidth import (
+    LocalTokenBucket,
+    RateShaper,
+    set_rate_override,
+    volume_limit_mbps,
+)
+
+MB = 1024 * 1024
+
+
+class FakeClock:
+    """Monotonic clock advanced only by the shaper's sleeps"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    LocalTokenBucket._buckets.clear()
+    bandwidth._local_overrides.clear()
+    yield
+    LocalTokenBucket._buckets.clear()
+    bandwidth._local_overrides.clear()
+
+
+def _shaper(clock, max_mbps=None, paths=(), now=None):
+    return RateShaper(9001, list(paths), max_mbps, backend=LocalTokenBucket(clock),
+                      clock=clock, sleep=clock.sleep, now=now or datetime.now)
+
+
+def test_bucket_burst_then_debt():
+    clock = FakeClock()
+    bucket = LocalTokenBucket(clock)
+
+    assert bucket.take("t", MB, MB) == 0  # One second of burst
+    assert bucket.take("t", MB, MB) == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.take("t", MB // 2, MB) == pytest.approx(0.5)
+
+
+def test_shaper_paces_to_transfer_limit():
+    clock = FakeClock()
+    shaper = _shaper(clock, max_mbps=2)
+
+    total = 10 * MB
+    for done in range(256 * 1024, total + 1, 256 * 1024):
+        shaper(done, total)
+
+    # 2 MB of burst, the remaining 8 MB at 2 MB/s
+    assert sum(clock.slept) == pytest.approx(4.0)
+    assert shaper.report()["allowed_mbps"] == 2
+    assert shaper.report()["achieved_mbps"] == pytest.approx(2.0)
+
+
+def test_runtime_override_and_new_phase():
+    clock = FakeClock()
+    shaper = _shaper(clock)
+    assert not shaper.limited
+
+    shaper(4 * MB, 8 * MB)
+    assert clock.slept == []
+
+    set_rate_override("transfer:9001", 1)
+    clock.now += bandwidth.RATE_REFRESH_SECONDS
+    shaper(8 * MB, 8 * MB)
+    assert shaper.allowed_mbps == 1
+    assert clock.slept == [pytest.approx(3.0)]  # 4 MB at 1 MB/s after 1 MB of burst
+
+    # Next loop restarts from zero: the delta is the new loop's bytes
+    shaper(MB, 8 * MB)
+    assert sum(clock.slept) == pytest.approx(4.0)
+
+    set_rate_override("transfer:9001", 0)  # Explicitly unlimited
+    clock.now += bandwidth.RATE_REFRESH_SECONDS
+    shaper(2 * MB, 8 * MB)
+    assert not shaper.limited
+
+
+def test_volume_windows():
+    volume = VolumeConfig({
+        "path": "/Volumes/Nexis",
+        "max_mbps": 500,
+        "rate_windows": [{"window": "09:00-19:00", "max_mbps": 100},
+                         {"window": "22:00-06:00", "max_mbps": 0}],
+    })
+    assert volume_limit_mbps(volume, datetime(2026, 1, 5, 10, 30)) == 100
+    assert volume_limit_mbps(volume, datetime(2026, 1, 5, 20, 0)) == 500
+    assert volume_limit_mbps(volume, datetime(2026, 1, 5, 23, 0)) is None
+    assert volume_limit_mbps(VolumeConfig({"path": "/tmp"})) is None
+
+
+def test_engine_reports_rate():
+    source_dir = tempfile.mkdtemp(prefix="ketter_rate_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_rate_dst_")
+    source = os.path.join(source_dir, "take.wav")
+    content = os.urandom(3 * MB)
+    with open(source, "wb") as f:
+        f.write(content)
+
+    db = SessionLocal()
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "take.wav"),
+        file_name="take.wav",
+        file_size=len(content),
+        status=TransferStatus.PENDING,
+        max_mbps=1
+    )
+    db.add(transfer)
+    db.commit()
+
+    slept = []
+    with patch.object(copy_engine, "RateShaper", partial(RateShaper, sleep=slept.append)), \
+         patch.object(copy_engine, "plan_streams", return_value=(4, "test")) as plan:
+        transfer = copy_engine.transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    plan.assert_called_once()
+    assert transfer.rate_allowed_mbps == 1
+    assert slept  # 9 MB read/written at 1 MB/s
+
+    copied = db.query(AuditLog).filter(
+        AuditLog.transfer_id == transfer.id,
+        AuditLog.message.like("File copied:%")
+    ).one()
+    assert copied.event_metadata["streams"] == 1
+    assert copied.event_metadata["rate"]["allowed_mbps"] == 1
+    db.close()
@@ -0,0 +1,338 @@
+"""
+Ketter 3.0 - Small-File Bundle Tests
+
+Tests verify bundled transfers of many small files:
+- Small files are grouped, large ones keep their own transfer
+- One bundle copies and verifies every file with a handful of DB writes
+- A failing file is reported in the per-file result list
+- MOVE deletes only the sources of verified files
+- The DESTINATION digest is built from what was re-read from the destination
+- Failed files of a bundle are re-queued as a follow-up bundle (capped)
+- A watched bundle that cannot be enqueued is FAILED and offered again
+- POST /transfers/bundle creates bundles and GET /transfers/{id}/bundle lists results
+"""
+
+import hashlib
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core import bundle as bundle_module
+from app.core.bundle import (
+    new_bundle_retry, new_bundle_transfer, plan_bundles, transfer_bundle_with_verification
+)
+from app.core.folder_manifest import MANIFEST_ALGORITHM, folder_digest
+from app.database import SessionLocal
+from app.models import AuditLog, Checksum, ChecksumType, Transfer, TransferStatus
+from app.routers import transfers as transfers_router
+
+
+def _sidecars(count, nested=True):
+    """count small files (some in a subfolder) -> (root, {relpath: bytes})"""
+    root = tempfile.mkdtemp(prefix="ketter_bundle_src_")
+    files = {}
+    for i in range(count):
+        relpath = os.path.join("meta", f"clip_{i:04d}.xml") if nested and i % 3 == 0 else f"clip_{i:04d}.txt"
+        files[relpath] = os.urandom(100 + i)
+    for relpath, data in files.items():
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return root, files
+
+
+def _bundle(db, root, files, **fields):
+    dest = os.path.join(tempfile.mkdtemp(prefix="ketter_bundle_dst_"), "sidecars")
+    transfer = new_bundle_transfer([os.path.join(root, rel) for rel in files], dest, **fields)
+    db.add(transfer)
+    db.commit()
+    return transfer, dest
+
+
+def test_plan_bundles(monkeypatch):
+    monkeypatch.setattr(bundle_module, "BUNDLE_MAX_FILE_BYTES", 1000)
+    monkeypatch.setattr(bundle_module, "BUNDLE_MIN_FILES", 3)
+    monkeypatch.setattr(bundle_module, "BUNDLE_MAX_FILES", 2)
+
+    files = [("a", 10), ("b", 20), ("big.wav", 5000), ("c", 30)]
+    assert plan_bundles(files) == ([["a", "b"], ["c"]], ["big.wav"])
+    assert plan_bundles(files[:3]) == ([], ["a", "b", "big.wav"])  # Too few small files
+
+
+def test_bundle_copies_and_verifies():
+    root, files = _sidecars(60)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files)
+
+    transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    assert transfer.file_count == 60
+    for relpath, data in files.items():
+        with open(os.path.join(dest, relpath), "rb") as f:
+            assert f.read() == data
+    results = {entry[0]: entry for entry in transfer.bundle_files}
+    for relpath, data in files.items():
+        assert results[relpath][1:] == [len(data), hashlib.sha256(data).hexdigest(), None]
+
+    checksums = db.query(Checksum).filter(Checksum.transfer_id == transfer.id).all()
+    assert {c.checksum_type for c in checksums} == {ChecksumType.SOURCE, ChecksumType.DESTINATION, ChecksumType.FINAL}
+    assert {c.algorithm for c in checksums} == {MANIFEST_ALGORITHM}
+    assert len({c.checksum_value for c in checksums}) == 1
+    # Per-bundle audit trail, not per file
+    assert db.query(AuditLog).filter(AuditLog.transfer_id == transfer.id).count() == 2
+    db.close()
+
+
+def test_failed_file_is_reported():
+    root, files = _sidecars(10, nested=False)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files)
+    os.remove(os.path.join(root, "clip_0004.txt"))  # Vanished before the job ran
+
+    transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.FAILED
+    assert "1 of 10" in transfer.error_message
+    failed = [entry for entry in transfer.bundle_files if entry[3]]
+    assert [entry[0] for entry in failed] == ["clip_0004.txt"]
+    assert failed[0][3].startswith("copy:")
+    assert os.path.exists(os.path.join(dest, "clip_0005.txt"))
+    db.close()
+
+
+def test_move_deletes_verified_sources():
+    root, files = _sidecars(12)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files, operation_mode="move")
+
+    transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    for relpath in files:
+        assert not os.path.exists(os.path.join(root, relpath))
+        assert os.path.exists(os.path.join(dest, relpath))
+    db.close()
+
+
+def test_destination_digest_is_read_back():
+    root, files = _sidecars(10)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files)
+    real_read = bundle_module.calculate_sha256_from_storage
+    read_back = {}
+
+    def read(path, *args, **kwargs):
+        value, stats = real_read(path, *args, **kwargs)
+        read_back[os.path.relpath(path, dest)] = [stats["bytes_read"], None, value]
+        return value, stats
+
+    with patch.object(bundle_module, "calculate_sha256_from_storage", side_effect=read):
+        transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    assert sorted(read_back) == sorted(files)
+    values = {c.checksum_type: c.checksum_value
+              for c in db.query(Checksum).filter(Checksum.transfer_id == transfer.id)}
+    assert values[ChecksumType.DESTINATION] == folder_digest(read_back)
+    assert values[ChecksumType.SOURCE] == folder_digest(
+        {rel: [len(data), None, hashlib.sha256(data).hexdigest()] for rel, data in files.items()})
+    db.close()
+
+
+def test_size_mismatch_on_read_back_fails_file():
+    root, files = _sidecars(8, nested=False)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files)
+    real_read = bundle_module.calculate_sha256_from_storage
+
+    def short_read(path, *args, **kwargs):
+        value, stats = real_read(path, *args, **kwargs)
+        if path.endswith("clip_0002.txt"):
+            stats = dict(stats, bytes_read=stats["bytes_read"] - 1)
+        return value, stats
+
+    with patch.object(bundle_module, "calculate_sha256_from_storage", side_effect=short_read):
+        transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.FAILED
+    failed = [entry for entry in transfer.bundle_files if entry[3]]
+    assert [entry[0] for entry in failed] == ["clip_0002.txt"]
+    assert failed[0][3].startswith("size mismatch")
+    db.close()
+
+
+def test_failed_move_files_are_requeued():
+    from app.services import worker_jobs
+
+    root, files = _sidecars(9)
+    db = SessionLocal()
+    transfer, dest = _bundle(db, root, files, operation_mode="move")
+    flaky = os.path.join("meta", "clip_0003.xml")
+    real_read = bundle_module.calculate_sha256_from_storage
+
+    def read(path, *args, **kwargs):
+        if path.endswith(flaky):
+            raise OSError(5, "Input/output error")
+        return real_read(path, *args, **kwargs)
+
+    with patch.object(bundle_module, "calculate_sha256_from_storage", side_effect=read):
+        transfer = transfer_bundle_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.FAILED
+    # Verified sources are gone, the failed one stays for the retry
+    assert os.path.exists(os.path.join(root, flaky))
+    assert not os.path.exists(os.path.join(root, "clip_0001.txt"))
+
+    queue = MagicMock()
+    queue.enqueue.return_value = MagicMock(id="job-bundle-retry")
+    with patch.object(worker_jobs, "get_lane_queue", return_value=queue), \
+         patch.object(worker_jobs, "transfer_job_timeout", return_value=600):
+        retry = worker_jobs._requeue_failed_bundle_files(MagicMock(id="bundle-job"), db, transfer)
+
+    assert queue.enqueue.call_args.args[1] == retry.id
+    assert retry.job_id == "job-bundle-retry"
+    assert retry.retry_count == 1
+    assert retry.source_path == transfer.source_path
+    assert [entry[0] for entry in retry.bundle_files] == [flaky]
+    assert f"transfer {retry.id}" in transfer.error_message
+
+    retry = transfer_bundle_with_verification(retry.id, db)
+    assert retry.status == TransferStatus.COMPLETED
+    assert os.path.exists(os.path.join(dest, flaky))
+    assert not os.path.exists(os.path.join(root, flaky))
+    assert new_bundle_retry(retry) is None  # Nothing left to retry
+    db.close()
+
+
+def test_bundle_retry_is_capped(monkeypatch):
+    monkeypatch.setattr(bundle_module, "BUNDLE_MAX_RETRIES", 2)
+    root, files = _sidecars(4, nested=False)
+    db = SessionLocal()
+    transfer, _ = _bundle(db, root, files)
+    transfer.bundle_files = [[rel, len(data), None, "copy: Input/output error"] for rel, data in files.items()]
+
+    transfer.retry_count = 1
+    assert new_bundle_retry(transfer).retry_count == 2
+    transfer.retry_count = 2
+    assert new_bundle_retry(transfer) is None
+    db.close()
+
+
+def test_bundle_api(client, monkeypatch):
+    monkeypatch.setattr(transfers_router, "BUNDLE_MAX_FILES", 25)
+    root, files = _sidecars(40, nested=False)
+    dest = os.path.join(tempfile.mkdtemp(prefix="ketter_bundle_api_"), "out")
+    queue = MagicMock()
+    queue.enqueue.return_value = MagicMock(id="job-bundle")
+
+    with patch.object(transfers_router, "get_lane_queue", return_value=queue), \
+         patch.object(transfers_router, "transfer_job_timeout", return_value=600):
+        status, body = client.post("/transfers/bundle", json={
+            "source_paths": [os.path.join(root, rel) for rel in files],
+            "destination_path": dest
+        })
+
+    assert status == 201
+    assert body["total"] == 2
+    assert [item["file_count"] for item in body["items"]] == [25, 15]
+    assert queue.enqueue.call_count == 2
+
+    db = SessionLocal()
+    transfer_bundle_with_verification(body["items"][0]["id"], db)
+    db.close()
+
+    status, result = client.get(f"/transfers/{body['items'][0]['id']}/bundle")
+    assert status == 200
+    assert result["total"] == 25 and result["failed"] == 0
+    assert all(f["sha256"] for f in result["files"])
+
+
+def test_watcher_bundles_small_files():
+    from app.models import WatchFile
+    from app.services import worker_jobs
+
+    root, files = _sidecars(20, nested=False)
+    dest = tempfile.mkdtemp(prefix="ketter_bundle_watch_")
+    db = SessionLocal()
+    watch = Transfer(
+        source_path=root,
+        destination_path=dest,
+        file_size=0,
+        file_name="watch",
+        status=TransferStatus.PENDING,
+        watch_mode_enabled=1,
+        settle_time_seconds=2,
+        watch_continuous=1,
+        last_files_processed="[]"
+    )
+    db.add(watch)
+    db.commit()
+
+    queue = MagicMock()
+    queue.enqueue.return_value = MagicMock(id="job-watch-bundle")
+    with patch.object(worker_jobs, "get_current_job", return_value=MagicMock(id="watch-job")), \
+         patch.object(worker_jobs, "get_redis"), \
+         patch.object(worker_jobs, "get_lane_queue", return_value=queue), \
+         patch.object(worker_jobs, "transfer_job_timeout", return_value=600), \
+         patch("app.services.worker_jobs.time.sleep"):
+        with pytest.raises(StopIteration):
+            worker_jobs.watcher_continuous_job(watch.id, stop_after_cycles=1)
+
+    assert queue.enqueue.call_count == 1
+    bundle_id = queue.enqueue.call_args.args[1]
+    bundled = db.query(Transfer).filter(Transfer.id == bundle_id).one()
+    assert bundled.file_count == 20
+    assert sorted(entry[0] for entry in bundled.bundle_files) == sorted(files)
+    assert db.query(WatchFile).filter(WatchFile.transfer_id == watch.id).count() == 1
+    db.close()
+
+
+def test_watcher_bundle_enqueue_failure_is_retried():
+    import json
+    from app.models import WatchFile
+    from app.services import worker_jobs
+
+    root, files = _sidecars(12, nested=False)
+    dest = tempfile.mkdtemp(prefix="ketter_bundle_watch_")
+    db = SessionLocal()
+    watch = Transfer(
+        source_path=root,
+        destination_path=dest,
+        file_size=0,
+        file_name="watch",
+        status=TransferStatus.PENDING,
+        watch_mode_enabled=1,
+        settle_time_seconds=2,
+        watch_continuous=1,
+        last_files_processed="[]"
+    )
+    db.add(watch)
+    db.commit()
+
+    queue = MagicMock()
+    queue.enqueue.side_effect = ConnectionError("redis down")
+    with patch.object(worker_jobs, "get_current_job", return_value=MagicMock(id="watch-job")), \
+         patch.object(worker_jobs, "get_redis"), \
+         patch.object(worker_jobs, "get_lane_queue", return_value=queue), \
+         patch.object(worker_jobs, "transfer_job_timeout", return_value=600), \
+         patch("app.services.worker_jobs.time.sleep"):
+        with pytest.raises(StopIteration):
+            worker_jobs.watcher_continuous_job(watch.id, stop_after_cycles=1)
+
+    bundle_id = queue.enqueue.call_args.args[1]
+    bundled = db.query(Transfer).filter(Transfer.id == bundle_id).one()
+    assert bundled.status == TransferStatus.FAILED
+    assert bundled.dedupe_key is None
+    assert "redis down" in bundled.error_message
+    watch_file = db.query(WatchFile).filter(WatchFile.transfer_id == watch.id).one()
+    assert watch_file.status == TransferStatus.FAILED
+
+    # Not recorded as processed: the next cycle offers them again
+    db.refresh(watch)
+    processed = set(json.loads(watch.last_files_processed))
+    assert not processed & {os.path.join(root, rel) for rel in files}
+    db.close()
@@ -0,0 +1,132 @@
+"""
+Ketter 3.0 - Checksum Algorithm Tests
+
+Tests verify the pluggable in-flight algorithm:
+- Registry names, aliases and unknown algorithms
+- CRC32 / BLAKE2b digests match their reference implementations
+- A non-SHA-256 in-flight check still records a SHA-256 FINAL, streamed
+  during the copy (holes of sparse sources included)
+- Deferred verification uses the stored in-flight algorithm
+"""
+
+import hashlib
+import os
+import tempfile
+import zlib
+
+import pytest
+
+from app.core import hashing
+from app.core.copy_engine import (
+    copy_file_with_progress,
+    transfer_file_with_verification,
+    verify_copied_transfer,
+)
+from app.database import SessionLocal
+from app.models import Checksum, ChecksumType, Transfer, TransferStatus
+from app.services.transfer_lock import LocalLockBackend
+
+
+@pytest.fixture
+def db():
+    LocalLockBackend._leases.clear()
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def _transfer(db, content):
+    source_dir = tempfile.mkdtemp(prefix="ketter_algo_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_algo_dst_")
+    source = os.path.join(source_dir, "stem.wav")
+    with open(source, "wb") as f:
+        f.write(content)
+
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "stem.wav"),
+        file_name="stem.wav",
+        file_size=len(content),
+        status=TransferStatus.PENDING
+    )
+    db.add(transfer)
+    db.commit()
+    return transfer
+
+
+def _rows(db, transfer_id):
+    return {
+        (row.checksum_type, row.algorithm): row.checksum_value
+        for row in db.query(Checksum).filter(Checksum.transfer_id == transfer_id)
+    }
+
+
+def test_registry_names():
+    assert hashing.normalize_algorithm("SHA256") == "sha256"
+    assert hashing.normalize_algorithm("SHA-256") == "sha256"
+    assert hashing.normalize_algorithm("BLAKE2B") == "blake2b"
+    assert hashing.is_cryptographic("crc32") is False
+
+    with pytest.raises(ValueError):
+        hashing.normalize_algorithm("md4")
+
+
+def test_digests_match_references():
+    data = os.urandom(4096)
+
+    crc = hashing.new_hasher("crc32")
+    crc.update(data[:1000])
+    crc.update(data[1000:])
+    assert crc.hexdigest() == f"{zlib.crc32(data):08x}"
+
+    blake = hashing.new_hasher("blake2b")
+    blake.update(data)
+    assert blake.hexdigest() == hashlib.blake2b(data).hexdigest()
+
+
+def test_fast_in_flight_keeps_sha256_final(db, monkeypatch):
+    monkeypatch.setenv("CHECKSUM_ALGORITHM", "CRC32")
+    content = os.urandom(300 * 1024)
+    transfer = _transfer(db, content)
+
+    transfer = transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    crc = f"{zlib.crc32(content):08x}"
+    sha = hashlib.sha256(content).hexdigest()
+    assert _rows(db, transfer.id) == {
+        (ChecksumType.SOURCE, "crc32"): crc,
+        (ChecksumType.SOURCE, "sha256"): sha,
+        (ChecksumType.DESTINATION, "crc32"): crc,
+        (ChecksumType.FINAL, "sha256"): sha,
+    }
+
+
+def test_deferred_verify_uses_stored_algorithm(db, monkeypatch):
+    monkeypatch.setenv("CHECKSUM_ALGORITHM", "blake2b")
+    content = os.urandom(64 * 1024)
+    transfer = _transfer(db, content)
+    transfer_file_with_verification(transfer.id, db, defer_verification=True)
+
+    # Configuration changed between copy and verify: the stored algorithm wins
+    monkeypatch.setenv("CHECKSUM_ALGORITHM", "SHA256")
+    verify_copied_transfer(transfer.id, db)
+
+    rows = _rows(db, transfer.id)
+    assert rows[(ChecksumType.DESTINATION, "blake2b")] == hashlib.blake2b(content).hexdigest()
+    assert rows[(ChecksumType.FINAL, "sha256")] == hashlib.sha256(content).hexdigest()
+
+
+def test_streamed_hash_covers_sparse_holes():
+    with tempfile.TemporaryDirectory(prefix="ketter_algo_sparse_") as workdir:
+        source = os.path.join(workdir, "disk.img")
+        with open(source, "wb") as f:
+            f.truncate(8 * 1024 * 1024)
+            f.seek(3 * 1024 * 1024)
+            f.write(b"data" * 1000)
+
+        streamed = hashlib.sha256()
+        copy_file_with_progress(source, os.path.join(workdir, "copy.img"), hasher=streamed)
+
+        with open(source, "rb") as f:
+            assert streamed.hexdigest() == hashlib.sha256(f.read()).hexdigest()
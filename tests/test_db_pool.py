@@ -0,0 +1,96 @@
+"""
+Ketter 3.0 - Database Pool Tests
+
+Tests verify the per-role connection pooling:
+- Each role gets its own pool size, timeouts and statement timeout,
+  overridable with KETTER_DB_* variables
+- PgBouncer mode drops the client-side pool and session-level options
+- Checkout waits and pool timeouts are counted
+- /status shows the API pool and the pools published by worker processes
+"""
+
+import fnmatch
+import tempfile
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from app.database import InstrumentedQueuePool, engine_options, pool_stats
+from app.services.worker_pool import get_published_pool_status, publish_pool_status
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the pool status keys"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def scan_iter(self, match=None, count=None):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+
+def test_role_settings_and_overrides(monkeypatch):
+    api = engine_options("api", sqlite=False)
+    worker = engine_options("worker", sqlite=False)
+
+    assert api["poolclass"] is InstrumentedQueuePool
+    assert worker["pool_size"] + worker["max_overflow"] < api["pool_size"] + api["max_overflow"]
+    assert worker["pool_pre_ping"] is True
+    assert worker["pool_recycle"] == 1800
+    assert worker["connect_args"] == {"application_name": "ketter-worker",
+                                      "options": "-c statement_timeout=60000"}
+
+    monkeypatch.setenv("KETTER_DB_POOL_SIZE", "7")
+    monkeypatch.setenv("KETTER_DB_STATEMENT_TIMEOUT_MS", "0")
+    tuned = engine_options("watch", sqlite=False)
+    assert tuned["pool_size"] == 7
+    assert "options" not in tuned["connect_args"]
+
+
+def test_pgbouncer_mode():
+    options = engine_options("worker", pgbouncer=True, sqlite=False)
+    assert options["poolclass"] is NullPool
+    assert options["connect_args"] == {"application_name": "ketter-worker"}
+
+
+def test_checkout_wait_and_timeout_are_counted():
+    path = tempfile.mktemp(prefix="ketter_pool_", suffix=".db")
+    test_engine = create_engine(f"sqlite:///{path}", poolclass=InstrumentedQueuePool,
+                                pool_size=1, max_overflow=0, pool_timeout=0.1)
+    before = pool_stats.snapshot()
+
+    with test_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(PoolTimeoutError):
+            test_engine.connect()
+
+    after = pool_stats.snapshot()
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["timeouts"] == before["timeouts"] + 1
+    assert after["max_wait_ms"] >= 100
+    test_engine.dispose()
+
+
+def test_status_shows_pools(client):
+    fake = FakeRedis()
+    publish_pool_status(fake, "ketter-worker.0.abcd1234")
+    assert get_published_pool_status(fake)[0]["worker"] == "ketter-worker.0.abcd1234"
+
+    with patch("app.main.redis.from_url", side_effect=ConnectionError("no redis")):
+        status, body = client.get("/status")
+
+    assert status == 200
+    api_pool = body["database_pools"]["api"]
+    assert api_pool["role"] == "api"
+    assert api_pool["pool_class"] == "InstrumentedQueuePool"
+    assert {"in_use", "checkouts", "timeouts", "avg_wait_ms", "max_wait_ms"} <= set(api_pool)
+    assert body["database_pools"]["workers"] == []
@@ -0,0 +1,177 @@
+"""
+Ketter 3.0 - Deferred Verification Tests
+
+Tests verify the opt-in COPIED_UNVERIFIED flow:
+- The copy pass stops in COPIED_UNVERIFIED without a DESTINATION checksum
+- The verify pass completes COPY transfers with the triple verification
+- MOVE sources survive until the deferred verification passes
+- A mismatch fails the transfer and keeps the source
+- The verify job lowers its I/O priority and honours the throughput cap
+- A verify job that cannot be queued fails the transfer
+"""
+
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core import copy_engine, file_io
+from app.core.copy_engine import (
+    CopyEngineError,
+    calculate_sha256_from_storage,
+    transfer_file_with_verification,
+    verify_copied_transfer,
+)
+from app.database import SessionLocal
+from app.models import AuditEventType, Checksum, ChecksumType, Transfer, TransferStatus
+from app.services.transfer_lock import LocalLockBackend
+
+
+@pytest.fixture
+def db():
+    LocalLockBackend._leases.clear()
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def _transfer(db, operation_mode="copy"):
+    source_dir = tempfile.mkdtemp(prefix="ketter_defer_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_defer_dst_")
+    source = os.path.join(source_dir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(os.urandom(256 * 1024))
+
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "take.wav"),
+        file_name="take.wav",
+        file_size=os.path.getsize(source),
+        status=TransferStatus.PENDING,
+        operation_mode=operation_mode
+    )
+    db.add(transfer)
+    db.commit()
+    db.refresh(transfer)
+    return transfer
+
+
+def _checksum_types(db, transfer_id):
+    rows = db.query(Checksum).filter(Checksum.transfer_id == transfer_id).all()
+    return {row.checksum_type for row in rows}
+
+
+def test_copy_pass_stops_unverified(db):
+    transfer = _transfer(db)
+    transfer = transfer_file_with_verification(transfer.id, db, defer_verification=True)
+
+    assert transfer.status == TransferStatus.COPIED_UNVERIFIED
+    assert os.path.exists(transfer.destination_path)
+    assert _checksum_types(db, transfer.id) == {ChecksumType.SOURCE}
+
+
+def test_verify_pass_completes_copy(db):
+    transfer = _transfer(db)
+    transfer_file_with_verification(transfer.id, db, defer_verification=True)
+
+    transfer = verify_copied_transfer(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    assert _checksum_types(db, transfer.id) == {
+        ChecksumType.SOURCE, ChecksumType.DESTINATION, ChecksumType.FINAL
+    }
+    assert os.path.exists(transfer.source_path)
+
+
+def test_move_keeps_source_until_verified(db):
+    transfer = _transfer(db, operation_mode="move")
+    transfer_file_with_verification(transfer.id, db, defer_verification=True)
+    assert os.path.exists(transfer.source_path), "Source must survive the copy pass"
+
+    verify_copied_transfer(transfer.id, db)
+    assert not os.path.exists(transfer.source_path)
+    assert os.path.exists(transfer.destination_path)
+
+
+def test_mismatch_fails_and_keeps_source(db):
+    transfer = _transfer(db, operation_mode="move")
+    transfer_file_with_verification(transfer.id, db, defer_verification=True)
+
+    with open(transfer.destination_path, "r+b") as f:
+        f.write(b"corrupt")
+
+    with pytest.raises(CopyEngineError):
+        verify_copied_transfer(transfer.id, db)
+
+    db.refresh(transfer)
+    assert transfer.status == TransferStatus.FAILED
+    assert os.path.exists(transfer.source_path)
+    assert ChecksumType.FINAL not in _checksum_types(db, transfer.id)
+
+
+def test_io_priority_lowered_and_restored(monkeypatch):
+    calls = []
+
+    def fake_syscall(number, which, who, *value):
+        calls.append((number, value))
+        return 0 if value else 4  # previous: best-effort, level 4
+
+    monkeypatch.setattr(file_io, "_syscall", fake_syscall)
+    monkeypatch.setattr(file_io, "_ioprio_syscalls", lambda: (251, 252))
+
+    with file_io.lowered_io_priority("idle") as changed:
+        assert changed is True
+
+    assert calls == [(252, ()), (251, (3 << 13,)), (251, (4,))]
+
+    monkeypatch.setattr(file_io, "_ioprio_syscalls", lambda: None)
+    with file_io.lowered_io_priority("idle") as changed:
+        assert changed is False
+
+
+def test_verify_read_is_throttled():
+    with tempfile.NamedTemporaryFile(prefix="ketter_throttle_") as f:
+        f.write(os.urandom(1024 * 1024))
+        f.flush()
+
+        with patch.object(copy_engine.time, "sleep") as sleep:
+            calculate_sha256_from_storage(f.name, cache_mode="off", max_bytes_per_second=512 * 1024)
+
+        # 1 MB at 512 KB/s: the reader must pause for roughly two seconds
+        assert sum(call.args[0] for call in sleep.call_args_list) == pytest.approx(2.0, abs=0.5)
+
+
+def test_copy_job_queues_verification(monkeypatch):
+    from app.services import worker_jobs
+
+    transfer = MagicMock(id=42, file_size=10 * 1024 * 1024, status=TransferStatus.COPIED_UNVERIFIED)
+    job = MagicMock(id="job-1")
+    queue = MagicMock()
+    monkeypatch.setattr(worker_jobs, "transfer_file_with_verification", lambda **kwargs: transfer)
+    monkeypatch.setattr(worker_jobs, "TransferHeartbeat", MagicMock())
+    monkeypatch.setattr(worker_jobs, "VERIFY_MAX_MBPS", 50)
+
+    with patch.object(worker_jobs, "Queue", return_value=queue) as queue_cls:
+        assert worker_jobs._run_transfer_with_heartbeat(job, MagicMock(), 42) is transfer
+
+    assert queue_cls.call_args.args[0] == "verify"
+    assert queue.enqueue.call_args.args == (worker_jobs.verify_transfer_job, 42)
+
+
+def test_verification_enqueue_failure_fails_transfer(monkeypatch):
+    from app.services import worker_jobs
+
+    transfer = MagicMock(id=42, file_size=1024, status=TransferStatus.COPIED_UNVERIFIED)
+    db = MagicMock()
+    queue = MagicMock()
+    queue.enqueue.side_effect = ConnectionError("redis gone")
+    monkeypatch.setattr(worker_jobs, "transfer_job_timeout", lambda *args: 600)
+
+    with patch.object(worker_jobs, "Queue", return_value=queue), \
+         pytest.raises(worker_jobs.CopyEngineError, match="could not be queued"):
+        worker_jobs._enqueue_verification(MagicMock(id="job-1"), db, transfer)
+
+    assert transfer.status == TransferStatus.FAILED
+    assert db.add.call_args.args[0].event_type == AuditEventType.TRANSFER_FAILED
+    db.commit.assert_called_once()
@@ -0,0 +1,96 @@
+"""
+Ketter 3.0 - Durability Level Tests
+
+Tests verify how the copy engine flushes destinations:
+- none never syncs, fsync syncs the file once
+- writebehind starts writeback window by window while copying
+- full also fsyncs the parent directory
+- folder trees are synced once (batched), not per file
+- volumes can override the default level
+"""
+
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.config import VolumeConfig
+from app.core import copy_engine, file_io
+from app.core.copy_engine import copy_file_with_progress
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def source():
+    with tempfile.TemporaryDirectory(prefix="ketter_durability_") as workdir:
+        path = os.path.join(workdir, "take.wav")
+        with open(path, "wb") as f:
+            f.write(os.urandom(4 * MB))
+        yield path
+
+
+def _copy(source, level, **kwargs):
+    dest = os.path.join(os.path.dirname(source), f"copy_{level}.wav")
+    with patch.object(copy_engine, "sync_file", wraps=file_io.sync_file) as sync_file, \
+         patch.object(copy_engine, "fsync_directory") as fsync_dir:
+        copy_file_with_progress(source, dest, durability=level, **kwargs)
+    return sync_file, fsync_dir
+
+
+def test_levels_sync_as_documented(source):
+    with patch.object(file_io.os, "fdatasync") as fdatasync:
+        _, fsync_dir = _copy(source, "none")
+        assert fdatasync.call_count == 0
+        fsync_dir.assert_not_called()
+
+        _, fsync_dir = _copy(source, "fsync")
+        assert fdatasync.call_count == 1
+        fsync_dir.assert_not_called()
+
+        _, fsync_dir = _copy(source, "full")
+        assert fdatasync.call_count == 2
+        fsync_dir.assert_called_once_with(os.path.dirname(source))
+
+
+def test_writebehind_flushes_by_window(monkeypatch):
+    calls = []
+    monkeypatch.setattr(file_io, "_sync_file_range", lambda fd, start, length, flags: calls.append((start, length, flags)) or 0)
+
+    write_behind = file_io.WriteBehind(fd=3, window=MB)
+    for position in range(MB // 2, 4 * MB + 1, MB // 2):
+        write_behind.written(position)
+
+    started = [(start, length) for start, length, flags in calls if flags == file_io.SYNC_FILE_RANGE_WRITE]
+    waited = [(start, length) for start, length, flags in calls if flags != file_io.SYNC_FILE_RANGE_WRITE]
+    assert started == [(0, MB), (MB, MB), (2 * MB, MB), (3 * MB, MB)]
+    # Each window waits for the one before it: at most two windows in flight
+    assert waited == started[:-1]
+
+
+def test_folder_tree_synced_once():
+    with tempfile.TemporaryDirectory(prefix="ketter_tree_") as folder:
+        with patch.object(file_io, "sync_filesystem") as sync_fs, \
+             patch.object(file_io, "fsync_directory") as fsync_dir:
+            file_io.sync_tree(folder, "fsync")
+            file_io.sync_tree(folder, "full")
+            file_io.sync_tree(folder, "none")
+
+        assert sync_fs.call_count == 2
+        fsync_dir.assert_called_once_with(os.path.dirname(folder))
+
+
+def test_volume_overrides_default_level(monkeypatch):
+    config = MagicMock()
+    config.get_volume_for_path.return_value = VolumeConfig({"path": "/Volumes/Nexis", "durability": "writebehind"})
+    monkeypatch.setattr("app.config.get_config", lambda: config)
+    assert file_io.get_durability("/Volumes/Nexis/show/take.wav") == "writebehind"
+
+    config.get_volume_for_path.return_value = None
+    monkeypatch.setattr(file_io, "DEFAULT_DURABILITY", "fsync")
+    assert file_io.get_durability("/elsewhere/take.wav") == "fsync"
+
+    monkeypatch.setattr(file_io, "DEFAULT_DURABILITY", "sometimes")
+    with pytest.raises(ValueError):
+        file_io.get_durability("/elsewhere/take.wav")
@@ -0,0 +1,218 @@
+"""
+Ketter 3.0 - Folder Resync Tests
+
+Tests verify the incremental folder transfer:
+- diff_manifest classifies added / changed / removed / unchanged, and a
+  destination file deleted behind our back is copied again
+- The folder digest covers paths, sizes and hashes
+- A first resync run does the full ZIP transfer and records the baseline
+- A second run copies only what changed, deletes removed files on request
+  and records the same folder digest as a fresh full manifest
+- Manifest hashes are read from storage; the audit trail says whether the
+  digest is manifest-level or a full re-read
+- KETTER_RESYNC_VERIFY=full re-hashes unchanged files and re-copies damaged ones
+"""
+
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core import copy_engine, folder_manifest
+from app.core.folder_manifest import (
+    MANIFEST_ALGORITHM,
+    build_entries,
+    diff_manifest,
+    folder_digest,
+    scan_folder,
+)
+from app.database import SessionLocal
+from app.models import AuditEventType, AuditLog, Checksum, ChecksumType, FolderManifest, Transfer, TransferStatus
+from app.services.transfer_lock import LocalLockBackend
+
+
+@pytest.fixture
+def db():
+    LocalLockBackend._leases.clear()
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _session_folder():
+    source = os.path.join(tempfile.mkdtemp(prefix="ketter_resync_src_"), "session")
+    _write(os.path.join(source, "session.ptx"), b"ptx v1")
+    _write(os.path.join(source, "Audio Files", "kick.wav"), os.urandom(64 * 1024))
+    _write(os.path.join(source, "Audio Files", "snare.wav"), os.urandom(64 * 1024))
+    _write(os.path.join(source, "Audio Files", "vox.wav"), os.urandom(64 * 1024))
+    return source
+
+
+def _run(db, source, destination, delete_removed=False):
+    transfer = Transfer(
+        source_path=source,
+        destination_path=destination,
+        file_name="session",
+        file_size=0,
+        status=TransferStatus.PENDING,
+        sync_mode="resync",
+        delete_removed=1 if delete_removed else 0
+    )
+    db.add(transfer)
+    db.commit()
+    return copy_engine.transfer_file_with_verification(transfer.id, db)
+
+
+def _bump_mtime(path):
+    later = time.time() + 60
+    os.utime(path, (later, later))
+
+
+def test_diff_classifies_paths():
+    with tempfile.TemporaryDirectory(prefix="ketter_manifest_") as workdir:
+        _write(os.path.join(workdir, "a.wav"), b"a" * 10)
+        _write(os.path.join(workdir, "b.wav"), b"b" * 10)
+        _write(os.path.join(workdir, ".DS_Store"), b"hidden")
+        scan = scan_folder(workdir)
+        assert sorted(scan) == ["a.wav", "b.wav"]
+
+        previous = build_entries(scan, workdir)
+        previous["gone.wav"] = [1, 1, "00"]
+
+        _write(os.path.join(workdir, "c.wav"), b"c")
+        _write(os.path.join(workdir, "b.wav"), b"B" * 12)
+
+        diff = diff_manifest(previous, scan_folder(workdir), workdir)
+        assert (diff.added, diff.changed, diff.removed, diff.unchanged) == (
+            ["c.wav"], ["b.wav"], ["gone.wav"], ["a.wav"]
+        )
+
+        # Same source, but the destination copy disappeared
+        with tempfile.TemporaryDirectory(prefix="ketter_manifest_dst_") as empty:
+            assert diff_manifest(previous, scan, empty).changed == ["a.wav", "b.wav"]
+
+
+def test_digest_covers_path_size_and_hash():
+    entries = {"a.wav": [10, 1, "aa"], "b.wav": [20, 2, "bb"]}
+    digest = folder_digest(entries)
+
+    assert folder_digest({"b.wav": [20, 9, "bb"], "a.wav": [10, 9, "aa"]}) == digest  # mtime-independent
+    assert folder_digest({"a.wav": [10, 1, "aa"], "c.wav": [20, 2, "bb"]}) != digest
+    assert folder_digest({"a.wav": [10, 1, "aa"], "b.wav": [20, 2, "bc"]}) != digest
+
+
+def test_resync_copies_only_changes(db):
+    source = _session_folder()
+    destination = os.path.join(tempfile.mkdtemp(prefix="ketter_resync_dst_"), "session")
+
+    first = _run(db, source, destination)
+    assert first.status == TransferStatus.COMPLETED
+    baseline = db.query(FolderManifest).filter(FolderManifest.transfer_id == first.id).one()
+    assert baseline.digest is not None and baseline.file_count == 4
+
+    # Session edited: one take re-recorded, one added, one removed
+    _write(os.path.join(source, "session.ptx"), b"ptx v2 - edited")
+    _bump_mtime(os.path.join(source, "session.ptx"))
+    _write(os.path.join(source, "Audio Files", "bass.wav"), os.urandom(32 * 1024))
+    os.remove(os.path.join(source, "Audio Files", "vox.wav"))
+
+    real_copy = copy_engine.copy_file_with_progress
+    with patch.object(copy_engine, "copy_file_with_progress", side_effect=real_copy) as copy, \
+         patch.object(copy_engine, "zip_folder_smart") as zip_folder:
+        second = _run(db, source, destination, delete_removed=True)
+
+    assert second.status == TransferStatus.COMPLETED
+    zip_folder.assert_not_called()
+    copied = sorted(os.path.relpath(call.args[0], source) for call in copy.call_args_list)
+    assert copied == [os.path.join("Audio Files", "bass.wav"), "session.ptx"]
+
+    for relpath in scan_folder(source):
+        with open(os.path.join(source, relpath), "rb") as a, open(os.path.join(destination, relpath), "rb") as b:
+            assert a.read() == b.read()
+    assert not os.path.exists(os.path.join(destination, "Audio Files", "vox.wav"))
+
+    # The incremental digest equals a manifest hashed from scratch
+    expected = folder_digest(build_entries(scan_folder(source), source))
+    values = {(c.checksum_type, c.algorithm): c.checksum_value
+              for c in db.query(Checksum).filter(Checksum.transfer_id == second.id)}
+    assert values == {
+        (ChecksumType.SOURCE, MANIFEST_ALGORITHM): expected,
+        (ChecksumType.DESTINATION, MANIFEST_ALGORITHM): expected,
+        (ChecksumType.FINAL, MANIFEST_ALGORITHM): expected,
+    }
+
+
+def test_removed_files_kept_without_delete_flag(db):
+    source = _session_folder()
+    destination = os.path.join(tempfile.mkdtemp(prefix="ketter_resync_dst_"), "session")
+    _run(db, source, destination)
+
+    os.remove(os.path.join(source, "Audio Files", "kick.wav"))
+    transfer = _run(db, source, destination)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    assert transfer.bytes_transferred == 0
+    assert os.path.exists(os.path.join(destination, "Audio Files", "kick.wav"))
+
+
+def _verified_event(db, transfer_id):
+    return db.query(AuditLog).filter(
+        AuditLog.transfer_id == transfer_id,
+        AuditLog.event_type == AuditEventType.CHECKSUM_VERIFIED
+    ).one()
+
+
+def test_manifest_hashes_read_from_storage():
+    with tempfile.TemporaryDirectory(prefix="ketter_manifest_") as workdir:
+        _write(os.path.join(workdir, "a.wav"), b"a" * 10)
+        with patch.object(folder_manifest, "StorageReader", wraps=folder_manifest.StorageReader) as reader:
+            build_entries(scan_folder(workdir), workdir)
+        reader.assert_called_once()
+        assert reader.call_args.args[0] == os.path.join(workdir, "a.wav")
+
+
+def test_resync_labels_manifest_level_check(db):
+    source = _session_folder()
+    destination = os.path.join(tempfile.mkdtemp(prefix="ketter_resync_dst_"), "session")
+    _run(db, source, destination)
+
+    _write(os.path.join(source, "session.ptx"), b"ptx v2")
+    _bump_mtime(os.path.join(source, "session.ptx"))
+    second = _run(db, source, destination)
+
+    event = _verified_event(db, second.id)
+    assert "manifest-level" in event.message
+    assert event.event_metadata["verify_level"] == "manifest"
+    assert event.event_metadata["rehashed_files"] == 1
+    assert event.event_metadata["size_checked_files"] == 3
+
+
+def test_full_verify_recopies_damaged_unchanged_file(db, monkeypatch):
+    source = _session_folder()
+    destination = os.path.join(tempfile.mkdtemp(prefix="ketter_resync_dst_"), "session")
+    _run(db, source, destination)
+
+    # Bit rot at the destination: same size, source untouched
+    kick = os.path.join(destination, "Audio Files", "kick.wav")
+    with open(kick, "r+b") as f:
+        f.seek(100)
+        f.write(b"rot")
+
+    monkeypatch.setattr(copy_engine, "RESYNC_VERIFY", "full")
+    second = _run(db, source, destination)
+
+    assert second.status == TransferStatus.COMPLETED
+    with open(os.path.join(source, "Audio Files", "kick.wav"), "rb") as a, open(kick, "rb") as b:
+        assert a.read() == b.read()
+    event = _verified_event(db, second.id)
+    assert event.event_metadata["verify_level"] == "full"
+    assert event.event_metadata["rehashed_files"] == 4
+    assert event.event_metadata["damaged_recopied"] == 1
@@ -0,0 +1,192 @@
+"""
+Ketter 3.0 - Job Lease Tests
+
+Tests verify heartbeat leases and dynamic timeouts:
+- Job timeout scales with size and measured throughput
+- Throughput estimate is a moving average
+- Lease key lives while progress happens and is removed afterwards
+- Stall detector interrupts a blocked transfer
+- Folder transfers are timed by the size of their tree, not the floor
+- Long flushes and hash passes keep the heartbeat fed
+"""
+
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core import delta_sync, file_io
+from app.core.folder_manifest import build_entries, scan_folder
+from app.routers import transfers as transfers_router
+from app.services import job_lease
+from app.services.job_lease import (
+    TransferHeartbeat,
+    TransferStalledError,
+    compute_job_timeout,
+    expected_transfer_bytes,
+    lease_key,
+    record_throughput,
+    transfer_job_timeout,
+)
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+
+def test_timeout_covers_large_files():
+    # 500 GB at 60 MB/s raw (20 MB/s effective over three passes), x2 safety
+    timeout = compute_job_timeout(500 * GB)
+    assert timeout > 500 * GB / (60 * MB)  # longer than a single pass
+    assert timeout > 7200  # the old fixed timeout would kill this transfer
+
+
+def test_timeout_clamped(monkeypatch):
+    monkeypatch.setattr(job_lease, "MIN_JOB_TIMEOUT_SECONDS", 600)
+    monkeypatch.setattr(job_lease, "MAX_JOB_TIMEOUT_SECONDS", 3600)
+
+    assert compute_job_timeout(1024) == 600
+    assert compute_job_timeout(0) == 600
+    assert compute_job_timeout(10 * 1024 * GB) == 3600
+
+
+def test_timeout_uses_measured_throughput(monkeypatch):
+    monkeypatch.setattr(job_lease, "MIN_JOB_TIMEOUT_SECONDS", 1)
+    fast = compute_job_timeout(100 * GB, throughput_bps=500 * MB)
+    slow = compute_job_timeout(100 * GB, throughput_bps=50 * MB)
+    assert slow == pytest.approx(fast * 10, rel=0.01)
+
+
+def test_throughput_moving_average():
+    redis_conn = MagicMock()
+    redis_conn.get.return_value = None
+    record_throughput(redis_conn, 100 * MB, 1.0)
+    redis_conn.set.assert_called_with(job_lease.THROUGHPUT_KEY, 100 * MB)
+
+    redis_conn.get.return_value = str(100 * MB).encode()
+    record_throughput(redis_conn, 200 * MB, 1.0)
+    assert redis_conn.set.call_args[0][1] == pytest.approx(120 * MB)
+
+
+def test_timeout_falls_back_when_redis_down():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    redis_conn = MagicMock()
+    redis_conn.get.side_effect = RedisConnectionError("down")
+    assert transfer_job_timeout(redis_conn, 10 * GB) == compute_job_timeout(10 * GB)
+
+
+def test_heartbeat_holds_and_drops_lease():
+    redis_conn = MagicMock()
+    with TransferHeartbeat(redis_conn, 42, holder="job-1", lease_ttl=30) as heartbeat:
+        heartbeat.beat(1, 10)
+        redis_conn.set.assert_called_with(lease_key(42), "job-1", ex=30)
+
+    redis_conn.delete.assert_called_once_with(lease_key(42))
+
+
+def test_stall_detector_interrupts_blocked_transfer():
+    redis_conn = MagicMock()
+    stalls = []
+    heartbeat = TransferHeartbeat(
+        redis_conn, 7, holder="job-1",
+        stall_timeout=1, lease_ttl=3,
+        on_stall=lambda hb: stalls.append(hb.transfer_id)
+    )
+
+    with pytest.raises(TransferStalledError):
+        with heartbeat:
+            # Simulates a read that never returns
+            time.sleep(10)
+
+    assert stalls == [7]
+    assert heartbeat.stalled is True
+
+
+def test_beat_after_stall_raises():
+    heartbeat = TransferHeartbeat(MagicMock(), 8, holder="job-1")
+    heartbeat.stalled = True
+    with pytest.raises(TransferStalledError):
+        heartbeat.beat(10, 100)
+
+
+def _folder(tmp_path, sizes=(1000, 2500, 4096)):
+    root = tmp_path / "reels"
+    (root / "sub").mkdir(parents=True)
+    for i, size in enumerate(sizes):
+        (root / ("sub" if i % 2 else ".") / f"f{i}.mov").write_bytes(os.urandom(size))
+    return root
+
+
+def test_folder_sized_by_walking_its_tree(tmp_path):
+    root = _folder(tmp_path)
+    assert expected_transfer_bytes(str(root), 0) == 1000 + 2500 + 4096
+    assert expected_transfer_bytes(str(root), 123) == 123  # Known size wins
+    assert expected_transfer_bytes(str(tmp_path / "missing"), 0) == 0
+
+
+def test_folder_transfer_enqueued_with_tree_timeout(client, tmp_path):
+    root = _folder(tmp_path)
+    queue = MagicMock()
+    queue.enqueue.return_value = MagicMock(id="job-folder")
+    with patch.object(transfers_router, "get_lane_queue", return_value=queue), \
+         patch.object(transfers_router, "transfer_job_timeout", return_value=99999) as timeout, \
+         patch.object(transfers_router, "promote_starved_jobs"):
+        status, _ = client.post("/transfers", json={
+            "source_path": str(root),
+            "destination_path": str(tmp_path / "out"),
+        })
+
+    assert status == 201
+    assert timeout.call_args[0][1] == 1000 + 2500 + 4096
+    assert queue.enqueue.call_args.kwargs["job_timeout"] == 99999
+
+
+def test_long_flush_keeps_heartbeat_fed(monkeypatch):
+    monkeypatch.setattr(file_io, "SYNC_BEAT_SECONDS", 0.2)
+    heartbeat = TransferHeartbeat(MagicMock(), 9, holder="job-1", stall_timeout=1, lease_ttl=3)
+
+    with heartbeat:
+        # A 2.5s flush, longer than the stall timeout
+        assert file_io.call_with_heartbeat(heartbeat.beat, lambda: time.sleep(2.5) or "synced") == "synced"
+
+    assert heartbeat.stalled is False
+
+
+def test_hung_flush_still_trips_stall_detector(monkeypatch):
+    monkeypatch.setattr(file_io, "SYNC_BEAT_SECONDS", 0.2)
+    monkeypatch.setattr(file_io, "SYNC_MAX_SECONDS", 0.5)
+    heartbeat = TransferHeartbeat(MagicMock(), 10, holder="job-1", stall_timeout=1, lease_ttl=3)
+
+    with pytest.raises(TransferStalledError):
+        with heartbeat:
+            file_io.call_with_heartbeat(heartbeat.beat, time.sleep, 10)
+
+
+def test_flush_errors_reach_the_caller():
+    def failing_sync():
+        raise OSError(5, "I/O error")
+
+    with pytest.raises(OSError):
+        file_io.call_with_heartbeat(lambda: None, failing_sync)
+
+
+def test_signature_and_manifest_passes_beat_per_chunk(tmp_path, monkeypatch):
+    big = tmp_path / "tree" / "big.mov"
+    big.parent.mkdir()
+    big.write_bytes(os.urandom(256 * 1024))
+
+    monkeypatch.setattr(delta_sync, "IO_BYTES", 64 * 1024)
+    beats = []
+    delta_sync.block_signatures(str(big), 16 * 1024, progress_callback=lambda *p: beats.append(p))
+    assert len(beats) >= 3
+
+    # One file, hashed in 64 KB chunks: beats during the file, not only after it
+    from app.core import folder_manifest
+    real_hash_file = folder_manifest.hash_file
+    monkeypatch.setattr(folder_manifest, "hash_file",
+                        lambda path, progress_callback=None: real_hash_file(path, 64 * 1024, progress_callback))
+    beats = []
+    root = str(big.parent)
+    build_entries(scan_folder(root), root, progress_callback=lambda *p: beats.append(p))
+    assert len(beats) >= 4
@@ -0,0 +1,141 @@
+"""
+Ketter 3.0 - Live Progress Tests
+
+Tests verify that hot progress counters stay off the transfers table:
+- Updates are throttled; the row is untouched until the next status change,
+  which writes the latest values back
+- A full engine copy issues a handful of UPDATEs, not one per chunk
+- The API overlays live progress on running transfers only
+- A Redis outage falls back to the in-process store
+"""
+
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import event
+
+from app.core.copy_engine import transfer_file_with_verification
+from app.database import SessionLocal, engine
+from app.models import Transfer, TransferStatus
+from app.services.progress import LiveProgress, LocalProgressStore, get_live_progress, read_live_progress
+from app.services.transfer_lock import LocalLockBackend
+
+
+@pytest.fixture
+def db():
+    LocalLockBackend._leases.clear()
+    LocalProgressStore._progress.clear()
+    db = SessionLocal()
+    yield db
+    db.close()
+    LocalProgressStore._progress.clear()
+
+
+def _transfer(db, size=4096, status=TransferStatus.PENDING):
+    source = os.path.join(tempfile.mkdtemp(prefix="ketter_live_src_"), "reel.mov")
+    with open(source, "wb") as f:
+        f.write(os.urandom(size))
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(tempfile.mkdtemp(prefix="ketter_live_dst_"), "reel.mov"),
+        file_name="reel.mov",
+        file_size=size,
+        status=status
+    )
+    db.add(transfer)
+    db.commit()
+    return transfer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_throttled_updates_land_on_status_change(db):
+    transfer = _transfer(db, status=TransferStatus.COPYING)
+    store = LocalProgressStore()
+    clock = FakeClock()
+    live = LiveProgress(transfer, store=store, clock=clock)
+    transfer._live_progress = live
+
+    live.update(bytes_transferred=100, progress_percent=10)
+    live.update(bytes_transferred=150, progress_percent=10)  # Same percent, within the interval
+    assert store.read_many([transfer.id])[transfer.id]["bytes_transferred"] == 100
+
+    clock.now = 1.0
+    live.update(bytes_transferred=200, progress_percent=10)
+    assert store.read_many([transfer.id])[transfer.id]["bytes_transferred"] == 200
+
+    db.refresh(transfer)
+    assert transfer.bytes_transferred == 0  # Row untouched so far
+
+    transfer.status = TransferStatus.VERIFYING
+    db.commit()
+    db.refresh(transfer)
+    assert transfer.bytes_transferred == 200
+    assert transfer.progress_percent == 10
+
+
+def test_engine_copy_skips_per_chunk_updates(db):
+    size = 12 * 1024 * 1024  # 12 chunks
+    transfer = _transfer(db, size=size)
+    updates = []
+
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE TRANSFERS"):
+            updates.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_updates)
+    try:
+        transfer_file_with_verification(transfer.id, db)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_updates)
+
+    db.refresh(transfer)
+    assert transfer.status == TransferStatus.COMPLETED
+    assert transfer.bytes_transferred == size
+    assert transfer.progress_percent == 100
+    assert len(updates) < 12
+
+
+def test_api_overlays_live_progress_on_running_transfers(client, db):
+    running = _transfer(db, status=TransferStatus.COPYING)
+    done = _transfer(db, status=TransferStatus.COMPLETED)
+    store = LocalProgressStore()
+    for transfer in (running, done):
+        store.write(transfer.id, {"bytes_transferred": 2048, "progress_percent": 50,
+                                  "rate_achieved_mbps": 12.5, "updated_at": 1700000000.0})
+
+    status, body = client.get(f"/transfers/{running.id}")
+    assert status == 200
+    assert body["bytes_transferred"] == 2048
+    assert body["progress_percent"] == 50
+    assert body["rate_achieved_mbps"] == 12.5
+
+    status, body = client.get(f"/transfers/{done.id}")
+    assert body["bytes_transferred"] == 0  # Terminal: the row is authoritative
+
+    status, body = client.get("/transfers")
+    items = {item["id"]: item for item in body["items"]}
+    assert items[running.id]["progress_percent"] == 50
+    assert items[done.id]["progress_percent"] == 0
+
+
+def test_redis_outage_falls_back_to_local_store(db):
+    transfer = _transfer(db, status=TransferStatus.COPYING)
+    broken = MagicMock()
+    broken.clear.side_effect = RedisConnectionError("down")
+    broken.write.side_effect = RedisConnectionError("down")
+
+    live = LiveProgress(transfer, store=broken)
+    assert isinstance(live.store, LocalProgressStore)
+    live.update(bytes_transferred=64, progress_percent=1)
+    assert read_live_progress([transfer.id])[transfer.id]["bytes_transferred"] == 64
+    assert get_live_progress(transfer) is not live  # Not attached: a fresh writer
@@ -0,0 +1,129 @@
+"""
+Ketter 3.0 - Multi-Stream Copy Tests
+
+Tests verify the concurrent ranged copy:
+- Output is bit-identical; the ordered hasher equals a sequential SHA-256
+  and the range leaves equal the tree hash leaves
+- Stream counts come from ketter.config.yml (per type, per volume override)
+- The tuner hill-climbs from the configured count to the fastest one
+- The copy engine uses it when the volume asks for more than one stream
+"""
+
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from app import config as app_config
+from app.core import copy_engine, multistream
+from app.core.multistream import StreamTuner, multistream_copy, plan_streams
+from app.core.tree_hash import tree_hash
+from app.database import SessionLocal
+from app.models import Checksum, ChecksumType, Transfer, TransferStatus
+
+RANGE = 64 * 1024
+
+
+@pytest.fixture
+def small_pieces(monkeypatch):
+    # Several pieces per range so pieces really arrive out of order
+    monkeypatch.setattr(multistream, "PIECE_BYTES", 8 * 1024)
+
+
+def test_copy_hash_and_leaves(small_pieces):
+    with tempfile.TemporaryDirectory(prefix="ketter_multi_") as workdir:
+        source = os.path.join(workdir, "reel.mov")
+        dest = os.path.join(workdir, "copy", "reel.mov")
+        with open(source, "wb") as f:
+            f.write(os.urandom(10 * RANGE + 1234))
+
+        flat = hashlib.sha256()
+        copied, leaves = multistream_copy(source, dest, streams=4, range_size=RANGE,
+                                          hasher=flat, with_leaves=True)
+
+        with open(source, "rb") as f:
+            data = f.read()
+        with open(dest, "rb") as f:
+            assert f.read() == data
+        assert copied == len(data)
+        assert flat.hexdigest() == hashlib.sha256(data).hexdigest()
+        assert leaves == tree_hash(source, chunk_size=RANGE)[0].leaves
+
+
+def test_streams_from_config(monkeypatch):
+    with tempfile.TemporaryDirectory(prefix="ketter_multi_cfg_") as workdir:
+        nas = os.path.join(workdir, "nas")
+        fast = os.path.join(workdir, "fast")
+        local = os.path.join(workdir, "local")
+        for path in (nas, fast, local):
+            os.makedirs(path)
+        config_path = os.path.join(workdir, "ketter.config.yml")
+        with open(config_path, "w") as f:
+            f.write(
+                "copy_streams:\n  network: 4\n  local: 1\n"
+                "volumes:\n"
+                f"  - {{path: {nas}, type: network}}\n"
+                f"  - {{path: {fast}, type: network, copy_streams: 8}}\n"
+                f"  - {{path: {local}, type: local}}\n"
+            )
+        monkeypatch.setattr(app_config, "_config_instance", app_config.KetterConfig(config_path))
+        monkeypatch.setattr(multistream, "MULTISTREAM_MIN_BYTES", 0)
+        monkeypatch.setattr(multistream, "_tuner", StreamTuner())
+
+        source = os.path.join(local, "take.wav")
+        with open(source, "wb") as f:
+            f.write(os.urandom(4096))
+
+        assert multistream.configured_streams(os.path.join(nas, "x")) == 4
+        assert multistream.configured_streams(os.path.join(fast, "x")) == 8
+        assert plan_streams(source, os.path.join(nas, "take.wav"), 4096)[0] == 4
+        assert plan_streams(source, os.path.join(local, "copy.wav"), 4096)[0] == 1
+
+
+def test_tuner_climbs_to_fastest_count():
+    tuner = StreamTuner(max_streams=8)
+    assert tuner.choose("nas", 4) == 4
+
+    tuner.record("nas", 4, 100, 1.0)
+    assert tuner.choose("nas", 4) == 5
+    tuner.record("nas", 5, 150, 1.0)
+    assert tuner.choose("nas", 4) == 6
+    tuner.record("nas", 6, 120, 1.0)
+    assert tuner.choose("nas", 4) == 5  # 4 and 6 both measured slower
+
+    tuner.record("nas", 5, 50, 1.0)  # Link got busy: smoothed, not replaced
+    assert tuner.rates("nas")[5] == 100
+
+
+def test_engine_uses_multistream(small_pieces):
+    source_dir = tempfile.mkdtemp(prefix="ketter_multi_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_multi_dst_")
+    source = os.path.join(source_dir, "reel.mov")
+    content = os.urandom(5 * RANGE)
+    with open(source, "wb") as f:
+        f.write(content)
+
+    db = SessionLocal()
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "reel.mov"),
+        file_name="reel.mov",
+        file_size=len(content),
+        status=TransferStatus.PENDING
+    )
+    db.add(transfer)
+    db.commit()
+
+    with patch.object(copy_engine, "plan_streams", return_value=(3, "test")), \
+         patch.object(copy_engine, "multistream_copy", wraps=multistream_copy) as copy:
+        transfer = copy_engine.transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    assert copy.call_args.args[2] == 3
+    digest = hashlib.sha256(content).hexdigest()
+    values = {c.checksum_type: c.checksum_value
+              for c in db.query(Checksum).filter(Checksum.transfer_id == transfer.id)}
+    assert values == {ChecksumType.SOURCE: digest, ChecksumType.DESTINATION: digest, ChecksumType.FINAL: digest}
+    db.close()
@@ -0,0 +1,102 @@
+"""
+Ketter 3.0 - Preallocation and Sparse Copy Tests
+
+Tests verify destination layout in copy_file_with_progress:
+- Dense files are preallocated to their full size before copying
+- Out-of-space during preallocation fails immediately
+- Sparse sources keep their holes and their content
+- Unsupported filesystems fall back to a plain copy
+"""
+
+import errno
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from app.core import copy_engine, file_io
+from app.core.copy_engine import InsufficientSpaceError, copy_file_with_progress
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def workdir():
+    with tempfile.TemporaryDirectory(prefix="ketter_prealloc_") as path:
+        yield path
+
+
+def _sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_dense_copy_preallocates_full_size(workdir):
+    source = os.path.join(workdir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(os.urandom(3 * MB + 123))
+    dest = os.path.join(workdir, "out", "take.wav")
+
+    with patch.object(copy_engine, "preallocate", wraps=file_io.preallocate) as prealloc:
+        copied = copy_file_with_progress(source, dest)
+
+    prealloc.assert_called_once()
+    assert prealloc.call_args[0][1] == 3 * MB + 123
+    assert copied == os.path.getsize(dest) == 3 * MB + 123
+    assert _sha256(source) == _sha256(dest)
+
+
+def test_preallocation_enospc_fails_fast(workdir):
+    source = os.path.join(workdir, "big.mov")
+    with open(source, "wb") as f:
+        f.write(b"x" * MB)
+    dest = os.path.join(workdir, "big_copy.mov")
+
+    with patch.object(copy_engine, "preallocate", side_effect=OSError(errno.ENOSPC, "No space left")):
+        with pytest.raises(InsufficientSpaceError):
+            copy_file_with_progress(source, dest)
+
+    assert os.path.getsize(dest) == 0, "Nothing written before the space error"
+
+
+def test_sparse_source_keeps_holes(workdir):
+    source = os.path.join(workdir, "disk.img")
+    with open(source, "wb") as f:
+        f.truncate(64 * MB)
+        f.seek(10 * MB)
+        f.write(b"header" * 1000)
+        f.seek(50 * MB)
+        f.write(b"tail" * 1000)
+
+    if not file_io.is_sparse(source):
+        pytest.skip("Filesystem does not create sparse files")
+
+    dest = os.path.join(workdir, "disk_copy.img")
+    progress = []
+    copied = copy_file_with_progress(source, dest, progress_callback=lambda done, total: progress.append(done))
+
+    assert copied == os.path.getsize(dest) == 64 * MB
+    assert _sha256(source) == _sha256(dest)
+    assert os.stat(dest).st_blocks * 512 < 4 * MB, "Holes must not be written out as zeros"
+    assert progress[-1] == 64 * MB
+
+
+def test_unsupported_filesystem_falls_back(workdir, monkeypatch):
+    source = os.path.join(workdir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(b"a" * MB)
+
+    def unsupported(fd, mode, offset, length):
+        import ctypes
+        ctypes.set_errno(errno.EOPNOTSUPP)
+        return -1
+
+    monkeypatch.setattr(file_io, "_fallocate", unsupported)
+    with open(source, "rb") as f:
+        assert file_io.preallocate(f.fileno(), MB) is False
+
+    dest = os.path.join(workdir, "copy.wav")
+    assert copy_file_with_progress(source, dest) == MB
+    assert _sha256(source) == _sha256(dest)
@@ -0,0 +1,241 @@
+"""
+Ketter 3.0 - Crash Recovery Sweeper Tests
+
+Tests verify the reconciler:
+- Stuck transfers without a heartbeat lease are requeued (or failed by policy)
+- Transfers with a live lease or a recent update are left alone
+- COPIED_UNVERIFIED transfers whose verify job was lost are verified again
+- Orphaned temp ZIPs are reclaimed, leased ones are kept
+- Partial destinations are removed only while the source still exists
+- Every sweep promotes starved lane jobs, without waiting for a new submission
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Transfer, AuditLog, TransferStatus
+from app.services import recovery
+from app.services.job_lease import lease_key
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def dirs():
+    source = tempfile.mkdtemp(prefix="ketter_recovery_src_")
+    dest = tempfile.mkdtemp(prefix="ketter_recovery_dst_")
+    scratch = tempfile.mkdtemp(prefix="ketter_recovery_tmp_")
+    yield source, dest, scratch
+    for path in (source, dest, scratch):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _redis(leased_ids=(), job_statuses=None):
+    """Redis mock whose pipeline reports EXISTS for the given transfer leases
+    and the status of the given RQ jobs (job_id -> status)"""
+    redis_conn = MagicMock()
+    leased_keys = {lease_key(tid) for tid in leased_ids}
+    job_statuses = {f"rq:job:{job_id}": status for job_id, status in (job_statuses or {}).items()}
+
+    def pipeline(transaction=True):
+        pipe = MagicMock()
+        calls = []
+        pipe.exists.side_effect = lambda key: calls.append(lambda: int(key in leased_keys))
+        pipe.hget.side_effect = lambda key, field: calls.append(
+            lambda: job_statuses.get(key.decode() if isinstance(key, bytes) else key))
+        pipe.execute.side_effect = lambda: [result() for result in calls]
+        return pipe
+
+    redis_conn.pipeline.side_effect = pipeline
+    return redis_conn
+
+
+def _stuck_transfer(db, source, dest, status=TransferStatus.COPYING, age_seconds=3600, retry_count=0):
+    transfer = Transfer(
+        source_path=source,
+        destination_path=dest,
+        file_name=os.path.basename(source),
+        file_size=10,
+        status=status,
+        retry_count=retry_count,
+        operation_mode="copy"
+    )
+    db.add(transfer)
+    db.commit()
+    db.refresh(transfer)
+    # Backdate the last update (bypasses onupdate)
+    old = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    db.execute(
+        Transfer.__table__.update().where(Transfer.id == transfer.id).values(updated_at=old)
+    )
+    db.commit()
+    db.refresh(transfer)
+    return transfer
+
+
+def _file(path, content=b"x" * 10):
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_stuck_transfer_requeued_and_partial_removed(db, dirs):
+    source_dir, dest_dir, _ = dirs
+    source = _file(os.path.join(source_dir, "take.wav"))
+    partial = _file(os.path.join(dest_dir, "take.wav"), b"x" * 3)
+    transfer = _stuck_transfer(db, source, partial)
+
+    with patch.object(recovery, "_enqueue_recovered") as enqueue:
+        result = recovery.recover_stale_transfers(db, _redis(), policy="requeue")
+
+    assert transfer.id in result["requeued"]
+    enqueue.assert_called_once()
+    assert not os.path.exists(partial)
+
+    db.refresh(transfer)
+    assert transfer.status == TransferStatus.PENDING
+    assert transfer.retry_count == 1
+    assert db.query(AuditLog).filter(AuditLog.transfer_id == transfer.id).count() == 1
+
+
+def test_live_lease_and_recent_update_are_left_alone(db, dirs):
+    source_dir, dest_dir, _ = dirs
+    source = _file(os.path.join(source_dir, "live.wav"))
+    leased = _stuck_transfer(db, source, os.path.join(dest_dir, "a.wav"))
+    recent = _stuck_transfer(db, source, os.path.join(dest_dir, "b.wav"), age_seconds=5)
+
+    stale = recovery.find_stale_transfers(db, _redis(leased_ids=[leased.id]), grace_seconds=900)
+    stale_ids = {t.id for t in stale}
+
+    assert leased.id not in stale_ids
+    assert recent.id not in stale_ids
+
+
+def test_lost_verification_requeued(db, dirs):
+    from app.services.worker_jobs import verify_job_id
+
+    source_dir, dest_dir, _ = dirs
+    source = _file(os.path.join(source_dir, "take.wav"))
+    lost = _stuck_transfer(db, source, _file(os.path.join(dest_dir, "a.wav")),
+                           status=TransferStatus.COPIED_UNVERIFIED)
+    queued = _stuck_transfer(db, source, _file(os.path.join(dest_dir, "b.wav")),
+                             status=TransferStatus.COPIED_UNVERIFIED)
+    failed_job = _stuck_transfer(db, source, _file(os.path.join(dest_dir, "c.wav")),
+                                 status=TransferStatus.COPIED_UNVERIFIED)
+    redis_conn = _redis(job_statuses={verify_job_id(queued.id): b"queued",
+                                      verify_job_id(failed_job.id): b"failed"})
+
+    with patch("app.services.worker_jobs.enqueue_verification") as enqueue:
+        requeued = recovery.requeue_lost_verifications(db, redis_conn)
+
+    assert lost.id in requeued and failed_job.id in requeued
+    assert queued.id not in requeued
+    assert {call.args[1].id for call in enqueue.call_args_list} >= {lost.id, failed_job.id}
+    assert os.path.exists(os.path.join(dest_dir, "a.wav"))  # The copy is kept
+    db.refresh(lost)
+    assert lost.status == TransferStatus.COPIED_UNVERIFIED
+
+
+def test_policy_fail_and_retry_limit(db, dirs):
+    source_dir, dest_dir, _ = dirs
+    source = _file(os.path.join(source_dir, "take.wav"))
+    exhausted = _stuck_transfer(db, source, os.path.join(dest_dir, "a.wav"), retry_count=3)
+    by_policy = _stuck_transfer(db, source, os.path.join(dest_dir, "b.wav"))
+
+    with patch.object(recovery, "_enqueue_recovered"):
+        result = recovery.recover_stale_transfers(db, _redis(), max_retries=3, policy="requeue")
+    assert exhausted.id in result["failed"]
+
+    by_policy = _stuck_transfer(db, source, os.path.join(dest_dir, "c.wav"))
+    result = recovery.recover_stale_transfers(db, _redis(), policy="fail")
+    assert by_policy.id in result["failed"]
+    db.refresh(by_policy)
+    assert by_policy.status == TransferStatus.FAILED
+
+
+def test_missing_source_fails_and_keeps_destination(db, dirs):
+    source_dir, dest_dir, _ = dirs
+    dest = _file(os.path.join(dest_dir, "moved.wav"))
+    transfer = _stuck_transfer(db, os.path.join(source_dir, "gone.wav"), dest, status=TransferStatus.VERIFYING)
+
+    result = recovery.recover_stale_transfers(db, _redis(), policy="requeue")
+
+    assert transfer.id in result["failed"]
+    assert os.path.exists(dest), "Destination may be the only copy left"
+
+
+def test_orphaned_temp_zips_reclaimed(db, dirs):
+    source_dir, dest_dir, scratch = dirs
+    source = _file(os.path.join(source_dir, "take.wav"))
+    running = _stuck_transfer(db, source, os.path.join(dest_dir, "a.wav"), age_seconds=0)
+
+    orphan = _file(os.path.join(scratch, "ketter_temp_999999_session.zip"), b"z" * 100)
+    live = _file(os.path.join(scratch, f"ketter_temp_{running.id}_session.zip"))
+    fresh = _file(os.path.join(scratch, "ketter_temp_999998_session.zip"))
+    unrelated = _file(os.path.join(scratch, "other.zip"))
+
+    old = time.time() - 3600
+    for path in (orphan, live, unrelated):
+        os.utime(path, (old, old))
+
+    reclaimed = recovery.reclaim_temp_zips(
+        db, _redis(leased_ids=[running.id]), temp_dir=scratch, grace_seconds=900
+    )
+
+    assert reclaimed == {"files": 1, "bytes": 100}
+    assert not os.path.exists(orphan)
+    assert os.path.exists(live)
+    assert os.path.exists(fresh)
+    assert os.path.exists(unrelated)
+
+
+def test_folder_scratch_path_is_destination_zip(dirs):
+    source_dir, dest_dir, _ = dirs
+    folder = os.path.join(source_dir, "Session")
+    os.makedirs(folder)
+    transfer = Transfer(
+        source_path=folder,
+        original_folder_path=folder,
+        destination_path=os.path.join(dest_dir, "Session"),
+        is_folder_transfer=1,
+        unzip_completed=0
+    )
+    assert recovery.destination_scratch_path(transfer) == os.path.join(dest_dir, "Session.zip")
+
+    transfer.unzip_completed = 1
+    assert recovery.destination_scratch_path(transfer) is None
+
+
+def test_sweep_promotes_starved_jobs(db, dirs):
+    idle = [
+        patch.object(recovery, "recover_stale_transfers", return_value={"requeued": 0, "failed": 0}),
+        patch.object(recovery, "requeue_lost_verifications", return_value=0),
+        patch("app.services.transfer_dedupe.release_stale_dedupe_keys", return_value=[]),
+        patch.object(recovery, "reclaim_temp_zips", return_value={"files": 0, "bytes": 0}),
+    ]
+    for p in idle:
+        p.start()
+    try:
+        with patch("app.services.scheduling.promote_starved_jobs", return_value=2) as promote:
+            result = recovery.run_recovery_sweep(db, _redis())
+        promote.assert_called_once()
+        assert result["promoted"] == 2
+
+        # A failing starvation check does not abort the sweep
+        with patch("app.services.scheduling.promote_starved_jobs", side_effect=RuntimeError("down")):
+            assert recovery.run_recovery_sweep(db, _redis())["promoted"] == 0
+    finally:
+        for p in idle:
+            p.stop()
@@ -0,0 +1,98 @@
+"""
+Ketter 3.0 - Scheduling Lane Tests
+
+Tests verify priority lanes and size-aware routing:
+- Priority classes map to separate queues
+- Small transfers bypass large ones only when the policy is enabled
+- Starved jobs are promoted one lane up
+- Lane stats report depth and wait time
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.schemas import TransferCreate
+from app.services import scheduling
+from app.services.scheduling import LANE_ORDER, select_lane, promote_starved_jobs
+
+
+def _job(job_id, waited_seconds):
+    job = MagicMock()
+    job.id = job_id
+    job.meta = {}
+    job.enqueued_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=waited_seconds)
+    return job
+
+
+def test_priorities_map_to_lanes():
+    assert select_lane("high", 10) == "high"
+    assert select_lane("normal", 10) == "default"
+    assert select_lane("low", 10) == "low"
+
+
+def test_size_aware_policy_routes_small_transfers(monkeypatch):
+    monkeypatch.setattr(scheduling, "SIZE_AWARE_SCHEDULING", True)
+    monkeypatch.setattr(scheduling, "SMALL_TRANSFER_BYTES", 1024)
+
+    assert select_lane("normal", 2048) == "default"
+    assert select_lane("normal", 1024) == "small"
+    # Folders are sized later by the ZIP engine: never treated as small
+    assert select_lane("normal", 0) == "default"
+    # Explicit priorities win over size
+    assert select_lane("low", 10) == "low"
+    assert select_lane("high", 10) == "high"
+
+
+def test_size_aware_policy_is_opt_in(monkeypatch):
+    monkeypatch.setattr(scheduling, "SIZE_AWARE_SCHEDULING", False)
+    assert select_lane("normal", 10) == "default"
+
+
+def test_transfer_create_rejects_unknown_priority():
+    with pytest.raises(ValueError):
+        TransferCreate(source_path="/tmp/a.wav", destination_path="/tmp/b.wav", priority="urgent")
+
+    assert TransferCreate(source_path="/tmp/a.wav", destination_path="/tmp/b.wav").priority == "normal"
+
+
+def test_starved_jobs_promoted_one_lane_up():
+    queues = {lane: MagicMock(name=lane) for lane in LANE_ORDER}
+    for lane, queue in queues.items():
+        queue.get_job_ids.return_value = []
+
+    starved = _job("starved", waited_seconds=1000)
+    fresh = _job("fresh", waited_seconds=5)
+    queues["low"].get_job_ids.return_value = ["starved", "fresh"]
+    jobs = {"starved": starved, "fresh": fresh}
+
+    with patch.object(scheduling, "get_lane_queue", side_effect=lambda lane, conn: queues[lane]), \
+         patch.object(scheduling.Job, "fetch", side_effect=lambda job_id, connection: jobs[job_id]):
+        promoted = promote_starved_jobs(MagicMock(), max_wait_seconds=900)
+
+    assert promoted == 1
+    queues["low"].remove.assert_called_once_with(starved)
+    queues["default"].enqueue_job.assert_called_once_with(starved)
+    assert starved.meta["promoted_from"] == ["low"]
+
+
+def test_lane_stats_report_depth_and_wait():
+    queues = {lane: MagicMock(name=lane, count=0) for lane in LANE_ORDER}
+    for queue in queues.values():
+        queue.get_job_ids.return_value = []
+    queues["default"].count = 3
+    queues["default"].get_job_ids.return_value = ["head"]
+
+    connection = MagicMock()
+    connection.lrange.side_effect = lambda key, start, end: [b"2.0", b"4.0"] if "default" in key else []
+
+    with patch.object(scheduling, "get_lane_queue", side_effect=lambda lane, conn: queues[lane]), \
+         patch.object(scheduling.Job, "fetch", return_value=_job("head", waited_seconds=60)):
+        stats = {s["lane"]: s for s in scheduling.get_lane_stats(connection)}
+
+    assert [s for s in stats] == LANE_ORDER
+    assert stats["default"]["depth"] == 3
+    assert stats["default"]["oldest_wait_seconds"] >= 60
+    assert stats["default"]["avg_wait_seconds"] == 3.0
+    assert stats["high"]["depth"] == 0
@@ -0,0 +1,141 @@
+"""
+Ketter 3.0 - Integrity Scrubber Tests
+
+Tests verify the background scrubber:
+- Never-scrubbed transfers come first, oldest delivery first
+- Recently scrubbed transfers are not due again
+- Intact, corrupted and missing destinations produce the right audit events
+- The quiet-hours window (including midnight wrap) and MB/s budget are enforced
+"""
+
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import AuditLog, AuditEventType, Checksum, ChecksumType, Transfer, TransferStatus
+from app.services import scrubber
+from app.services.scrubber import ScrubPacer, parse_window, seconds_until_window
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    # Scrub selection is global: start each test from a clean COMPLETED set
+    db.query(Transfer).filter(Transfer.status == TransferStatus.COMPLETED).update(
+        {Transfer.last_scrubbed_at: datetime.now(timezone.utc)}, synchronize_session=False
+    )
+    db.commit()
+    yield db
+    db.close()
+
+
+def _delivered(db, completed_days_ago, content=b"delivered media"):
+    dest_dir = tempfile.mkdtemp(prefix="ketter_scrub_")
+    dest = os.path.join(dest_dir, "take.wav")
+    with open(dest, "wb") as f:
+        f.write(content)
+
+    transfer = Transfer(
+        source_path="/gone/take.wav",
+        destination_path=dest,
+        file_name="take.wav",
+        file_size=len(content),
+        status=TransferStatus.COMPLETED,
+        completed_at=datetime.now(timezone.utc) - timedelta(days=completed_days_ago)
+    )
+    db.add(transfer)
+    db.commit()
+    db.add(Checksum(
+        transfer_id=transfer.id,
+        checksum_type=ChecksumType.FINAL,
+        checksum_value=hashlib.sha256(content).hexdigest()
+    ))
+    db.commit()
+    return transfer
+
+
+def _last_event(db, transfer_id):
+    return (
+        db.query(AuditLog)
+        .filter(AuditLog.transfer_id == transfer_id)
+        .order_by(AuditLog.id.desc())
+        .first()
+    )
+
+
+def test_oldest_unverified_first(db):
+    recent = _delivered(db, completed_days_ago=1)
+    old = _delivered(db, completed_days_ago=90)
+    scrubbed_long_ago = _delivered(db, completed_days_ago=200)
+    scrubbed_long_ago.last_scrubbed_at = datetime.now(timezone.utc) - timedelta(days=60)
+    db.commit()
+
+    due = [t.id for t in scrubber.find_due_transfers(db, limit=10, interval_days=30)]
+    assert due == [old.id, recent.id, scrubbed_long_ago.id]
+
+
+def test_scrub_records_results_and_progress(db):
+    intact = _delivered(db, completed_days_ago=3)
+    rotten = _delivered(db, completed_days_ago=2)
+    missing = _delivered(db, completed_days_ago=1)
+
+    with open(rotten.destination_path, "r+b") as f:
+        f.write(b"X")
+    os.remove(missing.destination_path)
+
+    counts = scrubber.run_scrub_pass(db, limit=10)
+    assert counts == {"scrubbed": 3, "passed": 1, "mismatch": 1, "missing": 1}
+
+    assert _last_event(db, intact.id).event_type == AuditEventType.SCRUB_PASSED
+    failed = _last_event(db, rotten.id)
+    assert failed.event_type == AuditEventType.SCRUB_FAILED
+    assert failed.event_metadata["result"] == "mismatch"
+    assert _last_event(db, missing.id).event_metadata["result"] == "missing"
+
+    # Progress is persisted: nothing is due again after a restart
+    assert scrubber.find_due_transfers(db, limit=10) == []
+
+
+def test_window_wraps_midnight():
+    window = parse_window("22:00-06:00")
+    assert seconds_until_window(window, datetime(2025, 1, 1, 23, 30)) == 0
+    assert seconds_until_window(window, datetime(2025, 1, 1, 5, 59)) == 0
+    assert seconds_until_window(window, datetime(2025, 1, 1, 21, 0)) == 3600
+    assert seconds_until_window(None, datetime(2025, 1, 1, 12, 0)) == 0
+
+    with pytest.raises(ValueError):
+        parse_window("late")
+
+
+def test_pacer_enforces_budget_and_pauses_outside_window():
+    clock = [0.0]
+    sleeps = []
+    current = [datetime(2025, 1, 1, 23, 0)]
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+        current[0] += timedelta(seconds=seconds)
+
+    pacer = ScrubPacer(
+        max_bytes_per_second=1024 * 1024,
+        window=parse_window("22:00-06:00"),
+        clock=lambda: clock[0],
+        sleep=sleep,
+        now=lambda: current[0]
+    )
+
+    pacer.start_file()
+    pacer(2 * 1024 * 1024, 4 * 1024 * 1024)
+    assert sleeps == [2.0]
+
+    # Window closes mid-file: wait for it to reopen, then no catch-up burst debt
+    current[0] = datetime(2025, 1, 2, 7, 0)
+    sleeps.clear()
+    pacer(4 * 1024 * 1024, 4 * 1024 * 1024)
+    assert sum(sleeps) == 15 * 3600
+    assert current[0].hour == 22
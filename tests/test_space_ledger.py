@@ -0,0 +1,147 @@
+"""
+Ketter 3.0 - Disk Space Ledger Tests
+
+Tests verify shared space reservations:
+- Concurrent transfers cannot over-commit one filesystem
+- Released and expired reservations free their bytes
+- Bytes a running transfer has on disk leave its reservation
+- statvfs is cached between preflights
+- The copy engine fails fast with InsufficientSpaceError
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.copy_engine import InsufficientSpaceError, copy_file_with_progress, reserve_disk_space
+from app.services import space_ledger
+from app.services.space_ledger import LocalSpaceLedger, RedisSpaceLedger, reserve_space
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def ledger():
+    LocalSpaceLedger._reservations.clear()
+    return LocalSpaceLedger()
+
+
+@pytest.fixture
+def disk():
+    """500 GB free on a 1000 GB filesystem (no min-free margin in these tests)"""
+    with patch.object(space_ledger, "get_disk_usage", return_value=(500 * GB, 1000 * GB)), \
+         patch.object(space_ledger, "filesystem_id", return_value="dev:test:1"):
+        yield
+
+
+def test_concurrent_reservations_do_not_overcommit(ledger, disk):
+    def reserve(transfer_id):
+        return reserve_space("/dest", transfer_id, 100 * GB, min_free_percent=0, ledger=ledger)
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        reservations = list(pool.map(reserve, range(10)))
+
+    granted = [r for r in reservations if r.granted]
+    assert len(granted) == 5
+    assert ledger.reserved("dev:test:1") == 500 * GB
+
+
+def test_release_frees_bytes(ledger, disk):
+    first = reserve_space("/dest", 1, 400 * GB, min_free_percent=0, ledger=ledger)
+    assert first.granted
+    assert not reserve_space("/dest", 2, 200 * GB, min_free_percent=0, ledger=ledger).granted
+
+    first.release()
+    assert reserve_space("/dest", 2, 200 * GB, min_free_percent=0, ledger=ledger).granted
+
+
+def test_bytes_on_disk_are_not_counted_twice(ledger):
+    with patch.object(space_ledger, "filesystem_id", return_value="dev:test:1"), \
+         patch.object(space_ledger, "get_disk_usage", return_value=(500 * GB, 1000 * GB)):
+        running = reserve_space("/dest", 1, 300 * GB, min_free_percent=0, ledger=ledger)
+    assert running.granted
+
+    # The running transfer preallocated its file: statvfs shows 200 GB free
+    running.written(300 * GB)
+    assert ledger.reserved("dev:test:1") == 0
+    with patch.object(space_ledger, "filesystem_id", return_value="dev:test:1"), \
+         patch.object(space_ledger, "get_disk_usage", return_value=(200 * GB, 1000 * GB)):
+        assert reserve_space("/dest", 2, 100 * GB, min_free_percent=0, ledger=ledger).granted
+        assert not reserve_space("/dest", 3, 101 * GB, min_free_percent=0, ledger=ledger).granted
+
+
+def test_reservation_shrinks_in_steps(ledger, disk):
+    reservation = reserve_space("/dest", 1, 100 * GB, min_free_percent=0, ledger=ledger)
+    reservation.written(GB // 2)  # Below the 1% step: not published yet
+    assert ledger.reserved("dev:test:1") == 100 * GB
+    reservation.written(40 * GB)
+    reservation.written(10 * GB)  # Never grows back
+    assert ledger.reserved("dev:test:1") == 60 * GB
+
+    reservation.release()
+    reservation.written(100 * GB)
+    assert ledger.reserved("dev:test:1") == 0
+
+
+def test_copy_reports_preallocation():
+    source_dir = tempfile.mkdtemp(prefix="ketter_ledger_src_")
+    source = os.path.join(source_dir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(os.urandom(3 * 1024 * 1024))
+    allocations, progress = [], []
+
+    with patch("app.core.copy_engine.preallocate", return_value=True):
+        copy_file_with_progress(source, os.path.join(source_dir, "copy.wav"), durability="none",
+                                progress_callback=lambda done, total: progress.append(done),
+                                allocation_callback=allocations.append)
+
+    assert allocations == [3 * 1024 * 1024]
+    assert progress[-1] == 3 * 1024 * 1024
+
+
+def test_reservations_expire(ledger, disk):
+    assert reserve_space("/dest", 1, 400 * GB, min_free_percent=0, ttl_seconds=0.05, ledger=ledger).granted
+    time.sleep(0.1)
+    assert reserve_space("/dest", 2, 400 * GB, min_free_percent=0, ledger=ledger).granted
+
+
+def test_min_free_percent_applies_to_total(ledger, disk):
+    # 500 free - 10% of 1000 = 400 usable
+    assert not reserve_space("/dest", 1, 401 * GB, ledger=ledger).granted
+    assert reserve_space("/dest", 1, 400 * GB, ledger=ledger).granted
+
+
+def test_statvfs_is_cached(monkeypatch):
+    space_ledger._statvfs_cache.clear()
+    directory = tempfile.gettempdir()
+    with patch.object(space_ledger.os, "statvfs", wraps=os.statvfs) as statvfs:
+        space_ledger.get_disk_usage(directory, "dev:cache")
+        space_ledger.get_disk_usage(directory, "dev:cache")
+    assert statvfs.call_count == 1
+
+
+def test_redis_ledger_sends_available_bytes():
+    redis_conn = MagicMock()
+    script = MagicMock(return_value=[0, 450 * GB])
+    redis_conn.register_script.return_value = script
+
+    granted, reserved = RedisSpaceLedger(redis_conn).reserve("dev:h:1", "7", 100 * GB, 500 * GB, 3600)
+
+    assert (granted, reserved) == (False, 450 * GB)
+    script.assert_called_once_with(
+        keys=["ketter:space:dev:h:1:reserved", "ketter:space:dev:h:1:expiry"],
+        args=["7", 100 * GB, 500 * GB, 3600]
+    )
+
+
+def test_engine_preflight_raises_when_ledger_full(ledger, disk):
+    dest = os.path.join(tempfile.mkdtemp(prefix="ketter_ledger_"), "take.wav")
+    with patch.object(space_ledger, "get_space_ledger", return_value=ledger):
+        held = reserve_disk_space(dest, 1, 300 * GB, min_free_percent=0)
+        with pytest.raises(InsufficientSpaceError, match="Reserved by running transfers"):
+            reserve_disk_space(dest, 2, 300 * GB, min_free_percent=0)
+        held.release()
@@ -0,0 +1,211 @@
+"""
+Ketter 3.0 - Transfer Agent Tests
+
+Tests run two agents on localhost and verify:
+- Pipelined streaming with end-to-end SHA-256 and a storage re-read checksum
+- A dropped connection resumes from the partial file on the next attempt
+- Corrupt chunks are refused as retryable, bad tokens are not
+- The agent fails closed: no token, no start; HELLOs are authenticated with
+  an HMAC over a per-connection nonce; only served volumes are written
+- The copy engine streams to the agent owning the destination volume
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+from app.config import get_config
+from app.core import copy_engine
+from app.database import SessionLocal
+from app.models import Checksum, ChecksumType, Transfer, TransferStatus
+from app.services import transfer_agent
+from app.services.transfer_agent import AgentError, TransferAgent, _Receive, hello_mac, send_file_sync
+
+CHUNK = 64 * 1024
+SERVED = [get_config().get_volume_for_path(tempfile.gettempdir()).path]
+
+
+@pytest.fixture
+def agents():
+    """Two agents sharing one event loop thread: [(port, agent), ...]"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    started = []
+    for token in ("alpha", "secret"):
+        agent = TransferAgent("127.0.0.1", 0, token=token, window=4, volumes=SERVED)
+        port = asyncio.run_coroutine_threadsafe(agent.start(), loop).result(timeout=5)
+        started.append((port, agent))
+    yield started
+
+    for _, agent in started:
+        asyncio.run_coroutine_threadsafe(agent.close(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def _source(size):
+    path = os.path.join(tempfile.mkdtemp(prefix="ketter_agent_src_"), "reel.mov")
+    data = os.urandom(size)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path, data, hashlib.sha256(data).hexdigest()
+
+
+def _dest(name="reel.mov"):
+    return os.path.join(tempfile.mkdtemp(prefix="ketter_agent_dst_"), name)
+
+
+def test_stream_to_two_agents(agents):
+    source, data, digest = _source(10 * CHUNK + 77)
+    (alpha_port, _), (secret_port, _) = agents
+
+    first, second = _dest(), _dest()
+    result = send_file_sync("127.0.0.1", alpha_port, source, first, digest, chunk_size=CHUNK, token="alpha")
+    send_file_sync("127.0.0.1", secret_port, source, second, digest, chunk_size=CHUNK, token="secret")
+
+    assert result["sha256"] == result["checksum"] == digest
+    assert result["resumed_from"] == 0 and result["bytes_sent"] == len(data)
+    assert "read_mbps" in result["read"]
+    for path in (first, second):
+        with open(path, "rb") as f:
+            assert f.read() == data
+        assert not os.path.exists(path + transfer_agent.PARTIAL_SUFFIX)
+
+
+def test_dropped_connection_resumes(agents):
+    source, data, digest = _source(12 * CHUNK)
+    port = agents[0][0]
+    dest = _dest()
+    acks = []
+
+    def drop_once(done, total):
+        acks.append(done)
+        if len(acks) == 5:
+            raise ConnectionResetError("link flap")
+
+    result = send_file_sync("127.0.0.1", port, source, dest, digest, token="alpha",
+                            chunk_size=CHUNK, progress_callback=drop_once)
+
+    assert result["resumed_from"] >= 5 * CHUNK
+    assert result["resumed_from"] % CHUNK == 0
+    assert result["bytes_sent"] == len(data) - result["resumed_from"]
+    with open(dest, "rb") as f:
+        assert f.read() == data
+
+
+def test_corrupt_chunk_is_retryable():
+    dest = _dest()
+    data = os.urandom(CHUNK)
+    receive = _Receive({"path": dest, "size": CHUNK, "sha256": hashlib.sha256(data).hexdigest(),
+                        "chunk_size": CHUNK}, SERVED)
+    receive.open()
+    try:
+        with pytest.raises(AgentError) as error:
+            receive.write(0, zlib.crc32(data) ^ 1, data)
+        assert error.value.retryable
+        assert receive.position == 0
+    finally:
+        receive.discard()
+
+
+def test_bad_token_refused(agents):
+    source, _, digest = _source(CHUNK)
+    with pytest.raises(AgentError) as error:
+        send_file_sync("127.0.0.1", agents[1][0], source, _dest(), digest, token="wrong")
+    assert not error.value.retryable
+    assert "KETTER_AGENT_TOKEN" in str(error.value)
+
+
+def test_agent_fails_closed_without_token(monkeypatch):
+    with pytest.raises(AgentError):
+        TransferAgent("127.0.0.1", 0, token="", volumes=SERVED)
+
+    monkeypatch.setattr(transfer_agent, "AGENT_TOKEN", "")
+    assert transfer_agent.main([]) != 0
+
+
+def test_hello_mac_binds_nonce_and_fields():
+    hello = {"path": "/tmp/a.mov", "size": 10, "sha256": "ab", "algorithm": "sha256", "chunk_size": CHUNK}
+    mac = hello_mac("secret", "nonce-1", hello)
+    assert hello_mac("secret", "nonce-1", dict(hello, mac=mac)) == mac
+    assert hello_mac("secret", "nonce-2", hello) != mac
+    assert hello_mac("secret", "nonce-1", dict(hello, path="/tmp/b.mov")) != mac
+    assert hello_mac("other", "nonce-1", hello) != mac
+
+
+def test_plaintext_token_hello_is_refused(agents):
+    """Old-style HELLO carrying the token itself: no valid MAC, no write"""
+    dest = _dest()
+
+    async def hello_with_token(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await transfer_agent._recv(reader)  # CHALLENGE
+        await transfer_agent._send_json(writer, transfer_agent.HELLO, {
+            "path": dest, "size": 1, "sha256": "00", "chunk_size": CHUNK, "token": "secret"
+        })
+        kind, payload = await transfer_agent._recv(reader)
+        writer.close()
+        return kind, json.loads(payload)
+
+    kind, body = asyncio.run(hello_with_token(agents[1][0]))
+    assert kind == transfer_agent.ERROR
+    assert "Authentication failed" in body["message"]
+    assert not os.path.exists(dest + transfer_agent.PARTIAL_SUFFIX)
+
+
+def test_destination_outside_served_volumes_refused():
+    data = os.urandom(16)
+    hello = {"path": _dest(), "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+    with pytest.raises(AgentError, match="not on a volume served by this agent"):
+        _Receive(hello, ["/Volumes/Nexis"])
+
+
+def test_served_volumes_come_from_config(monkeypatch):
+    config = get_config()
+    nexis = next(v for v in config.volumes if v.path == "/Volumes/Nexis")
+    monkeypatch.setattr(nexis, "agent", "ingest-01:9470")
+
+    assert transfer_agent.served_volume_paths("ingest-01", 9470) == ["/Volumes/Nexis"]
+    assert transfer_agent.served_volume_paths("ingest-01", 9471) == []
+    assert transfer_agent.served_volume_paths("other-node", 9470) == []
+
+
+def test_engine_streams_to_agent(agents):
+    source, data, digest = _source(3 * CHUNK + 5)
+    dest = _dest()
+    port = agents[0][0]
+
+    db = SessionLocal()
+    transfer = Transfer(
+        source_path=source,
+        destination_path=dest,
+        file_name="reel.mov",
+        file_size=len(data),
+        status=TransferStatus.PENDING
+    )
+    db.add(transfer)
+    db.commit()
+
+    with patch.object(copy_engine, "agent_for_path", return_value=("127.0.0.1", port)), \
+         patch.object(transfer_agent, "AGENT_TOKEN", "alpha"), \
+         patch.object(copy_engine, "copy_file_with_progress") as local_copy:
+        transfer = copy_engine.transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    local_copy.assert_not_called()
+    with open(dest, "rb") as f:
+        assert f.read() == data
+    values = {c.checksum_type: c.checksum_value
+              for c in db.query(Checksum).filter(Checksum.transfer_id == transfer.id)}
+    assert values == {ChecksumType.SOURCE: digest, ChecksumType.DESTINATION: digest, ChecksumType.FINAL: digest}
+    db.close()
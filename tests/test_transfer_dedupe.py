@@ -0,0 +1,227 @@
+"""
+Ketter 3.0 - Transfer Deduplication Tests
+
+Tests verify that identical requests never reach a worker twice:
+- A duplicate attaches to the queued transfer (one job, one row)
+- on_duplicate=reject answers 409 with a pointer to the existing transfer
+- A terminal status frees the key, so the copy can be requested again
+- A changed source (new mtime) is new work
+- The unique index rejects a second row with the same key
+- A holder no job or worker will run gives its key up (API and sweeper)
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models import AuditLog, Transfer, TransferStatus
+from app.routers import transfers as transfers_router
+from app.services.job_lease import lease_key
+from app.services.transfer_dedupe import release_stale_dedupe_keys, transfer_dedupe_key
+
+
+@pytest.fixture
+def queue():
+    queue = MagicMock()
+    queue.enqueue.return_value = MagicMock(id="job-dedupe")
+    with patch.object(transfers_router, "get_lane_queue", return_value=queue), \
+         patch.object(transfers_router, "transfer_job_timeout", return_value=600), \
+         patch.object(transfers_router, "promote_starved_jobs"):
+        yield queue
+
+
+def _redis(job_statuses=None, leased_ids=()):
+    """Redis mock: RQ job statuses (job_id -> status) and heartbeat leases"""
+    job_statuses = {f"rq:job:{job_id}": status for job_id, status in (job_statuses or {}).items()}
+    leased_keys = {lease_key(tid) for tid in leased_ids}
+    redis_conn = MagicMock()
+
+    def pipeline(transaction=True):
+        pipe = MagicMock()
+        calls = []
+        pipe.exists.side_effect = lambda key: calls.append(int(key in leased_keys))
+        pipe.hget.side_effect = lambda key, field: calls.append(
+            job_statuses.get(key.decode() if isinstance(key, bytes) else key))
+        pipe.execute.side_effect = lambda: list(calls)
+        return pipe
+
+    redis_conn.pipeline.side_effect = pipeline
+    return redis_conn
+
+
+def _backdate(transfer_id, seconds=3600):
+    db = SessionLocal()
+    old = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    db.execute(Transfer.__table__.update().where(Transfer.id == transfer_id).values(updated_at=old))
+    db.commit()
+    db.close()
+
+
+def _request(**fields):
+    source_dir = tempfile.mkdtemp(prefix="ketter_dedupe_src_")
+    source = os.path.join(source_dir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(os.urandom(4096))
+    dest = os.path.join(tempfile.mkdtemp(prefix="ketter_dedupe_dst_"), "take.wav")
+    return dict({"source_path": source, "destination_path": dest}, **fields)
+
+
+def test_duplicate_attaches_to_queued_transfer(client, queue):
+    request = _request()
+
+    status, first = client.post("/transfers", json=request)
+    assert status == 201
+    status, second = client.post("/transfers", json=request)
+    assert status == 200
+    assert second["id"] == first["id"]
+    assert queue.enqueue.call_count == 1
+
+    db = SessionLocal()
+    attached = db.query(AuditLog).filter(
+        AuditLog.transfer_id == first["id"],
+        AuditLog.message.like("Duplicate request attached%")
+    ).one()
+    assert attached.event_metadata["deduplicated"] is True
+    db.close()
+
+
+def test_duplicate_rejected_with_pointer(client, queue):
+    request = _request(on_duplicate="reject")
+
+    status, first = client.post("/transfers", json=request)
+    assert status == 201
+    status, body = client.post("/transfers", json=request)
+
+    assert status == 409
+    assert body["detail"]["transfer_id"] == first["id"]
+    assert body["detail"]["url"] == f"/transfers/{first['id']}"
+    assert queue.enqueue.call_count == 1
+
+
+def test_terminal_status_frees_key(client, queue):
+    request = _request()
+    status, first = client.post("/transfers", json=request)
+    assert status == 201
+
+    db = SessionLocal()
+    transfer = db.query(Transfer).filter(Transfer.id == first["id"]).one()
+    assert transfer.dedupe_key is not None
+    transfer.status = TransferStatus.COMPLETED
+    db.commit()
+    assert transfer.dedupe_key is None
+    db.close()
+
+    status, second = client.post("/transfers", json=request)
+    assert status == 201
+    assert second["id"] != first["id"]
+
+
+def test_changed_source_is_new_work(client, queue):
+    request = _request()
+    status, first = client.post("/transfers", json=request)
+    assert status == 201
+
+    stat = os.stat(request["source_path"])
+    os.utime(request["source_path"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    status, second = client.post("/transfers", json=request)
+    assert status == 201
+    assert second["id"] != first["id"]
+    assert queue.enqueue.call_count == 2
+
+
+def test_unique_index_arbitrates_races():
+    request = _request()
+    key = transfer_dedupe_key(request["source_path"], request["destination_path"])
+    # Same request spelled differently normalizes to the same key
+    assert key == transfer_dedupe_key(request["source_path"].replace("/take.wav", "/./take.wav"),
+                                      request["destination_path"])
+
+    def row():
+        return Transfer(source_path=request["source_path"], destination_path=request["destination_path"],
+                        file_size=4096, file_name="take.wav", status=TransferStatus.PENDING, dedupe_key=key)
+
+    db = SessionLocal()
+    db.add(row())
+    db.commit()
+    db.add(row())
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    db.close()
+
+
+def test_dead_holder_releases_key(client, queue):
+    request = _request()
+    status, first = client.post("/transfers", json=request)
+    assert status == 201
+    _backdate(first["id"])
+
+    # The job was lost (failed in RQ); nothing holds a lease
+    with patch.object(transfers_router, "redis_conn", _redis({"job-dedupe": b"failed"})):
+        status, second = client.post("/transfers", json=request)
+
+    assert status == 201
+    assert second["id"] != first["id"]
+    assert queue.enqueue.call_count == 2
+
+    db = SessionLocal()
+    stale = db.query(Transfer).filter(Transfer.id == first["id"]).one()
+    assert stale.dedupe_key is None
+    assert db.query(AuditLog).filter(
+        AuditLog.transfer_id == stale.id,
+        AuditLog.message.like("Dedupe key released%")
+    ).count() == 1
+    db.close()
+
+
+def test_live_holder_keeps_attaching(client, queue):
+    request = _request()
+    status, first = client.post("/transfers", json=request)
+    _backdate(first["id"])
+
+    with patch.object(transfers_router, "redis_conn", _redis({"job-dedupe": b"scheduled"})):
+        status, second = client.post("/transfers", json=request)
+
+    assert status == 200
+    assert second["id"] == first["id"]
+    assert queue.enqueue.call_count == 1
+
+
+def test_redis_outage_keeps_attaching(client, queue):
+    request = _request()
+    status, first = client.post("/transfers", json=request)
+    _backdate(first["id"])
+    broken = MagicMock()
+    broken.pipeline.side_effect = RedisConnectionError("down")
+
+    with patch.object(transfers_router, "redis_conn", broken):
+        status, second = client.post("/transfers", json=request)
+
+    assert status == 200
+    assert second["id"] == first["id"]
+
+
+def test_sweeper_releases_keys_of_dead_holders(client, queue):
+    status, dead = client.post("/transfers", json=_request())
+    status, leased = client.post("/transfers", json=_request())
+    status, fresh = client.post("/transfers", json=_request())
+    _backdate(dead["id"])
+    _backdate(leased["id"])
+
+    db = SessionLocal()
+    released = release_stale_dedupe_keys(db, _redis(leased_ids=[leased["id"]]), stale_seconds=60)
+    assert dead["id"] in released
+    assert leased["id"] not in released and fresh["id"] not in released
+
+    keys = {t.id: t.dedupe_key for t in db.query(Transfer).all()}
+    assert keys[dead["id"]] is None
+    assert keys[leased["id"]] is not None
+    assert keys[fresh["id"]] is not None  # Younger than the grace window
+    db.close()
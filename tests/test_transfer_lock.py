@@ -0,0 +1,165 @@
+"""
+Ketter 3.0 - Fenced Transfer Lock Tests
+
+Tests verify the MOVE lease lock:
+- Only one holder per transfer; other transfers are independent
+- Fencing tokens strictly increase per transfer
+- A stale holder (expired or superseded lease) fails the fence check
+- Redis outages fail closed
+- MOVE transfers keep the source when the fence check fails
+"""
+
+import os
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.database import SessionLocal, acquire_transfer_lock, release_transfer_lock
+from app.models import Transfer, TransferStatus
+from app.services import transfer_lock
+from app.services.transfer_lock import (
+    LocalLockBackend,
+    RedisLockBackend,
+    acquire_transfer_lease,
+    record_fence_token,
+    verify_transfer_fence,
+)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def backend():
+    LocalLockBackend._leases.clear()
+    LocalLockBackend._fences.clear()
+    return LocalLockBackend()
+
+
+def _transfer(db, operation_mode="move"):
+    transfer = Transfer(
+        source_path="/tmp/lock_source.wav",
+        destination_path="/tmp/lock_dest.wav",
+        file_name="lock_source.wav",
+        file_size=1,
+        status=TransferStatus.PENDING,
+        operation_mode=operation_mode
+    )
+    db.add(transfer)
+    db.commit()
+    db.refresh(transfer)
+    return transfer
+
+
+def test_single_holder_per_transfer(backend):
+    first = acquire_transfer_lease(1, timeout_seconds=0, backend=backend)
+    assert first is not None
+    assert acquire_transfer_lease(1, timeout_seconds=0, backend=backend) is None
+
+    # Different transfers never block each other
+    assert acquire_transfer_lease(2, timeout_seconds=0, backend=backend) is not None
+
+    first.release()
+    second = acquire_transfer_lease(1, timeout_seconds=0, backend=backend)
+    assert second is not None
+    assert second.token > first.token
+
+
+def test_expired_lease_is_taken_over(backend):
+    stale = acquire_transfer_lease(3, timeout_seconds=0, ttl_seconds=0.05, backend=backend)
+    time.sleep(0.1)
+    fresh = acquire_transfer_lease(3, timeout_seconds=0, backend=backend)
+
+    assert fresh is not None
+    assert fresh.token > stale.token
+    assert stale.renew() is False
+    assert stale.is_held() is False
+
+    # Releasing the stale lease must not drop the new holder's lease
+    stale.release()
+    assert fresh.is_held() is True
+
+
+def test_fence_rejects_stale_holder(db, backend):
+    transfer = _transfer(db)
+    stale = acquire_transfer_lease(transfer.id, timeout_seconds=0, ttl_seconds=0.05, backend=backend)
+    assert record_fence_token(db, stale) is True
+
+    time.sleep(0.1)
+    fresh = acquire_transfer_lease(transfer.id, timeout_seconds=0, backend=backend)
+    assert record_fence_token(db, fresh) is True
+
+    assert verify_transfer_fence(db, fresh) is True
+    assert verify_transfer_fence(db, stale) is False
+    # An older token can never overwrite a newer one
+    assert record_fence_token(db, stale) is False
+
+
+def test_acquire_records_fence_token(db, backend):
+    transfer = _transfer(db)
+    with patch.object(transfer_lock, "get_lock_backend", return_value=backend):
+        lease = acquire_transfer_lock(db, transfer.id, timeout_seconds=0)
+        try:
+            assert lease is not None
+            db.refresh(transfer)
+            assert transfer.lock_token == lease.token
+        finally:
+            release_transfer_lock(db, lease)
+
+    assert backend.holder(lease.key) is None
+
+
+def test_redis_outage_fails_closed():
+    backend = MagicMock()
+    backend.acquire.side_effect = RedisConnectionError("down")
+    assert acquire_transfer_lease(4, timeout_seconds=0, backend=backend) is None
+
+
+def test_redis_backend_uses_lease_and_fence_keys():
+    redis_conn = MagicMock()
+    acquire_script = MagicMock(return_value=7)
+    redis_conn.register_script.side_effect = [acquire_script, MagicMock(), MagicMock()]
+
+    lease = acquire_transfer_lease(5, timeout_seconds=0, ttl_seconds=60, backend=RedisLockBackend(redis_conn))
+
+    assert lease.token == 7
+    acquire_script.assert_called_once_with(
+        keys=["ketter:lock:transfer:5", "ketter:lock:transfer:5:fence"],
+        args=[lease.owner, 60000]
+    )
+
+
+def test_move_keeps_source_when_fence_fails(db, backend):
+    from app.core.copy_engine import CopyEngineError, transfer_file_with_verification
+
+    source_dir = tempfile.mkdtemp(prefix="ketter_lock_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_lock_dst_")
+    source = os.path.join(source_dir, "take.wav")
+    with open(source, "wb") as f:
+        f.write(b"audio" * 100)
+
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "take.wav"),
+        file_name="take.wav",
+        file_size=os.path.getsize(source),
+        status=TransferStatus.PENDING,
+        operation_mode="move"
+    )
+    db.add(transfer)
+    db.commit()
+    db.refresh(transfer)
+
+    with patch.object(transfer_lock, "get_lock_backend", return_value=backend), \
+         patch("app.core.copy_engine.verify_transfer_fence", return_value=False):
+        with pytest.raises(CopyEngineError):
+            transfer_file_with_verification(transfer.id, db)
+
+    assert os.path.exists(source), "Source must survive a lost MOVE lease"
@@ -0,0 +1,168 @@
+"""
+Ketter 3.0 - Tree Hash Tests
+
+Tests verify the Merkle tree mode for large files:
+- Leaves are the plain SHA-256 of each chunk; the flat SHA-256 comes from the same read
+- Parallel and sequential hashing give the same tree
+- diff() names the exact bad byte ranges
+- The copy engine stores both trees, repairs only the bad range, and
+  records the DESTINATION by its tree root (no flat digest is claimed)
+- With drop_cache every chunk is evicted before it is read (storage, not RAM)
+"""
+
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from app.core import copy_engine
+from app.core.tree_hash import TREE_ALGORITHM, hash_chunk, merkle_root, repair_ranges, tree_hash
+from app.database import SessionLocal
+from app.models import Checksum, ChecksumTree, ChecksumType, Transfer, TransferStatus
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture
+def media_file():
+    with tempfile.TemporaryDirectory(prefix="ketter_tree_") as workdir:
+        path = os.path.join(workdir, "reel.mov")
+        with open(path, "wb") as f:
+            f.write(os.urandom(5 * CHUNK + 100))
+        yield path
+
+
+def test_leaves_root_and_flat(media_file):
+    with open(media_file, "rb") as f:
+        data = f.read()
+
+    tree, flat = tree_hash(media_file, chunk_size=CHUNK, workers=4, with_flat=True)
+
+    assert flat == hashlib.sha256(data).hexdigest()
+    assert len(tree.leaves) == 6
+    assert tree.leaves[5] == hashlib.sha256(data[5 * CHUNK:]).hexdigest()
+    assert tree.root == merkle_root(tree.leaves)
+
+    parallel, no_flat = tree_hash(media_file, chunk_size=CHUNK, workers=4)
+    single, _ = tree_hash(media_file, chunk_size=CHUNK, workers=1)
+    assert no_flat is None
+    assert parallel.leaves == single.leaves == tree.leaves
+
+
+def test_diff_points_to_bad_range(media_file):
+    source, _ = tree_hash(media_file, chunk_size=CHUNK)
+    with open(media_file, "r+b") as f:
+        f.seek(3 * CHUNK + 10)
+        f.write(b"bitrot")
+
+    damaged, _ = tree_hash(media_file, chunk_size=CHUNK)
+    assert source.diff(damaged) == [(3 * CHUNK, 4 * CHUNK)]
+    assert source.root != damaged.root
+
+
+def test_repair_rewrites_only_bad_range(media_file):
+    dest = media_file + ".copy"
+    with open(media_file, "rb") as src, open(dest, "wb") as dst:
+        dst.write(src.read())
+    with open(dest, "r+b") as f:
+        f.seek(CHUNK)
+        f.write(b"\x00" * 32)
+
+    source, _ = tree_hash(media_file, chunk_size=CHUNK)
+    bad = source.diff(tree_hash(dest, chunk_size=CHUNK)[0])
+
+    assert repair_ranges(media_file, dest, bad) == CHUNK
+    assert tree_hash(dest, chunk_size=CHUNK)[0].root == source.root
+
+
+def test_engine_repairs_bad_chunk_and_stores_trees(monkeypatch):
+    monkeypatch.setattr(copy_engine, "TREE_HASH_ENABLED", True)
+    monkeypatch.setattr(copy_engine, "TREE_HASH_MIN_BYTES", 0)
+
+    source_dir = tempfile.mkdtemp(prefix="ketter_tree_src_")
+    dest_dir = tempfile.mkdtemp(prefix="ketter_tree_dst_")
+    source = os.path.join(source_dir, "reel.mov")
+    with open(source, "wb") as f:
+        f.write(os.urandom(4 * CHUNK))
+
+    db = SessionLocal()
+    transfer = Transfer(
+        source_path=source,
+        destination_path=os.path.join(dest_dir, "reel.mov"),
+        file_name="reel.mov",
+        file_size=os.path.getsize(source),
+        status=TransferStatus.PENDING
+    )
+    db.add(transfer)
+    db.commit()
+
+    real_copy = copy_engine.copy_file_with_progress
+
+    def corrupting_copy(src, dst, **kwargs):
+        copied = real_copy(src, dst, **kwargs)
+        with open(dst, "r+b") as f:
+            f.seek(2 * CHUNK + 5)
+            f.write(b"flip")
+        return copied
+
+    real_tree_hash = copy_engine.tree_hash
+
+    def small_chunks(path, chunk_size=CHUNK, **kwargs):
+        return real_tree_hash(path, chunk_size=CHUNK, **kwargs)
+
+    with patch.object(copy_engine, "copy_file_with_progress", side_effect=corrupting_copy), \
+         patch.object(copy_engine, "tree_hash", side_effect=small_chunks), \
+         patch.object(copy_engine, "repair_ranges", wraps=repair_ranges) as repair:
+        transfer = copy_engine.transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    repair.assert_called_once()
+    assert repair.call_args.args[2] == [(2 * CHUNK, 3 * CHUNK)]
+
+    with open(source, "rb") as f:
+        flat = hashlib.sha256(f.read()).hexdigest()
+    trees = db.query(ChecksumTree).filter(ChecksumTree.transfer_id == transfer.id).all()
+    assert {t.checksum_type for t in trees} == {ChecksumType.SOURCE, ChecksumType.DESTINATION}
+    assert len({t.root for t in trees}) == 1
+    root = trees[0].root
+
+    # The destination was never hashed flat: its row is the tree root
+    values = {(c.checksum_type, c.algorithm): c.checksum_value
+              for c in db.query(Checksum).filter(Checksum.transfer_id == transfer.id)}
+    assert values == {
+        (ChecksumType.SOURCE, "sha256"): flat,
+        (ChecksumType.SOURCE, TREE_ALGORITHM): root,
+        (ChecksumType.DESTINATION, TREE_ALGORITHM): root,
+        (ChecksumType.FINAL, "sha256"): flat,
+    }
+    db.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fadvise"), reason="needs posix_fadvise")
+def test_drop_cache_evicts_each_chunk_before_reading(media_file):
+    calls = []
+    real_pread, real_fadvise = os.pread, os.posix_fadvise
+
+    def pread(fd, n, offset):
+        calls.append(("read", offset))
+        return real_pread(fd, n, offset)
+
+    def fadvise(fd, offset, length, advice):
+        if advice == os.POSIX_FADV_DONTNEED:
+            calls.append(("evict", offset))
+        return real_fadvise(fd, offset, length, advice)
+
+    with patch.object(os, "pread", side_effect=pread), \
+         patch.object(os, "posix_fadvise", side_effect=fadvise):
+        tree, _ = tree_hash(media_file, chunk_size=CHUNK, workers=1, drop_cache=True)
+        calls_after_tree = list(calls)
+        calls.clear()
+        hash_chunk(media_file, tree, 2, drop_cache=True)
+
+    assert ("read", 2 * CHUNK) in calls
+    for sequence in (calls_after_tree, calls):
+        for offset in {offset for kind, offset in sequence if kind == "read" and offset % CHUNK == 0}:
+            # The chunk starting here was evicted before its first read
+            assert sequence.index(("evict", offset)) < sequence.index(("read", offset))
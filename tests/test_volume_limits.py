@@ -0,0 +1,122 @@
+"""
+Ketter 3.0 - Per-Volume I/O Concurrency Limit Tests
+
+Tests verify the distributed volume semaphore:
+- max_streams is read from volume config
+- Paths resolve to the most specific volume
+- Slots are all-or-nothing across source and destination volumes
+- Redis outages fail open (limits are a tuning knob, not a safety check)
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.config import KetterConfig, VolumeConfig
+from app.services import volume_limits
+from app.services.volume_limits import (
+    VolumeSemaphore,
+    acquire_volume_streams,
+    get_limited_volumes,
+)
+
+
+@pytest.fixture
+def config():
+    """Config with one limited NAS, one limited SSD and one unlimited volume"""
+    cfg = KetterConfig.__new__(KetterConfig)
+    cfg.server_name = "test"
+    cfg.server_location = ""
+    cfg.volumes = [
+        VolumeConfig({"path": "/Volumes", "max_streams": 10}),
+        VolumeConfig({"path": "/Volumes/Nexis", "max_streams": 2}),
+        VolumeConfig({"path": "/ssd", "max_streams": 8}),
+        VolumeConfig({"path": "/tmp"}),
+    ]
+    with patch.object(volume_limits, "get_config", return_value=cfg):
+        yield cfg
+
+
+def _redis_with_script_results(*results):
+    """Mock Redis whose Lua scripts return the given values in order"""
+    redis_conn = MagicMock()
+    script = MagicMock(side_effect=list(results))
+    redis_conn.register_script.return_value = script
+    return redis_conn, script
+
+
+def test_volume_config_reads_max_streams():
+    volume = VolumeConfig({"path": "/Volumes/Nexis", "max_streams": 2})
+    assert volume.max_streams == 2
+    assert volume.to_dict()["max_streams"] == 2
+    assert VolumeConfig({"path": "/tmp"}).max_streams is None
+
+
+def test_path_resolves_to_most_specific_volume(config):
+    volume = config.get_volume_for_path("/Volumes/Nexis/project/a.wav")
+    assert volume.path == "/Volumes/Nexis"
+    assert config.get_volume_for_path("/elsewhere/file") is None
+
+
+def test_sibling_prefix_is_not_on_volume(config):
+    assert config.get_volume_for_path("/Volumes/Nexis2/file.wav").path == "/Volumes"
+    assert config.get_volume_for_path("/Volumes/Nexis").path == "/Volumes/Nexis"
+    assert config.get_volume_for_path("/tmpfiles/a.wav") is None
+
+
+def test_limited_volumes_are_distinct_and_sorted(config):
+    volumes = get_limited_volumes([
+        "/ssd/in/a.wav",
+        "/Volumes/Nexis/out/a.wav",
+        "/ssd/in/b.wav",
+        "/tmp/c.wav",
+    ])
+    assert [v.path for v in volumes] == ["/Volumes/Nexis", "/ssd"]
+
+
+def test_unlimited_volumes_do_not_touch_redis(config):
+    redis_conn = MagicMock()
+    leases = acquire_volume_streams(redis_conn, "job-1", ["/tmp/a", "/tmp/b"])
+
+    assert leases is not None
+    assert leases.semaphores == []
+    redis_conn.register_script.assert_not_called()
+
+
+def test_semaphore_passes_limit_and_ttl_to_script(config):
+    redis_conn, script = _redis_with_script_results(1)
+    sem = VolumeSemaphore(redis_conn, config.volumes[1], ttl_seconds=60)
+
+    assert sem.acquire("job-1") is True
+    script.assert_called_once_with(keys=[sem.key], args=["job-1", 2, 60])
+
+
+def test_acquire_all_volumes(config):
+    redis_conn, _ = _redis_with_script_results(1, 1)
+    leases = acquire_volume_streams(redis_conn, "job-1", ["/ssd/a.wav", "/Volumes/Nexis/a.wav"])
+
+    try:
+        assert leases is not None
+        assert leases.volumes == ["/Volumes/Nexis", "/ssd"]
+    finally:
+        leases.release()
+
+    assert redis_conn.zrem.call_count == 2
+
+
+def test_saturated_volume_releases_partial_slots(config):
+    # First volume grants the slot, second is saturated
+    redis_conn, _ = _redis_with_script_results(1, 0)
+    leases = acquire_volume_streams(redis_conn, "job-1", ["/ssd/a.wav", "/Volumes/Nexis/a.wav"])
+
+    assert leases is None
+    redis_conn.zrem.assert_called_once_with("ketter:volume:/Volumes/Nexis:streams", "job-1")
+
+
+def test_redis_outage_fails_open(config):
+    redis_conn, _ = _redis_with_script_results(RedisConnectionError("down"))
+    leases = acquire_volume_streams(redis_conn, "job-1", ["/Volumes/Nexis/a.wav"])
+
+    assert leases is not None
+    assert leases.semaphores == []
@@ -0,0 +1,84 @@
+"""
+Ketter 3.0 - Worker Pool Tests
+
+Tests verify the pre-forked worker pool supervisor:
+- A crashed worker process is reaped and replaced, the others keep running
+- Children drop the connections inherited from the supervisor
+- Reaping fails the job the dead worker was running and deregisters it
+"""
+
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import text
+
+from app.services import redis_client, worker_pool
+from app.services.worker_pool import WorkerPool, reap_dead_worker
+
+
+def test_crashed_process_is_replaced():
+    workdir = tempfile.mkdtemp(prefix="ketter_pool_")
+
+    def target(name, queue_names, redis_url, max_jobs, burst, with_scheduler):
+        with open(os.path.join(workdir, name), "w") as f:
+            f.write(",".join(queue_names))
+        try:
+            # The first process to start crashes, every other one drains and exits
+            os.close(os.open(os.path.join(workdir, "crashed"), os.O_CREAT | os.O_EXCL))
+            return 3
+        except FileExistsError:
+            return 0
+
+    with patch.object(worker_pool, "reap_dead_worker", return_value="job-lost") as reap:
+        pool = WorkerPool(["small", "default"], processes=2, burst=True, target=target, sleep=lambda s: None)
+        pool.start()
+        assert pool.supervise() == 0
+
+    assert pool.restarts == 1
+    reap.assert_called_once()
+    assert reap.call_args.args[2] == 3
+    started = [name for name in os.listdir(workdir) if name != "crashed"]
+    assert len(started) == 3  # Two slots + one replacement, each with a fresh name
+    assert reap.call_args.args[1] in started
+
+
+def test_children_reset_inherited_connections():
+    workdir = tempfile.mkdtemp(prefix="ketter_pool_reset_")
+    redis_client._redis_conn = MagicMock()
+
+    def target(name, queue_names, redis_url, max_jobs, burst, with_scheduler):
+        from app.database import SessionLocal
+
+        db = SessionLocal()
+        db.execute(text("SELECT 1"))
+        db.close()
+        with open(os.path.join(workdir, "result"), "w") as f:
+            f.write(f"{redis_client._redis_conn is None} {with_scheduler}")
+        return 0
+
+    try:
+        pool = WorkerPool(["default"], processes=1, burst=True, target=target)
+        pool.start()
+        pool.supervise()
+    finally:
+        redis_client._redis_conn = None
+
+    with open(os.path.join(workdir, "result")) as f:
+        assert f.read() == "True True"  # Slot 0 also runs the RQ scheduler
+
+
+def test_reap_fails_running_job():
+    worker = MagicMock()
+    worker.get_current_job_id.return_value = "job-42"
+    job = MagicMock(origin="small")
+
+    with patch.object(worker_pool.Worker, "find_by_key", return_value=worker), \
+         patch.object(worker_pool.Job, "fetch", return_value=job):
+        assert reap_dead_worker(MagicMock(), "ketter-worker.0.abc", -9) == "job-42"
+
+    failed_job, queue = worker.handle_job_failure.call_args.args
+    assert failed_job is job
+    assert queue.name == "small"
+    assert "exit code -9" in worker.handle_job_failure.call_args.kwargs["exc_string"]
+    worker.register_death.assert_called_once()
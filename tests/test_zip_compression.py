@@ -0,0 +1,138 @@
+"""
+Ketter 3.0 - Adaptive ZIP Compression Tests
+
+Tests verify the opt-in per-entry compression of the ZIP path:
+- Media stays STORED, compressible entries are DEFLATE/LZMA, random data
+  is STORED after sampling; the decision is recorded per entry
+- Extraction is bit-identical
+- With the mode off every entry is STORED and carries no decision
+- The mode comes from the destination volume, and the copy engine uses it
+"""
+
+import os
+import tempfile
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from app import config as app_config
+from app.core import copy_engine
+from app.core.zip_engine import (
+    get_zip_compression,
+    get_zip_info,
+    unzip_folder_smart,
+    zip_folder_smart,
+)
+from app.database import SessionLocal
+from app.models import AuditLog, Transfer, TransferStatus
+
+
+def _session(root):
+    """Pro Tools-like session: audio, MIDI/XML exports and a random blob"""
+    files = {
+        "Audio Files/kick.wav": os.urandom(32 * 1024),
+        "MIDI/groove.mid": b"MTrk\x00\x90\x3c\x40" * 4096,
+        "Exports/session.xml": b"<clip name='take' start='0' end='48000'/>\n" * 2000,
+        "Bounces/noise.bin": os.urandom(200 * 1024),
+        "notes.txt": b"hi",
+    }
+    for relpath, data in files.items():
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return files
+
+
+@pytest.mark.parametrize("codec, compress_type", [
+    ("deflate", zipfile.ZIP_DEFLATED),
+    ("lzma", zipfile.ZIP_LZMA),
+])
+def test_adaptive_decisions_and_round_trip(codec, compress_type):
+    with tempfile.TemporaryDirectory(prefix="ketter_zipc_") as workdir:
+        source = os.path.join(workdir, "session")
+        files = _session(source)
+        zip_path = os.path.join(workdir, "session.zip")
+
+        zip_folder_smart(source, zip_path, compression="adaptive", codec=codec)
+
+        with zipfile.ZipFile(zip_path) as zf:
+            types = {info.filename: info.compress_type for info in zf.infolist()}
+        decisions = get_zip_info(zip_path)["decisions"]
+
+        assert types["Audio Files/kick.wav"] == zipfile.ZIP_STORED
+        assert decisions["Audio Files/kick.wav"] == "store media"
+        assert types["Bounces/noise.bin"] == zipfile.ZIP_STORED
+        assert decisions["Bounces/noise.bin"].startswith("store ratio=")
+        assert decisions["notes.txt"] == "store small"
+        for name in ("MIDI/groove.mid", "Exports/session.xml"):
+            assert types[name] == compress_type
+            assert decisions[name].startswith(f"{codec} ratio=")
+        assert os.path.getsize(zip_path) < sum(len(d) for d in files.values())
+
+        dest = os.path.join(workdir, "dest")
+        unzip_folder_smart(zip_path, dest)
+        for relpath, data in files.items():
+            with open(os.path.join(dest, relpath), "rb") as f:
+                assert f.read() == data
+
+
+def test_mode_off_stays_store_only():
+    with tempfile.TemporaryDirectory(prefix="ketter_zipc_off_") as workdir:
+        source = os.path.join(workdir, "session")
+        _session(source)
+        zip_path = os.path.join(workdir, "session.zip")
+
+        zip_folder_smart(source, zip_path)
+
+        with zipfile.ZipFile(zip_path) as zf:
+            assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+        assert get_zip_info(zip_path)["decisions"] == {}
+
+
+def test_mode_from_volume_config(monkeypatch):
+    with tempfile.TemporaryDirectory(prefix="ketter_zipc_cfg_") as workdir:
+        vpn = os.path.join(workdir, "vpn")
+        config_path = os.path.join(workdir, "ketter.config.yml")
+        with open(config_path, "w") as f:
+            f.write("volumes:\n"
+                    f"  - {{path: {vpn}, type: network, zip_compression: adaptive}}\n"
+                    f"  - {{path: {workdir}, type: local}}\n")
+        monkeypatch.setattr(app_config, "_config_instance", app_config.KetterConfig(config_path))
+
+        assert get_zip_compression(os.path.join(vpn, "Session")) == "adaptive"
+        assert get_zip_compression(os.path.join(workdir, "Session")) == "store"
+
+
+def test_engine_packages_adaptively():
+    source = os.path.join(tempfile.mkdtemp(prefix="ketter_zipc_src_"), "Session")
+    files = _session(source)
+    dest = os.path.join(tempfile.mkdtemp(prefix="ketter_zipc_dst_"), "Session")
+
+    db = SessionLocal()
+    transfer = Transfer(
+        source_path=source,
+        destination_path=dest,
+        file_name="Session",
+        file_size=0,
+        status=TransferStatus.PENDING
+    )
+    db.add(transfer)
+    db.commit()
+
+    with patch.object(copy_engine, "get_zip_compression", return_value="adaptive"):
+        transfer = copy_engine.transfer_file_with_verification(transfer.id, db)
+
+    assert transfer.status == TransferStatus.COMPLETED
+    for relpath, data in files.items():
+        with open(os.path.join(dest, relpath), "rb") as f:
+            assert f.read() == data
+
+    zipped = db.query(AuditLog).filter(
+        AuditLog.transfer_id == transfer.id,
+        AuditLog.message.like("Folder zipped successfully%")
+    ).one()
+    assert zipped.event_metadata["compression"] == "adaptive"
+    assert zipped.event_metadata["entries_compressed"] == 2
+    db.close()